@@ -14,9 +14,14 @@ import okhttp3.RequestBody.Companion.toRequestBody
 import okhttp3.RequestBody.Companion.asRequestBody
 import okio.BufferedSink
 import okio.source
+import java.io.ByteArrayOutputStream
 import java.io.File
 import java.io.IOException
+import java.io.RandomAccessFile
+import java.security.MessageDigest
 import java.util.concurrent.TimeUnit
+import java.util.zip.GZIPOutputStream
+import kotlin.random.Random
 
 /**
  * 数据提交管理器
@@ -41,6 +46,10 @@ class DataSubmitManager(private val context: Context) {
         private const val TAG = "DataSubmitManager"
         private const val PREF_NAME = "uploaded_files_prefs"
         private const val KEY_UPLOADED_FILES = "uploaded_files"
+        private const val MAX_BUSY_RETRIES = 5  // 服务器繁忙（503）时最多重试次数
+        private const val MAX_RETRY_AFTER_SECONDS = 30L
+        private const val RESUMABLE_UPLOAD_THRESHOLD = 8L * 1024 * 1024  // 超过该大小的文件（视频）使用可续传上传
+        private const val MAX_CHUNK_RETRIES = 5  // 分块上传连续中断的最多重试次数
     }
     
     // 已上传文件记录（内存缓存）
@@ -139,8 +148,8 @@ class DataSubmitManager(private val context: Context) {
                 
                 Log.d(TAG, "提交团队信息到: $serverUrl/api/submit")
                 
-                // 发送请求
-                val response = client.newCall(request).execute()
+                // 发送请求（服务器繁忙时按 Retry-After 等待后重试）
+                val response = executeWithBusyRetry(request)
                 
                 if (response.isSuccessful) {
                     val responseBody = response.body?.string()
@@ -263,20 +272,20 @@ class DataSubmitManager(private val context: Context) {
                     }
                 }
                 
-                // 过滤掉已上传的文件
-                val filesToUpload = mediaFilesToUpload.filter { mediaItem ->
-                    val file = File(mediaItem.path)
-                    if (file.exists() && !isFileUploaded(mediaItem.path)) {
-                        true
-                    } else {
-                        if (isFileUploaded(mediaItem.path)) {
-                            Log.d(TAG, "⏭️ 跳过已上传文件: ${file.name}")
-                        }
-                        false
+                // 询问服务器缺少哪些文件，只上传缺少或内容不一致的文件；
+                // 服务器不支持媒体清单（旧版本）或请求失败时，按本地记录过滤掉已上传的文件
+                val existingMedia = mediaFilesToUpload.filter { File(it.path).exists() }.distinctBy { it.path }
+                val missingPaths = fetchMissingMedia(serverConfig.getServerUrl(), studentId, existingMedia)
+                val filesToUpload = existingMedia.filter { mediaItem ->
+                    val needed = missingPaths?.contains(mediaItem.path) ?: !isFileUploaded(mediaItem.path)
+                    if (!needed) {
+                        Log.d(TAG, "⏭️ 跳过已上传文件: ${File(mediaItem.path).name}")
                     }
+                    needed
                 }
                 
-                // 上传媒体文件（带进度回调）
+                // 上传媒体文件（带进度回调）；失败的文件在提交之后按服务器分配的媒体ID重新上传
+                val failedUploads = mutableListOf<MediaItem>()
                 if (filesToUpload.isNotEmpty()) {
                     Log.d(TAG, "开始上传 ${filesToUpload.size} 个媒体文件（跳过 ${mediaFilesToUpload.size - filesToUpload.size} 个已上传文件）")
                     var uploadSuccessCount = 0
@@ -306,6 +315,7 @@ class DataSubmitManager(private val context: Context) {
                                     Log.d(TAG, "✅ 上传成功: ${file.name}")
                                 } else {
                                     uploadFailCount++
+                                    failedUploads.add(mediaItem)
                                     Log.w(TAG, "⚠️ 上传失败: ${file.name}")
                                 }
                             } else {
@@ -314,6 +324,7 @@ class DataSubmitManager(private val context: Context) {
                             }
                         } catch (e: Exception) {
                             uploadFailCount++
+                            failedUploads.add(mediaItem)
                             Log.e(TAG, "上传文件异常: ${mediaItem.path}, ${e.message}", e)
                         }
                     }
@@ -325,25 +336,31 @@ class DataSubmitManager(private val context: Context) {
                     onProgress?.invoke(0, 0, "", 100)
                 }
                 
-                // 转换为JSON
+                // 转换为JSON，gzip压缩后发送（笔记、总结等文字较多，体积可减少数倍）
                 val json = gson.toJson(dataPackage)
-                val requestBody = json.toRequestBody("application/json".toMediaType())
+                val jsonBytes = json.toByteArray(Charsets.UTF_8)
+                val compressedBytes = gzip(jsonBytes)
+                val requestBody = compressedBytes.toRequestBody("application/json".toMediaType())
                 
                 // 构建请求
                 val serverUrl = serverConfig.getServerUrl()
                 val request = Request.Builder()
                     .url("$serverUrl/api/submit")
+                    .header("Content-Encoding", "gzip")
                     .post(requestBody)
                     .build()
                 
-                Log.d(TAG, "提交完整数据到: $serverUrl/api/submit")
+                Log.d(TAG, "提交完整数据到: $serverUrl/api/submit (${jsonBytes.size} 字节, 压缩后 ${compressedBytes.size} 字节)")
                 
-                // 发送请求
-                val response = client.newCall(request).execute()
+                // 发送请求（服务器繁忙时按 Retry-After 等待后重试）
+                val response = executeWithBusyRetry(request)
                 
                 if (response.isSuccessful) {
                     val responseBody = response.body?.string()
                     Log.d(TAG, "提交成功: $responseBody")
+                    if (failedUploads.isNotEmpty()) {
+                        uploadFailedMediaById(serverUrl, studentId, responseBody, failedUploads)
+                    }
                     onSuccess?.invoke()
                 } else {
                     val errorMsg = "服务器错误: ${response.code}"
@@ -363,6 +380,35 @@ class DataSubmitManager(private val context: Context) {
         }.start()
     }
     
+    /**
+     * 发送请求；服务器繁忙返回 503 时按 Retry-After 等待后重试
+     * 等待时间加上随机抖动，避免全班的请求在同一时刻再次涌入
+     */
+    private fun executeWithBusyRetry(request: Request): Response {
+        var attempt = 0
+        while (true) {
+            val response = client.newCall(request).execute()
+            if (response.code != 503 || attempt >= MAX_BUSY_RETRIES) {
+                return response
+            }
+            val retryAfter = (response.header("Retry-After")?.toLongOrNull() ?: 1L)
+                .coerceIn(1L, MAX_RETRY_AFTER_SECONDS)
+            response.close()
+            attempt++
+            Log.w(TAG, "服务器繁忙，${retryAfter}秒后重试 ($attempt/$MAX_BUSY_RETRIES)")
+            Thread.sleep(retryAfter * 1000 + Random.nextLong(0, 1000))
+        }
+    }
+    
+    /**
+     * gzip压缩请求体（服务器按 Content-Encoding: gzip 解压）
+     */
+    private fun gzip(data: ByteArray): ByteArray {
+        val output = ByteArrayOutputStream()
+        GZIPOutputStream(output).use { it.write(data) }
+        return output.toByteArray()
+    }
+    
     /**
      * 将ProcessRecord转换为Map（用于JSON序列化）
      */
@@ -415,14 +461,43 @@ class DataSubmitManager(private val context: Context) {
     
     /**
      * 上传媒体文件到服务器（带进度回调）
+     * mediaId / uploadUrl 为 /api/submit 响应中服务器分配的媒体ID和上传地址；
+     * 提交之前上传时为 null，服务器按团队和原始路径绑定
      */
     private fun uploadMediaFile(
         serverUrl: String, 
         studentId: String, 
         mediaItem: MediaItem, 
         file: File,
+        mediaId: String? = null,
+        uploadUrl: String? = null,
         onFileProgress: ((Int) -> Unit)? = null
     ): Boolean {
+        // 服务器已有相同内容（重试、重新提交或其他团队上传过同一文件）时只登记，不再上传
+        val sha256 = try {
+            sha256Hex(file)
+        } catch (e: IOException) {
+            Log.w(TAG, "计算文件哈希失败: ${file.name}, ${e.message}")
+            null
+        }
+        if (sha256 != null && linkExistingMedia(serverUrl, studentId, mediaItem, file, sha256, mediaId)) {
+            onFileProgress?.invoke(100)
+            return true
+        }
+        
+        // 大文件分块上传，断线后从服务器已接收的位置继续（服务器不支持时改用普通上传）
+        if (file.length() >= RESUMABLE_UPLOAD_THRESHOLD) {
+            val result = try {
+                uploadMediaFileResumable(serverUrl, studentId, mediaItem, file, sha256, mediaId, onFileProgress)
+            } catch (e: Exception) {
+                Log.e(TAG, "可续传上传异常: ${file.name}, ${e.message}", e)
+                false
+            }
+            if (result != null) {
+                return result
+            }
+        }
+        
         return try {
             // 根据文件类型确定MIME类型
             val mimeType = when {
@@ -465,18 +540,21 @@ class DataSubmitManager(private val context: Context) {
                 }
             }
             
-            // 构建multipart请求体
-            val multipartBody = MultipartBody.Builder()
+            // 构建multipart请求体（sha256 用于服务器校验文件完整性）
+            val multipartBuilder = MultipartBody.Builder()
                 .setType(MultipartBody.FORM)
                 .addFormDataPart("file", file.name, requestBody)
                 .addFormDataPart("original_path", mediaItem.path)
                 .addFormDataPart("type", mediaItem.type.name)
                 .addFormDataPart("timestamp", mediaItem.timestamp.toString())
-                .build()
+            if (sha256 != null) {
+                multipartBuilder.addFormDataPart("sha256", sha256)
+            }
+            val multipartBody = multipartBuilder.build()
             
             val encodedStudentId = java.net.URLEncoder.encode(studentId, "UTF-8")
             val request = Request.Builder()
-                .url("$serverUrl/api/student/$encodedStudentId/media/upload")
+                .url(if (uploadUrl != null) "$serverUrl$uploadUrl" else "$serverUrl/api/student/$encodedStudentId/media/upload")
                 .post(multipartBody)
                 .build()
             
@@ -502,6 +580,295 @@ class DataSubmitManager(private val context: Context) {
         }
     }
     
+    /**
+     * 可续传上传：创建上传后按服务器建议的分块大小逐块 PATCH（请求头 Upload-Offset 为分块的起始位置），
+     * 连接中断时查询服务器已接收的字节数（HEAD）并从该位置继续；全部发送后校验 SHA-256 完成上传。
+     * 创建上传时服务器会返回同一文件之前已接收的字节数，应用重启后也能从断点继续。
+     * 服务器不支持可续传上传（旧版本）时返回 null
+     */
+    private fun uploadMediaFileResumable(
+        serverUrl: String,
+        studentId: String,
+        mediaItem: MediaItem,
+        file: File,
+        sha256: String?,
+        mediaId: String? = null,
+        onFileProgress: ((Int) -> Unit)? = null
+    ): Boolean? {
+        val fileSize = file.length()
+        val encodedStudentId = java.net.URLEncoder.encode(studentId, "UTF-8")
+        val jsonType = "application/json".toMediaType()
+        
+        // 1. 创建上传（或取得同一文件未完成的上传）
+        val createBody = gson.toJson(mapOf(
+            "originalPath" to mediaItem.path,
+            "filename" to file.name,
+            "type" to mediaItem.type.name,
+            "timestamp" to mediaItem.timestamp,
+            "size" to fileSize,
+            "mediaId" to mediaId
+        )).toRequestBody(jsonType)
+        val createRequest = Request.Builder()
+            .url("$serverUrl/api/student/$encodedStudentId/media/uploads")
+            .post(createBody)
+            .build()
+        
+        var offset: Long
+        val chunkSize: Long
+        val uploadUrl: String
+        executeWithBusyRetry(createRequest).use { response ->
+            if (response.code == 404 || response.code == 405) {
+                Log.w(TAG, "服务器不支持可续传上传，改用普通上传: ${file.name}")
+                return null
+            }
+            val responseBody = response.body?.string()
+            if (!response.isSuccessful) {
+                Log.e(TAG, "创建上传失败: ${file.name}, 响应码: ${response.code}, 错误: $responseBody")
+                return false
+            }
+            val state = gson.fromJson(responseBody, Map::class.java)
+            offset = (state["offset"] as Number).toLong()
+            chunkSize = (state["chunkSize"] as Number).toLong().coerceAtLeast(64L * 1024)
+            uploadUrl = "$serverUrl${state["uploadUrl"]}"
+        }
+        if (offset > 0) {
+            Log.d(TAG, "从断点继续上传: ${file.name} ($offset/$fileSize 字节)")
+        }
+        
+        // 2. 逐块发送
+        var retries = 0
+        while (offset < fileSize) {
+            val chunkStart = offset
+            val chunkLength = minOf(chunkSize, fileSize - chunkStart)
+            val chunkBody = object : RequestBody() {
+                override fun contentType(): MediaType = "application/offset+octet-stream".toMediaType()
+                
+                override fun contentLength(): Long = chunkLength
+                
+                override fun writeTo(sink: BufferedSink) {
+                    RandomAccessFile(file, "r").use { raf ->
+                        raf.seek(chunkStart)
+                        val buffer = ByteArray(8192)
+                        var sent = 0L
+                        while (sent < chunkLength) {
+                            val bytesRead = raf.read(buffer, 0, minOf(buffer.size.toLong(), chunkLength - sent).toInt())
+                            if (bytesRead == -1) throw IOException("文件在上传过程中被修改")
+                            sink.write(buffer, 0, bytesRead)
+                            sent += bytesRead
+                            onFileProgress?.invoke(((chunkStart + sent) * 100 / fileSize).toInt())
+                        }
+                    }
+                }
+            }
+            val chunkRequest = Request.Builder()
+                .url(uploadUrl)
+                .header("Upload-Offset", chunkStart.toString())
+                .patch(chunkBody)
+                .build()
+            
+            try {
+                client.newCall(chunkRequest).execute().use { response ->
+                    val serverOffset = response.header("Upload-Offset")?.toLongOrNull()
+                    when {
+                        response.isSuccessful && serverOffset != null -> {
+                            offset = serverOffset
+                            retries = 0
+                        }
+                        response.code == 409 && serverOffset != null -> {
+                            // 服务器记录的位置与本地不一致（上一个请求断开前多写入了一部分），从服务器的位置继续
+                            offset = serverOffset
+                            retries++
+                        }
+                        else -> {
+                            Log.e(TAG, "分块上传失败: ${file.name}, 响应码: ${response.code}, 错误: ${response.body?.string()}")
+                            return false
+                        }
+                    }
+                }
+            } catch (e: IOException) {
+                retries++
+                if (retries > MAX_CHUNK_RETRIES) {
+                    Log.e(TAG, "分块上传多次中断，放弃: ${file.name}, ${e.message}")
+                    return false
+                }
+                Log.w(TAG, "分块上传中断，${retries}秒后从断点继续 ($retries/$MAX_CHUNK_RETRIES): ${file.name}, ${e.message}")
+                Thread.sleep(retries * 1000L + Random.nextLong(0, 500))
+                offset = queryUploadOffset(uploadUrl) ?: chunkStart
+            }
+            if (retries > MAX_CHUNK_RETRIES) {
+                Log.e(TAG, "分块上传位置多次不一致，放弃: ${file.name}")
+                return false
+            }
+        }
+        
+        // 3. 完成上传（服务器校验大小和 SHA-256 后移动到媒体目录）
+        val completeBody = gson.toJson(mapOf("sha256" to (sha256 ?: sha256Hex(file)))).toRequestBody(jsonType)
+        val completeRequest = Request.Builder()
+            .url("$uploadUrl/complete")
+            .post(completeBody)
+            .build()
+        executeWithBusyRetry(completeRequest).use { response ->
+            val responseBody = response.body?.string()
+            if (!response.isSuccessful) {
+                Log.e(TAG, "完成上传失败: ${file.name}, 响应码: ${response.code}, 错误: $responseBody")
+                return false
+            }
+            Log.d(TAG, "可续传上传成功: ${file.name}, 响应: $responseBody")
+            onFileProgress?.invoke(100)
+            return true
+        }
+    }
+    
+    /**
+     * 提交成功后重新上传之前失败的文件：/api/submit 的响应中 media 列出每个媒体文件的服务器ID和上传地址，
+     * 按ID上传的文件由服务器直接绑定到对应的媒体记录（服务器不返回 media 时不重试，下次提交时再上传）
+     */
+    private fun uploadFailedMediaById(
+        serverUrl: String,
+        studentId: String,
+        responseBody: String?,
+        mediaItems: List<MediaItem>
+    ) {
+        val media = try {
+            (gson.fromJson(responseBody, Map::class.java)?.get("media") as? List<*>).orEmpty()
+                .filterIsInstance<Map<*, *>>()
+        } catch (e: Exception) {
+            Log.w(TAG, "解析提交响应中的媒体ID失败: ${e.message}")
+            return
+        }
+        val serverMedia = media.associateBy { it["path"] as? String }
+        mediaItems.forEach { mediaItem ->
+            val entry = serverMedia[mediaItem.path] ?: return@forEach
+            val mediaId = entry["mediaId"] as? String ?: return@forEach
+            val uploadUrl = entry["uploadUrl"] as? String ?: return@forEach
+            val file = File(mediaItem.path)
+            val success = try {
+                uploadMediaFile(serverUrl, studentId, mediaItem, file, mediaId, uploadUrl)
+            } catch (e: Exception) {
+                Log.e(TAG, "按媒体ID上传文件异常: ${file.name}, ${e.message}", e)
+                false
+            }
+            if (success) {
+                markFileAsUploaded(mediaItem.path)
+                Log.d(TAG, "✅ 按媒体ID重新上传成功: ${file.name}")
+            } else {
+                Log.w(TAG, "⚠️ 按媒体ID重新上传失败: ${file.name}，下次提交时再上传")
+            }
+        }
+    }
+    
+    /**
+     * 媒体清单：把本地媒体文件列表（路径和大小）发给服务器，返回需要上传的文件路径（服务器缺少或内容不一致）
+     * 服务器已有的文件同时记为已上传；服务器不支持或请求失败时返回 null
+     */
+    private fun fetchMissingMedia(serverUrl: String, studentId: String, mediaItems: List<MediaItem>): Set<String>? {
+        if (mediaItems.isEmpty()) {
+            return emptySet()
+        }
+        return try {
+            val encodedStudentId = java.net.URLEncoder.encode(studentId, "UTF-8")
+            val body = gson.toJson(mapOf(
+                "files" to mediaItems.map { mapOf("path" to it.path, "size" to File(it.path).length()) }
+            )).toRequestBody("application/json".toMediaType())
+            val request = Request.Builder()
+                .url("$serverUrl/api/student/$encodedStudentId/media/manifest")
+                .post(body)
+                .build()
+            executeWithBusyRetry(request).use { response ->
+                if (!response.isSuccessful) {
+                    Log.w(TAG, "获取媒体清单失败（响应码: ${response.code}），按本地记录判断已上传文件")
+                    return null
+                }
+                val result = gson.fromJson(response.body?.string(), Map::class.java)
+                val missing = (result["missing"] as? List<*>).orEmpty().filterIsInstance<String>()
+                val stale = (result["stale"] as? List<*>).orEmpty().filterIsInstance<String>()
+                val present = (result["present"] as? List<*>).orEmpty().filterIsInstance<String>()
+                present.forEach { uploadedFilesSet.add(it) }
+                (missing + stale).forEach { uploadedFilesSet.remove(it) }
+                saveUploadedFiles()
+                Log.d(TAG, "媒体清单: 服务器已有 ${present.size} 个，缺少 ${missing.size} 个，不一致 ${stale.size} 个")
+                (missing + stale).toSet()
+            }
+        } catch (e: Exception) {
+            Log.w(TAG, "获取媒体清单失败，按本地记录判断已上传文件: ${e.message}")
+            null
+        }
+    }
+    
+    /**
+     * 上传前检查服务器是否已有该内容（HEAD /api/media/blob/<sha256>），有则直接登记为本团队的文件
+     * 返回 false 表示需要正常上传（内容不存在、服务器不支持或请求失败）
+     */
+    private fun linkExistingMedia(
+        serverUrl: String,
+        studentId: String,
+        mediaItem: MediaItem,
+        file: File,
+        sha256: String,
+        mediaId: String? = null
+    ): Boolean {
+        return try {
+            val headRequest = Request.Builder().url("$serverUrl/api/media/blob/$sha256").head().build()
+            val exists = client.newCall(headRequest).execute().use { it.isSuccessful }
+            if (!exists) {
+                return false
+            }
+            
+            val encodedStudentId = java.net.URLEncoder.encode(studentId, "UTF-8")
+            val body = gson.toJson(mapOf(
+                "originalPath" to mediaItem.path,
+                "filename" to file.name,
+                "type" to mediaItem.type.name,
+                "timestamp" to mediaItem.timestamp,
+                "mediaId" to mediaId
+            )).toRequestBody("application/json".toMediaType())
+            val linkRequest = Request.Builder()
+                .url("$serverUrl/api/student/$encodedStudentId/media/blob/$sha256")
+                .post(body)
+                .build()
+            executeWithBusyRetry(linkRequest).use { response ->
+                if (response.isSuccessful) {
+                    Log.d(TAG, "服务器已有相同内容，跳过上传: ${file.name}")
+                }
+                response.isSuccessful
+            }
+        } catch (e: IOException) {
+            Log.w(TAG, "检查服务器已有内容失败，改为上传: ${file.name}, ${e.message}")
+            false
+        }
+    }
+    
+    /**
+     * 查询服务器已接收的字节数（连接中断后确定从哪里继续），查询失败返回 null
+     */
+    private fun queryUploadOffset(uploadUrl: String): Long? {
+        return try {
+            val request = Request.Builder().url(uploadUrl).head().build()
+            client.newCall(request).execute().use { response ->
+                if (response.isSuccessful) response.header("Upload-Offset")?.toLongOrNull() else null
+            }
+        } catch (e: IOException) {
+            Log.w(TAG, "查询上传进度失败: ${e.message}")
+            null
+        }
+    }
+    
+    /**
+     * 计算文件的 SHA-256（十六进制）
+     */
+    private fun sha256Hex(file: File): String {
+        val digest = MessageDigest.getInstance("SHA-256")
+        file.inputStream().use { input ->
+            val buffer = ByteArray(64 * 1024)
+            while (true) {
+                val bytesRead = input.read(buffer)
+                if (bytesRead == -1) break
+                digest.update(buffer, 0, bytesRead)
+            }
+        }
+        return digest.digest().joinToString("") { "%02x".format(it) }
+    }
+    
     /**
      * 加载团队分工数据
      */
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+写请求准入控制（WSGI中间件）
+全班同时点击“提交”时，开发服务器为每个请求开一个线程，所有线程同时争抢 SQLite 写锁、
+在 _execute 的重试循环里退避等待，结果每个人都很慢。
+这里限制同时处理的写请求数，多出的请求在一个短队列里排队；队列已满或排队超时时
+直接返回 503 和 Retry-After（按队列长度和平均处理耗时估算），由客户端稍后重试。
+"""
+
+import math
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable
+
+from werkzeug.wrappers import Response
+
+from config import Config
+from metrics import metrics
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 需要准入控制的请求方法（只读请求不受限制）
+WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+# 平均处理耗时的平滑系数与初始值（秒）
+_EWMA_ALPHA = 0.2
+_INITIAL_SERVICE_TIME = 0.2
+
+
+class AdmissionController:
+    """并发上限 + 有界等待队列"""
+    
+    def __init__(self, max_active: int, max_queue: int, queue_timeout: float):
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._service_time = _INITIAL_SERVICE_TIME
+    
+    def acquire(self) -> bool:
+        """取得一个处理名额；队列已满或排队超时返回 False"""
+        with self._cond:
+            # 有人在排队时新请求也要排队，不能插队
+            if self._active < self.max_active and not self._queued:
+                self._active += 1
+                metrics.inc('admission.admitted')
+                return True
+            if self._queued >= self.max_queue:
+                metrics.inc('admission.rejected')
+                return False
+            
+            self._queued += 1
+            metrics.inc('admission.queued')
+            start = time.monotonic()
+            deadline = start + self.queue_timeout
+            try:
+                while self._active >= self.max_active:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.inc('admission.timedOut')
+                        return False
+                    self._cond.wait(remaining)
+                self._active += 1
+                metrics.inc('admission.admitted')
+                metrics.inc('admission.waitMs', int((time.monotonic() - start) * 1000))
+                return True
+            finally:
+                self._queued -= 1
+    
+    def release(self, service_time: float):
+        """归还名额，并更新平均处理耗时"""
+        with self._cond:
+            self._active -= 1
+            self._service_time += _EWMA_ALPHA * (service_time - self._service_time)
+            # 唤醒所有排队者：只唤醒一个时，它若恰好已经超时就会带着这次唤醒返回，其余排队者等到超时
+            self._cond.notify_all()
+    
+    def retry_after(self) -> int:
+        """建议客户端多少秒后重试：排在前面的请求按当前并发数处理完所需的时间"""
+        with self._cond:
+            backlog = self._active + self._queued + 1
+            seconds = backlog / self.max_active * self._service_time
+        return min(max(1, math.ceil(seconds)), Config.ADMISSION_RETRY_AFTER_MAX)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': self._queued,
+                'maxActive': self.max_active,
+                'maxQueue': self.max_queue,
+                'avgServiceMs': round(self._service_time * 1000, 1),
+            }
+
+
+class _ReleasingIterable:
+    """包装响应体：迭代结束或 close() 时归还名额（以先发生的为准，只归还一次）"""
+    
+    def __init__(self, iterable: Iterable[bytes], release: Callable[[], None]):
+        self._iterable = iterable
+        self._release = release
+    
+    def __iter__(self):
+        try:
+            yield from self._iterable
+        finally:
+            self._release()
+    
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._release()
+
+
+class AdmissionMiddleware:
+    """对指定路径前缀的写请求做准入控制"""
+    
+    def __init__(self, app: Callable, controller: AdmissionController, paths: Iterable[str],
+                 exempt_suffixes: Iterable[str] = (), exempt_segments: Iterable[str] = ()):
+        self.app = app
+        self.controller = controller
+        self.paths = tuple(paths)
+        self.exempt_suffixes = tuple(exempt_suffixes)
+        self.exempt_segments = tuple(exempt_segments)
+    
+    def _applies(self, environ: Dict[str, Any]) -> bool:
+        if environ.get('REQUEST_METHOD', 'GET') not in WRITE_METHODS:
+            return False
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.paths):
+            return False
+        if self.exempt_suffixes and path.endswith(self.exempt_suffixes):
+            return False
+        return not any(segment in path for segment in self.exempt_segments)
+    
+    def __call__(self, environ: Dict[str, Any], start_response: Callable):
+        if not self._applies(environ):
+            return self.app(environ, start_response)
+        
+        if not self.controller.acquire():
+            retry_after = self.controller.retry_after()
+            logger.warning("⚠️ 服务器繁忙，拒绝写请求: %s（%s 秒后重试）", environ.get('PATH_INFO'), retry_after)
+            response = Response(
+                json_codec.dumps_bytes({
+                    'status': 'error',
+                    'message': '服务器繁忙，请稍后重试',
+                    'retryAfter': retry_after
+                }),
+                status=503, mimetype='application/json', headers={'Retry-After': str(retry_after)}
+            )
+            return response(environ, start_response)
+        
+        start = time.perf_counter()
+        released = False
+        
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.controller.release(time.perf_counter() - start)
+        
+        try:
+            # 响应体发送完后才归还名额
+            return _ReleasingIterable(self.app(environ, start_response), release)
+        except Exception:
+            release()
+            raise
+
+
+def create_admission_middleware(app: Callable) -> Callable:
+    """按配置包装 WSGI 应用（未启用时原样返回），并注册准入指标"""
+    if not Config.ADMISSION_ENABLED:
+        return app
+    controller = AdmissionController(Config.ADMISSION_MAX_ACTIVE, Config.ADMISSION_MAX_QUEUE,
+                                     Config.ADMISSION_QUEUE_TIMEOUT)
+    metrics.register_gauge('admission', controller.stats)
+    return AdmissionMiddleware(app, controller, Config.ADMISSION_PATHS, Config.ADMISSION_EXEMPT_SUFFIXES,
+                               Config.ADMISSION_EXEMPT_SEGMENTS)
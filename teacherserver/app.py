@@ -7,35 +7,55 @@
 
 from flask import Flask, request, jsonify, send_file, render_template_string, Response
 from flask_cors import CORS
-import json
 import os
 import socket
 import shutil
 import io
 import csv
+import multiprocessing
 from datetime import datetime
-from typing import Dict, List, Optional
+from urllib.parse import quote
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
-from models import StudentDataPackage, TeacherEvaluation, Menu
+from models import TeacherEvaluation, Menu, STAGE_ORDER, media_id_for
 from storage import DataStorage
+from validation import ValidatedSubmission, validate_stage_patch, validate_summary_patch, submission_team_id
+from parse_pool import ParsedSubmission, ParseTimeout, parse_data, decode_submission
+from stream_parser import PayloadTooLarge, parse_submission_stream
+from resumable_upload import ResumableUploads, UploadError, safe_media_filename
+from media_store import MediaStore, FileTooLarge, ChecksumMismatch
+from ingest import IngestQueue
+from compression import RequestDecompressionMiddleware
+from admission import create_admission_middleware
+from team_locks import team_locks
+from file_writer import file_writer
+from metrics import metrics
+from log_config import setup_logging, set_verbose, logging_status
 from config import Config
+import json_codec
+import msgpack_codec
 from db_init import init_database
 import sqlite3
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志（后台线程输出，见 log_config.py）
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 创建Flask应用
 app = Flask(__name__)
+app.json = json_codec.CodecJSONProvider(app)  # jsonify / get_json 使用统一的JSON编解码
 CORS(app)  # 允许跨域请求
+# 解压 Content-Encoding: gzip / deflate 的请求体
+app.wsgi_app = RequestDecompressionMiddleware(app.wsgi_app, Config.REQUEST_DECOMPRESS_PATHS)
+# 写请求准入控制（最外层：超出并发和队列上限的请求在读取、解压请求体之前就返回 503）
+app.wsgi_app = create_admission_middleware(app.wsgi_app)
 
 # 初始化数据存储
 storage = DataStorage(Config.DATA_DIR, Config.MEDIA_DIR)
+media_store = MediaStore(Config.MEDIA_BLOB_DIR, Config.MEDIA_DIR)
+uploads = ResumableUploads(Config.UPLOAD_TMP_DIR, media_store)
+metrics.register_gauge('resumableUploads', uploads.stats)
 
 
 @app.route('/api/status', methods=['GET'])
@@ -51,130 +71,439 @@ def get_status():
             'port': Config.PORT
         }), 200
     except Exception as e:
-        logger.error(f"获取状态失败: {str(e)}")
+        logger.error("获取状态失败: %s", e)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+def _prepare_submission(data: Any) -> Tuple[Optional[ValidatedSubmission], Optional[str], Optional[Tuple[Dict[str, Any], int]]]:
+    """
+    写入数据库之前的步骤：校验、重复提交检测、归档原始数据
+    data 为解码后的字典，或大请求体在解析进程池中已校验好的 ParsedSubmission
+    返回 (待保存的提交数据, 内容哈希, None)；不需要写数据库时返回 (None, None, (响应字典, HTTP状态码))
+    """
+    parsed = data if isinstance(data, ParsedSubmission) else parse_data(data)
+    if parsed.submission is None:
+        return None, None, ({
+            'status': 'error',
+            'message': parsed.error
+        }, 400)
+    
+    submission = parsed.submission
+    student_id = submission.student_id
+    metrics.inc('submit.received')
+    
+    # 重复提交检测：内容（忽略 exportTime）与上次成功保存的相同时直接确认，不写文件也不写数据库
+    content_hash = None
+    if Config.SUBMIT_DEDUPE and not submission.errors:
+        content_hash = parsed.content_hash
+        if storage.is_unchanged_submission(student_id, content_hash):
+            metrics.inc('submit.accepted')
+            metrics.inc('submit.unchanged')
+            logger.info("⏭️ 提交内容未变化，跳过保存: %s", student_id)
+            return None, None, ({
+                'status': 'success',
+                'studentId': student_id,
+                'message': '数据接收成功（内容未变化）',
+                'unchanged': True,
+                'media': _submission_media(submission)
+            }, 200)
+    
+    # ⭐ 关键修复：立即保存原始 JSON 数据到文件（校验失败也保留原始数据）
+    try:
+        # 每份提交一行摘要，各阶段明细只在诊断模式下输出
+        logger.info("📥 收到学生数据提交: %s, %d 个阶段, %d 个媒体文件", student_id, len(submission.stages),
+                    submission.media_count,
+                    extra={'studentId': student_id, 'stageCount': len(submission.stages),
+                           'mediaCount': submission.media_count})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("数据键: %s", parsed.keys)
+            for stage_name, media_items in submission.stages_media.items():
+                logger.debug("      阶段 %s: %d 个媒体文件", stage_name, len(media_items))
+        if not submission.process:
+            logger.warning("⚠️ processRecord 不存在: %s", student_id)
+        
+        if not student_id:
+            raise ValueError("teamInfo 无效，无法生成学生ID")
+        
+        # 追加到团队的压缩归档（同一秒内的多次提交不会互相覆盖）
+        if parsed.archive_payload is not None:
+            version = storage.archive_compressed_submission(student_id, parsed.archive_payload)
+            logger.debug("✅ 已归档原始 JSON 数据: %s 版本 %d (压缩后 %d 字节)", student_id, version,
+                         len(parsed.archive_payload))
+        else:
+            raw_json = parsed.raw_json
+            version = storage.archive_submission(student_id, raw_json)
+            logger.debug("✅ 已归档原始 JSON 数据: %s 版本 %d (%d 字节)", student_id, version, len(raw_json))
+    
+    except Exception as e:
+        logger.error("保存 JSON 文件失败: %s", e, exc_info=True)
+        # 继续处理，不中断流程
+    
+    if submission.errors:
+        metrics.inc('submit.invalid')
+        logger.error("数据校验失败: %s, %s 个错误: %s",
+                     student_id, len(submission.errors), '; '.join(str(e) for e in submission.errors[:5]))
+        return None, None, ({
+            'status': 'error',
+            'message': f'数据格式错误: {submission.errors[0]}',
+            'errors': [e.to_dict() for e in submission.errors]
+        }, 400)
+    
+    return submission, content_hash, None
+
+
+def _submission_media(submission: ValidatedSubmission) -> List[Dict[str, Any]]:
+    """提交中每个媒体文件的服务器ID和上传地址（客户端按ID上传文件）"""
+    media = []
+    for stage_name, media_items in submission.stages_media.items():
+        for media_item in media_items:
+            media_id = media_item.media_id or media_id_for(submission.student_id, stage_name, media_item.file_path)
+            media.append({
+                'stage': stage_name,
+                'path': media_item.file_path,
+                'mediaId': media_id,
+                'uploadUrl': f"/api/media/{media_id}/upload",
+            })
+    return media
+
+
+def _submission_saved(submission: ValidatedSubmission) -> Tuple[Dict[str, Any], int]:
+    """提交数据写入数据库之后：记录指标和日志，返回 (响应字典, HTTP状态码)"""
+    student_id = submission.student_id
+    metrics.inc('submit.accepted')
+    metrics.inc('submit.saved')
+    
+    # 记录分工信息（如果有）
+    logger.info("✅ 学生数据已保存: %s, %s", student_id, '包含分工信息' if submission.division else '无分工信息')
+    if submission.division and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("   分工详情: %s", submission.division.to_android_dict())
+    
+    return {
+        'status': 'success',
+        'studentId': student_id,
+        'message': '数据接收成功',
+        'media': _submission_media(submission)
+    }, 200
+
+
+def process_submission(data: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    处理一份学生提交数据：保存原始JSON、校验、写入数据库
+    同步提交和异步队列的工作线程共用，返回 (响应字典, HTTP状态码)
+    """
+    submission, content_hash, response = _prepare_submission(data)
+    if response:
+        return response
+    
+    # 保存学生数据到数据库
+    storage.save_submission(submission, content_hash)
+    return _submission_saved(submission)
+
+
+def process_submission_batch(items: List[Any]) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    处理多个团队的提交数据（中继设备批量上传）：逐个校验、归档，
+    再每 Config.BATCH_SUBMIT_GROUP_SIZE 个团队在一个事务中写入数据库。
+    某一组写入失败时整组回滚，再逐个写入，只有出错的那一项失败。
+    返回与 items 一一对应的 [(响应字典, HTTP状态码)]
+    """
+    results: List[Optional[Tuple[Dict[str, Any], int]]] = [None] * len(items)
+    pending: List[Tuple[int, ValidatedSubmission, Optional[str]]] = []
+    for index, data in enumerate(items):
+        if isinstance(data, Exception):
+            # NDJSON 中无法解析的行
+            results[index] = ({'status': 'error', 'message': f'JSON解析失败: {str(data)}'}, 400)
+            continue
+        submission, content_hash, response = _prepare_submission(data)
+        if response:
+            results[index] = response
+        else:
+            pending.append((index, submission, content_hash))
+    
+    group_size = max(1, Config.BATCH_SUBMIT_GROUP_SIZE)
+    for start in range(0, len(pending), group_size):
+        group = pending[start:start + group_size]
+        try:
+            storage.save_submissions([(submission, content_hash) for _, submission, content_hash in group])
+            for index, submission, _ in group:
+                results[index] = _submission_saved(submission)
+        except Exception as e:
+            logger.warning("⚠️ 批量写入失败，改为逐个写入 (%s 个团队): %s", len(group), e)
+            for index, submission, content_hash in group:
+                try:
+                    storage.save_submission(submission, content_hash)
+                    results[index] = _submission_saved(submission)
+                except Exception as item_error:
+                    results[index] = ({
+                        'status': 'error',
+                        'studentId': submission.student_id,
+                        'message': f'服务器错误: {str(item_error)}'
+                    }, 500)
+    
+    return results
+
+
+# 异步提交队列（写日志后立即返回202，由工作线程调用 process_submission；同一团队的连续提交合并写入）
+def _coalesce_key(data: Any) -> str:
+    """异步提交的合并键（团队ID）"""
+    if isinstance(data, ParsedSubmission):
+        return data.submission.student_id if data.submission else ''
+    return submission_team_id(data)
+
+
+ingest_queue = IngestQueue(Config.INGEST_DIR, process_submission, key_func=_coalesce_key, decoder=decode_submission)
+metrics.register_gauge('ingestQueue', ingest_queue.stats)
+
+
+def _wants_async() -> bool:
+    """是否走异步提交：全局开启，或请求头 Prefer: respond-async"""
+    return Config.ASYNC_INGEST or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def _wants_stream_parse() -> bool:
+    """同步提交是否流式解析：请求体长度未知（分块传输）或超过 Config.STREAM_PARSE_MIN_BYTES"""
+    if not Config.STREAM_PARSE_ENABLED:
+        return False
+    return request.content_length is None or request.content_length >= Config.STREAM_PARSE_MIN_BYTES
+
+
+def _payload_too_large():
+    return jsonify({
+        'status': 'error',
+        'message': f'提交数据超过 {Config.MAX_FILE_SIZE // (1024 * 1024)}MB 上限'
+    }), 413
+
+
 @app.route('/api/submit', methods=['POST'])
 def submit_student_data():
     """接收学生端提交的数据"""
     try:
-        # 获取JSON数据
-        data = request.get_json()
+        if _wants_async():
+            # 异步：只追加日志并入队（一次顺序写），处理结果通过 /api/submit/<job_id> 查询
+            payload = request.get_data()
+            if not payload:
+                return jsonify({
+                    'status': 'error',
+                    'message': '未收到数据'
+                }), 400
+            
+            payload_format = 'msgpack' if msgpack_codec.is_msgpack(request.content_type) else 'json'
+            job_id = ingest_queue.submit(payload, payload_format)
+            logger.info("📥 提交已入队: %s (%s 字节)", job_id, len(payload))
+            response = jsonify({
+                'status': 'accepted',
+                'jobId': job_id,
+                'statusUrl': f'/api/submit/{job_id}',
+                'message': '数据已接收，正在后台处理'
+            })
+            response.headers['Location'] = f'/api/submit/{job_id}'
+            response.headers['Preference-Applied'] = 'respond-async'
+            return response, 202
+        
+        # 同步：按 Content-Type 解码（JSON 或 MessagePack）并立即处理
+        payload_format = 'msgpack' if msgpack_codec.is_msgpack(request.content_type) else 'json'
+        if request.content_length is not None and request.content_length > Config.MAX_FILE_SIZE:
+            # 声明的长度已经超过上限，不读取请求体
+            return _payload_too_large()
+        if payload_format == 'json' and _wants_stream_parse():
+            # 大JSON请求体边读边解析，不缓存整个请求体
+            try:
+                data = parse_submission_stream(request.stream)
+            except PayloadTooLarge:
+                return _payload_too_large()
+            except ValueError as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'JSON解析失败: {str(e)}'
+                }), 400
+            metrics.inc('submit.streamParsed')
+            result, code = process_submission(data)
+            return jsonify(result), code
         
-        if not data:
+        # 其余请求体整体读取，大请求体在解析进程池中解码和校验
+        payload = request.get_data()
+        try:
+            data = decode_submission(payload, payload_format) if payload else None
+        except ValueError as e:
             return jsonify({
                 'status': 'error',
-                'message': '未收到数据'
+                'message': f"{'MessagePack' if payload_format == 'msgpack' else 'JSON'}解析失败: {str(e)}"
             }), 400
-        
-        # 验证数据格式
-        if 'teamInfo' not in data:
+        except ParseTimeout as e:
+            response = jsonify({
+                'status': 'error',
+                'message': f'{str(e)}，服务器繁忙，请稍后重试'
+            })
+            response.headers['Retry-After'] = str(Config.ADMISSION_RETRY_AFTER_MAX)
+            return response, 503
+        result, code = process_submission(data)
+        return jsonify(result), code
+    
+    except Exception as e:
+        logger.error("处理提交失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': f'服务器错误: {str(e)}'
+        }), 500
+
+
+# 逐行JSON（NDJSON）请求体的 Content-Type
+NDJSON_CONTENT_TYPES = frozenset({'application/x-ndjson', 'application/ndjson'})
+
+
+def _read_ndjson_items(stream) -> List[Any]:
+    """
+    逐行读取 NDJSON 请求体（不缓存整个请求体）；单行解析失败时该项为异常对象，作为单项失败返回
+    累计超过 Config.MAX_FILE_SIZE 时抛出 PayloadTooLarge
+    """
+    items: List[Any] = []
+    remaining = Config.MAX_FILE_SIZE
+    while True:
+        line = stream.readline(remaining + 1)
+        if not line:
+            return items
+        remaining -= len(line)
+        if remaining < 0:
+            raise PayloadTooLarge()
+        if not line.strip():
+            continue
+        try:
+            items.append(json_codec.loads(line))
+        except ValueError as e:
+            items.append(e)
+        if len(items) > Config.BATCH_SUBMIT_MAX_ITEMS:
+            return items  # 已超过条数上限，由调用方返回 413，不再读取
+
+
+def _read_batch_items() -> List[Any]:
+    """
+    解析批量提交的请求体：JSON数组、MessagePack数组，或每行一个JSON对象（NDJSON，逐行读取）
+    整体格式错误时抛出 ValueError，超过大小上限时抛出 PayloadTooLarge
+    """
+    if request.content_length is not None and request.content_length > Config.MAX_FILE_SIZE:
+        raise PayloadTooLarge()
+    content_type = (request.content_type or '').split(';', 1)[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        return _read_ndjson_items(request.stream)
+    
+    body = request.get_data()
+    items = msgpack_codec.unpackb(body) if msgpack_codec.is_msgpack(content_type) else json_codec.loads(body)
+    if not isinstance(items, list):
+        raise ValueError('请求体必须是提交数据的数组')
+    return items
+
+
+@app.route('/api/submit/batch', methods=['POST'])
+def submit_student_data_batch():
+    """接收中继设备一次上传的多个团队的提交数据，逐项返回处理结果"""
+    try:
+        try:
+            items = _read_batch_items()
+        except PayloadTooLarge:
+            return _payload_too_large()
+        except ValueError as e:
             return jsonify({
                 'status': 'error',
-                'message': '缺少团队信息'
+                'message': f'数据解析失败: {str(e)}'
             }), 400
         
-        # ⭐ 关键修复：立即检查并保存原始 JSON 数据到文件
-        try:
-            # 生成学生ID
-            team_info = data.get('teamInfo', {})
-            student_id = f"{team_info.get('school', '')}_{team_info.get('grade', '')}_{team_info.get('className', '')}_{team_info.get('stoveNumber', '')}"
-            
-            # 立即检查接收到的数据
-            logger.info("=" * 60)
-            logger.info("收到学生数据提交")
-            logger.info(f"学生ID: {student_id}")
-            logger.info(f"数据键: {list(data.keys())}")
-            
-            process_record = data.get('processRecord')
-            if process_record:
-                logger.info(f"✅ processRecord 存在")
-                logger.info(f"   processRecord 的键: {list(process_record.keys())}")
-                has_stages = 'stages' in process_record
-                logger.info(f"   包含 stages 字段: {has_stages}")
-                if has_stages:
-                    stages = process_record.get('stages', {})
-                    logger.info(f"   stages 数量: {len(stages)}")
-                    total_media = 0
-                    for stage_name, stage_data in stages.items():
-                        media_items = stage_data.get('mediaItems', [])
-                        if not media_items:
-                            media_items = stage_data.get('media_items', [])
-                        media_count = len(media_items) if media_items else 0
-                        total_media += media_count
-                        if media_count > 0:
-                            logger.info(f"      阶段 {stage_name}: {media_count} 个媒体文件")
-                    logger.info(f"   总计: {total_media} 个媒体文件")
-                else:
-                    logger.warning(f"   ⚠️ processRecord 中没有 stages 字段！")
-            else:
-                logger.warning("⚠️ processRecord 不存在")
-            logger.info("=" * 60)
-            
-            # 创建学生数据目录
-            student_dir = os.path.join(Config.DATA_DIR, student_id)
-            os.makedirs(student_dir, exist_ok=True)
-            
-            # 保存原始 JSON 数据（带时间戳）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            json_filename = f'data_{timestamp}.json'
-            json_path = os.path.join(student_dir, json_filename)
-            
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # 同时保存为 latest.json（覆盖）
-            latest_json_path = os.path.join(student_dir, 'latest.json')
-            with open(latest_json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"✅ 已保存原始 JSON 数据: {json_path}")
-            logger.info(f"   包含 stages: {'stages' in data.get('processRecord', {})}")
-            
-        except Exception as e:
-            logger.error(f"保存 JSON 文件失败: {str(e)}", exc_info=True)
-            # 继续处理，不中断流程
-        
-        # 解析数据包
-        try:
-            data_package = StudentDataPackage.from_dict(data)
-        except Exception as e:
-            logger.error(f"数据解析失败: {str(e)}")
+        if not items:
             return jsonify({
                 'status': 'error',
-                'message': f'数据格式错误: {str(e)}'
+                'message': '未收到数据'
             }), 400
+        if len(items) > Config.BATCH_SUBMIT_MAX_ITEMS:
+            return jsonify({
+                'status': 'error',
+                'message': f'单次最多提交 {Config.BATCH_SUBMIT_MAX_ITEMS} 个团队'
+            }), 413
         
-        # 保存学生数据到数据库
-        student_id = storage.save_student_data(data_package)
+        results = process_submission_batch(items)
+        accepted = sum(1 for _, code in results if code == 200)
+        failed = len(results) - accepted
+        metrics.inc('submit.batches')
+        logger.info("📥 批量提交: %d 个团队, 成功 %d 个, 失败 %d 个", len(results), accepted, failed)
         
-        # 记录分工信息（如果有）
-        if data_package.teamDivision:
-            logger.info(f"✅ 收到学生数据: {student_id}, 包含分工信息")
-            try:
-                # 使用 to_android_dict() 避免 team_id 问题
-                division_info = data_package.teamDivision.to_android_dict()
-                logger.info(f"   分工详情: {division_info}")
-            except Exception as e:
-                logger.warning(f"   记录分工信息失败: {str(e)}")
-        else:
-            logger.info(f"✅ 收到学生数据: {student_id}, 无分工信息")
+        # 全部成功 200，部分成功 207，全部失败 422（中继设备不能把整批失败当作已送达）
+        code = 200 if not failed else (207 if accepted else 422)
+        return jsonify({
+            'status': 'success' if not failed else ('partial' if accepted else 'error'),
+            'total': len(results),
+            'accepted': accepted,
+            'failed': failed,
+            'results': [{'index': index, 'httpStatus': item_code, **result}
+                        for index, (result, item_code) in enumerate(results)]
+        }), code
+    
+    except Exception as e:
+        logger.error("处理批量提交失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': f'服务器错误: {str(e)}'
+        }), 500
+
+
+@app.route('/api/submit/<job_id>', methods=['GET'])
+def get_submit_job(job_id: str):
+    """查询异步提交任务的处理状态"""
+    try:
+        job = ingest_queue.get_job(job_id)
+        if not job:
+            return jsonify({
+                'status': 'error',
+                'message': '任务不存在或已过期'
+            }), 404
         
         return jsonify({
             'status': 'success',
-            'studentId': student_id,
-            'message': '数据接收成功'
+            'job': job
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"处理提交失败: {str(e)}", exc_info=True)
+        logger.error("查询提交任务失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'服务器错误: {str(e)}'
         }), 500
 
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """获取服务器运行指标（提交去重率、队列长度等）"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'metrics': metrics.snapshot()
+        }), 200
+    except Exception as e:
+        logger.error("获取运行指标失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/logging', methods=['GET'])
+def get_logging_status():
+    """获取日志配置和丢弃、采样、限流的条数"""
+    return jsonify({'status': 'success', 'logging': logging_status()}), 200
+
+
+@app.route('/api/logging', methods=['PUT'])
+def update_logging():
+    """切换诊断模式：{"verbose": true} 输出 DEBUG 日志且不采样"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('verbose'), bool):
+            return jsonify({
+                'status': 'error',
+                'message': 'verbose 必须是布尔值'
+            }), 400
+        set_verbose(data['verbose'])
+        logger.warning("⚠️ 诊断日志已%s", '打开' if data['verbose'] else '关闭')
+        return jsonify({'status': 'success', 'logging': logging_status()}), 200
+    except Exception as e:
+        logger.error("修改日志配置失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @app.route('/api/submit_menu', methods=['POST'])
 def submit_menu():
     """接收学生端提交的菜单数据"""
@@ -205,7 +534,7 @@ def submit_menu():
         team_info = data.get('teamInfo', {})
         team_id = f"{team_info.get('school', '')}_{team_info.get('grade', '')}_{team_info.get('className', '')}_{team_info.get('stoveNumber', '')}"
         
-        logger.info(f"收到菜单数据提交: {team_id}")
+        logger.info("收到菜单数据提交: %s", team_id)
         
         # 解析菜单数据
         menu_data = data.get('menuData', {})
@@ -213,20 +542,18 @@ def submit_menu():
         menu.team_id = team_id
         
         # 保存菜单到数据库（如果已存在则覆盖）
-        from db_manager import DatabaseManager
-        db_manager = DatabaseManager()
-        db_manager.save_menu(menu)
+        storage.save_menu(menu)
         
-        logger.info(f"✅ 菜单已保存: {team_id}, 汤: {menu.soup}, 菜数: {len(menu.dishes)}")
+        logger.info("✅ 菜单已保存: %s, 汤: %s, 菜数: %s", team_id, menu.soup, len(menu.dishes))
         
         return jsonify({
             'status': 'success',
             'teamId': team_id,
             'message': '菜单保存成功'
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"处理菜单提交失败: {str(e)}", exc_info=True)
+        logger.error("处理菜单提交失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'服务器错误: {str(e)}'
@@ -245,7 +572,7 @@ def get_students():
             stage_ratings = student.get('stageRatings', {})
             # 调试：记录评分数据
             if stage_ratings:
-                logger.debug(f"学生 {student['id']} 的评分数据: {stage_ratings}")
+                logger.debug("学生 %s 的评分数据: %s", student['id'], stage_ratings)
             
             result.append({
                 'id': student['id'],
@@ -271,9 +598,9 @@ def get_students():
             'students': result,
             'count': len(result)
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取学生列表失败: {str(e)}", exc_info=True)
+        logger.error("获取学生列表失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -296,9 +623,127 @@ def get_student_data(student_id: str):
             'status': 'success',
             'data': student_data
         }), 200
+    
+    except Exception as e:
+        logger.error("获取学生数据失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+def _patch_error(errors) -> Tuple[Response, int]:
+    return jsonify({
+        'status': 'error',
+        'message': f'数据格式错误: {errors[0]}',
+        'errors': [e.to_dict() for e in errors]
+    }), 400
+
+
+@app.route('/api/student/<student_id>/stage/<stage_name>', methods=['PATCH'])
+def patch_student_stage(student_id: str, stage_name: str):
+    """
+    更新单个阶段记录（只需发送修改的字段，如 notes / selfRating / isCompleted）
+    请求中包含 mediaItems 时同时更新该阶段的媒体文件列表；阶段不存在时自动创建
+    """
+    try:
+        fields, media_items, errors = validate_stage_patch(stage_name, request.get_json(silent=True))
+        if errors:
+            return _patch_error(errors)
         
+        stage = storage.update_stage(student_id, stage_name, fields, media_items)
+        if stage is None:
+            return jsonify({
+                'status': 'error',
+                'message': '学生数据不存在'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'studentId': student_id,
+            'stage': stage
+        }), 200
+    
     except Exception as e:
-        logger.error(f"获取学生数据失败: {str(e)}", exc_info=True)
+        logger.error("更新阶段记录失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/student/<student_id>/summary', methods=['PATCH'])
+def patch_student_summary(student_id: str):
+    """更新课后总结（只需发送修改的回答，如 answer2）"""
+    try:
+        fields, errors = validate_summary_patch(request.get_json(silent=True))
+        if errors:
+            return _patch_error(errors)
+        
+        summary = storage.update_summary(student_id, fields)
+        if summary is None:
+            return jsonify({
+                'status': 'error',
+                'message': '学生数据不存在'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'studentId': student_id,
+            'summaryData': summary
+        }), 200
+    
+    except Exception as e:
+        logger.error("更新课后总结失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/student/<student_id>/submissions', methods=['GET'])
+def get_submission_versions(student_id: str):
+    """获取学生原始提交的所有版本（版本号、时间、压缩后大小）"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'studentId': student_id,
+            'versions': storage.get_submission_versions(student_id)
+        }), 200
+    
+    except Exception as e:
+        logger.error("获取提交版本失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/student/<student_id>/submissions/<version>', methods=['GET'])
+def get_raw_submission(student_id: str, version: str):
+    """获取某个版本的原始提交数据（version 为版本号或 latest）"""
+    try:
+        if version != 'latest' and not version.isdigit():
+            return jsonify({
+                'status': 'error',
+                'message': '版本号无效'
+            }), 400
+        
+        submission = storage.get_raw_submission(student_id, None if version == 'latest' else int(version))
+        if submission is None:
+            return jsonify({
+                'status': 'error',
+                'message': '提交版本不存在'
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'studentId': student_id,
+            **submission
+        }), 200
+    
+    except Exception as e:
+        logger.error("读取原始提交失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -315,9 +760,9 @@ def get_student_evaluation(student_id: str):
             'status': 'success',
             'evaluations': evaluations
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取评价失败: {str(e)}", exc_info=True)
+        logger.error("获取评价失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -360,15 +805,15 @@ def save_student_evaluation(student_id: str):
         # 保存评价
         storage.save_student_evaluation(student_id, evaluation)
         
-        logger.info(f"✅ 保存评价: {student_id} - {evaluation.stage_name}")
+        logger.info("✅ 保存评价: %s - %s", student_id, evaluation.stage_name)
         
         return jsonify({
             'status': 'success',
             'message': '评价保存成功'
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"保存评价失败: {str(e)}", exc_info=True)
+        logger.error("保存评价失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -382,18 +827,18 @@ def get_evaluation_teams():
         # 获取分页参数
         page = request.args.get('page', 1, type=int)
         page_size = request.args.get('page_size', 5, type=int)
-
+        
         # 限制每页数量范围（1-20）
         page_size = max(1, min(page_size, 20))
-
+        
         result = storage.get_all_evaluation_teams(page=page, page_size=page_size)
-
+        
         return jsonify({
             'status': 'success',
             **result  # 包含 teams 和 pagination
         }), 200
     except Exception as e:
-        logger.error(f"获取评价团队列表失败: {str(e)}", exc_info=True)
+        logger.error("获取评价团队列表失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -423,7 +868,7 @@ def save_evaluation():
         team_name = data.get('teamName', team_id)
         evaluations = data.get('evaluations', {})
         
-        logger.info(f"收到评价保存请求（V2）: team_id={team_id}, 评价环节数={len(evaluations)}")
+        logger.info("收到评价保存请求（V2）: team_id=%s, 评价环节数=%s", team_id, len(evaluations))
         
         # 准备评价数据（JSON格式）
         evaluation_data = {
@@ -453,9 +898,9 @@ def save_evaluation():
                 'status': 'error',
                 'message': '保存评价失败'
             }), 500
-        
+    
     except Exception as e:
-        logger.error(f"保存评价失败: {str(e)}", exc_info=True)
+        logger.error("保存评价失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'服务器错误: {str(e)}'
@@ -499,9 +944,9 @@ def get_evaluation(team_id: str):
             'teamId': team_id,
             'evaluations': {}
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取评价失败: {str(e)}", exc_info=True)
+        logger.error("获取评价失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -541,7 +986,7 @@ def upload_evaluation_media(student_id: str):
         file_path = os.path.join(evaluation_media_dir, safe_filename)
         file.save(file_path)
         
-        logger.info(f"✅ 上传评价媒体文件成功: {student_id}/evaluations/{evaluation_stage}/{safe_filename}")
+        logger.info("✅ 上传评价媒体文件成功: %s/evaluations/%s/%s", student_id, evaluation_stage, safe_filename)
         
         return jsonify({
             'status': 'success',
@@ -549,9 +994,9 @@ def upload_evaluation_media(student_id: str):
             'file_type': file_type,
             'message': '文件上传成功'
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"上传评价媒体文件失败: {str(e)}", exc_info=True)
+        logger.error("上传评价媒体文件失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -572,9 +1017,119 @@ def get_evaluation_media(student_id: str, filename: str):
             }), 404
         
         return send_file(file_path)
-        
+    
     except Exception as e:
-        logger.error(f"获取评价媒体文件失败: {str(e)}", exc_info=True)
+        logger.error("获取评价媒体文件失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+def _register_uploaded_media(student_id: str, original_path: str, safe_filename: str,
+                             sha256: str, file_size: int, file_type: str, media_id: Optional[str] = None) -> int:
+    """
+    媒体文件上传完成后，记录文件的内容哈希，并按服务器ID把文件绑定到媒体记录，返回绑定的记录数
+    团队媒体目录中同名的文件只有一份，同一文件在其他阶段的记录（ID 由团队、阶段和文件名算出）一并绑定；
+    旧版本客户端不提供 media_id，只按算出的ID绑定（先上传、后提交时为 0，提交时再绑定）。
+    写入失败时抛出异常，由调用方返回错误，客户端会重新上传
+    """
+    db_manager = storage.db_manager
+    media_ids = {media_id_for(student_id, stage_name, original_path or safe_filename) for stage_name in STAGE_ORDER}
+    if media_id:
+        media_ids.add(media_id)
+    # 与该团队的重新提交互斥
+    with team_locks.lock(student_id), db_manager.transaction():
+        db_manager.save_media_ref(student_id, safe_filename, sha256, file_size, file_type)
+        bound = db_manager.bind_uploaded_media(media_ids, f"{student_id}/{safe_filename}", file_size)
+    logger.debug("   已绑定媒体记录: %s -> %s (%d 条)", original_path or media_id, safe_filename, bound)
+    return bound
+
+
+def _save_uploaded_media(student_id: str, original_path: str, file_type: str, media_id: Optional[str] = None):
+    """保存 multipart 请求中的媒体文件（file 字段）并绑定到媒体记录，返回响应"""
+    # multipart 请求体包含表单字段，留出 1MB 余量
+    if request.content_length is not None and request.content_length > Config.MAX_FILE_SIZE + 1024 * 1024:
+        return jsonify({
+            'status': 'error',
+            'message': f'文件超过 {Config.MAX_FILE_SIZE // (1024 * 1024)}MB 上限'
+        }), 413
+    
+    if 'file' not in request.files:
+        logger.warning("❌ 上传请求中没有 'file' 字段: %s, 可用的文件字段: %s", student_id,
+                       list(request.files.keys()))
+        return jsonify({
+            'status': 'error',
+            'message': '没有文件'
+        }), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        logger.warning("❌ 上传的文件名为空: %s", student_id)
+        return jsonify({
+            'status': 'error',
+            'message': '文件名为空'
+        }), 400
+    
+    logger.debug("文件信息: 文件名=%s, 原始路径=%s, 文件类型=%s, 媒体ID=%s",
+                 file.filename, original_path, file_type, media_id)
+    
+    # 生成安全的文件名（优先使用原始路径中的文件名）
+    safe_filename = safe_media_filename(original_path, file.filename)
+    
+    # 按内容保存（边读边计算 SHA-256，相同内容只存一份；客户端提供了 SHA-256 时校验，传输中损坏的文件不保存）
+    try:
+        stored = media_store.save_stream(file.stream, student_id, safe_filename,
+                                         expected_sha256=request.form.get('sha256') or None)
+    except FileTooLarge as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 413
+    except ChecksumMismatch as e:
+        logger.warning("❌ 上传的文件校验失败: %s", student_id)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 422
+    logger.debug("文件已保存: %s, 大小: %d 字节, sha256=%s", stored.path, stored.size, stored.sha256)
+    
+    bound = _register_uploaded_media(student_id, original_path, safe_filename, stored.sha256, stored.size,
+                                     file_type, media_id)
+    
+    logger.info("✅ 上传媒体文件成功: %s/%s (%s, %d 字节%s)", student_id, safe_filename, file_type, stored.size,
+                '，内容已存在' if stored.deduplicated else '',
+                extra={'studentId': student_id, 'mediaFile': safe_filename, 'mediaType': file_type,
+                       'size': stored.size, 'sha256': stored.sha256})
+    
+    response = {
+        'status': 'success',
+        'filename': safe_filename,
+        'sha256': stored.sha256,
+        'bound': bound,
+        'message': '文件上传成功'
+    }
+    if media_id:
+        response['mediaId'] = media_id
+        response['url'] = f"/api/media/{media_id}"
+    return jsonify(response), 200
+
+
+@app.route('/api/media/<media_id>/upload', methods=['POST'])
+def upload_media_by_id(media_id: str):
+    """按服务器ID上传媒体文件（ID 和上传地址由 /api/submit 的响应返回）"""
+    try:
+        found = storage.db_manager.get_media_item(media_id)
+        if not found:
+            return jsonify({
+                'status': 'error',
+                'message': '媒体记录不存在（请先提交数据）'
+            }), 404
+        media_item, student_id = found
+        return _save_uploaded_media(student_id, media_item.file_path, media_item.file_type, media_id)
+    
+    except Exception as e:
+        logger.error("上传媒体文件失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -583,92 +1138,307 @@ def get_evaluation_media(student_id: str, filename: str):
 
 @app.route('/api/student/<student_id>/media/upload', methods=['POST'])
 def upload_media_file(student_id: str):
-    """上传媒体文件（照片/视频）"""
+    """上传媒体文件（照片/视频；旧版本客户端按原始路径上传）"""
     try:
-        # 记录所有上传请求（包括失败的）
-        logger.info("=" * 60)
-        logger.info(f"收到文件上传请求: student_id={student_id}")
-        logger.info(f"请求方法: {request.method}")
-        logger.info(f"Content-Type: {request.content_type}")
-        logger.info(f"请求文件: {list(request.files.keys())}")
-        logger.info(f"请求表单: {list(request.form.keys())}")
+        # 请求明细只在诊断模式下输出（上传请求数量与媒体文件数量相同）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("收到文件上传请求: student_id=%s, Content-Type=%s, 文件=%s, 表单=%s", student_id,
+                         request.content_type, list(request.files.keys()), list(request.form.keys()))
         
-        if 'file' not in request.files:
-            logger.warning("❌ 上传请求中没有 'file' 字段")
-            logger.warning(f"   可用的文件字段: {list(request.files.keys())}")
+        original_path = request.form.get('original_path', '')  # Android端的原始路径
+        file_type = request.form.get('type', 'PHOTO')  # PHOTO 或 VIDEO
+        return _save_uploaded_media(student_id, original_path, file_type, request.form.get('media_id') or None)
+    
+    except Exception as e:
+        logger.error("上传媒体文件失败: %s", e, exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+def _media_id_belongs_to(student_id: str, media_id: Optional[str]) -> bool:
+    """客户端提供的服务器ID是否属于该团队（未提供时为 True）"""
+    if not media_id:
+        return True
+    found = storage.db_manager.get_media_item(media_id)
+    return found is not None and found[1] == student_id
+
+
+def _upload_error(e: UploadError):
+    response = jsonify({'status': 'error', 'message': e.message, 'offset': e.offset})
+    if e.offset is not None:
+        response.headers['Upload-Offset'] = str(e.offset)
+    return response, e.status
+
+
+def _upload_url(student_id: str, upload_id: str) -> str:
+    return f"/api/student/{quote(student_id)}/media/uploads/{upload_id}"
+
+
+@app.route('/api/student/<student_id>/media/uploads', methods=['POST'])
+def create_media_upload(student_id: str):
+    """
+    创建可续传上传：{"originalPath", "type", "timestamp", "size"}
+    同一文件的上传已存在时返回已接收的字节数（offset），客户端从该位置继续
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
             return jsonify({
                 'status': 'error',
-                'message': '没有文件'
+                'message': '请求体必须是JSON对象'
             }), 400
+        try:
+            size = int(data.get('size'))
+            timestamp = int(data.get('timestamp') or 0)
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'size 和 timestamp 必须是整数'
+            }), 400
+        original_path = str(data.get('originalPath') or '')
+        media_id = data.get('mediaId') or None
+        if not _media_id_belongs_to(student_id, media_id):
+            return jsonify({
+                'status': 'error',
+                'message': '媒体记录不存在（请先提交数据）'
+            }), 404
         
-        file = request.files['file']
-        if file.filename == '':
-            logger.warning("❌ 上传的文件名为空")
+        state, created = uploads.create(student_id, original_path, str(data.get('filename') or ''),
+                                        str(data.get('type') or 'PHOTO'), timestamp, size, media_id)
+        upload_url = _upload_url(student_id, state['uploadId'])
+        response = jsonify({'status': 'success', **state, 'uploadUrl': upload_url})
+        response.headers['Location'] = upload_url
+        response.headers['Upload-Offset'] = str(state['offset'])
+        return response, 201 if created else 200
+    
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        logger.error("创建上传失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/student/<student_id>/media/uploads/<upload_id>', methods=['HEAD', 'GET'])
+def get_media_upload(student_id: str, upload_id: str):
+    """查询上传已接收的字节数（响应头 Upload-Offset / Upload-Length）"""
+    try:
+        state = uploads.status(student_id, upload_id)
+        response = jsonify({'status': 'success', **state})
+        response.headers['Upload-Offset'] = str(state['offset'])
+        response.headers['Upload-Length'] = str(state['size'])
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 200
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        logger.error("查询上传失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/student/<student_id>/media/uploads/<upload_id>', methods=['PATCH'])
+def append_media_upload(student_id: str, upload_id: str):
+    """追加一段数据：请求头 Upload-Offset 为这段数据的起始位置，请求体为文件内容"""
+    try:
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': '缺少 Upload-Offset 请求头'
+            }), 400
+        new_offset = uploads.append(student_id, upload_id, offset, request.stream, request.content_length)
+        response = jsonify({'status': 'success', 'offset': new_offset})
+        response.headers['Upload-Offset'] = str(new_offset)
+        return response, 200
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        logger.error("追加上传数据失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/student/<student_id>/media/uploads/<upload_id>/complete', methods=['POST'])
+def complete_media_upload(student_id: str, upload_id: str):
+    """完成上传：校验大小和 SHA-256（{"sha256": ...}，可选）后移动到媒体目录"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = uploads.finalize(student_id, upload_id, data.get('sha256') if isinstance(data, dict) else None)
+        bound = _register_uploaded_media(student_id, result['originalPath'], result['filename'], result['sha256'],
+                                         result['size'], result['type'], result.get('mediaId'))
+        logger.info("✅ 上传媒体文件成功（可续传）: %s/%s (%s, %d 字节)", student_id, result['filename'],
+                    result['type'], result['size'],
+                    extra={'studentId': student_id, 'mediaFile': result['filename'], 'mediaType': result['type'],
+                           'size': result['size']})
+        return jsonify({
+            'status': 'success',
+            'filename': result['filename'],
+            'size': result['size'],
+            'sha256': result['sha256'],
+            'bound': bound,
+            'message': '文件上传成功'
+        }), 200
+    except UploadError as e:
+        return _upload_error(e)
+    except Exception as e:
+        logger.error("完成上传失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/media/blob/<sha256>', methods=['GET', 'HEAD'])
+def get_media_blob(sha256: str):
+    """
+    按内容哈希获取媒体文件；客户端上传前用 HEAD 检查服务器是否已有该内容（200 已有，404 需要上传）
+    """
+    try:
+        sha256 = sha256.lower()
+        if media_store.blob_size(sha256) is None:
+            return jsonify({
+                'status': 'error',
+                'message': '内容不存在'
+            }), 404
+        metrics.inc('media.preflightHits' if request.method == 'HEAD' else 'media.blobReads')
+        response = send_file(media_store.blob_path(sha256), conditional=True, etag=sha256, max_age=31536000)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+    except Exception as e:
+        logger.error("获取媒体内容失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/student/<student_id>/media/blob/<sha256>', methods=['POST'])
+def link_media_blob(student_id: str, sha256: str):
+    """
+    服务器已有该内容时登记团队的媒体文件，不需要再上传：{"mediaId", "originalPath", "filename", "type", "timestamp"}
+    内容不存在（如已被清理）时返回 404，客户端改为正常上传
+    """
+    try:
+        sha256 = sha256.lower()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                'status': 'error',
+                'message': '请求体必须是JSON对象'
+            }), 400
+        original_path = str(data.get('originalPath') or '')
+        file_type = str(data.get('type') or 'PHOTO')
+        media_id = data.get('mediaId') or None
+        safe_filename = safe_media_filename(original_path, str(data.get('filename') or ''))
+        if not safe_filename:
             return jsonify({
                 'status': 'error',
                 'message': '文件名为空'
             }), 400
+        if not _media_id_belongs_to(student_id, media_id):
+            return jsonify({
+                'status': 'error',
+                'message': '媒体记录不存在（请先提交数据）'
+            }), 404
         
-        # 获取文件信息
-        original_path = request.form.get('original_path', '')  # Android端的原始路径
-        file_type = request.form.get('type', 'PHOTO')  # PHOTO 或 VIDEO
-        timestamp = request.form.get('timestamp', '0')
-        
-        logger.info(f"文件信息:")
-        logger.info(f"   文件名: {file.filename}")
-        logger.info(f"   原始路径: {original_path}")
-        logger.info(f"   文件类型: {file_type}")
-        logger.info(f"   时间戳: {timestamp}")
-        
-        # 创建学生媒体目录
-        student_media_dir = os.path.join(Config.MEDIA_DIR, student_id)
-        os.makedirs(student_media_dir, exist_ok=True)
-        logger.info(f"媒体目录: {student_media_dir}")
-        
-        # 生成安全的文件名（使用原始文件名或时间戳）
-        if original_path:
-            # 从原始路径提取文件名
-            safe_filename = os.path.basename(original_path)
-        else:
-            # 使用上传的文件名
-            safe_filename = file.filename
-        
-        # 确保文件名安全
-        safe_filename = safe_filename.replace('..', '').replace('/', '').replace('\\', '')
-        
-        file_path = os.path.join(student_media_dir, safe_filename)
-        logger.info(f"保存路径: {file_path}")
-        
-        # 保存文件
-        file.save(file_path)
-        logger.info(f"文件已保存，大小: {os.path.getsize(file_path)} 字节")
-        
-        # 更新数据库中的文件路径（如果存在）
+        file_size = media_store.blob_size(sha256)
+        if file_size is None:
+            return jsonify({
+                'status': 'error',
+                'message': '内容不存在，请上传文件'
+            }), 404
         try:
-            from db_manager import DatabaseManager
-            db_manager = DatabaseManager()
-            # 查找使用原始路径的记录并更新为服务器端路径
-            db_manager._execute(
-                "UPDATE media_items SET file_path = ? WHERE file_path = ?",
-                (safe_filename, original_path)
-            )
-            logger.info(f"   已更新数据库路径: {original_path} -> {safe_filename}")
-        except Exception as e:
-            logger.warning(f"   更新数据库路径失败: {str(e)}")
-        
-        logger.info(f"✅ 上传媒体文件成功: {student_id}/{safe_filename}")
-        logger.info(f"   原始路径: {original_path}")
-        logger.info(f"   文件类型: {file_type}")
-        logger.info(f"   文件大小: {os.path.getsize(file_path)} 字节")
-        
+            media_store.link(sha256, student_id, safe_filename)
+        except FileNotFoundError:
+            return jsonify({
+                'status': 'error',
+                'message': '内容不存在，请上传文件'
+            }), 404
+        metrics.inc('media.dedupHits')
+        metrics.inc('media.bytesSaved', file_size)
+        bound = _register_uploaded_media(student_id, original_path, safe_filename, sha256, file_size, file_type,
+                                         media_id)
+        
+        logger.info("✅ 媒体文件内容已存在，跳过上传: %s/%s (%s, %d 字节)", student_id, safe_filename, file_type,
+                    file_size, extra={'studentId': student_id, 'mediaFile': safe_filename, 'mediaType': file_type,
+                                      'size': file_size, 'sha256': sha256})
         return jsonify({
             'status': 'success',
             'filename': safe_filename,
-            'message': '文件上传成功'
+            'sha256': sha256,
+            'bound': bound,
+            'message': '文件已存在，无需上传'
         }), 200
+    
+    except Exception as e:
+        logger.error("登记媒体文件失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/student/<student_id>/media/manifest', methods=['POST'])
+def check_media_manifest(student_id: str):
+    """
+    媒体文件清单：客户端提交本地媒体文件列表 {"files": [{"path", "size", "sha256"}]}（size、sha256 可选），
+    服务器返回其中需要上传的文件（missing：服务器没有；stale：同名文件大小或内容不一致）和已有的文件（present）
+    """
+    try:
+        data = request.get_json(silent=True)
+        files = data.get('files') if isinstance(data, dict) else None
+        if not isinstance(files, list):
+            return jsonify({
+                'status': 'error',
+                'message': '请求体必须是 {"files": [...]}'
+            }), 400
+        if len(files) > Config.MEDIA_MANIFEST_MAX_ITEMS:
+            return jsonify({
+                'status': 'error',
+                'message': f'一次最多检查 {Config.MEDIA_MANIFEST_MAX_ITEMS} 个文件'
+            }), 413
+        
+        items = []
+        for index, entry in enumerate(files):
+            if not isinstance(entry, dict) or not isinstance(entry.get('path'), str) or not entry['path']:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'files[{index}] 缺少 path'
+                }), 400
+            size = entry.get('size')
+            sha256 = entry.get('sha256')
+            items.append({
+                'path': entry['path'],
+                'filename': safe_media_filename(entry['path'], ''),
+                'size': size if isinstance(size, int) and not isinstance(size, bool) else None,
+                'sha256': sha256.lower() if isinstance(sha256, str) else None,
+            })
         
+        refs = storage.db_manager.get_media_refs(student_id) if any(item['sha256'] for item in items) else {}
+        result = media_store.check_manifest(student_id, items, refs)
+        metrics.inc('media.manifestChecks')
+        metrics.inc('media.manifestPresent', len(result['present']))
+        logger.debug("媒体清单: %s, %d 个文件, 缺少 %d, 不一致 %d", student_id, len(items), len(result['missing']),
+                     len(result['stale']))
+        
+        return jsonify({
+            'status': 'success',
+            'studentId': student_id,
+            **result
+        }), 200
+    
     except Exception as e:
-        logger.error(f"上传媒体文件失败: {str(e)}", exc_info=True)
+        logger.error("检查媒体清单失败: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/media/<media_id>', methods=['GET'])
+def get_media_by_id(media_id: str):
+    """按服务器ID获取媒体文件（照片/视频）"""
+    try:
+        file_path = storage.get_media_file_path(media_id)
+        if not file_path:
+            logger.debug("媒体文件不存在或未上传: %s", media_id)
+            return jsonify({
+                'status': 'error',
+                'message': '文件不存在或尚未上传'
+            }), 404
+        return send_file(file_path, conditional=True)
+    
+    except Exception as e:
+        logger.error("获取媒体文件失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -677,77 +1447,23 @@ def upload_media_file(student_id: str):
 
 @app.route('/api/student/<student_id>/media/<path:filename>', methods=['GET'])
 def get_media_file(student_id: str, filename: str):
-    """获取媒体文件（照片/视频）"""
+    """
+    按团队和文件名获取媒体文件（没有服务器ID的旧数据；文件名为 Android 路径时取其中的文件名）
+    旧版本教师端页面和客户端仍在使用，保留；与 /api/media/<media_id> 读取的是同一个文件
+    """
     try:
-        # 增强日志
-        logger.info(f"请求媒体文件: student_id={student_id}, filename={filename[:100]}...")
-        
-        # 首先尝试从存储管理器查找
-        file_path = storage.get_media_file_path(student_id, filename)
-        
-        if not file_path:
-            logger.warning(f"媒体文件路径未找到: {student_id}/{filename[:50]}...")
-            
-            # 尝试从数据库查找完整路径
-            try:
-                from db_manager import DatabaseManager
-                db_manager = DatabaseManager()
-                
-                # 如果filename是完整Android路径，提取文件名
-                search_filename = os.path.basename(filename) if '/' in filename or '\\' in filename else filename
-                
-                # 查询数据库中的文件路径（匹配文件名）
-                rows = db_manager._fetch_all(
-                    "SELECT file_path FROM media_items WHERE file_path LIKE ? OR file_path LIKE ? LIMIT 5",
-                    (f'%{search_filename}', f'%{os.path.basename(search_filename)}')
-                )
-                
-                if rows:
-                    logger.info(f"在数据库中找到 {len(rows)} 条相关记录")
-                    for row in rows:
-                        db_path = row['file_path']
-                        logger.info(f"数据库路径: {db_path[:100]}...")
-                        
-                        # 提取文件名
-                        db_filename = os.path.basename(db_path)
-                        logger.info(f"提取的文件名: {db_filename}")
-                        
-                        # 尝试使用提取的文件名查找
-                        file_path = storage.get_media_file_path(student_id, db_filename)
-                        if file_path and os.path.exists(file_path):
-                            logger.info(f"✅ 通过数据库路径找到文件: {file_path}")
-                            break
-                        
-                        # 如果数据库路径是Android路径，说明文件未上传
-                        if db_path.startswith('/storage/') or db_path.startswith('storage/'):
-                            logger.warning(f"⚠️ 数据库中的路径是Android路径，文件可能未上传: {db_path[:100]}...")
-                            logger.warning(f"   文件名应该是: {db_filename}")
-                            logger.warning(f"   请检查Android端是否已重新编译并上传文件")
-            except Exception as e:
-                logger.error(f"从数据库查找路径失败: {str(e)}", exc_info=True)
-        
-        if not file_path or not os.path.exists(file_path):
-            logger.error(f"❌ 媒体文件不存在: {file_path}")
-            
-            # 提供更详细的错误信息
-            error_info = {
-                'student_id': student_id,
-                'filename': filename[:100] + ('...' if len(filename) > 100 else ''),
-                'searched_path': str(file_path) if file_path else None,
-                'hint': '文件可能未上传到服务器，请检查Android端是否已重新编译并上传文件'
-            }
-            
+        metrics.inc('media.legacyReads')
+        file_path = os.path.join(Config.MEDIA_DIR, student_id, safe_media_filename(filename, ''))
+        if not os.path.isfile(file_path):
+            logger.debug("媒体文件不存在: %s/%s", student_id, filename[:100])
             return jsonify({
                 'status': 'error',
-                'message': '文件不存在',
-                'debug': error_info
+                'message': '文件不存在'
             }), 404
-        
-        logger.info(f"✅ 找到媒体文件: {file_path}")
-        return send_file(file_path)
-        
+        return send_file(file_path, conditional=True)
+    
     except Exception as e:
-        logger.error(f"获取媒体文件失败: {str(e)}", exc_info=True)
+        logger.error("获取媒体文件失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -767,9 +1483,9 @@ def export_all_data():
             }), 500
         
         return send_file(zip_path, as_attachment=True, download_name=f'学生数据导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip')
-        
+    
     except Exception as e:
-        logger.error(f"导出数据失败: {str(e)}", exc_info=True)
+        logger.error("导出数据失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -785,9 +1501,9 @@ def get_statistics():
             'status': 'success',
             'statistics': stats
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取统计失败: {str(e)}", exc_info=True)
+        logger.error("获取统计失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -805,7 +1521,7 @@ def clear_database():
         # 验证密码
         from config import Config
         if password != Config.CLEAR_DATABASE_PASSWORD:
-            logger.warning(f"⚠️ 清空数据库请求被拒绝：密码错误（尝试的密码: {password[:3]}***）")
+            logger.warning("⚠️ 清空数据库请求被拒绝：密码错误（尝试的密码: %s***）", password[:3])
             return jsonify({
                 'status': 'error',
                 'message': '密码错误，无法清空数据库'
@@ -830,7 +1546,7 @@ def clear_database():
             db_manager.close()
             
             logger.warning("⚠️ 所有数据库数据已被清空！")
-            logger.info(f"清空验证结果: {verification}")
+            logger.info("清空验证结果: %s", verification)
             
             return jsonify({
                 'status': 'success',
@@ -838,17 +1554,17 @@ def clear_database():
                 'cleared_items': cleared_items,
                 'verification': verification
             }), 200
-            
+        
         except Exception as e:
             db_manager.close()
-            logger.error(f"清空数据库失败: {str(e)}", exc_info=True)
+            logger.error("清空数据库失败: %s", e, exc_info=True)
             return jsonify({
                 'status': 'error',
                 'message': f'清空数据库失败: {str(e)}'
             }), 500
-        
+    
     except Exception as e:
-        logger.error(f"清空数据失败: {str(e)}", exc_info=True)
+        logger.error("清空数据失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'清空失败: {str(e)}'
@@ -923,11 +1639,11 @@ def upload_student_list():
                         'status': 'error',
                         'message': 'CSV文件格式错误或为空，请检查文件格式'
                     }), 400
-                    
+            
             elif filename.endswith('.json'):
                 # JSON文件
                 file_content = file.read().decode('utf-8')
-                data = json.loads(file_content)
+                data = json_codec.loads(file_content)
             else:
                 return jsonify({
                     'status': 'error',
@@ -957,19 +1673,18 @@ def upload_student_list():
         os.makedirs(os.path.dirname(student_list_file), exist_ok=True)
         
         # 保存到文件
-        with open(student_list_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        json_codec.dump_file(data, student_list_file, 'student_list')
         
-        logger.info(f"✅ 学生名单已上传，包含 {len(data)} 个炉号")
+        logger.info("✅ 学生名单已上传，包含 %s 个炉号", len(data))
         
         return jsonify({
             'status': 'success',
             'message': f'学生名单上传成功，包含 {len(data)} 个炉号',
             'stove_count': len(data)
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"上传学生名单失败: {str(e)}", exc_info=True)
+        logger.error("上传学生名单失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'上传失败: {str(e)}'
@@ -989,16 +1704,15 @@ def get_student_list():
                 'message': '学生名单文件不存在'
             }), 200
         
-        with open(student_list_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = json_codec.load_file(student_list_file)
         
         return jsonify({
             'status': 'success',
             'studentList': data
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取学生名单失败: {str(e)}", exc_info=True)
+        logger.error("获取学生名单失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'获取失败: {str(e)}'
@@ -1017,8 +1731,7 @@ def get_student_list_by_stove(stove_number: str):
                 'message': '学生名单文件不存在'
             }), 404
         
-        with open(student_list_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = json_codec.load_file(student_list_file)
         
         # 查找对应的炉号（支持"1号炉"、"1"等格式）
         import re
@@ -1047,9 +1760,9 @@ def get_student_list_by_stove(stove_number: str):
             'names': names,
             'count': len(names)
         }), 200
-        
+    
     except Exception as e:
-        logger.error(f"获取学生名单失败: {str(e)}", exc_info=True)
+        logger.error("获取学生名单失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'获取失败: {str(e)}'
@@ -1084,13 +1797,13 @@ def get_student_list_template():
         }
         
         # 返回JSON格式的样板（确保中文字符不被转义）
-        json_str = json.dumps(template_data, ensure_ascii=False, indent=2)
+        json_str = json_codec.dumps(template_data, json_codec.is_pretty('student_list'))
         response = Response(json_str, mimetype='application/json; charset=utf-8')
         response.headers['Content-Disposition'] = 'attachment; filename="student_list_template.json"'
         return response, 200
-        
+    
     except Exception as e:
-        logger.error(f"生成样板失败: {str(e)}", exc_info=True)
+        logger.error("生成样板失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'生成样板失败: {str(e)}'
@@ -1120,9 +1833,9 @@ def get_student_list_template_csv():
         response = Response(csv_bytes, mimetype='text/csv; charset=utf-8')
         response.headers['Content-Disposition'] = 'attachment; filename="student_list_template.csv"'
         return response, 200
-        
+    
     except Exception as e:
-        logger.error(f"生成CSV样板失败: {str(e)}", exc_info=True)
+        logger.error("生成CSV样板失败: %s", e, exc_info=True)
         return jsonify({
             'status': 'error',
             'message': f'生成CSV样板失败: {str(e)}'
@@ -1158,9 +1871,9 @@ def index():
             </body>
             </html>
             """, 200
-        
+    
     except Exception as e:
-        logger.error(f"生成首页失败: {str(e)}")
+        logger.error("生成首页失败: %s", e)
         return f"<h1>服务器错误</h1><p>{str(e)}</p>", 500
 
 
@@ -1206,11 +1919,23 @@ def main():
             print("⚠️  数据库初始化失败，但将继续启动服务器")
             print("   如果遇到表不存在错误，请手动运行: python db_init.py")
     except Exception as e:
-        logger.error(f"数据库初始化出错: {str(e)}", exc_info=True)
+        logger.error("数据库初始化出错: %s", e, exc_info=True)
         print(f"⚠️  数据库初始化出错: {str(e)}")
         print("   如果遇到表不存在错误，请手动运行: python db_init.py")
     print("=" * 60)
     
+    # 清理没有团队文件引用的媒体内容文件
+    try:
+        media_store.collect_garbage()
+    except Exception as e:
+        logger.error("清理媒体内容文件失败: %s", e, exc_info=True)
+    
+    # 启动异步提交队列（重放日志中未完成的提交）
+    try:
+        ingest_queue.start()
+    except Exception as e:
+        logger.error("启动异步提交队列失败: %s", e, exc_info=True)
+    
     # 获取本机IP
     server_ip = get_local_ip()
     
@@ -1226,14 +1951,20 @@ def main():
     print("=" * 60)
     
     # 启动Flask服务器
-    app.run(
-        host='0.0.0.0',  # 允许局域网访问
-        port=Config.PORT,
-        debug=Config.DEBUG,
-        threaded=True
-    )
+    try:
+        app.run(
+            host='0.0.0.0',  # 允许局域网访问
+            port=Config.PORT,
+            debug=Config.DEBUG,
+            threaded=True
+        )
+    finally:
+        # 写完后台队列中的文件再退出
+        file_writer.shutdown()
 
 
 if __name__ == '__main__':
+    # 打包成 exe 后，解析进程池的子进程需要从这里进入
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+原始提交归档
+每个团队目录下一个只追加的归档文件和一个定长索引文件，取代每次提交都写
+data_<时间>.json + latest.json 的方式：同一秒内的多次提交不会互相覆盖，
+数据 zlib 压缩，目录下只有两个文件，读取最新版本或任意历史版本只需一次定位。
+
+submissions.log  每条记录 = 头部(magic, 版本号, 压缩后长度, 时间戳, crc32) + 压缩后的JSON
+submissions.idx  每个版本 24 字节(记录偏移, 压缩后长度, 时间戳, 版本号)，
+                 版本号连续，第 n 条索引对应版本号 = 第一条的版本号 + n
+
+用法:
+    python archive.py stats                       # 归档统计（版本数、占用空间、旧格式文件数）
+    python archive.py migrate [学生ID ...]        # 把旧的 data_*.json / latest.json 导入归档并删除
+    python archive.py compact [--keep N] [学生ID ...]  # 只保留最近 N 个版本（默认 Config.ARCHIVE_KEEP_VERSIONS）
+
+migrate / compact 请在服务器停止时运行（写入锁只在同一进程内有效）
+"""
+
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config import Config
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+LOG_FILENAME = 'submissions.log'
+INDEX_FILENAME = 'submissions.idx'
+
+_MAGIC = b'CSA1'
+_RECORD_HEADER = struct.Struct('<4sIIqI')  # magic, 版本号, 压缩后长度, 时间戳(毫秒), crc32(压缩后数据)
+_INDEX_ENTRY = struct.Struct('<QIqI')  # 记录偏移, 压缩后长度, 时间戳(毫秒), 版本号
+
+# 旧格式：每次提交一个文件
+_LEGACY_PATTERN = re.compile(r'^data_(\d{8}_\d{6})\.json$')
+_LEGACY_LATEST = 'latest.json'
+
+# 写入（追加、补齐索引、压缩归档）串行执行；读取不加锁（索引只在记录完整写入后才追加）
+_write_lock = threading.Lock()
+
+
+class ArchiveEntry(NamedTuple):
+    """索引中的一个版本"""
+    version: int
+    timestamp: int
+    offset: int
+    length: int
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': self.version, 'timestamp': self.timestamp, 'compressedSize': self.length}
+
+
+class SubmissionArchive:
+    """一个团队的提交归档"""
+    
+    def __init__(self, student_dir: str):
+        self.student_dir = student_dir
+        self.log_path = os.path.join(student_dir, LOG_FILENAME)
+        self.index_path = os.path.join(student_dir, INDEX_FILENAME)
+    
+    # ==================== 写入 ====================
+    
+    def append(self, raw: bytes, timestamp: Optional[int] = None) -> int:
+        """追加一个版本（raw 为原始JSON字节），返回版本号"""
+        return self.append_compressed(zlib.compress(raw, Config.ARCHIVE_COMPRESS_LEVEL), timestamp)
+    
+    def append_compressed(self, payload: bytes, timestamp: Optional[int] = None) -> int:
+        """追加一个已经用 zlib 压缩好的版本（流式读取请求体时边读边压缩），返回版本号"""
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        with _write_lock:
+            os.makedirs(self.student_dir, exist_ok=True)
+            version = self._recover()
+            header = _RECORD_HEADER.pack(_MAGIC, version, len(payload), timestamp, zlib.crc32(payload))
+            with open(self.log_path, 'ab') as f:
+                offset = f.tell()
+                f.write(header + payload)
+            # 记录完整写入后才追加索引，读取方看到的索引总是指向完整的记录
+            with open(self.index_path, 'ab') as f:
+                f.write(_INDEX_ENTRY.pack(offset, len(payload), timestamp, version))
+        return version
+    
+    def _recover(self) -> int:
+        """
+        保证索引与归档文件一致（进程在两次写入之间被结束时补齐或重建索引），返回下一个版本号
+        调用方持有 _write_lock
+        """
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        count = self._count()
+        if count and os.path.getsize(self.index_path) != count * _INDEX_ENTRY.size:
+            # 索引最后一条只写了一半
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(count * _INDEX_ENTRY.size)
+        
+        last = self._entry_at(count - 1) if count else None
+        indexed_end = last.offset + _RECORD_HEADER.size + last.length if last else 0
+        if indexed_end == log_size:
+            return last.version + 1 if last else 1
+        
+        if indexed_end > log_size:
+            # 索引指向不存在的数据（归档文件被替换或截断），从头重建
+            logger.warning("⚠️ 归档索引与数据不一致，重建索引: %s", self.index_path)
+            entries, end = self._scan_all(0)
+            mode = 'wb'
+        else:
+            # 归档文件尾部有尚未写入索引的记录
+            entries, end = self._scan_all(indexed_end)
+            mode = 'ab'
+        
+        with open(self.index_path, mode) as f:
+            for entry in entries:
+                f.write(_INDEX_ENTRY.pack(entry.offset, entry.length, entry.timestamp, entry.version))
+        if end < log_size:
+            # 最后一条记录写到一半，丢弃
+            logger.warning("⚠️ 归档末尾存在不完整记录，已截断: %s", self.log_path)
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(end)
+        
+        if entries:
+            return entries[-1].version + 1
+        return last.version + 1 if last and mode == 'ab' else 1
+    
+    def _scan_all(self, start: int) -> Tuple[List[ArchiveEntry], int]:
+        """从 start 开始顺序扫描完整记录，返回 (记录列表, 最后一条完整记录的结束位置)"""
+        entries = []
+        end = start
+        if not os.path.exists(self.log_path):
+            return entries, end
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                magic, version, length, timestamp, crc = _RECORD_HEADER.unpack(header)
+                if magic != _MAGIC:
+                    break
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                entries.append(ArchiveEntry(version, timestamp, end, length))
+                end += _RECORD_HEADER.size + length
+        return entries, end
+    
+    # ==================== 读取 ====================
+    
+    def _count(self) -> int:
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // _INDEX_ENTRY.size
+    
+    def _entry_at(self, position: int) -> Optional[ArchiveEntry]:
+        """索引第 position 条（从0开始）"""
+        with open(self.index_path, 'rb') as f:
+            f.seek(position * _INDEX_ENTRY.size)
+            data = f.read(_INDEX_ENTRY.size)
+        if len(data) < _INDEX_ENTRY.size:
+            return None
+        offset, length, timestamp, version = _INDEX_ENTRY.unpack(data)
+        return ArchiveEntry(version, timestamp, offset, length)
+    
+    def entries(self) -> List[ArchiveEntry]:
+        """所有版本（从旧到新）"""
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        return [ArchiveEntry(version, timestamp, offset, length)
+                for offset, length, timestamp, version in _INDEX_ENTRY.iter_unpack(data[:usable])]
+    
+    def entry(self, version: Optional[int] = None) -> Optional[ArchiveEntry]:
+        """指定版本的索引（version 为 None 时返回最新版本），不存在时返回 None"""
+        count = self._count()
+        if not count:
+            return None
+        if version is None:
+            return self._entry_at(count - 1)
+        first = self._entry_at(0)
+        position = version - first.version
+        if position < 0 or position >= count:
+            return None
+        return self._entry_at(position)
+    
+    def read(self, version: Optional[int] = None) -> Optional[bytes]:
+        """读取指定版本的原始JSON字节（version 为 None 时读取最新版本）"""
+        entry = self.entry(version)
+        if entry is None:
+            return None
+        with open(self.log_path, 'rb') as f:
+            f.seek(entry.offset)
+            header = f.read(_RECORD_HEADER.size)
+            payload = f.read(entry.length)
+        magic, record_version, length, _, crc = _RECORD_HEADER.unpack(header)
+        if magic != _MAGIC or record_version != entry.version or zlib.crc32(payload) != crc:
+            raise ValueError(f"归档记录损坏: {self.log_path} 版本 {entry.version}")
+        return zlib.decompress(payload)
+    
+    def load(self, version: Optional[int] = None) -> Any:
+        """读取并解析指定版本（version 为 None 时读取最新版本）"""
+        raw = self.read(version)
+        return None if raw is None else json_codec.loads(raw)
+    
+    # ==================== 维护 ====================
+    
+    def compact(self, keep: int) -> Tuple[int, int]:
+        """只保留最近 keep 个版本并重写归档（版本号不变），返回 (删除的版本数, 释放的字节数)"""
+        keep = max(1, keep)
+        with _write_lock:
+            if not os.path.exists(self.log_path):
+                return 0, 0
+            self._recover()
+            entries = self.entries()
+            if len(entries) <= keep:
+                return 0, 0
+            kept = entries[-keep:]
+            old_size = os.path.getsize(self.log_path)
+            
+            temp_log = self.log_path + '.tmp'
+            temp_index = self.index_path + '.tmp'
+            with open(self.log_path, 'rb') as src, open(temp_log, 'wb') as log_f, open(temp_index, 'wb') as index_f:
+                for entry in kept:
+                    src.seek(entry.offset)
+                    record = src.read(_RECORD_HEADER.size + entry.length)
+                    index_f.write(_INDEX_ENTRY.pack(log_f.tell(), entry.length, entry.timestamp, entry.version))
+                    log_f.write(record)
+                log_f.flush()
+                os.fsync(log_f.fileno())
+            # 先删除旧索引：替换过程中进程被结束时，下次写入会按新归档文件重建索引
+            os.remove(self.index_path)
+            os.replace(temp_log, self.log_path)
+            os.replace(temp_index, self.index_path)
+            return len(entries) - keep, old_size - os.path.getsize(self.log_path)
+    
+    def legacy_files(self) -> List[str]:
+        """目录下旧格式的提交文件（data_*.json 从旧到新，latest.json 在最后）"""
+        if not os.path.isdir(self.student_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.student_dir) if _LEGACY_PATTERN.match(name))
+        if os.path.exists(os.path.join(self.student_dir, _LEGACY_LATEST)):
+            names.append(_LEGACY_LATEST)
+        return names
+    
+    def migrate_legacy(self) -> int:
+        """把旧格式文件按时间顺序导入归档后删除，返回导入的版本数"""
+        names = self.legacy_files()
+        data_files = [name for name in names if name != _LEGACY_LATEST]
+        # latest.json 与最新的 data_*.json 内容相同，只有没有 data_*.json 时才导入
+        to_import = data_files or names
+        for name in to_import:
+            path = os.path.join(self.student_dir, name)
+            match = _LEGACY_PATTERN.match(name)
+            if match:
+                timestamp = int(datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').timestamp() * 1000)
+            else:
+                timestamp = int(os.path.getmtime(path) * 1000)
+            with open(path, 'rb') as f:
+                raw = f.read()
+            try:
+                # 旧文件是缩进格式，重新紧凑编码
+                raw = json_codec.dumps_bytes(json_codec.loads(raw))
+            except ValueError:
+                logger.warning("⚠️ 旧提交文件不是有效的JSON，按原样归档: %s", path)
+            self.append(raw, timestamp)
+        for name in names:
+            os.remove(os.path.join(self.student_dir, name))
+        return len(to_import)
+
+
+def list_submissions(student_dir: str, newest_first: bool = True) -> List[Tuple[str, Callable[[], Any]]]:
+    """
+    一个团队的所有提交（归档版本和尚未迁移的旧格式文件），返回 [(名称, 读取函数)]
+    供诊断脚本使用
+    """
+    archive = SubmissionArchive(student_dir)
+    items: List[Tuple[int, str, Any]] = []
+    for entry in archive.entries():
+        items.append((entry.timestamp, f'版本 {entry.version}', lambda v=entry.version: archive.load(v)))
+    for name in archive.legacy_files():
+        path = os.path.join(student_dir, name)
+        items.append((int(os.path.getmtime(path) * 1000), name, lambda p=path: json_codec.load_file(p)))
+    items.sort(key=lambda item: item[0], reverse=newest_first)
+    return [(name, loader) for _, name, loader in items]
+
+
+def _student_dirs(data_dir: str, student_ids: List[str]) -> List[str]:
+    if student_ids:
+        return [os.path.join(data_dir, student_id) for student_id in student_ids]
+    if not os.path.isdir(data_dir):
+        return []
+    return [os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))
+            if os.path.isdir(os.path.join(data_dir, name))]
+
+
+def main():
+    args = sys.argv[1:]
+    command = args.pop(0) if args else 'stats'
+    keep = Config.ARCHIVE_KEEP_VERSIONS
+    if '--keep' in args:
+        i = args.index('--keep')
+        keep = int(args[i + 1])
+        del args[i:i + 2]
+    
+    student_dirs = _student_dirs(Config.DATA_DIR, args)
+    if command == 'stats':
+        versions = size = legacy = 0
+        for student_dir in student_dirs:
+            archive = SubmissionArchive(student_dir)
+            versions += len(archive.entries())
+            legacy += len(archive.legacy_files())
+            for path in (archive.log_path, archive.index_path):
+                if os.path.exists(path):
+                    size += os.path.getsize(path)
+        print(f"团队 {len(student_dirs)} 个, 归档版本 {versions} 个, 占用 {size / 1024:.1f} KB, 未迁移的旧格式文件 {legacy} 个")
+    elif command == 'migrate':
+        total = 0
+        for student_dir in student_dirs:
+            count = SubmissionArchive(student_dir).migrate_legacy()
+            if count:
+                print(f"  {os.path.basename(student_dir)}: 导入 {count} 个旧提交文件")
+            total += count
+        print(f"✅ 迁移完成，共导入 {total} 个版本")
+    elif command == 'compact':
+        removed = freed = 0
+        for student_dir in student_dirs:
+            count, size = SubmissionArchive(student_dir).compact(keep)
+            if count:
+                print(f"  {os.path.basename(student_dir)}: 删除 {count} 个旧版本, 释放 {size / 1024:.1f} KB")
+            removed += count
+            freed += size
+        print(f"✅ 压缩完成（每个团队保留最近 {keep} 个版本），共删除 {removed} 个版本, 释放 {freed / 1024:.1f} KB")
+    else:
+        print(f"未知的命令: {command}（可选: stats, migrate, compact）")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
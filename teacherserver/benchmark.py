@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本
+用于对比热点路径优化前后的耗时与内存占用（不依赖正在运行的服务器）
+
+用法:
+    python benchmark.py            # 运行全部基准
+    python benchmark.py models     # 只运行指定基准
+    python benchmark.py serializers
+    python benchmark.py json
+    python benchmark.py lazy
+    python benchmark.py validation
+    python benchmark.py archive
+    python benchmark.py rebuild
+    python benchmark.py compression
+    python benchmark.py msgpack
+"""
+
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import json_codec
+from models import Team, ProcessRecord, StageRecord, MediaItem
+
+# 每个基准构造的对象数量
+OBJECT_COUNT = 20000
+
+
+def _timeit(func: Callable[[], object], repeat: int = 5) -> float:
+    """运行多次取最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _memory_per_object(factory: Callable[[], object], count: int) -> float:
+    """统计每个对象平均占用内存（字节）"""
+    tracemalloc.start()
+    objects = [factory() for _ in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current / count
+
+
+def _sample_rows():
+    """构造与数据库列顺序一致的样例行"""
+    team_row = (1, '实验学校_7_3班_5号炉', '实验学校', '7', '3班', '5号炉', 6, '张三,李四,王五',
+                1700000000000, 1700000000000, 1, None)
+    stage_row = (1, 1, 'COOKING_RICE', 1700000000000, 1700000600000, 4, '米饭煮好了', '', 1,
+                 '["火候", "水量"]', 1700000000000, 1700000000000, 1, None)
+    media_row = (1, 1, None, 'IMG_20240101_120000.jpg', 'PHOTO', None, 1700000000000,
+                 1700000000000, 1, None)
+    return team_row, stage_row, media_row
+
+
+def bench_models():
+    """模型构造：字典构造（from_dict）与按位置构造（from_row）对比"""
+    team_row, stage_row, media_row = _sample_rows()
+    cases = [
+        (Team, team_row),
+        (StageRecord, stage_row),
+        (MediaItem, media_row),
+    ]
+    print(f"[models] 每组构造 {OBJECT_COUNT} 个对象")
+    for model_cls, row in cases:
+        row_dict = dict(zip(model_cls.COLUMNS, row))
+        dict_time = _timeit(lambda: [model_cls(row_dict) for _ in range(OBJECT_COUNT)])
+        row_time = _timeit(lambda: [model_cls.from_row(row) for _ in range(OBJECT_COUNT)])
+        dict_mem = _memory_per_object(lambda: model_cls(row_dict), OBJECT_COUNT)
+        row_mem = _memory_per_object(lambda: model_cls.from_row(row), OBJECT_COUNT)
+        print(f"  {model_cls.__name__:<12} 构造: dict {dict_time * 1000:8.2f} ms | "
+              f"row {row_time * 1000:8.2f} ms | 加速 {dict_time / row_time:5.2f}x")
+        print(f"  {'':<12} 内存: dict {dict_mem:8.1f} B  | row {row_mem:8.1f} B")
+
+
+def bench_serializers():
+    """模型序列化：整个班级的阶段记录转换为JSON（to_dict / to_android_dict / 插入参数）"""
+    _, stage_row, _ = _sample_rows()
+    stages = [StageRecord.from_row(stage_row) for _ in range(OBJECT_COUNT)]
+    print(f"[serializers] 序列化 {OBJECT_COUNT} 条阶段记录")
+    cases = [
+        ('to_dict', lambda: json.dumps([s.to_dict() for s in stages], ensure_ascii=False)),
+        ('to_android_dict', lambda: json.dumps([s.to_android_dict() for s in stages], ensure_ascii=False)),
+        ('insert_params', lambda: [StageRecord.serializer.insert_params(s) for s in stages]),
+    ]
+    for name, func in cases:
+        print(f"  {name:<16} {_timeit(func) * 1000:8.2f} ms")
+
+
+def _sample_submission(media_per_stage: int = 10):
+    """构造一份与Android端提交格式一致的完整数据包"""
+    stages = {}
+    for i, stage in enumerate(['PREPARATION', 'FIRE_MAKING', 'COOKING_RICE', 'COOKING_DISHES', 'SHOWCASE', 'CLEANING']):
+        stages[stage] = {
+            'stage': stage, 'startTime': 1700000000000 + i, 'endTime': 1700000600000 + i,
+            'selfRating': 4, 'notes': '本阶段完成得不错，火候控制良好' * 3, 'problemNotes': '',
+            'isCompleted': True, 'selectedTags': ['火候', '水量', '分工'],
+            'mediaItems': [
+                {'path': f'/storage/emulated/0/DCIM/{stage}_{j}.jpg', 'type': 'PHOTO', 'timestamp': 1700000000000 + j}
+                for j in range(media_per_stage)
+            ],
+        }
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                     'memberCount': 6, 'memberNames': '张三,李四,王五,赵六,钱七,孙八'},
+        'teamDivision': {'groupLeader': '张三', 'groupCooking': '李四', 'groupSoupRice': '王五',
+                         'groupFire': '赵六', 'groupHealth': '钱七'},
+        'processRecord': {'startTime': 1700000000000, 'endTime': 1700003600000, 'currentStage': 5,
+                          'overallNotes': '整体顺利', 'stages': stages},
+        'summaryData': {'answer1': '学会了生火' * 10, 'answer2': '团队合作很重要' * 10, 'answer3': '下次注意安全' * 10},
+        'exportTime': 1700003600000,
+    }
+
+
+def bench_json():
+    """JSON编码：标准库 indent=2（原实现）与统一编解码模块对比"""
+    submission = _sample_submission()
+    student = {'id': '实验学校_7_3班_5号炉', 'teamInfo': submission['teamInfo'],
+               'processRecord': {'stages': {k: {'isCompleted': True, 'selfRating': 4} for k in submission['processRecord']['stages']}}}
+    students_payload = {'status': 'success', 'count': 200, 'students': [dict(student) for _ in range(200)]}
+    print(f"[json] 后端: {json_codec.BACKEND}")
+    cases = [
+        ('/api/students', students_payload, 'response'),
+        ('提交归档', submission, None),
+    ]
+    for name, obj, kind in cases:
+        std_time = _timeit(lambda: [json.dumps(obj, ensure_ascii=False, indent=2) for _ in range(100)])
+        codec_time = _timeit(lambda: [json_codec.dumps_bytes(obj, json_codec.is_pretty(kind)) for _ in range(100)])
+        print(f"  {name:<14} 100次: json {std_time * 1000:8.2f} ms | codec {codec_time * 1000:8.2f} ms | "
+              f"加速 {std_time / codec_time:5.2f}x")
+
+
+def bench_lazy(team_count: int = 40):
+    """过程记录读取：完整加载媒体文件与只加载阶段（列表页）对比"""
+    from db_init import init_database
+    from db_manager import DatabaseManager, LoadSpec
+    
+    # 写入大量日志会淹没计时结果
+    logging.disable(logging.INFO)
+    temp_dir = tempfile.mkdtemp(prefix='campcooking_bench_')
+    try:
+        db_path = os.path.join(temp_dir, 'bench.db')
+        init_database(db_path)
+        db = DatabaseManager(db_path)
+        submission = _sample_submission()
+        stages_data = submission['processRecord']['stages']
+        team_ids = []
+        for i in range(team_count):
+            team_info = dict(submission['teamInfo'], stoveNumber=f'{i + 1}号炉')
+            team = Team({'teamInfo': team_info})
+            db.save_team(team)
+            stages = [StageRecord(stage_data) for stage_data in stages_data.values()]
+            stages_media = {name: stage_data['mediaItems'] for name, stage_data in stages_data.items()}
+            db.save_process_record(team.team_id, ProcessRecord(submission), stages, stages_media)
+            team_ids.append(team.team_id)
+        
+        def read_list(spec):
+            for team_id in team_ids:
+                _, stages = db.get_process_record(team_id, spec)
+                [(stage.self_rating, stage.is_completed) for stage in stages]
+        
+        def read_full():
+            for team_id in team_ids:
+                _, stages = db.get_process_record(team_id, LoadSpec.FULL)
+                [stage.to_android_dict() for stage in stages]
+        
+        print(f"[lazy] {team_count} 个团队，每个 {len(stages_data)} 个阶段、每阶段 10 个媒体文件")
+        full_time = _timeit(read_full)
+        for name, func in [('FULL（含媒体）', read_full),
+                           ('STAGES（列表页）', lambda: read_list(LoadSpec.STAGES)),
+                           ('MEDIA_COUNTS', lambda: read_list(LoadSpec.MEDIA_COUNTS))]:
+            elapsed = _timeit(func)
+            print(f"  {name:<16} {elapsed * 1000:8.2f} ms | 相对完整加载 {full_time / elapsed:5.2f}x")
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _repeat(func: Callable[[object], object], arg: object, count: int):
+    """重复调用，不保留结果（避免大量存活对象触发GC影响计时）"""
+    for _ in range(count):
+        func(arg)
+
+
+def bench_validation():
+    """提交解析：原多次遍历（计数 + StudentDataPackage + 再次提取阶段/媒体）与单次校验对比"""
+    from models import StudentDataPackage
+    from validation import validate_submission
+    
+    def legacy_parse(data):
+        # app.submit_student_data 的统计遍历
+        for stage_data in data['processRecord']['stages'].values():
+            len(stage_data.get('mediaItems') or stage_data.get('media_items') or [])
+        package = StudentDataPackage.from_dict(data)
+        # storage.save_student_data 的统计遍历 + 提取阶段和媒体
+        for stage_data in package._raw_data['processRecord']['stages'].values():
+            len(stage_data.get('mediaItems') or stage_data.get('media_items') or [])
+        Team({'teamInfo': package.teamInfo.to_dict()})
+        for stage_data in package._raw_data['processRecord']['stages'].values():
+            StageRecord(stage_data)
+            [MediaItem(media_data) for media_data in stage_data.get('mediaItems', [])]
+    
+    print("[validation] 每组解析 200 次")
+    for media_per_stage in (10, 100):
+        data = _sample_submission(media_per_stage)
+        legacy_time = _timeit(lambda: _repeat(legacy_parse, data, 200))
+        single_time = _timeit(lambda: _repeat(validate_submission, data, 200))
+        print(f"  每阶段 {media_per_stage:>3} 个媒体  原实现 {legacy_time * 1000:8.2f} ms | "
+              f"单次校验 {single_time * 1000:8.2f} ms | 加速 {legacy_time / single_time:5.2f}x")
+
+
+def _dir_usage(path: str):
+    """目录下的文件数和总字节数"""
+    names = os.listdir(path)
+    return len(names), sum(os.path.getsize(os.path.join(path, name)) for name in names)
+
+
+def bench_archive(submit_count: int = 200):
+    """原始提交归档：每次提交写 data_*.json + latest.json（indent=2）与压缩归档对比"""
+    from archive import SubmissionArchive
+    
+    data = _sample_submission()
+    temp_dir = tempfile.mkdtemp(prefix='campcooking_bench_')
+    try:
+        legacy_dir = os.path.join(temp_dir, 'legacy')
+        archive_dir = os.path.join(temp_dir, 'archive')
+        os.makedirs(legacy_dir)
+        
+        def write_legacy():
+            for i in range(submit_count):
+                raw = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+                # 原实现按秒命名，这里用序号避免同名覆盖
+                for name in (f'data_{i:08d}.json', 'latest.json'):
+                    with open(os.path.join(legacy_dir, name), 'wb') as f:
+                        f.write(raw)
+        
+        def write_archive():
+            archive = SubmissionArchive(archive_dir)
+            for _ in range(submit_count):
+                archive.append(json_codec.dumps_bytes(data))
+        
+        legacy_time = _timeit(write_legacy, repeat=1)
+        archive_time = _timeit(write_archive, repeat=1)
+        legacy_files, legacy_bytes = _dir_usage(legacy_dir)
+        archive_files, archive_bytes = _dir_usage(archive_dir)
+        
+        archive = SubmissionArchive(archive_dir)
+        read_time = _timeit(lambda: [archive.load() for _ in range(submit_count)])
+        history_time = _timeit(lambda: [archive.load(v) for v in range(1, submit_count + 1)])
+        
+        print(f"[archive] 同一团队提交 {submit_count} 次")
+        print(f"  原实现   写入 {legacy_time * 1000:8.2f} ms | {legacy_files:>4} 个文件 | {legacy_bytes / 1024:8.1f} KB")
+        print(f"  压缩归档 写入 {archive_time * 1000:8.2f} ms | {archive_files:>4} 个文件 | {archive_bytes / 1024:8.1f} KB"
+              f" | 空间 {legacy_bytes / archive_bytes:5.1f}x")
+        print(f"  读取最新版本 {submit_count} 次 {read_time * 1000:8.2f} ms | 依次读取全部历史版本 {history_time * 1000:8.2f} ms")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_rebuild(team_count: int = 400):
+    """从归档重建数据库：逐个团队解析并调用 save_submission 与进程池解析 + 批量写入对比"""
+    from archive import SubmissionArchive
+    from db_init import init_database
+    from db_manager import DatabaseManager
+    from rebuild import rebuild_database
+    from validation import validate_submission, submission_hash
+    
+    logging.disable(logging.INFO)
+    temp_dir = tempfile.mkdtemp(prefix='campcooking_bench_')
+    try:
+        data_dir = os.path.join(temp_dir, 'students')
+        media_dir = os.path.join(temp_dir, 'media')
+        submission = _sample_submission()
+        for i in range(team_count):
+            team_info = dict(submission['teamInfo'], stoveNumber=f'{i + 1}号炉')
+            data = dict(submission, teamInfo=team_info)
+            team_id = f"{team_info['school']}_{team_info['grade']}_{team_info['className']}_{team_info['stoveNumber']}"
+            SubmissionArchive(os.path.join(data_dir, team_id)).append(json_codec.dumps_bytes(data))
+        
+        def serial():
+            # 与 DataStorage.save_submission 相同的逐表保存
+            db_path = os.path.join(temp_dir, 'serial.db')
+            init_database(db_path)
+            db = DatabaseManager(db_path)
+            for name in sorted(os.listdir(data_dir)):
+                data = SubmissionArchive(os.path.join(data_dir, name)).load()
+                parsed = validate_submission(data)
+                db.save_team(parsed.team)
+                db.save_team_division(parsed.student_id, parsed.division)
+                db.save_process_record(parsed.student_id, parsed.process, parsed.stages, parsed.stages_media)
+                db.save_summary_data(parsed.student_id, parsed.summary)
+                db.save_submission_hash(parsed.student_id, submission_hash(data))
+            db.close()
+        
+        def parallel(workers):
+            db_path = os.path.join(temp_dir, f'rebuild_{workers}.db')
+            rebuild_database(db_path, data_dir, media_dir, workers=workers)
+        
+        cpu_count = os.cpu_count() or 1
+        print(f"[rebuild] {team_count} 个团队，每个 6 个阶段、每阶段 10 个媒体文件（{cpu_count} 核）")
+        serial_time = _timeit(serial, repeat=1)
+        print(f"  逐个保存（save_submission）   {serial_time * 1000:8.2f} ms")
+        for workers in sorted({1, cpu_count}):
+            elapsed = _timeit(lambda: parallel(workers), repeat=1)
+            print(f"  rebuild {workers:>2} 进程 + 批量写入  {elapsed * 1000:8.2f} ms | 加速 {serial_time / elapsed:5.2f}x")
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_compression():
+    """压缩请求体：提交数据 gzip 前后的上传字节数，以及服务器端解压耗时"""
+    import gzip
+    import io
+    import zlib
+    from compression import RequestDecompressionMiddleware
+    
+    middleware = RequestDecompressionMiddleware(lambda environ, start_response: [], ())
+    print("[compression] 提交数据 gzip（Android 端 GZIPOutputStream 默认级别）")
+    for media_per_stage in (10, 100):
+        raw = json.dumps(_sample_submission(media_per_stage), ensure_ascii=False).encode('utf-8')
+        compressed = gzip.compress(raw, 6)
+        decompress_time = _timeit(lambda: [
+            middleware._decompress(io.BytesIO(compressed), 16 + zlib.MAX_WBITS)[0].close() for _ in range(100)
+        ])
+        print(f"  每阶段 {media_per_stage:>3} 个媒体  原始 {len(raw) / 1024:7.1f} KB | gzip {len(compressed) / 1024:6.1f} KB | "
+              f"减少 {len(raw) / len(compressed):5.2f}x | 解压 100次 {decompress_time * 1000:6.2f} ms")
+
+
+def bench_msgpack():
+    """MessagePack 提交：与JSON的请求体大小，以及解码+校验耗时"""
+    import msgpack_codec
+    from validation import validate_submission
+    
+    print(f"[msgpack] 提交数据 JSON vs MessagePack（MessagePack 后端: {msgpack_codec.BACKEND}, JSON 后端: {json_codec.BACKEND}）")
+    for media_per_stage in (10, 100):
+        data = _sample_submission(media_per_stage)
+        raw_json = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        raw_msgpack = msgpack_codec.packb(data)
+        assert msgpack_codec.unpackb(raw_msgpack) == data
+        
+        stdlib_time = _timeit(lambda: [json.loads(raw_json) for _ in range(100)])
+        codec_time = _timeit(lambda: [json_codec.loads(raw_json) for _ in range(100)])
+        msgpack_time = _timeit(lambda: [msgpack_codec.unpackb(raw_msgpack) for _ in range(100)])
+        validate_time = _timeit(lambda: [validate_submission(data) for _ in range(100)])
+        # /api/submit 实际走的路径：解码后校验（两种格式共用同一个校验器）
+        json_path = _timeit(lambda: [validate_submission(json_codec.loads(raw_json)) for _ in range(100)])
+        msgpack_path = _timeit(lambda: [validate_submission(msgpack_codec.unpackb(raw_msgpack)) for _ in range(100)])
+        print(f"  每阶段 {media_per_stage:>3} 个媒体  JSON {len(raw_json) / 1024:6.1f} KB | "
+              f"MessagePack {len(raw_msgpack) / 1024:6.1f} KB ({len(raw_msgpack) / len(raw_json):.0%})")
+        print(f"    解码 100次  json {stdlib_time * 1000:7.2f} ms | json_codec {codec_time * 1000:7.2f} ms | "
+              f"msgpack {msgpack_time * 1000:7.2f} ms | 校验 100次 {validate_time * 1000:7.2f} ms")
+        print(f"    解码+校验 100次  JSON {json_path * 1000:7.2f} ms | MessagePack {msgpack_path * 1000:7.2f} ms "
+              f"({msgpack_path / json_path:.1f}x)")
+
+
+def bench_stream():
+    """流式解析 /api/submit：内存峰值（不含校验结果本身）与耗时，对比整体读取后解析"""
+    import io
+    import zlib
+    from config import Config
+    from parse_pool import parse_data
+    from stream_parser import parse_submission_stream
+    
+    print("[stream] 整体读取 vs 流式解析（包括校验、内容哈希和归档压缩）")
+    for media_per_stage in (1000, 5000):
+        raw = json.dumps(_sample_submission(media_per_stage), ensure_ascii=False).encode('utf-8')
+        
+        def buffered():
+            body = io.BytesIO(raw).read()
+            parsed = parse_data(json_codec.loads(body), body)
+            zlib.compress(parsed.raw_json, Config.ARCHIVE_COMPRESS_LEVEL)
+            return parsed
+        
+        def streamed():
+            return parse_submission_stream(io.BytesIO(raw))
+        
+        print(f"  每阶段 {media_per_stage:>4} 个媒体  请求体 {len(raw) / 1024 / 1024:5.2f} MB")
+        for name, func in (('整体读取', buffered), ('流式解析', streamed)):
+            elapsed = _timeit(func, repeat=3)
+            tracemalloc.start()
+            result = func()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(f"    {name}  {elapsed * 1000:7.1f} ms | 临时内存峰值 {(peak - current) / 1024 / 1024:6.2f} MB")
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    'models': bench_models,
+    'serializers': bench_serializers,
+    'json': bench_json,
+    'lazy': bench_lazy,
+    'validation': bench_validation,
+    'archive': bench_archive,
+    'rebuild': bench_rebuild,
+    'compression': bench_compression,
+    'msgpack': bench_msgpack,
+    'stream': bench_stream,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        bench = BENCHMARKS.get(name)
+        if not bench:
+            print(f"未知的基准: {name}（可选: {', '.join(BENCHMARKS.keys())}）")
+            sys.exit(1)
+        bench()
+
+
+if __name__ == '__main__':
+    main()
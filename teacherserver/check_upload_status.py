@@ -4,7 +4,8 @@
 
 import sqlite3
 import os
-import json
+
+from archive import list_submissions
 
 db_path = 'data/campcooking.db'
 media_dir = 'data/media'
@@ -91,28 +92,28 @@ if os.path.exists(data_dir):
     
     if student_dirs:
         for student_dir in student_dirs[:3]:  # 只检查前3个
-            latest_json = os.path.join(data_dir, student_dir, 'latest.json')
-            if os.path.exists(latest_json):
-                try:
-                    with open(latest_json, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    process_record = data.get('processRecord', {})
-                    stages = process_record.get('stages', {})
+            submissions = list_submissions(os.path.join(data_dir, student_dir))
+            if not submissions:
+                continue
+            try:
+                data = submissions[0][1]()
+                
+                process_record = data.get('processRecord', {})
+                stages = process_record.get('stages', {})
+                
+                if stages:
+                    total_media = 0
+                    for stage_name, stage_data in stages.items():
+                        media_items = stage_data.get('mediaItems', [])
+                        if not media_items:
+                            media_items = stage_data.get('media_items', [])
+                        total_media += len(media_items) if media_items else 0
                     
-                    if stages:
-                        total_media = 0
-                        for stage_name, stage_data in stages.items():
-                            media_items = stage_data.get('mediaItems', [])
-                            if not media_items:
-                                media_items = stage_data.get('media_items', [])
-                            total_media += len(media_items) if media_items else 0
-                        
-                        print(f"  {student_dir}: {len(stages)} 个阶段, {total_media} 个媒体文件")
-                    else:
-                        print(f"  {student_dir}: [WARN] 没有stages数据")
-                except Exception as e:
-                    print(f"  {student_dir}: [ERROR] 读取失败: {e}")
+                    print(f"  {student_dir}: {len(stages)} 个阶段, {total_media} 个媒体文件")
+                else:
+                    print(f"  {student_dir}: [WARN] 没有stages数据")
+            except Exception as e:
+                print(f"  {student_dir}: [ERROR] 读取失败: {e}")
 
 # 4. 诊断结果
 print("\n" + "=" * 60)
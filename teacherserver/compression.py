@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求体解压（WSGI中间件）
+客户端可以用 Content-Encoding: gzip / deflate 发送压缩后的请求体，
+在进入 Flask 之前解压并改写请求头，视图函数（request.get_json / request.files）无需改动。
+解压后的大小有上限（Config.MAX_DECOMPRESSED_SIZE），防止压缩炸弹。
+"""
+
+import tempfile
+import zlib
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import get_input_stream
+
+from config import Config
+from metrics import metrics, ratio
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Content-Encoding -> zlib wbits
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,  # 按 HTTP 规范为 zlib 格式，不是原始 deflate
+}
+
+_CHUNK_SIZE = 64 * 1024
+_SPOOL_SIZE = 1024 * 1024  # 解压结果超过 1MB 时写入临时文件
+
+
+class BodyTooLarge(Exception):
+    """解压后的请求体超过上限"""
+
+
+class RequestDecompressionMiddleware:
+    """对指定路径前缀的请求透明解压请求体"""
+    
+    def __init__(self, app: Callable, paths: Iterable[str], max_size: Optional[int] = None):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_size = max_size or Config.MAX_DECOMPRESSED_SIZE
+    
+    def __call__(self, environ: Dict[str, Any], start_response: Callable):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity' or not environ.get('PATH_INFO', '').startswith(self.paths):
+            return self.app(environ, start_response)
+        
+        wbits = _WBITS.get(encoding)
+        if wbits is None:
+            return self._error(environ, start_response, 415, f'不支持的 Content-Encoding: {encoding}')
+        
+        try:
+            body, compressed_size, size = self._decompress(get_input_stream(environ), wbits)
+        except BodyTooLarge:
+            metrics.inc('requestCompression.rejected')
+            logger.warning("⚠️ 压缩请求体解压后超过 %s 字节，已拒绝: %s", self.max_size, environ.get('PATH_INFO'))
+            return self._error(environ, start_response, 413, f'请求体解压后超过 {self.max_size // (1024 * 1024)}MB 上限')
+        except zlib.error as e:
+            metrics.inc('requestCompression.rejected')
+            return self._error(environ, start_response, 400, f'请求体解压失败: {str(e)}')
+        
+        metrics.inc('requestCompression.requests')
+        metrics.inc('requestCompression.compressedBytes', compressed_size)
+        metrics.inc('requestCompression.decompressedBytes', size)
+        
+        environ['wsgi.input'] = body
+        environ['CONTENT_LENGTH'] = str(size)
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        environ.pop('wsgi.input_terminated', None)
+        try:
+            return self.app(environ, start_response)
+        finally:
+            body.close()
+    
+    def _decompress(self, stream, wbits: int):
+        """流式解压到内存/临时文件，返回 (文件对象, 压缩后字节数, 解压后字节数)"""
+        decompressor = zlib.decompressobj(wbits)
+        body = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        compressed_size = size = 0
+        try:
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                compressed_size += len(chunk)
+                # max_length 限制单次输出，超出上限时立即停止，不会先把整个炸弹解压出来
+                data = decompressor.decompress(chunk, self.max_size - size + 1)
+                while data:
+                    size += len(data)
+                    if size > self.max_size:
+                        raise BodyTooLarge()
+                    body.write(data)
+                    data = decompressor.decompress(decompressor.unconsumed_tail, self.max_size - size + 1)
+                if decompressor.eof:
+                    break
+            data = decompressor.flush()
+            size += len(data)
+            if size > self.max_size:
+                raise BodyTooLarge()
+            body.write(data)
+            if not decompressor.eof:
+                raise zlib.error('压缩数据不完整')
+        except Exception:
+            body.close()
+            raise
+        body.seek(0)
+        return body, compressed_size, size
+    
+    @staticmethod
+    def _error(environ: Dict[str, Any], start_response: Callable, code: int, message: str):
+        response = Response(json_codec.dumps_bytes({'status': 'error', 'message': message}),
+                            status=code, mimetype='application/json')
+        return response(environ, start_response)
+
+
+# 压缩请求的解压比例（解压后 / 压缩后）
+metrics.register_gauge(
+    'requestCompressionRatio',
+    lambda: ratio(metrics.get('requestCompression.decompressedBytes'),
+                  metrics.get('requestCompression.compressedBytes'))
+)
@@ -26,6 +26,15 @@ class Config:
     DEBUG = False  # 调试模式（生产环境设为False）
     HOST = '0.0.0.0'  # 监听所有网络接口
     
+    # 日志（见 log_config.py）：格式化和输出在后台线程完成，INFO 及以下按 logger 采样，同一处日志按时间窗口限流
+    LOG_LEVEL = 'INFO'  # 平时的日志级别（诊断模式下为 DEBUG）
+    LOG_VERBOSE = False  # 启动时即打开诊断模式（运行中可通过 PUT /api/logging 切换）
+    LOG_FORMAT = 'text'  # 'text' 或 'json'（每行一个JSON对象）
+    LOG_SAMPLE_RATES = {'werkzeug': 0.1}  # logger 名称前缀 -> 保留比例（werkzeug 访问日志以看板轮询和媒体下载为主）
+    LOG_RATE_LIMIT = 20  # 同一处日志每个时间窗口最多输出的条数（ERROR 及以上不限，0 表示不限流）
+    LOG_RATE_WINDOW = 10.0  # 限流时间窗口（秒）
+    LOG_QUEUE_SIZE = 10000  # 待输出日志的队列上限（满时丢弃新日志）
+    
     # 数据存储配置
     BASE_DIR = get_base_dir()
     DATA_DIR = os.path.join(BASE_DIR, 'data', 'students')  # 学生数据目录
@@ -33,6 +42,7 @@ class Config:
     EVALUATION_DIR = os.path.join(BASE_DIR, 'data', 'evaluations')  # 评价数据目录
     EXPORT_DIR = os.path.join(BASE_DIR, 'data', 'exports')  # 导出文件目录
     DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'campcooking.db')  # SQLite数据库路径
+    INGEST_DIR = os.path.join(BASE_DIR, 'data', 'ingest')  # 异步提交日志目录
     
     # 允许的文件类型
     ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
@@ -41,9 +51,90 @@ class Config:
     # 最大文件大小（字节）
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
     
+    # 可续传上传（见 resumable_upload.py）：大视频分块追加到临时文件，断线后从已接收的位置继续
+    UPLOAD_TMP_DIR = os.path.join(BASE_DIR, 'data', 'uploads')  # 未完成的上传（与媒体目录在同一磁盘，完成时原子移动）
+    RESUMABLE_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 建议客户端每个 PATCH 请求发送的字节数
+    RESUMABLE_UPLOAD_EXPIRE_HOURS = 72  # 超过该时间没有写入的上传会被删除
+    
+    # 按内容寻址的媒体存储（见 media_store.py）：相同内容只存一份，团队媒体目录中的文件是指向它的硬链接
+    MEDIA_BLOB_DIR = os.path.join(BASE_DIR, 'data', 'media_blobs')  # 内容文件目录（与媒体目录在同一磁盘才能硬链接）
+    MEDIA_BLOB_GC_GRACE_SECONDS = 3600  # 未被引用的内容文件保留该时间后才清理（可能正在被链接）
+    MEDIA_MANIFEST_MAX_ITEMS = 5000  # 媒体清单（/media/manifest）一次最多检查的文件数
+    
     # API配置
     CORS_ORIGINS = ['*']  # 允许的跨域来源（生产环境应限制具体域名）
     
+    # 压缩请求体（Content-Encoding: gzip / deflate）
+    REQUEST_DECOMPRESS_PATHS = ('/api/submit', '/api/evaluation', '/api/student/')  # 允许压缩请求体的路径前缀
+    MAX_DECOMPRESSED_SIZE = MAX_FILE_SIZE  # 解压后请求体上限（防止压缩炸弹）
+    
+    # 写请求准入控制（见 admission.py）：同时处理的写请求数有上限，多出的排队，队列满或排队超时返回 503
+    ADMISSION_ENABLED = True
+    ADMISSION_PATHS = ('/api/',)  # 需要准入控制的路径前缀（只限制 POST / PUT / PATCH / DELETE）
+    ADMISSION_EXEMPT_SUFFIXES = ('/upload', '/media/manifest')  # 媒体上传（/media/upload、/api/media/<id>/upload）主要耗时在网络传输、清单只读，不占用名额
+    ADMISSION_EXEMPT_SEGMENTS = ('/media/uploads',)  # 路径中包含这些片段的请求也不受限制（可续传上传）
+    ADMISSION_MAX_ACTIVE = 4  # 同时处理的写请求数（SQLite 只有一个写者，再多只会在锁上重试）
+    ADMISSION_MAX_QUEUE = 32  # 排队等待的写请求数上限
+    ADMISSION_QUEUE_TIMEOUT = 10.0  # 排队最长等待（秒）
+    ADMISSION_RETRY_AFTER_MAX = 30  # Retry-After 上限（秒）
+    
+    # 同一团队的写操作按团队加锁排队（见 team_locks.py），锁的分段数
+    TEAM_LOCK_STRIPES = 64
+    
+    # 异步提交配置
+    # True：/api/submit 全部先写日志、入队后立即返回 202；
+    # False：只有请求头带 "Prefer: respond-async" 的提交走异步，其余保持同步处理
+    ASYNC_INGEST = False
+    INGEST_WORKERS = 2  # 后台处理线程数
+    INGEST_FSYNC = True  # 写入日志后是否 fsync（关闭后更快，但断电可能丢失刚收到的数据）
+    INGEST_JOB_HISTORY = 1000  # 内存中保留的已完成任务状态数量
+    INGEST_JOURNAL_MAX_BYTES = 64 * 1024 * 1024  # 日志超过该大小且没有未完成任务时清空
+    INGEST_COALESCE_MS = 500  # 同一团队相隔不到该时间的异步提交合并为最新的一份（0 表示不合并）
+    INGEST_COALESCE_MAX_MS = 3000  # 合并窗口从第一份提交算起的最长等待时间
+    
+    # 批量提交（/api/submit/batch，中继设备一次上传多个团队）
+    BATCH_SUBMIT_MAX_ITEMS = 100  # 单次请求最多的团队数
+    BATCH_SUBMIT_GROUP_SIZE = 25  # 每个数据库事务写入的团队数
+    
+    # 大提交的进程池解析（见 parse_pool.py）：超过该大小的请求体在子进程中解码和校验，不占用请求线程的 GIL
+    PARSE_POOL_ENABLED = True
+    PARSE_POOL_MIN_BYTES = 1024 * 1024  # 1MB
+    PARSE_POOL_WORKERS = None  # 进程数，None 表示 CPU 核心数 - 1
+    PARSE_POOL_TIMEOUT = 60  # 单个请求体解析超时（秒）
+    
+    # 同步提交的流式解析（见 stream_parser.py）：超过该大小（或未知长度）的JSON请求体边读边解析、边压缩归档，
+    # 内存峰值取决于读取块和最大的单个阶段，而不是整个请求体；优先于进程池（进程池仍用于 MessagePack 和异步提交）
+    STREAM_PARSE_ENABLED = True
+    STREAM_PARSE_MIN_BYTES = 256 * 1024  # 256KB
+    STREAM_PARSE_CHUNK_SIZE = 64 * 1024  # 每次从请求体读取的字节数
+    
+    # 重复提交检测：同一团队提交内容（忽略 exportTime）与上次成功保存的完全相同时，直接确认而不写入
+    SUBMIT_DEDUPE = True
+    
+    # 原始提交归档（每个团队一个压缩的只追加文件，见 archive.py）
+    ARCHIVE_COMPRESS_LEVEL = 6  # zlib 压缩级别（1 最快，9 最小）
+    ARCHIVE_KEEP_VERSIONS = 20  # python archive.py compact 默认保留的最近版本数
+    
+    # 从原始提交归档重建数据库（python rebuild.py）
+    REBUILD_WORKERS = None  # 解析进程数，None 表示使用全部CPU核心
+    REBUILD_BATCH_SIZE = 500  # 每个事务批量写入的团队数
+    
+    # 后台文件写入（教师评价快照等，见 file_writer.py）
+    FILE_WRITER_WORKERS = 2  # 写入线程数
+    FILE_WRITER_MAX_QUEUE = 256  # 每个线程的队列上限，写满时请求线程等待
+    FILE_WRITER_FSYNC = 'always'  # 'always'（文件和目录都 fsync）/ 'file'（只 fsync 文件）/ 'none'
+    
+    # JSON编解码配置
+    JSON_BACKEND = 'auto'  # 'auto'（已安装orjson时优先使用）/ 'orjson' / 'json'（标准库）
+    MSGPACK_BACKEND = 'auto'  # 'auto'（已安装msgpack时优先使用C扩展）/ 'python'（内置实现）
+    # 各类文件是否缩进美化输出（未列出的类型默认紧凑输出）
+    JSON_PRETTY = {
+        'evaluation': True,  # 教师评价文件 evaluation_*.json
+        'student_list': True,  # 学生名单 student_list.json 及样板
+        'metadata': True,  # 导出包中的 metadata.json
+        'response': False,  # API响应（调试模式下始终美化）
+    }
+    
     # 清空数据库密码配置
     CLEAR_DATABASE_PASSWORD = '81438316'  # 清空数据库所需的密码
 
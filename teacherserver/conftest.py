@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试公用的 fixture
+server：把数据目录和数据库指向临时目录后导入 app，并替换 app 中的存储对象
+client：Flask 测试客户端（经过解压和准入中间件）
+"""
+
+import importlib
+import logging
+import sys
+
+import pytest
+
+import log_config
+from config import Config
+from db_init import init_database
+
+
+@pytest.fixture(scope='session')
+def _server_logging():
+    """app 导入时把日志输出绑定到 pytest 捕获的 stderr：结束时停止日志线程，之后的日志输出到真正的 stderr"""
+    yield
+    log_config.shutdown_logging()
+    for handler in logging.getLogger().handlers:
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(sys.__stderr__)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, _server_logging):
+    """使用临时数据目录的 app 模块"""
+    data_dir = tmp_path / 'data'
+    for name, path in (('DATA_DIR', data_dir / 'students'), ('MEDIA_DIR', data_dir / 'media'),
+                       ('EVALUATION_DIR', data_dir / 'evaluations'), ('EXPORT_DIR', data_dir / 'exports'),
+                       ('INGEST_DIR', data_dir / 'ingest'), ('UPLOAD_TMP_DIR', data_dir / 'uploads'),
+                       ('MEDIA_BLOB_DIR', data_dir / 'media_blobs'),
+                       ('DATABASE_PATH', data_dir / 'campcooking.db')):
+        monkeypatch.setattr(Config, name, str(path))
+    data_dir.mkdir()
+    assert init_database(Config.DATABASE_PATH)
+    
+    # app 只导入一次；存储对象在模块级创建，每个测试换成指向临时目录的新实例
+    app = importlib.import_module('app')
+    storage = app.DataStorage(Config.DATA_DIR, Config.MEDIA_DIR)
+    media_store = app.MediaStore(Config.MEDIA_BLOB_DIR, Config.MEDIA_DIR)
+    monkeypatch.setattr(app, 'storage', storage)
+    monkeypatch.setattr(app, 'media_store', media_store)
+    monkeypatch.setattr(app, 'uploads', app.ResumableUploads(Config.UPLOAD_TMP_DIR, media_store))
+    yield app
+    storage.db_manager.close()
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
@@ -8,8 +8,11 @@
 import sqlite3
 import os
 import logging
+from datetime import datetime
 from typing import Optional
 
+from models import media_id_for, media_key
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,10 +30,10 @@ class DatabaseInitializer:
         # 启用 WAL 模式（Write-Ahead Logging）以提高并发性能
         try:
             self.conn.execute("PRAGMA journal_mode=WAL")
-            logger.info(f"连接到数据库: {self.db_path} (WAL 模式已启用)")
+            logger.info("连接到数据库: %s (WAL 模式已启用)", self.db_path)
         except Exception as e:
-            logger.warning(f"启用 WAL 模式失败: {str(e)}")
-            logger.info(f"连接到数据库: {self.db_path}")
+            logger.warning("启用 WAL 模式失败: %s", e)
+            logger.info("连接到数据库: %s", self.db_path)
         # 设置 busy_timeout（毫秒），自动重试锁定的数据库
         self.conn.execute("PRAGMA busy_timeout=5000")  # 5秒超时
     
@@ -49,9 +52,9 @@ class DatabaseInitializer:
             cursor = self.conn.cursor()
             cursor.execute(sql)
             self.conn.commit()
-            logger.debug(f"执行SQL成功: {sql[:100]}...")
+            logger.debug("执行SQL成功: %s...", sql[:100])
         except Exception as e:
-            logger.error(f"执行SQL失败: {sql[:100]}... 错误: {str(e)}")
+            logger.error("执行SQL失败: %s... 错误: %s", sql[:100], e)
             raise
     
     def init_database(self):
@@ -146,6 +149,8 @@ class DatabaseInitializer:
                 file_type TEXT NOT NULL,
                 file_size INTEGER,
                 timestamp INTEGER NOT NULL,
+                media_id TEXT,
+                stored_path TEXT,
                 created_at INTEGER NOT NULL,
                 schema_version INTEGER NOT NULL DEFAULT 1,
                 extra_data TEXT,
@@ -229,7 +234,32 @@ class DatabaseInitializer:
             )
         """)
         
-        # 11. 创建 data_versions 表
+        # 11. 创建 submission_hashes 表（每个团队最近一次成功保存的提交内容哈希，用于跳过重复提交）
+        self.execute_sql("""
+            CREATE TABLE IF NOT EXISTS submission_hashes (
+                team_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                submit_count INTEGER NOT NULL DEFAULT 1,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+        
+        # 12. 创建 media_refs 表（团队的媒体文件名 -> 内容 SHA-256，文件本身按内容保存在 MEDIA_BLOB_DIR）
+        self.execute_sql("""
+            CREATE TABLE IF NOT EXISTS media_refs (
+                team_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                file_type TEXT,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                PRIMARY KEY (team_id, filename)
+            )
+        """)
+        
+        # 13. 创建 data_versions 表
         self.execute_sql("""
             CREATE TABLE IF NOT EXISTS data_versions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -241,6 +271,9 @@ class DatabaseInitializer:
             )
         """)
         
+        # 旧数据库补充新增的列（CREATE TABLE IF NOT EXISTS 不会修改已存在的表）
+        self.migrate_media_ids()
+        
         # 创建索引
         logger.info("创建索引...")
         
@@ -265,6 +298,7 @@ class DatabaseInitializer:
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_media_items_stage_id ON media_items(stage_record_id)")
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_media_items_file_path ON media_items(file_path)")
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_media_items_type ON media_items(file_type)")
+        self.execute_sql("CREATE UNIQUE INDEX IF NOT EXISTS idx_media_items_media_id ON media_items(media_id)")
         
         # summary_data 表索引
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_summary_data_team_id ON summary_data(team_id)")
@@ -283,11 +317,62 @@ class DatabaseInitializer:
         # menus 表索引
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_menus_team_id ON menus(team_id)")
         
+        # media_refs 表索引
+        self.execute_sql("CREATE INDEX IF NOT EXISTS idx_media_refs_sha256 ON media_refs(sha256)")
+        
         # data_versions 表索引
         self.execute_sql("CREATE INDEX IF NOT EXISTS idx_data_versions_table ON data_versions(table_name)")
         
         logger.info("数据库初始化完成！")
     
+    def migrate_media_ids(self, media_dir: Optional[str] = None):
+        """
+        media_items 增加 media_id / stored_path 列并补全旧数据：
+        media_id 按团队、阶段和文件名生成（media_id_for）；团队媒体目录中已有同名文件（已上传）的记录 stored_path；
+        同一阶段中文件名相同的记录得到同一个 media_id，只保留第一条、删除其余的（与保存提交时按文件名合并一致）
+        """
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(media_items)")}
+        for column in ('media_id', 'stored_path'):
+            if column not in columns:
+                self.execute_sql(f"ALTER TABLE media_items ADD COLUMN {column} TEXT")
+                logger.info("media_items 表已添加列: %s", column)
+        
+        rows = self.conn.execute("""
+            SELECT mi.id, mi.file_path, sr.stage_name, pr.team_id FROM media_items mi
+            JOIN stage_records sr ON mi.stage_record_id = sr.id
+            JOIN process_records pr ON sr.process_record_id = pr.id
+            WHERE mi.media_id IS NULL
+        """).fetchall()
+        if not rows:
+            return
+        
+        if media_dir is None:
+            from config import Config
+            media_dir = Config.MEDIA_DIR
+        updates, duplicates = [], []
+        seen = set()
+        for media_row_id, file_path, stage_name, team_id in rows:
+            media_id = media_id_for(team_id, stage_name, file_path)
+            if media_id in seen:
+                duplicates.append((media_row_id,))
+                continue
+            seen.add(media_id)
+            filename = media_key(file_path)
+            uploaded = os.path.isfile(os.path.join(media_dir, team_id, filename))
+            updates.append((media_id, f"{team_id}/{filename}" if uploaded else None, media_row_id))
+        cursor = self.conn.cursor()
+        cursor.executemany("UPDATE media_items SET media_id = ?, stored_path = ? WHERE id = ?", updates)
+        cursor.executemany("DELETE FROM media_items WHERE id = ?", duplicates)
+        cursor.execute(
+            "INSERT INTO data_versions (table_name, schema_version, migration_script, applied_at, description) "
+            "VALUES ('media_items', 2, 'db_init.migrate_media_ids', ?, ?)",
+            (int(datetime.now().timestamp() * 1000), f'补全 {len(updates)} 条媒体记录的 media_id / stored_path')
+        )
+        self.conn.commit()
+        logger.info("已补全 %s 条媒体记录的服务器ID", len(updates))
+        if duplicates:
+            logger.warning("⚠️ 已合并 %s 条同一阶段中文件名重复的媒体记录", len(duplicates))
+    
     def check_tables(self) -> bool:
         """检查表是否存在"""
         if not self.conn:
@@ -299,7 +384,8 @@ class DatabaseInitializer:
             WHERE type='table' AND name IN (
                 'teams', 'team_divisions', 'process_records', 'stage_records',
                 'media_items', 'summary_data', 'teacher_evaluations', 
-                'teacher_evaluation_teams', 'teacher_evaluations_v2', 'menus', 'data_versions'
+                'teacher_evaluation_teams', 'teacher_evaluations_v2', 'menus', 'submission_hashes',
+                'media_refs', 'data_versions'
             )
         """)
         tables = [row[0] for row in cursor.fetchall()]
@@ -307,15 +393,16 @@ class DatabaseInitializer:
         required_tables = [
             'teams', 'team_divisions', 'process_records', 'stage_records',
             'media_items', 'summary_data', 'teacher_evaluations',
-            'teacher_evaluation_teams', 'teacher_evaluations_v2', 'menus', 'data_versions'
+            'teacher_evaluation_teams', 'teacher_evaluations_v2', 'menus', 'submission_hashes',
+            'media_refs', 'data_versions'
         ]
         
         missing_tables = set(required_tables) - set(tables)
         if missing_tables:
-            logger.warning(f"缺少表: {missing_tables}")
+            logger.warning("缺少表: %s", missing_tables)
             return False
         
-        logger.info(f"所有表已存在: {tables}")
+        logger.info("所有表已存在: %s", tables)
         return True
 
 
@@ -327,7 +414,7 @@ def init_database(db_path: str):
         initializer.init_database()
         return True
     except Exception as e:
-        logger.error(f"数据库初始化失败: {str(e)}", exc_info=True)
+        logger.error("数据库初始化失败: %s", e, exc_info=True)
         return False
     finally:
         initializer.close()
@@ -5,19 +5,24 @@
 封装所有数据库CRUD操作
 """
 
+import os
 import sqlite3
-import json
 import logging
 import time
 import random
-from typing import Dict, List, Optional, Any, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from datetime import datetime
 
 from models import (
-    Team, TeamDivision, ProcessRecord, StageRecord,
-    SummaryData, TeacherEvaluation, TeacherEvaluationV2, TeacherEvaluationTeam, MediaItem, Menu, STAGE_ORDER
+    Team, TeamDivision, ProcessRecord, StageRecord, LazyMediaItems,
+    SummaryData, TeacherEvaluation, TeacherEvaluationV2, TeacherEvaluationTeam, MediaItem, Menu, STAGE_ORDER,
+    media_key, media_id_for
 )
 from config import Config
+from validation import ValidatedSubmission
+import json_codec
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +32,31 @@ RETRY_DELAY_BASE = 0.1  # 基础延迟（秒）
 RETRY_DELAY_MAX = 2.0  # 最大延迟（秒，增加到2秒）
 
 
+# 判断记录是否变化时比较的字段（不含 id、时间戳）
+_PROCESS_CONTENT = ('start_time', 'end_time', 'current_stage', 'overall_notes', 'extra_data')
+_STAGE_CONTENT = ('start_time', 'end_time', 'self_rating', 'notes', 'problem_notes',
+                  'is_completed', 'selected_tags', 'extra_data')
+_MEDIA_CONTENT = ('file_type', 'timestamp', 'summary_question')
+
+
+def _changed(old: Any, new: Any, fields: Tuple[str, ...]) -> bool:
+    """两条记录在指定字段上是否有差异"""
+    return any(getattr(old, name) != getattr(new, name) for name in fields)
+
+
+class LoadSpec:
+    """get_process_record 的加载范围"""
+    STAGES = 'stages'  # 只加载阶段记录（列表页：评分、完成状态），stage.media_items 保持为空列表
+    MEDIA_COUNTS = 'media_counts'  # 阶段记录 + 每个阶段的媒体数量（一次聚合查询），媒体内容迭代时才查询
+    FULL = 'full'  # 阶段记录 + 惰性媒体集合（迭代时才查询）
+
+
 class DatabaseManager:
     """数据库管理器（线程安全）"""
     
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or Config.DATABASE_PATH
+        self._local = threading.local()  # 每个线程的事务嵌套深度
     
     def _get_connection(self) -> sqlite3.Connection:
         """获取数据库连接（每次请求创建新连接，线程安全）"""
@@ -51,7 +76,7 @@ class DatabaseManager:
                 conn.execute("PRAGMA journal_mode=WAL")
                 logger.debug("已启用 WAL 模式")
             except Exception as e:
-                logger.warning(f"启用 WAL 模式失败（可能已启用）: {str(e)}")
+                logger.warning("启用 WAL 模式失败（可能已启用）: %s", e)
             # 设置 busy_timeout（毫秒），自动重试锁定的数据库
             # 增加到30秒，给并发操作更多时间
             conn.execute("PRAGMA busy_timeout=30000")  # 30秒超时
@@ -68,8 +93,52 @@ class DatabaseManager:
                 self._thread_connections[thread_id].close()
                 del self._thread_connections[thread_id]
     
+    def _in_transaction(self) -> bool:
+        return getattr(self._local, 'depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self):
+        """
+        写事务：BEGIN IMMEDIATE 一开始就取得写锁（锁定时按退避策略重试），
+        块内的 _execute 不再逐条提交，正常结束时统一提交，异常时整体回滚。支持嵌套（只有最外层提交）
+        """
+        if self._in_transaction():
+            self._local.depth += 1
+            try:
+                yield self._get_connection()
+            finally:
+                self._local.depth -= 1
+            return
+        
+        conn = self._get_connection()
+        for attempt in range(MAX_RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e).lower() or attempt == MAX_RETRIES - 1:
+                    raise
+                delay = min(RETRY_DELAY_BASE * (2 ** attempt) + random.uniform(0, 0.1), RETRY_DELAY_MAX)
+                logger.warning("数据库被锁定，%.2f秒后重试开启事务 (%s/%s): %s", delay, attempt + 1, MAX_RETRIES, e)
+                time.sleep(delay)
+        
+        self._local.depth = 1
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.depth = 0
+    
     def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
-        """执行SQL语句（带重试机制和连接管理）"""
+        """执行SQL语句（带重试机制和连接管理；在 transaction() 内时不单独提交、不重试）"""
+        if self._in_transaction():
+            cursor = self._get_connection().cursor()
+            cursor.execute(sql, params)
+            return cursor
+        
         last_exception = None
         
         for attempt in range(MAX_RETRIES):
@@ -100,8 +169,7 @@ class DatabaseManager:
                             RETRY_DELAY_MAX
                         )
                         logger.warning(
-                            f"数据库被锁定，{delay:.2f}秒后重试 "
-                            f"({attempt + 1}/{MAX_RETRIES}): {str(e)}"
+                            "数据库被锁定，%.2f秒后重试 (%s/%s): %s", delay, attempt + 1, MAX_RETRIES, e
                         )
                         time.sleep(delay)
                         # 关闭当前连接，强制重新获取
@@ -117,7 +185,7 @@ class DatabaseManager:
                                 pass
                         continue
                     else:
-                        logger.error(f"数据库锁定，已达到最大重试次数: {str(e)}")
+                        logger.error("数据库锁定，已达到最大重试次数: %s", e)
                         raise
                 else:
                     # 其他类型的错误，直接抛出
@@ -126,7 +194,7 @@ class DatabaseManager:
                             conn.rollback()
                         except:
                             pass
-                    logger.error(f"数据库操作失败: {str(e)}")
+                    logger.error("数据库操作失败: %s", e)
                     raise
             except Exception as e:
                 # 非数据库锁定错误，回滚并抛出
@@ -135,7 +203,7 @@ class DatabaseManager:
                         conn.rollback()
                     except:
                         pass
-                logger.error(f"数据库操作失败: {str(e)}")
+                logger.error("数据库操作失败: %s", e)
                 raise
         
         # 如果所有重试都失败
@@ -157,6 +225,18 @@ class DatabaseManager:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
     
+    def _fetch_row(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        """执行查询并返回单条原始行（元组，按SELECT列顺序，配合 Model.from_row 使用）"""
+        cursor = self._execute(sql, params)
+        cursor.row_factory = None
+        return cursor.fetchone()
+    
+    def _fetch_rows(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """执行查询并返回所有原始行（元组，按SELECT列顺序，配合 Model.from_row 使用）"""
+        cursor = self._execute(sql, params)
+        cursor.row_factory = None
+        return cursor.fetchall()
+    
     # ==================== Teams 操作 ====================
     
     def save_team(self, team: Team) -> int:
@@ -184,51 +264,40 @@ class DatabaseManager:
                     team.team_id
                 ))
                 team.id = existing['id']
-                logger.info(f"更新团队: {team.team_id}")
+                logger.debug("更新团队: %s", team.team_id)
             else:
                 # 插入
-                cursor = self._execute("""
-                    INSERT INTO teams (
-                        team_id, school, grade, class_name, stove_number,
-                        member_count, member_names,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team.team_id, team.school, team.grade, team.class_name, team.stove_number,
-                    team.member_count, team.member_names,
-                    team.created_at, team.updated_at, team.schema_version, team.extra_data
-                ))
+                cursor = self._execute(Team.serializer.insert_sql, Team.serializer.insert_params(team))
                 team.id = cursor.lastrowid
-                logger.info(f"插入团队: {team.team_id}")
+                logger.debug("插入团队: %s", team.team_id)
             
             return team.id
         except Exception as e:
-            logger.error(f"保存团队失败: {str(e)}", exc_info=True)
+            logger.error("保存团队失败: %s", e, exc_info=True)
             raise
     
     def get_team(self, team_id: str) -> Optional[Team]:
         """获取团队信息"""
         try:
-            # 添加详细日志
-            logger.debug(f"查询团队: team_id='{team_id}' (类型: {type(team_id)})")
-            row = self._fetch_one("SELECT * FROM teams WHERE team_id = ?", (team_id,))
+            logger.debug("查询团队: team_id=%r", team_id)
+            row = self._fetch_row(f"SELECT {Team.COLUMN_SQL} FROM teams WHERE team_id = ?", (team_id,))
             if row:
-                logger.debug(f"✅ 找到团队: team_id='{team_id}'")
-                return Team(row)
+                logger.debug("✅ 找到团队: team_id=%r", team_id)
+                return Team.from_row(row)
             else:
-                logger.debug(f"❌ 未找到团队: team_id='{team_id}'")
+                logger.debug("❌ 未找到团队: team_id=%r", team_id)
             return None
         except Exception as e:
-            logger.error(f"获取团队失败: team_id='{team_id}', 错误: {str(e)}", exc_info=True)
+            logger.error("获取团队失败: team_id='%s', 错误: %s", team_id, e, exc_info=True)
             return None
     
     def get_all_teams(self) -> List[Team]:
         """获取所有团队"""
         try:
-            rows = self._fetch_all("SELECT * FROM teams ORDER BY school, grade, class_name, stove_number")
-            return [Team(row) for row in rows]
+            rows = self._fetch_rows(f"SELECT {Team.COLUMN_SQL} FROM teams ORDER BY school, grade, class_name, stove_number")
+            return [Team.from_row(row) for row in rows]
         except Exception as e:
-            logger.error(f"获取所有团队失败: {str(e)}", exc_info=True)
+            logger.error("获取所有团队失败: %s", e, exc_info=True)
             return []
     
     # ==================== Team Divisions 操作 ====================
@@ -260,185 +329,294 @@ class DatabaseManager:
                     team_id
                 ))
                 division.id = existing['id']
-                logger.info(f"更新团队分工: {team_id}")
+                logger.debug("更新团队分工: %s", team_id)
             else:
                 # 插入
-                cursor = self._execute("""
-                    INSERT INTO team_divisions (
-                        team_id, group_leader, group_cooking, group_soup_rice,
-                        group_fire, group_health,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team_id, division.group_leader, division.group_cooking, division.group_soup_rice,
-                    division.group_fire, division.group_health,
-                    division.created_at, division.updated_at, division.schema_version, division.extra_data
-                ))
+                cursor = self._execute(TeamDivision.serializer.insert_sql, TeamDivision.serializer.insert_params(division))
                 division.id = cursor.lastrowid
-                logger.info(f"插入团队分工: {team_id}")
+                logger.debug("插入团队分工: %s", team_id)
             
             return division.id
         except Exception as e:
-            logger.error(f"保存团队分工失败: {str(e)}", exc_info=True)
+            logger.error("保存团队分工失败: %s", e, exc_info=True)
             raise
     
     def get_team_division(self, team_id: str) -> Optional[TeamDivision]:
         """获取团队分工"""
         try:
-            row = self._fetch_one("SELECT * FROM team_divisions WHERE team_id = ?", (team_id,))
+            row = self._fetch_row(f"SELECT {TeamDivision.COLUMN_SQL} FROM team_divisions WHERE team_id = ?", (team_id,))
             if row:
-                return TeamDivision(row)
+                return TeamDivision.from_row(row)
             return None
         except Exception as e:
-            logger.error(f"获取团队分工失败: {str(e)}", exc_info=True)
+            logger.error("获取团队分工失败: %s", e, exc_info=True)
             return None
     
     # ==================== Process Records 操作 ====================
     
-    def save_process_record(self, team_id: str, process_record: ProcessRecord, stages: List[StageRecord], stages_media: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> int:
-        """保存或更新过程记录和阶段记录（使用事务）"""
-        conn = self._get_connection()
+    def save_process_record(self, team_id: str, process_record: ProcessRecord, stages: List[StageRecord], stages_media: Optional[Dict[str, List[Any]]] = None) -> int:
+        """
+        保存或更新过程记录和阶段记录（单个事务，按差异合并）
+        与已保存的数据逐阶段、逐媒体文件比较，只对有变化的行执行 UPDATE / INSERT / DELETE；
+        已有的媒体记录按文件名匹配，保留原记录（服务器ID和上传状态不变）
+        
+        stages_media: 阶段名 -> 媒体文件列表（MediaItem 对象，或Android格式字典）
+        """
         try:
-            conn.execute("BEGIN TRANSACTION")
-            
-            process_record.team_id = team_id
-            
-            # 检查是否已存在过程记录
-            existing = self._fetch_one(
-                "SELECT id FROM process_records WHERE team_id = ?",
-                (team_id,)
-            )
-            
-            if existing:
-                # 更新过程记录
-                process_record.update_timestamp()
-                self._execute("""
-                    UPDATE process_records SET
-                        start_time = ?, end_time = ?, current_stage = ?, overall_notes = ?,
-                        updated_at = ?, schema_version = ?, extra_data = ?
-                    WHERE team_id = ?
-                """, (
-                    process_record.start_time, process_record.end_time,
-                    process_record.current_stage, process_record.overall_notes,
-                    process_record.updated_at, process_record.schema_version, process_record.extra_data,
-                    team_id
-                ))
-                process_record.id = existing['id']
-                # 删除旧的阶段记录
-                self._execute("DELETE FROM stage_records WHERE process_record_id = ?", (process_record.id,))
-                logger.info(f"更新过程记录: {team_id}")
-            else:
-                # 插入过程记录
-                cursor = self._execute("""
-                    INSERT INTO process_records (
-                        team_id, start_time, end_time, current_stage, overall_notes,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team_id, process_record.start_time, process_record.end_time,
-                    process_record.current_stage, process_record.overall_notes,
-                    process_record.created_at, process_record.updated_at,
-                    process_record.schema_version, process_record.extra_data
-                ))
-                process_record.id = cursor.lastrowid
-                logger.info(f"插入过程记录: {team_id}")
-            
-            # 插入所有阶段记录
-            for stage in stages:
-                stage.process_record_id = process_record.id
-                stage.update_timestamp()
-                cursor = self._execute("""
-                    INSERT INTO stage_records (
-                        process_record_id, stage_name, start_time, end_time,
-                        self_rating, notes, problem_notes, is_completed, selected_tags,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    stage.process_record_id, stage.stage_name, stage.start_time, stage.end_time,
-                    stage.self_rating, stage.notes, stage.problem_notes,
-                    1 if stage.is_completed else 0,
-                    json.dumps(stage.selected_tags, ensure_ascii=False) if stage.selected_tags else '[]',
-                    stage.created_at, stage.updated_at, stage.schema_version, stage.extra_data
-                ))
-                stage.id = cursor.lastrowid
-                
-                # 删除该阶段旧的媒体文件（如果存在）
-                self._execute("DELETE FROM media_items WHERE stage_record_id = ?", (stage.id,))
+            with self.transaction():
+                process_record.team_id = team_id
+                stages_media = stages_media or {}
+                changes = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
                 
-                # 保存该阶段的媒体文件
-                logger.info(f"处理阶段 {stage.stage_name} (ID: {stage.id}) 的媒体文件")
-                logger.info(f"stages_media 的键: {list(stages_media.keys()) if stages_media else []}")
+                # 检查是否已存在过程记录
+                existing_row = self._fetch_row(
+                    f"SELECT {ProcessRecord.COLUMN_SQL} FROM process_records WHERE team_id = ?",
+                    (team_id,)
+                )
                 
-                if stages_media and stage.stage_name in stages_media:
-                    media_items = stages_media[stage.stage_name]
-                    logger.info(f"找到 {len(media_items)} 个媒体文件需要保存")
+                existing_stages: Dict[str, StageRecord] = {}
+                if existing_row:
+                    existing = ProcessRecord.from_row(existing_row)
+                    process_record.id = existing.id
+                    process_record.created_at = existing.created_at
+                    if _changed(existing, process_record, _PROCESS_CONTENT):
+                        # 更新过程记录
+                        process_record.update_timestamp()
+                        self._execute("""
+                            UPDATE process_records SET
+                                start_time = ?, end_time = ?, current_stage = ?, overall_notes = ?,
+                                updated_at = ?, schema_version = ?, extra_data = ?
+                            WHERE id = ?
+                        """, (
+                            process_record.start_time, process_record.end_time,
+                            process_record.current_stage, process_record.overall_notes,
+                            process_record.updated_at, process_record.schema_version, process_record.extra_data,
+                            process_record.id
+                        ))
+                        logger.debug("更新过程记录: %s", team_id)
                     
-                    for idx, media_data in enumerate(media_items):
-                        try:
-                            logger.debug(f"处理媒体文件 {idx+1}: {media_data}")
-                            media_item = MediaItem(media_data)
-                            media_item.stage_record_id = stage.id
-                            media_item.update_timestamp()
-                            
-                            # 确保 timestamp 有值
-                            if not media_item.timestamp:
-                                media_item.timestamp = media_item.created_at
-                            
-                            logger.info(f"保存媒体文件: path={media_item.file_path}, type={media_item.file_type}, timestamp={media_item.timestamp}")
-                            
+                    # 已保存的阶段记录（按阶段名匹配）
+                    stage_rows = self._fetch_rows(
+                        f"SELECT {StageRecord.COLUMN_SQL} FROM stage_records WHERE process_record_id = ?",
+                        (process_record.id,)
+                    )
+                    for row in stage_rows:
+                        stage = StageRecord.from_row(row)
+                        existing_stages[stage.stage_name] = stage
+                else:
+                    # 插入过程记录
+                    cursor = self._execute(ProcessRecord.serializer.insert_sql, ProcessRecord.serializer.insert_params(process_record))
+                    process_record.id = cursor.lastrowid
+                    logger.debug("插入过程记录: %s", team_id)
+                
+                for stage in stages:
+                    stage.process_record_id = process_record.id
+                    old_stage = existing_stages.pop(stage.stage_name, None)
+                    if old_stage is None:
+                        stage.update_timestamp()
+                        cursor = self._execute(StageRecord.serializer.insert_sql, StageRecord.serializer.insert_params(stage))
+                        stage.id = cursor.lastrowid
+                        changes['inserted'] += 1
+                    else:
+                        stage.id = old_stage.id
+                        stage.created_at = old_stage.created_at
+                        if _changed(old_stage, stage, _STAGE_CONTENT):
+                            stage.update_timestamp()
+                            row = StageRecord.serializer.to_dict(stage)  # 数据库格式（布尔、标签已编码）
                             self._execute("""
-                                INSERT INTO media_items (
-                                    stage_record_id, summary_question, file_path, file_type,
-                                    file_size, timestamp, created_at, schema_version, extra_data
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                UPDATE stage_records SET
+                                    start_time = ?, end_time = ?, self_rating = ?, notes = ?, problem_notes = ?,
+                                    is_completed = ?, selected_tags = ?,
+                                    updated_at = ?, schema_version = ?, extra_data = ?
+                                WHERE id = ?
                             """, (
-                                media_item.stage_record_id, media_item.summary_question,
-                                media_item.file_path, media_item.file_type,
-                                media_item.file_size, media_item.timestamp,
-                                media_item.created_at, media_item.schema_version, media_item.extra_data
+                                row['start_time'], row['end_time'], row['self_rating'], row['notes'], row['problem_notes'],
+                                row['is_completed'], row['selected_tags'],
+                                row['updated_at'], row['schema_version'], row['extra_data'],
+                                stage.id
                             ))
-                            logger.info(f"✅ 成功保存媒体文件: {media_item.file_path}")
-                        except Exception as e:
-                            logger.error(f"保存媒体文件失败: {str(e)}, 数据: {media_data}", exc_info=True)
-                            # 继续处理其他媒体文件
-                else:
-                    logger.info(f"阶段 {stage.stage_name} 没有媒体文件需要保存")
+                            changes['updated'] += 1
+                        else:
+                            changes['unchanged'] += 1
+                    
+                    media_items = [
+                        media_data if isinstance(media_data, MediaItem) else MediaItem(media_data)
+                        for media_data in stages_media.get(stage.stage_name, [])
+                    ]
+                    self._merge_stage_media(team_id, stage, media_items, is_new_stage=old_stage is None)
+                
+                # 本次提交中已不存在的阶段（媒体文件随外键级联删除）
+                for old_stage in existing_stages.values():
+                    self._execute("DELETE FROM stage_records WHERE id = ?", (old_stage.id,))
+                    changes['deleted'] += 1
             
-            conn.commit()
-            media_count = sum(len(media_list) for media_list in (stages_media or {}).values())
-            logger.info(f"保存过程记录和{len(stages)}个阶段记录，{media_count}个媒体文件: {team_id}")
+            media_count = sum(len(media_list) for media_list in stages_media.values())
+            logger.info("保存过程记录和%d个阶段记录，%d个媒体文件: %s (阶段 新增%d 更新%d 删除%d 未变化%d)",
+                        len(stages), media_count, team_id, changes['inserted'], changes['updated'],
+                        changes['deleted'], changes['unchanged'])
             return process_record.id
+        
+        except Exception as e:
+            logger.error("保存过程记录失败: %s", e, exc_info=True)
+            raise
+    
+    def patch_stage(self, team_id: str, stage_name: str, fields: Dict[str, Any],
+                    media_items: Optional[List[MediaItem]] = None) -> Optional[StageRecord]:
+        """
+        更新单个阶段记录的部分字段（单个事务，只写一行；media_items 不为 None 时同时合并媒体文件）
+        过程记录或阶段记录不存在时自动创建；团队不存在时返回 None
+        
+        Args:
+            fields: 要更新的列 -> 值（模型属性格式，如 is_completed 为 bool）
+        """
+        try:
+            with self.transaction():
+                if not self._fetch_row("SELECT 1 FROM teams WHERE team_id = ?", (team_id,)):
+                    return None
+                
+                process_row = self._fetch_row("SELECT id FROM process_records WHERE team_id = ?", (team_id,))
+                if process_row:
+                    process_record_id = process_row[0]
+                else:
+                    process_record = ProcessRecord()
+                    process_record.team_id = team_id
+                    process_record.start_time = process_record.created_at
+                    cursor = self._execute(ProcessRecord.serializer.insert_sql, ProcessRecord.serializer.insert_params(process_record))
+                    process_record_id = cursor.lastrowid
+                    logger.info("插入过程记录（阶段更新时自动创建）: %s", team_id)
+                
+                stage_row = self._fetch_row(
+                    f"SELECT {StageRecord.COLUMN_SQL} FROM stage_records WHERE process_record_id = ? AND stage_name = ?",
+                    (process_record_id, stage_name)
+                )
+                if stage_row:
+                    stage = StageRecord.from_row(stage_row)
+                    changed = {column: value for column, value in fields.items() if getattr(stage, column) != value}
+                    if changed:
+                        for column, value in changed.items():
+                            setattr(stage, column, value)
+                        stage.update_timestamp()
+                        values = StageRecord.serializer.encode_db(changed)
+                        assignments = ', '.join(f"{column} = ?" for column in values)
+                        self._execute(
+                            f"UPDATE stage_records SET {assignments}, updated_at = ? WHERE id = ?",
+                            (*values.values(), stage.updated_at, stage.id)
+                        )
+                    is_new_stage = False
+                else:
+                    stage = StageRecord()
+                    stage.process_record_id = process_record_id
+                    stage.stage_name = stage_name
+                    for column, value in fields.items():
+                        setattr(stage, column, value)
+                    cursor = self._execute(StageRecord.serializer.insert_sql, StageRecord.serializer.insert_params(stage))
+                    stage.id = cursor.lastrowid
+                    is_new_stage = True
+                
+                if media_items is not None:
+                    self._merge_stage_media(team_id, stage, media_items, is_new_stage)
+                
+                # 数据已与上次完整提交不同，清除内容哈希，避免之后重发旧的完整数据被当作重复提交跳过
+                self._execute("DELETE FROM submission_hashes WHERE team_id = ?", (team_id,))
             
+            # 返回给客户端的阶段包含当前全部媒体文件（含服务器ID和上传地址）
+            stage.media_items = self.get_stage_media_items(stage.id)
+            logger.info("更新阶段记录: %s - %s (%s)", team_id, stage_name, ', '.join(fields) or '仅媒体文件')
+            return stage
+        
         except Exception as e:
-            conn.rollback()
-            logger.error(f"保存过程记录失败: {str(e)}", exc_info=True)
+            logger.error("更新阶段记录失败: %s", e, exc_info=True)
             raise
     
-    def get_process_record(self, team_id: str) -> Optional[Tuple[ProcessRecord, List[StageRecord]]]:
-        """获取过程记录及所有阶段记录（按STAGE_ORDER排序）"""
+    @staticmethod
+    def _assign_media_ids(team_id: str, stage_name: str, media_items: List[MediaItem]) -> List[MediaItem]:
+        """设置服务器ID（media_id_for），去掉同一阶段中重复列出的同一文件"""
+        result = []
+        seen = set()
+        for media_item in media_items:
+            media_item.media_id = media_id_for(team_id, stage_name, media_item.file_path)
+            if media_item.media_id in seen:
+                continue
+            seen.add(media_item.media_id)
+            result.append(media_item)
+        return result
+    
+    def _merge_stage_media(self, team_id: str, stage: StageRecord, media_items: List[MediaItem], is_new_stage: bool):
+        """按文件名合并阶段的媒体文件（调用方已开启事务）"""
+        existing_by_name: Dict[str, List[MediaItem]] = {}
+        if not is_new_stage:
+            rows = self._fetch_rows(
+                f"SELECT {MediaItem.COLUMN_SQL} FROM media_items WHERE stage_record_id = ?",
+                (stage.id,)
+            )
+            for row in rows:
+                old_media = MediaItem.from_row(row)
+                existing_by_name.setdefault(media_key(old_media.file_path), []).append(old_media)
+        
+        for media_item in self._assign_media_ids(team_id, stage.stage_name, media_items):
+            media_item.stage_record_id = stage.id
+            
+            candidates = existing_by_name.get(media_key(media_item.file_path))
+            if candidates:
+                # 已存在：保留原记录（包括上传状态），只更新类型和时间；
+                # 客户端没有时间戳（0）时沿用原记录的时间，不算作改动
+                old_media = candidates.pop(0)
+                if not media_item.timestamp:
+                    media_item.timestamp = old_media.timestamp
+                if _changed(old_media, media_item, _MEDIA_CONTENT):
+                    self._execute(
+                        "UPDATE media_items SET file_type = ?, timestamp = ?, summary_question = ? WHERE id = ?",
+                        (media_item.file_type, media_item.timestamp, media_item.summary_question, old_media.id)
+                    )
+                media_item.id = old_media.id
+                media_item.file_path = old_media.file_path
+                media_item.stored_path = old_media.stored_path
+                continue
+            
+            # 确保 timestamp 有值
+            if not media_item.timestamp:
+                media_item.timestamp = media_item.created_at
+            
+            # 先上传、后提交的文件（旧版本客户端）：团队媒体目录中已有该文件
+            filename = media_key(media_item.file_path)
+            if os.path.isfile(os.path.join(Config.MEDIA_DIR, team_id, filename)):
+                media_item.stored_path = f"{team_id}/{filename}"
+            self._execute(MediaItem.serializer.insert_sql, MediaItem.serializer.insert_params(media_item))
+            logger.debug("保存媒体文件: path=%s, type=%s", media_item.file_path, media_item.file_type)
+        
+        # 本次提交中已不存在的媒体文件
+        stale_ids = [(old_media.id,) for remaining in existing_by_name.values() for old_media in remaining]
+        if stale_ids:
+            self._get_connection().executemany("DELETE FROM media_items WHERE id = ?", stale_ids)
+    
+    def get_process_record(self, team_id: str, spec: str = LoadSpec.FULL) -> Optional[Tuple[ProcessRecord, List[StageRecord]]]:
+        """
+        获取过程记录及所有阶段记录（按STAGE_ORDER排序）
+        
+        Args:
+            team_id: 团队ID
+            spec: 加载范围（LoadSpec.STAGES / MEDIA_COUNTS / FULL），
+                  只需要评分、完成状态的列表类调用应使用 LoadSpec.STAGES
+        """
         try:
             # 获取过程记录
-            process_row = self._fetch_one(
-                "SELECT * FROM process_records WHERE team_id = ?",
+            process_row = self._fetch_row(
+                f"SELECT {ProcessRecord.COLUMN_SQL} FROM process_records WHERE team_id = ?",
                 (team_id,)
             )
             
             if not process_row:
                 return None
             
-            # 确保数据是字典格式（sqlite3.Row转换为dict）
-            if not isinstance(process_row, dict):
-                process_row = dict(process_row)
-            
             try:
-                process_record = ProcessRecord(process_row)
+                process_record = ProcessRecord.from_row(process_row)
             except Exception as e:
-                logger.error(f"创建ProcessRecord对象失败: {str(e)}, 数据: {process_row}", exc_info=True)
+                logger.error("创建ProcessRecord对象失败: %s, 数据: %s", e, process_row, exc_info=True)
                 raise
             
             # 获取阶段记录（按固定顺序排序）
-            stage_rows = self._fetch_all("""
-                SELECT * FROM stage_records
+            stage_rows = self._fetch_rows(f"""
+                SELECT {StageRecord.COLUMN_SQL} FROM stage_records
                 WHERE process_record_id = ?
                 ORDER BY CASE stage_name
                     WHEN 'PREPARATION' THEN 1
@@ -452,39 +630,76 @@ class DatabaseManager:
                 END
             """, (process_record.id,))
             
-            # 确保每个stage_row都是字典格式
+            # 每个阶段的媒体数量（一次聚合查询）
+            media_counts = {}
+            if spec == LoadSpec.MEDIA_COUNTS:
+                count_rows = self._fetch_rows("""
+                    SELECT mi.stage_record_id, COUNT(*) FROM media_items mi
+                    JOIN stage_records sr ON mi.stage_record_id = sr.id
+                    WHERE sr.process_record_id = ?
+                    GROUP BY mi.stage_record_id
+                """, (process_record.id,))
+                media_counts = dict(count_rows)
+            
             stages = []
             for row in stage_rows:
-                if not isinstance(row, dict):
-                    row = dict(row)
                 try:
-                    stage = StageRecord(row)
+                    stage = StageRecord.from_row(row)
                     # 调试：记录阶段评分
-                    logger.debug(f"从数据库读取阶段 {stage.stage_name}: self_rating={row.get('self_rating')}, 类型={type(row.get('self_rating'))}")
-                    # 获取该阶段的媒体文件
-                    media_rows = self._fetch_all(
-                        "SELECT * FROM media_items WHERE stage_record_id = ? ORDER BY timestamp",
-                        (stage.id,)
-                    )
-                    # 转换为MediaItem对象并添加到stage
-                    media_items = []
-                    for media_row in media_rows:
-                        if not isinstance(media_row, dict):
-                            media_row = dict(media_row)
-                        media_item = MediaItem(media_row)
-                        media_items.append(media_item.to_android_dict())
-                    # 将媒体文件添加到stage对象（用于前端显示）
-                    stage.media_items = media_items
+                    logger.debug("从数据库读取阶段 %s: self_rating=%r", stage.stage_name, stage.self_rating)
+                    if spec != LoadSpec.STAGES:
+                        # 媒体文件在迭代时才查询（用于前端显示）
+                        count = media_counts.get(stage.id, 0) if spec == LoadSpec.MEDIA_COUNTS else None
+                        stage.media_items = LazyMediaItems(
+                            lambda stage_record_id=stage.id: self.get_stage_media_items(stage_record_id),
+                            count
+                        )
                     stages.append(stage)
                 except Exception as e:
-                    logger.error(f"创建StageRecord对象失败: {str(e)}, 数据: {row}", exc_info=True)
+                    logger.error("创建StageRecord对象失败: %s, 数据: %s", e, row, exc_info=True)
                     raise
             
             return (process_record, stages)
         except Exception as e:
-            logger.error(f"获取过程记录失败: {str(e)}", exc_info=True)
+            logger.error("获取过程记录失败: %s", e, exc_info=True)
             return None
     
+    def get_media_item(self, media_id: str) -> Optional[Tuple[MediaItem, str]]:
+        """按服务器ID获取媒体记录，返回 (媒体记录, 团队ID)"""
+        row = self._fetch_row(f"""
+            SELECT {', '.join('mi.' + column for column in MediaItem.COLUMNS)}, pr.team_id FROM media_items mi
+            JOIN stage_records sr ON mi.stage_record_id = sr.id
+            JOIN process_records pr ON sr.process_record_id = pr.id
+            WHERE mi.media_id = ?
+        """, (media_id,))
+        if not row:
+            return None
+        return MediaItem.from_row(row[:-1]), row[-1]
+    
+    def bind_uploaded_media(self, media_ids: Iterable[str], stored_path: str, file_size: int) -> int:
+        """把上传完成的文件绑定到媒体记录（按服务器ID），返回更新的记录数"""
+        media_ids = list(media_ids)
+        if not media_ids:
+            return 0
+        placeholders = ', '.join('?' * len(media_ids))
+        cursor = self._execute(
+            f"UPDATE media_items SET stored_path = ?, file_size = ? WHERE media_id IN ({placeholders})",
+            (stored_path, file_size, *media_ids)
+        )
+        return cursor.rowcount
+    
+    def get_stage_media_items(self, stage_record_id: int) -> List[Dict[str, Any]]:
+        """获取阶段的媒体文件（Android格式，按时间排序）"""
+        try:
+            media_rows = self._fetch_rows(
+                f"SELECT {MediaItem.COLUMN_SQL} FROM media_items WHERE stage_record_id = ? ORDER BY timestamp",
+                (stage_record_id,)
+            )
+            return [MediaItem.from_row(media_row).to_android_dict() for media_row in media_rows]
+        except Exception as e:
+            logger.error("获取阶段媒体文件失败: %s, %s", stage_record_id, e, exc_info=True)
+            return []
+    
     # ==================== Summary Data 操作 ====================
     
     def save_summary_data(self, team_id: str, summary: SummaryData) -> int:
@@ -512,37 +727,70 @@ class DatabaseManager:
                     team_id
                 ))
                 summary.id = existing['id']
-                logger.info(f"更新课后总结: {team_id}")
+                logger.debug("更新课后总结: %s", team_id)
             else:
                 # 插入
-                cursor = self._execute("""
-                    INSERT INTO summary_data (
-                        team_id, answer1, answer2, answer3,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team_id, summary.answer1, summary.answer2, summary.answer3,
-                    summary.created_at, summary.updated_at, summary.schema_version, summary.extra_data
-                ))
+                cursor = self._execute(SummaryData.serializer.insert_sql, SummaryData.serializer.insert_params(summary))
                 summary.id = cursor.lastrowid
-                logger.info(f"插入课后总结: {team_id}")
+                logger.debug("插入课后总结: %s", team_id)
             
             return summary.id
         except Exception as e:
-            logger.error(f"保存课后总结失败: {str(e)}", exc_info=True)
+            logger.error("保存课后总结失败: %s", e, exc_info=True)
             raise
     
     def get_summary_data(self, team_id: str) -> Optional[SummaryData]:
         """获取课后总结"""
         try:
-            row = self._fetch_one("SELECT * FROM summary_data WHERE team_id = ?", (team_id,))
+            row = self._fetch_row(f"SELECT {SummaryData.COLUMN_SQL} FROM summary_data WHERE team_id = ?", (team_id,))
             if row:
-                return SummaryData(row)
+                return SummaryData.from_row(row)
             return None
         except Exception as e:
-            logger.error(f"获取课后总结失败: {str(e)}", exc_info=True)
+            logger.error("获取课后总结失败: %s", e, exc_info=True)
             return None
     
+    def patch_summary_data(self, team_id: str, fields: Dict[str, Any]) -> Optional[SummaryData]:
+        """更新课后总结的部分字段（不存在时创建）；团队不存在时返回 None"""
+        try:
+            with self.transaction():
+                if not self._fetch_row("SELECT 1 FROM teams WHERE team_id = ?", (team_id,)):
+                    return None
+                
+                row = self._fetch_row(
+                    f"SELECT {SummaryData.COLUMN_SQL} FROM summary_data WHERE team_id = ?",
+                    (team_id,)
+                )
+                if row:
+                    summary = SummaryData.from_row(row)
+                    changed = {column: value for column, value in fields.items() if getattr(summary, column) != value}
+                    if changed:
+                        for column, value in changed.items():
+                            setattr(summary, column, value)
+                        summary.update_timestamp()
+                        values = SummaryData.serializer.encode_db(changed)
+                        assignments = ', '.join(f"{column} = ?" for column in values)
+                        self._execute(
+                            f"UPDATE summary_data SET {assignments}, updated_at = ? WHERE id = ?",
+                            (*values.values(), summary.updated_at, summary.id)
+                        )
+                else:
+                    summary = SummaryData()
+                    summary.team_id = team_id
+                    for column, value in fields.items():
+                        setattr(summary, column, value)
+                    cursor = self._execute(SummaryData.serializer.insert_sql, SummaryData.serializer.insert_params(summary))
+                    summary.id = cursor.lastrowid
+                
+                self._execute("DELETE FROM submission_hashes WHERE team_id = ?", (team_id,))
+            
+            logger.info("更新课后总结: %s (%s)", team_id, ', '.join(fields))
+            return summary
+        
+        except Exception as e:
+            logger.error("更新课后总结失败: %s", e, exc_info=True)
+            raise
+    
     # ==================== Menu 操作 ====================
     
     def save_menu(self, menu: Menu) -> int:
@@ -552,6 +800,9 @@ class DatabaseManager:
             if not team_id:
                 raise ValueError("team_id 不能为空")
             
+            # 按字段映射表编码一次（dishes -> JSON字符串），更新和插入共用
+            params = Menu.serializer.insert_params(menu)
+            
             # 检查是否已存在
             existing = self._fetch_one("SELECT id FROM menus WHERE team_id = ?", (team_id,))
             
@@ -564,40 +815,32 @@ class DatabaseManager:
                         updated_at = ?, schema_version = ?, extra_data = ?
                     WHERE team_id = ?
                 """, (
-                    menu.soup, json.dumps(menu.dishes, ensure_ascii=False),
+                    params[1], params[2],
                     menu.updated_at, menu.schema_version, menu.extra_data,
                     team_id
                 ))
                 menu.id = existing['id']
-                logger.info(f"更新菜单: {team_id}")
+                logger.info("更新菜单: %s", team_id)
             else:
                 # 插入
-                cursor = self._execute("""
-                    INSERT INTO menus (
-                        team_id, soup, dishes,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team_id, menu.soup, json.dumps(menu.dishes, ensure_ascii=False),
-                    menu.created_at, menu.updated_at, menu.schema_version, menu.extra_data
-                ))
+                cursor = self._execute(Menu.serializer.insert_sql, params)
                 menu.id = cursor.lastrowid
-                logger.info(f"插入菜单: {team_id}")
+                logger.info("插入菜单: %s", team_id)
             
             return menu.id
         except Exception as e:
-            logger.error(f"保存菜单失败: {str(e)}", exc_info=True)
+            logger.error("保存菜单失败: %s", e, exc_info=True)
             raise
     
     def get_menu(self, team_id: str) -> Optional[Menu]:
         """获取菜单"""
         try:
-            row = self._fetch_one("SELECT * FROM menus WHERE team_id = ?", (team_id,))
+            row = self._fetch_row(f"SELECT {Menu.COLUMN_SQL} FROM menus WHERE team_id = ?", (team_id,))
             if row:
-                return Menu(row)
+                return Menu.from_row(row)
             return None
         except Exception as e:
-            logger.error(f"获取菜单失败: {str(e)}", exc_info=True)
+            logger.error("获取菜单失败: %s", e, exc_info=True)
             return None
     
     # ==================== Teacher Evaluations 操作 ====================
@@ -633,65 +876,53 @@ class DatabaseManager:
                     team_id, evaluation.stage_name
                 ))
                 evaluation.id = existing['id']
-                logger.info(f"更新教师评价: {team_id} - {evaluation.stage_name}")
+                logger.info("更新教师评价: %s - %s", team_id, evaluation.stage_name)
             else:
                 # 插入
-                cursor = self._execute("""
-                    INSERT INTO teacher_evaluations (
-                        team_id, stage_name, rating, comment,
-                        strengths, improvements, timestamp,
-                        created_at, updated_at, schema_version, extra_data
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    team_id, evaluation.stage_name, evaluation.rating, evaluation.comment,
-                    evaluation.strengths, evaluation.improvements, evaluation.timestamp,
-                    evaluation.created_at, evaluation.updated_at, evaluation.schema_version, evaluation.extra_data
-                ))
+                cursor = self._execute(TeacherEvaluation.serializer.insert_sql, TeacherEvaluation.serializer.insert_params(evaluation))
                 evaluation.id = cursor.lastrowid
-                logger.info(f"插入教师评价: {team_id} - {evaluation.stage_name}")
+                logger.info("插入教师评价: %s - %s", team_id, evaluation.stage_name)
             
             return evaluation.id
         except Exception as e:
-            logger.error(f"保存教师评价失败: {str(e)}", exc_info=True)
+            logger.error("保存教师评价失败: %s", e, exc_info=True)
             raise
     
     def get_teacher_evaluation(self, team_id: str, stage_name: Optional[str] = None) -> Optional[TeacherEvaluation]:
         """获取教师评价（如果指定stage_name，则获取特定阶段的评价）"""
         try:
             if stage_name:
-                row = self._fetch_one(
-                    "SELECT * FROM teacher_evaluations WHERE team_id = ? AND stage_name = ?",
+                row = self._fetch_row(
+                    f"SELECT {TeacherEvaluation.COLUMN_SQL} FROM teacher_evaluations WHERE team_id = ? AND stage_name = ?",
                     (team_id, stage_name)
                 )
             else:
                 # 兼容旧代码：如果没有指定stage_name，返回第一个找到的评价
-                row = self._fetch_one(
-                    "SELECT * FROM teacher_evaluations WHERE team_id = ? LIMIT 1",
+                row = self._fetch_row(
+                    f"SELECT {TeacherEvaluation.COLUMN_SQL} FROM teacher_evaluations WHERE team_id = ? LIMIT 1",
                     (team_id,)
                 )
             if row:
-                return TeacherEvaluation(row)
+                return TeacherEvaluation.from_row(row)
             return None
         except Exception as e:
-            logger.error(f"获取教师评价失败: {str(e)}", exc_info=True)
+            logger.error("获取教师评价失败: %s", e, exc_info=True)
             return None
     
     def get_all_teacher_evaluations(self, team_id: str) -> Dict[str, TeacherEvaluation]:
         """获取团队所有阶段的教师评价"""
         try:
-            rows = self._fetch_all(
-                "SELECT * FROM teacher_evaluations WHERE team_id = ? ORDER BY CASE stage_name WHEN 'PREPARATION' THEN 1 WHEN 'FIRE_MAKING' THEN 2 WHEN 'COOKING_RICE' THEN 3 WHEN 'COOKING_DISHES' THEN 4 WHEN 'SHOWCASE' THEN 5 WHEN 'CLEANING' THEN 6 WHEN 'COMPLETED' THEN 7 ELSE 999 END",
+            rows = self._fetch_rows(
+                f"SELECT {TeacherEvaluation.COLUMN_SQL} FROM teacher_evaluations WHERE team_id = ? ORDER BY CASE stage_name WHEN 'PREPARATION' THEN 1 WHEN 'FIRE_MAKING' THEN 2 WHEN 'COOKING_RICE' THEN 3 WHEN 'COOKING_DISHES' THEN 4 WHEN 'SHOWCASE' THEN 5 WHEN 'CLEANING' THEN 6 WHEN 'COMPLETED' THEN 7 ELSE 999 END",
                 (team_id,)
             )
             evaluations = {}
             for row in rows:
-                if not isinstance(row, dict):
-                    row = dict(row)
-                evaluation = TeacherEvaluation(row)
+                evaluation = TeacherEvaluation.from_row(row)
                 evaluations[evaluation.stage_name] = evaluation
             return evaluations
         except Exception as e:
-            logger.error(f"获取所有教师评价失败: {str(e)}", exc_info=True)
+            logger.error("获取所有教师评价失败: %s", e, exc_info=True)
             return {}
     
     # ==================== Teacher Evaluation Teams 操作 ====================
@@ -723,23 +954,18 @@ class DatabaseManager:
                 """, (team_id, team_name, now, now))
                 return cursor.lastrowid
         except Exception as e:
-            logger.error(f"保存教师评价团队失败: {str(e)}", exc_info=True)
+            logger.error("保存教师评价团队失败: %s", e, exc_info=True)
             raise
     
     def get_all_evaluation_teams(self) -> List[TeacherEvaluationTeam]:
         """获取所有可评价的团队列表"""
         try:
-            rows = self._fetch_all(
-                "SELECT * FROM teacher_evaluation_teams ORDER BY team_id"
+            rows = self._fetch_rows(
+                f"SELECT {TeacherEvaluationTeam.COLUMN_SQL} FROM teacher_evaluation_teams ORDER BY team_id"
             )
-            teams = []
-            for row in rows:
-                if not isinstance(row, dict):
-                    row = dict(row)
-                teams.append(TeacherEvaluationTeam(row))
-            return teams
+            return [TeacherEvaluationTeam.from_row(row) for row in rows]
         except Exception as e:
-            logger.error(f"获取评价团队列表失败: {str(e)}", exc_info=True)
+            logger.error("获取评价团队列表失败: %s", e, exc_info=True)
             return []
     
     # ==================== Teacher Evaluations V2 操作 ====================
@@ -747,8 +973,7 @@ class DatabaseManager:
     def save_teacher_evaluation_v2(self, team_id: str, evaluation_data: Dict[str, Any], json_file_path: Optional[str] = None) -> int:
         """保存或更新教师评价V2（单次操作，高性能）"""
         try:
-            import json
-            eval_json = json.dumps(evaluation_data, ensure_ascii=False)
+            eval_json = json_codec.dumps(evaluation_data)
             
             existing = self._fetch_one(
                 "SELECT id FROM teacher_evaluations_v2 WHERE team_id = ?",
@@ -774,37 +999,32 @@ class DatabaseManager:
                 """, (team_id, eval_json, json_file_path, now, now))
                 return cursor.lastrowid
         except Exception as e:
-            logger.error(f"保存教师评价V2失败: {str(e)}", exc_info=True)
+            logger.error("保存教师评价V2失败: %s", e, exc_info=True)
             raise
     
     def get_teacher_evaluation_v2(self, team_id: str) -> Optional[TeacherEvaluationV2]:
         """获取教师评价V2"""
         try:
-            row = self._fetch_one(
-                "SELECT * FROM teacher_evaluations_v2 WHERE team_id = ?",
+            row = self._fetch_row(
+                f"SELECT {TeacherEvaluationV2.COLUMN_SQL} FROM teacher_evaluations_v2 WHERE team_id = ?",
                 (team_id,)
             )
             if row:
-                return TeacherEvaluationV2(row)
+                return TeacherEvaluationV2.from_row(row)
             return None
         except Exception as e:
-            logger.error(f"获取教师评价V2失败: {str(e)}", exc_info=True)
+            logger.error("获取教师评价V2失败: %s", e, exc_info=True)
             return None
     
     def get_all_teacher_evaluations_v2(self) -> List[TeacherEvaluationV2]:
         """获取所有教师评价V2"""
         try:
-            rows = self._fetch_all(
-                "SELECT * FROM teacher_evaluations_v2 ORDER BY updated_at DESC"
+            rows = self._fetch_rows(
+                f"SELECT {TeacherEvaluationV2.COLUMN_SQL} FROM teacher_evaluations_v2 ORDER BY updated_at DESC"
             )
-            evaluations = []
-            for row in rows:
-                if not isinstance(row, dict):
-                    row = dict(row)
-                evaluations.append(TeacherEvaluationV2(row))
-            return evaluations
+            return [TeacherEvaluationV2.from_row(row) for row in rows]
         except Exception as e:
-            logger.error(f"获取所有教师评价V2失败: {str(e)}", exc_info=True)
+            logger.error("获取所有教师评价V2失败: %s", e, exc_info=True)
             return []
     
     # ==================== 统计操作 ====================
@@ -846,7 +1066,7 @@ class DatabaseManager:
                 'totalStages': total_stages
             }
         except Exception as e:
-            logger.error(f"获取统计失败: {str(e)}", exc_info=True)
+            logger.error("获取统计失败: %s", e, exc_info=True)
             return {
                 'totalStudents': 0,
                 'studentsWithProcess': 0,
@@ -856,14 +1076,134 @@ class DatabaseManager:
                 'totalStages': 0
             }
     
+    # ==================== Submission Hashes 操作 ====================
+    
+    def get_submission_hash(self, team_id: str) -> Optional[str]:
+        """获取团队最近一次成功保存的提交内容哈希"""
+        try:
+            row = self._fetch_row(
+                "SELECT content_hash FROM submission_hashes WHERE team_id = ?",
+                (team_id,)
+            )
+            return row[0] if row else None
+        except Exception as e:
+            logger.error("获取提交哈希失败: %s", e, exc_info=True)
+            return None
+    
+    def save_submission_hash(self, team_id: str, content_hash: str):
+        """记录团队最近一次成功保存的提交内容哈希"""
+        now = int(datetime.now().timestamp() * 1000)
+        self._execute("""
+            INSERT INTO submission_hashes (team_id, content_hash, submit_count, created_at, updated_at)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(team_id) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                submit_count = submit_count + 1,
+                updated_at = excluded.updated_at
+        """, (team_id, content_hash, now, now))
+    
+    # ==================== Media Refs 操作 ====================
+    
+    def save_media_ref(self, team_id: str, filename: str, sha256: str, file_size: int, file_type: Optional[str] = None):
+        """记录团队媒体文件对应的内容哈希（同名文件重新上传时覆盖）"""
+        now = int(datetime.now().timestamp() * 1000)
+        self._execute("""
+            INSERT INTO media_refs (team_id, filename, sha256, file_size, file_type, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(team_id, filename) DO UPDATE SET
+                sha256 = excluded.sha256,
+                file_size = excluded.file_size,
+                file_type = COALESCE(excluded.file_type, file_type),
+                updated_at = excluded.updated_at
+        """, (team_id, filename, sha256, file_size, file_type, now, now))
+    
+    def get_media_refs(self, team_id: str) -> Dict[str, Dict[str, Any]]:
+        """团队全部媒体文件的内容哈希：{文件名: {sha256, fileSize, fileType}}"""
+        try:
+            rows = self._fetch_rows(
+                "SELECT filename, sha256, file_size, file_type FROM media_refs WHERE team_id = ?",
+                (team_id,)
+            )
+            return {row[0]: {'sha256': row[1], 'fileSize': row[2], 'fileType': row[3]} for row in rows}
+        except Exception as e:
+            logger.error("获取媒体文件哈希失败: %s", e, exc_info=True)
+            return {}
+    
+    # ==================== 批量写入 ====================
+    
+    def bulk_insert_submissions(self, submissions: List[Tuple[ValidatedSubmission, Optional[str]]]) -> Dict[str, int]:
+        """
+        批量写入校验后的提交数据（重建数据库用）：单个事务，每个表一次 executemany
+        只做插入，调用方保证这些团队在数据库中还不存在；
+        过程记录和阶段记录的 id 在这里预先分配，不需要逐行插入取 lastrowid
+        
+        submissions: [(提交数据, 内容哈希)]
+        """
+        teams, divisions, processes, stages, media, summaries, hashes = [], [], [], [], [], [], []
+        try:
+            with self.transaction():
+                process_id = self._fetch_row("SELECT COALESCE(MAX(id), 0) FROM process_records")[0]
+                stage_id = self._fetch_row("SELECT COALESCE(MAX(id), 0) FROM stage_records")[0]
+                now = int(datetime.now().timestamp() * 1000)
+                
+                for submission, content_hash in submissions:
+                    team_id = submission.student_id
+                    teams.append(Team.serializer.insert_params(submission.team))
+                    
+                    division = submission.division
+                    if division and not division.is_empty():
+                        division.team_id = team_id
+                        divisions.append(TeamDivision.serializer.insert_params(division))
+                    
+                    if submission.process:
+                        process_id += 1
+                        submission.process.id = process_id
+                        submission.process.team_id = team_id
+                        processes.append((process_id, *ProcessRecord.serializer.insert_params(submission.process)))
+                        for stage in submission.stages:
+                            stage_id += 1
+                            stage.id = stage_id
+                            stage.process_record_id = process_id
+                            stages.append((stage_id, *StageRecord.serializer.insert_params(stage)))
+                            stage_media = submission.stages_media.get(stage.stage_name, [])
+                            for media_item in self._assign_media_ids(team_id, stage.stage_name, stage_media):
+                                media_item.stage_record_id = stage_id
+                                if not media_item.timestamp:
+                                    media_item.timestamp = media_item.created_at
+                                media.append(MediaItem.serializer.insert_params(media_item))
+                    
+                    if submission.summary:
+                        submission.summary.team_id = team_id
+                        summaries.append(SummaryData.serializer.insert_params(submission.summary))
+                    
+                    if content_hash:
+                        hashes.append((team_id, content_hash, now, now))
+                
+                conn = self._get_connection()
+                for sql, rows in (
+                    (Team.serializer.insert_sql, teams),
+                    (TeamDivision.serializer.insert_sql, divisions),
+                    (ProcessRecord.serializer.insert_with_id_sql, processes),
+                    (StageRecord.serializer.insert_with_id_sql, stages),
+                    (MediaItem.serializer.insert_sql, media),
+                    (SummaryData.serializer.insert_sql, summaries),
+                    ("INSERT INTO submission_hashes (team_id, content_hash, submit_count, created_at, updated_at) "
+                     "VALUES (?, ?, 1, ?, ?)", hashes),
+                ):
+                    if rows:
+                        conn.executemany(sql, rows)
+            
+            return {'teams': len(teams), 'stages': len(stages), 'media': len(media)}
+        
+        except Exception as e:
+            logger.error("批量写入提交数据失败: %s", e, exc_info=True)
+            raise
+    
     # ==================== 清空数据 ====================
     
     def clear_all_data(self) -> Dict[str, int]:
         """清空所有数据，返回删除的记录数"""
-        conn = self._get_connection()
         try:
-            conn.execute("BEGIN TRANSACTION")
-            
             counts = {}
             
             # 按顺序删除（考虑外键约束）
@@ -874,19 +1214,20 @@ class DatabaseManager:
                 'summary_data',
                 'teacher_evaluations',
                 'team_divisions',
+                'submission_hashes',
+                'media_refs',
                 'teams'
             ]
             
-            for table in tables:
-                cursor = self._execute(f"DELETE FROM {table}")
-                counts[table] = cursor.rowcount
+            with self.transaction():
+                for table in tables:
+                    cursor = self._execute(f"DELETE FROM {table}")
+                    counts[table] = cursor.rowcount
             
-            conn.commit()
-            logger.info(f"清空所有数据: {counts}")
+            logger.info("清空所有数据: %s", counts)
             return counts
-            
+        
         except Exception as e:
-            conn.rollback()
-            logger.error(f"清空数据失败: {str(e)}", exc_info=True)
+            logger.error("清空数据失败: %s", e, exc_info=True)
             raise
 
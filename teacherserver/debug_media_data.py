@@ -5,12 +5,13 @@
 检查最近接收的数据中是否包含 stages 和 mediaItems
 """
 
-import json
 import os
 import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+from archive import list_submissions
+
 # 数据目录
 DATA_DIR = 'data/students'
 DB_PATH = 'data/campcooking.db'
@@ -33,22 +34,19 @@ def check_json_files():
     
     for student_dir in student_dirs:
         student_path = os.path.join(DATA_DIR, student_dir)
-        json_files = [f for f in os.listdir(student_path) if f.endswith('.json')]
+        submissions = list_submissions(student_path)
         
-        if not json_files:
+        if not submissions:
             continue
         
-        # 获取最新的 JSON 文件
-        json_files.sort(reverse=True)
-        latest_json = json_files[0]
-        json_path = os.path.join(student_path, latest_json)
+        # 最新的一次提交
+        latest_name, load_latest = submissions[0]
         
         print(f"\n[学生] {student_dir}")
-        print(f"   文件: {latest_json}")
+        print(f"   提交: {latest_name}")
         
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = load_latest()
             
             process_record = data.get('processRecord')
             if not process_record:
@@ -80,7 +78,7 @@ def check_json_files():
                     print(f"      [WARN] {stage_name}: 没有媒体文件")
             
             print(f"   [统计] 总计: {total_media} 个媒体文件")
-            
+        
         except Exception as e:
             print(f"   [ERROR] 读取文件失败: {str(e)}")
 
@@ -137,7 +135,7 @@ def check_database():
                 print(f"  阶段ID: {row[0]}, 阶段名: {row[1]}, 媒体文件数: {row[3]}")
         
         conn.close()
-        
+    
     except Exception as e:
         print(f"[ERROR] 检查数据库失败: {str(e)}")
 
@@ -5,11 +5,12 @@
 检查所有 JSON 文件，找出问题根源
 """
 
-import json
 import os
 from datetime import datetime
 from pathlib import Path
 
+from archive import list_submissions
+
 DATA_DIR = 'data/students'
 
 def check_all_json_files():
@@ -30,27 +31,22 @@ def check_all_json_files():
     
     for student_dir in student_dirs:
         student_path = os.path.join(DATA_DIR, student_dir)
-        json_files = [f for f in os.listdir(student_path) if f.endswith('.json')]
+        # 归档中的版本和尚未迁移的 JSON 文件（从新到旧）
+        submissions = list_submissions(student_path)
         
-        if not json_files:
+        if not submissions:
             continue
         
         print(f"\n[学生] {student_dir}")
-        print(f"   JSON 文件数量: {len(json_files)}")
-        
-        # 按时间排序
-        json_files.sort(reverse=True)
+        print(f"   提交数量: {len(submissions)}")
         
         # 检查每个文件
         files_with_stages = 0
         files_without_stages = 0
         
-        for json_file in json_files:
-            json_path = os.path.join(student_path, json_file)
-            
+        for i, (json_file, load_submission) in enumerate(submissions):
             try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = load_submission()
                 
                 process_record = data.get('processRecord')
                 if process_record:
@@ -72,14 +68,14 @@ def check_all_json_files():
                             print(f"   [OK] {json_file}: 包含 stages, {len(stages)} 个阶段, 但无媒体文件")
                     else:
                         files_without_stages += 1
-                        if json_file == 'latest.json' or files_without_stages <= 3:
+                        if i == 0 or files_without_stages <= 3:
                             print(f"   [ERROR] {json_file}: 没有 stages 字段")
                             print(f"      processRecord 的键: {list(process_record.keys())}")
                 else:
                     files_without_stages += 1
-                    if json_file == 'latest.json':
+                    if i == 0:
                         print(f"   [ERROR] {json_file}: 没有 processRecord")
-                        
+            
             except Exception as e:
                 print(f"   [ERROR] 读取 {json_file} 失败: {str(e)}")
         
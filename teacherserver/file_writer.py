@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台文件写入
+教师评价快照等JSON文件不需要在请求返回前落盘：请求线程只序列化并放入队列，
+由后台线程写入。所有写入都是“临时文件 + os.replace”的原子替换，
+进程崩溃或断电后 evaluation_*_latest.json 要么是旧内容要么是新内容，不会只写了一半。
+
+同一路径的写入总是由同一个线程按顺序完成（按路径哈希分配线程），后提交的内容不会被先提交的覆盖。
+队列有上限，写满时调用方等待（背压，不丢数据）；进程退出时等待队列写完，之后的写入在调用线程中同步完成。
+"""
+
+import atexit
+import os
+import queue
+import tempfile
+import threading
+import zlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# fsync 策略
+FSYNC_ALWAYS = 'always'  # 文件和所在目录都 fsync（断电后也保证是完整的新文件）
+FSYNC_FILE = 'file'  # 只 fsync 文件
+FSYNC_NONE = 'none'  # 不 fsync（原子替换仍然保证不会读到写了一半的文件，但断电可能丢失最近的写入）
+
+
+def atomic_write(path: str, data: bytes, fsync: Optional[str] = None):
+    """原子写入文件：先写同目录下的临时文件，再 os.replace 替换目标文件"""
+    fsync = fsync or Config.FILE_WRITER_FSYNC
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        os.chmod(temp_path, 0o644)  # mkstemp 创建的文件只有属主可读
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync != FSYNC_NONE:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync == FSYNC_ALWAYS and os.name == 'posix':
+        # 目录项（rename）本身也要落盘
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class FileWriter:
+    """后台写入线程池（每个线程一个有界队列）"""
+    
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 fsync: Optional[str] = None):
+        self.worker_count = max(1, workers or Config.FILE_WRITER_WORKERS)
+        self.max_queue = max_queue or Config.FILE_WRITER_MAX_QUEUE
+        self.fsync = fsync or Config.FILE_WRITER_FSYNC
+        self._queues: List['queue.Queue[Optional[Tuple[str, bytes]]]'] = []
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()  # 保护线程和队列的启动、停止，以及入队（不会排在停止标记之后）
+        self._started = False
+        self._stopped = False  # 已调用 shutdown
+        self._atexit_registered = False
+    
+    def start(self):
+        """启动写入线程（第一次写入时自动调用）"""
+        with self._lock:
+            self._start_locked()
+    
+    def _start_locked(self):
+        """调用方持有 self._lock"""
+        if self._started:
+            return
+        for i in range(self.worker_count):
+            work_queue: 'queue.Queue[Optional[Tuple[str, bytes]]]' = queue.Queue(self.max_queue)
+            worker = threading.Thread(target=self._worker_loop, args=(work_queue,),
+                                      name=f"file-writer-{i + 1}", daemon=True)
+            worker.start()
+            self._queues.append(work_queue)
+            self._workers.append(worker)
+        self._started = True
+        self._stopped = False
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+    
+    def write(self, path: str, data: bytes):
+        """在后台原子写入文件；队列已满时等待。已停止（进程退出中）时在当前线程同步写入"""
+        with self._lock:
+            if not self._stopped:
+                self._start_locked()
+                work_queue = self._queues[zlib.crc32(path.encode('utf-8')) % len(self._queues)]
+                try:
+                    work_queue.put_nowait((path, data))
+                    metrics.inc('fileWriter.queued')
+                except queue.Full:
+                    # 不能在当前线程直接写：同一路径先排队的旧内容会在之后覆盖它
+                    metrics.inc('fileWriter.blocked')
+                    work_queue.put((path, data))
+                return
+        atomic_write(path, data, self.fsync)
+        metrics.inc('fileWriter.written')
+        metrics.inc('fileWriter.bytes', len(data))
+    
+    def write_json(self, obj: Any, path: str, kind: Optional[str] = None):
+        """序列化（在当前线程，之后修改 obj 不影响写入内容）并在后台写入JSON文件"""
+        self.write(path, json_codec.dumps_bytes(obj, json_codec.is_pretty(kind)))
+    
+    def _worker_loop(self, work_queue: 'queue.Queue[Optional[Tuple[str, bytes]]]'):
+        while True:
+            item = work_queue.get()
+            try:
+                if item is None:
+                    return
+                path, data = item
+                try:
+                    atomic_write(path, data, self.fsync)
+                    metrics.inc('fileWriter.written')
+                    metrics.inc('fileWriter.bytes', len(data))
+                except Exception as e:
+                    metrics.inc('fileWriter.failed')
+                    logger.error("后台写入文件失败: %s, %s", path, e, exc_info=True)
+            finally:
+                work_queue.task_done()
+    
+    def flush(self):
+        """等待已提交的写入全部完成"""
+        for work_queue in list(self._queues):
+            work_queue.join()
+    
+    def shutdown(self):
+        """写完队列中的文件并停止线程（进程退出时自动调用，重复调用无副作用）"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            self._stopped = True
+            # 持有锁等待写完：之后在当前线程同步写入的内容不会被队列中的旧内容覆盖
+            for work_queue in self._queues:
+                work_queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._queues, self._workers = [], []
+        logger.info("✅ 后台文件写入已全部完成")
+    
+    def stats(self) -> Dict[str, int]:
+        return {'queued': sum(q.qsize() for q in self._queues), 'workers': len(self._workers)}
+
+
+# 全局实例
+file_writer = FileWriter()
+metrics.register_gauge('fileWriter', file_writer.stats)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步提交队列
+请求处理线程只把原始数据顺序追加到日志文件（一次顺序写）并放入内存队列，立即返回任务ID；
+后台工作线程解析并写入数据库，结果同样追加到日志文件。
+服务器重启时重放日志，未完成的任务重新入队。
+
+同一团队的连续提交（学生端自动保存）在短时间窗口内合并：窗口内到达的提交只写入最新的一份，
+被合并的任务以最终结果完成（结果中 coalesced 为 true）。最新的一份校验失败时依次尝试较早的提交，
+不会因为一份坏数据丢掉之前的有效数据。
+
+日志文件格式（追加写入）：
+    J <job_id> <长度>\\n<原始数据>\\n     —— 提交的原始数据（JSON）
+    M <job_id> <长度>\\n<原始数据>\\n     —— 提交的原始数据（MessagePack）
+    S <job_id> <长度>\\n<状态JSON>\\n     —— 任务最终状态
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+import json_codec
+import msgpack_codec
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_PROCESSING = 'processing'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+JOURNAL_FILENAME = 'ingest.journal'
+
+# 原始数据格式 -> 日志记录类型
+PAYLOAD_KINDS = {'json': b'J', 'msgpack': b'M'}
+
+# 合并窗口到期的内部任务（队列中的记录类型，不写入日志）
+_FLUSH = b'F'
+
+# handler(data) -> (响应字典, HTTP状态码)，与同步提交的返回一致
+SubmissionHandler = Callable[[Any], Tuple[Dict[str, Any], int]]
+# key_func(data) -> 合并键（团队ID），返回空字符串时不合并
+CoalesceKeyFunc = Callable[[Any], str]
+# decoder(原始数据, 格式) -> 交给 handler 的数据，格式错误抛出 ValueError
+PayloadDecoder = Callable[[bytes, str], Any]
+
+
+def _decode(payload: bytes, payload_format: str) -> Any:
+    return msgpack_codec.unpackb(payload) if payload_format == 'msgpack' else json_codec.loads(payload)
+
+
+class _CoalesceSlot:
+    """一个团队在合并窗口内等待写入的提交"""
+    
+    def __init__(self, now: float):
+        self.first_at = now
+        self.deadline = now
+        self.entries: List[Tuple[str, Dict[str, Any], Any]] = []  # [(job_id, 任务状态, 数据)]，按到达顺序
+
+
+class IngestQueue:
+    """提交任务队列（日志持久化 + 工作线程）"""
+    
+    def __init__(self, ingest_dir: str, handler: SubmissionHandler,
+                 workers: Optional[int] = None, fsync: Optional[bool] = None,
+                 key_func: Optional[CoalesceKeyFunc] = None, coalesce_ms: Optional[int] = None,
+                 decoder: Optional[PayloadDecoder] = None):
+        self.ingest_dir = ingest_dir
+        self.journal_path = os.path.join(ingest_dir, JOURNAL_FILENAME)
+        self.handler = handler
+        self.worker_count = workers or Config.INGEST_WORKERS
+        self.fsync = Config.INGEST_FSYNC if fsync is None else fsync
+        self.key_func = key_func
+        self.decoder = decoder or _decode
+        self.coalesce_window = (Config.INGEST_COALESCE_MS if coalesce_ms is None else coalesce_ms) / 1000
+        self.coalesce_max_delay = max(self.coalesce_window, Config.INGEST_COALESCE_MAX_MS / 1000)
+        
+        self._queue: 'queue.Queue[Tuple[str, bytes, bytes]]' = queue.Queue()  # (job_id, 记录类型, 原始数据)
+        self._jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()  # job_id -> 状态
+        self._pending = 0  # 尚未写入最终状态的任务数
+        self._lock = threading.Lock()  # 保护日志文件和任务表
+        self._journal = None
+        self._workers: List[threading.Thread] = []
+        self._started = False
+        
+        self._coalesce_lock = threading.Lock()  # 保护下面两个表
+        self._slots: Dict[str, _CoalesceSlot] = {}  # 团队ID -> 合并窗口内等待的提交
+        self._flushing: Dict[str, int] = {}  # 团队ID -> 已入队尚未写完的合并任务数（保证同一团队按顺序写入）
+    
+    # ==================== 启动与恢复 ====================
+    
+    def start(self):
+        """重放日志并启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.ingest_dir, exist_ok=True)
+            pending = self._replay_journal()
+            self._rewrite_journal(pending)
+            self._journal = open(self.journal_path, 'ab')
+            for job_id, kind, payload in pending:
+                self._jobs[job_id] = self._new_job(job_id, JOB_QUEUED)
+                self._pending += 1
+                self._queue.put((job_id, kind, payload))
+            for i in range(self.worker_count):
+                worker = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i + 1}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            self._started = True
+        if pending:
+            logger.info("📥 从日志恢复 %s 个未完成的提交任务", len(pending))
+        logger.info("✅ 异步提交队列已启动: %s 个工作线程, 日志: %s", self.worker_count, self.journal_path)
+    
+    def _replay_journal(self) -> List[Tuple[str, bytes, bytes]]:
+        """读取日志，返回未完成的任务 [(job_id, 记录类型, 原始数据)]；已完成任务的状态载入内存"""
+        if not os.path.exists(self.journal_path):
+            return []
+        payloads: 'OrderedDict[str, Tuple[bytes, bytes]]' = OrderedDict()
+        with open(self.journal_path, 'rb') as f:
+            while True:
+                header = f.readline()
+                if not header:
+                    break
+                try:
+                    kind, job_id, length = header.split()
+                    body = f.read(int(length))
+                    if len(body) < int(length) or f.read(1) != b'\n':
+                        raise ValueError("记录不完整")
+                except ValueError:
+                    # 最后一条记录写到一半（进程被强制结束），丢弃
+                    logger.warning("⚠️ 提交日志末尾存在不完整记录，已忽略: %s", self.journal_path)
+                    break
+                job_id = job_id.decode('ascii')
+                if kind in (b'J', b'M'):
+                    payloads[job_id] = (kind, body)
+                elif kind == b'S':
+                    payloads.pop(job_id, None)
+                    self._remember(json_codec.loads(body))
+        return [(job_id, kind, body) for job_id, (kind, body) in payloads.items()]
+    
+    def _rewrite_journal(self, pending: List[Tuple[str, bytes, bytes]]):
+        """只保留未完成的任务，避免日志无限增长"""
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for job_id, kind, payload in pending:
+                f.write(self._frame(kind, job_id, payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+    
+    # ==================== 提交与查询 ====================
+    
+    @staticmethod
+    def _frame(kind: bytes, job_id: str, body: bytes) -> bytes:
+        return b'%s %s %d\n' % (kind, job_id.encode('ascii'), len(body)) + body + b'\n'
+    
+    @staticmethod
+    def _new_job(job_id: str, status: str) -> Dict[str, Any]:
+        now = int(time.time() * 1000)
+        return {'jobId': job_id, 'status': status, 'createdAt': now, 'updatedAt': now}
+    
+    def _append(self, kind: bytes, job_id: str, body: bytes):
+        """追加一条记录（调用方持有 self._lock）"""
+        self._journal.write(self._frame(kind, job_id, body))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+    
+    def _remember(self, job: Dict[str, Any]):
+        """记录任务状态，超过上限时丢弃最早完成的任务（调用方持有 self._lock 或在启动阶段）"""
+        self._jobs[job['jobId']] = job
+        self._jobs.move_to_end(job['jobId'])
+        while len(self._jobs) > Config.INGEST_JOB_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest['status'] not in (JOB_DONE, JOB_FAILED):
+                break
+            self._jobs.pop(oldest_id)
+    
+    def submit(self, payload: bytes, payload_format: str = 'json') -> str:
+        """持久化原始数据（payload_format: json / msgpack）并入队，返回任务ID"""
+        if not self._started:
+            self.start()
+        kind = PAYLOAD_KINDS[payload_format]
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._append(kind, job_id, payload)
+            self._remember(self._new_job(job_id, JOB_QUEUED))
+            self._pending += 1
+        self._queue.put((job_id, kind, payload))
+        return job_id
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            result = dict(job)
+        if result['status'] == JOB_QUEUED:
+            result['queueSize'] = self._queue.qsize()
+        return result
+    
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self._queue.qsize(), 'pending': self._pending, 'workers': len(self._workers),
+                'coalescing': len(self._slots)}
+    
+    # ==================== 工作线程 ====================
+    
+    def _worker_loop(self):
+        while True:
+            job_id, kind, payload = self._queue.get()
+            try:
+                if kind == _FLUSH:
+                    self._flush_slot(job_id, payload)
+                else:
+                    self._run_job(job_id, kind, payload)
+            except Exception as e:
+                logger.error("提交任务处理异常 %s: %s", job_id, e, exc_info=True)
+            finally:
+                self._queue.task_done()
+    
+    def _run_job(self, job_id: str, kind: bytes, payload: bytes):
+        with self._lock:
+            job = self._jobs.get(job_id) or self._new_job(job_id, JOB_QUEUED)
+            job = dict(job, status=JOB_PROCESSING, updatedAt=int(time.time() * 1000))
+            self._remember(job)
+        
+        start = time.perf_counter()
+        try:
+            data = self.decoder(payload, 'msgpack' if kind == b'M' else 'json')
+            key = self.key_func(data) if self.key_func and self.coalesce_window > 0 else ''
+        except ValueError as e:
+            format_name = 'MessagePack' if kind == b'M' else 'JSON'
+            self._finish(job_id, job, {'status': 'error', 'message': f'{format_name}解析失败: {str(e)}'}, 400, start)
+            return
+        except Exception as e:
+            # 解析超时、进程池崩溃等：任务同样要写入最终状态，否则客户端会一直轮询到 processing
+            logger.error("提交任务解析失败 %s: %s", job_id, e, exc_info=True)
+            self._finish(job_id, job, {'status': 'error', 'message': f'服务器错误: {str(e)}'}, 500, start)
+            return
+        
+        if key:
+            # 放入该团队的合并窗口，窗口到期后由 _flush_slot 统一写入并完成
+            self._add_to_slot(key, job_id, job, data)
+            return
+        
+        response, code = self._handle(job_id, data)
+        self._finish(job_id, job, response, code, start)
+    
+    def _handle(self, job_id: str, data: Any) -> Tuple[Dict[str, Any], int]:
+        try:
+            return self.handler(data)
+        except Exception as e:
+            logger.error("提交任务处理失败 %s: %s", job_id, e, exc_info=True)
+            return {'status': 'error', 'message': f'服务器错误: {str(e)}'}, 500
+    
+    def _finish(self, job_id: str, job: Dict[str, Any], response: Dict[str, Any], code: int,
+                start: Optional[float] = None):
+        """写入任务最终状态"""
+        elapsed_ms = (time.perf_counter() - start) * 1000 if start is not None else 0
+        job = dict(job, status=JOB_DONE if code < 400 else JOB_FAILED, httpStatus=code,
+                   result=response, updatedAt=int(time.time() * 1000))
+        with self._lock:
+            self._append(b'S', job_id, json_codec.dumps_bytes(job))
+            self._remember(job)
+            self._pending -= 1
+            if self._pending == 0 and self._journal.tell() > Config.INGEST_JOURNAL_MAX_BYTES:
+                # 所有任务都已完成，清空日志
+                self._journal.truncate(0)
+                self._journal.seek(0)
+        if code < 400:
+            logger.info("✅ 提交任务完成 %s: %s (%.0f ms)", job_id, response.get('studentId', ''), elapsed_ms)
+        else:
+            logger.warning("⚠️ 提交任务失败 %s: %s", job_id, response.get('message', ''))
+    
+    # ==================== 同一团队的提交合并 ====================
+    
+    def _add_to_slot(self, key: str, job_id: str, job: Dict[str, Any], data: Any):
+        """加入团队的合并窗口：每来一份提交窗口顺延，但从第一份算起最多等待 coalesce_max_delay"""
+        now = time.monotonic()
+        with self._coalesce_lock:
+            slot = self._slots.get(key)
+            is_new = slot is None
+            if is_new:
+                slot = self._slots[key] = _CoalesceSlot(now)
+            slot.entries.append((job_id, job, data))
+            slot.deadline = min(now + self.coalesce_window, slot.first_at + self.coalesce_max_delay)
+        if is_new:
+            self._schedule(key, self.coalesce_window)
+    
+    def _schedule(self, key: str, delay: float):
+        timer = threading.Timer(delay, self._slot_due, args=(key,))
+        timer.daemon = True
+        timer.start()
+    
+    def _slot_due(self, key: str):
+        """定时器到期：窗口已顺延或该团队上一批还没写完时继续等待，否则放入工作队列"""
+        with self._coalesce_lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                return
+            remaining = slot.deadline - time.monotonic()
+            if remaining <= 0 and self._flushing.get(key):
+                remaining = self.coalesce_window
+            if remaining <= 0:
+                self._slots.pop(key)
+                self._flushing[key] = self._flushing.get(key, 0) + 1
+        if remaining > 0:
+            self._schedule(key, remaining)
+        else:
+            self._queue.put((key, _FLUSH, slot))
+    
+    def _flush_slot(self, key: str, slot: _CoalesceSlot):
+        """写入窗口内最新的提交；最新的失败（如校验错误）时依次尝试较早的，其余任务以成功的结果完成"""
+        start = time.perf_counter()
+        try:
+            results: Dict[int, Tuple[Dict[str, Any], int]] = {}
+            winner: Optional[int] = None
+            for index in range(len(slot.entries) - 1, -1, -1):
+                job_id, _, data = slot.entries[index]
+                results[index] = self._handle(job_id, data)
+                if results[index][1] < 400:
+                    winner = index
+                    break
+            
+            for index, (job_id, job, _) in enumerate(slot.entries):
+                if index in results:
+                    response, code = results[index]
+                else:
+                    # 被更新的提交取代，以实际写入的那份的结果完成
+                    response, code = results[winner]
+                    response = dict(response, coalesced=True)
+                self._finish(job_id, job, response, code, start)
+            
+            superseded = len(slot.entries) - len(results)
+            if superseded:
+                metrics.inc('ingest.coalesced', superseded)
+                logger.info("⏭️ 合并 %s 个连续提交，只写入 %s 次: %s", len(slot.entries), len(results), key)
+        finally:
+            with self._coalesce_lock:
+                self._flushing[key] -= 1
+                if not self._flushing[key]:
+                    del self._flushing[key]
+    
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的任务全部处理完（用于关闭服务器和测试）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending > 0:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON编解码模块
+Flask响应、原始数据归档、评价文件和模型字段编码统一经过这里：
+已安装 orjson 时使用 orjson，否则回退到标准库 json；
+是否缩进美化按文件类型在 Config.JSON_PRETTY 中配置
+"""
+
+import json
+import decimal
+import hashlib
+import uuid
+from typing import Any, Optional
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+if Config.JSON_BACKEND == 'json' or orjson is None:
+    BACKEND = 'json'
+else:
+    BACKEND = 'orjson'
+
+if Config.JSON_BACKEND == 'orjson' and orjson is None:
+    import logging
+    logging.getLogger(__name__).warning("⚠️ 配置要求使用 orjson，但未安装，已回退到标准库 json")
+
+
+def _default(obj: Any) -> Any:
+    """两个后端都不能直接编码的类型"""
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def is_pretty(kind: Optional[str]) -> bool:
+    """某类文件是否缩进输出"""
+    return bool(kind and Config.JSON_PRETTY.get(kind, False))
+
+
+if BACKEND == 'orjson':
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+    _PRETTY_OPTIONS = _OPTIONS | orjson.OPT_INDENT_2
+    
+    def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+        """编码为UTF-8字节串（不转义中文）"""
+        try:
+            return orjson.dumps(obj, default=_default, option=_PRETTY_OPTIONS if pretty else _OPTIONS)
+        except TypeError:
+            # orjson 不支持的情况（如超过64位的整数），交给标准库
+            return _std_dumps(obj, pretty).encode('utf-8')
+    
+    def dumps(obj: Any, pretty: bool = False) -> str:
+        """编码为字符串（不转义中文）"""
+        return dumps_bytes(obj, pretty).decode('utf-8')
+    
+    def loads(data: Any) -> Any:
+        """解析JSON字符串或字节串（解析失败抛出 json.JSONDecodeError 的子类）"""
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any, pretty: bool = False) -> str:
+        """编码为字符串（不转义中文）"""
+        return _std_dumps(obj, pretty)
+    
+    def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+        """编码为UTF-8字节串（不转义中文）"""
+        return _std_dumps(obj, pretty).encode('utf-8')
+    
+    def loads(data: Any) -> Any:
+        """解析JSON字符串或字节串"""
+        return json.loads(data)
+
+
+def _std_dumps(obj: Any, pretty: bool) -> str:
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+if BACKEND == 'orjson':
+    def canonical_bytes(obj: Any) -> bytes:
+        """规范化JSON（键排序、无空白），相同内容得到相同字节"""
+        return orjson.dumps(obj, default=_default, option=_OPTIONS | orjson.OPT_SORT_KEYS)
+else:
+    def canonical_bytes(obj: Any) -> bytes:
+        """规范化JSON（键排序、无空白），相同内容得到相同字节"""
+        return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(',', ':'),
+                          default=_default).encode('utf-8')
+
+
+def content_hash(obj: Any) -> str:
+    """内容哈希（规范化JSON的 sha256），与键顺序、缩进无关"""
+    return hashlib.sha256(canonical_bytes(obj)).hexdigest()
+
+
+def dump_file(obj: Any, path: str, kind: Optional[str] = None):
+    """原子写入JSON文件（临时文件 + 替换），kind 对应 Config.JSON_PRETTY 中的文件类型"""
+    from file_writer import atomic_write
+    atomic_write(path, dumps_bytes(obj, is_pretty(kind)))
+
+
+def load_file(path: str) -> Any:
+    """读取JSON文件"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask JSON提供者：jsonify / request.get_json 使用同一套编解码"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj, kwargs.get('indent') is not None)
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = is_pretty('response') or self._app.debug
+        return self._app.response_class(dumps_bytes(obj, pretty), mimetype=self.mimetype)
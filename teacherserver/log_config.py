@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务器日志配置
+请求线程只做级别判断、采样/限流和入队（QueueHandler），格式化和写 stderr 由后台线程（QueueListener）完成：
+- 按 logger 名称前缀采样（Config.LOG_SAMPLE_RATES，只对 INFO 及以下生效）；
+- 同一处日志（文件 + 行号）在每个时间窗口内最多输出 Config.LOG_RATE_LIMIT 条（ERROR 及以上不限），
+  被省略的条数附在该处下一条输出的日志后面；
+- 诊断模式（verbose）：运行中通过 PUT /api/logging 打开，输出 DEBUG 日志，不采样；
+- Config.LOG_FORMAT = 'json' 时每行一个JSON对象，extra 传入的字段一并输出。
+日志队列已满时丢弃新日志并计数（log.dropped），不阻塞请求线程。
+"""
+
+import atexit
+import logging
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+import json_codec
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 入队时可以直接保留（之后不会再被修改）的参数类型，其他类型的参数在当前线程先格式化
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes)
+
+# LogRecord 自带的属性（JSON格式中其余属性视为 extra 字段）
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 采样 + 按日志位置限流（在请求线程中执行，只有少量字典操作）"""
+    
+    def __init__(self, sample_rates: Dict[str, float], rate_limit: int, rate_window: float):
+        super().__init__()
+        self.sample_rates = dict(sample_rates)
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.verbose = False
+        self._rates: Dict[str, float] = {}  # logger 名称 -> 采样比例（按最长前缀匹配的结果缓存）
+        self._windows: Dict[Tuple[str, int], list] = {}  # (文件, 行号) -> [窗口开始时间, 已输出条数, 已省略条数]
+        self._lock = threading.Lock()
+    
+    def _sample_rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix_length = -1
+            for prefix, value in self.sample_rates.items():
+                if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > prefix_length:
+                    rate, prefix_length = value, len(prefix)
+            self._rates[name] = rate
+        return rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        if record.levelno < logging.WARNING and not self.verbose:
+            rate = self._sample_rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                metrics.inc('log.sampledOut')
+                return False
+        if self.rate_limit <= 0:
+            return True
+        
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.rate_window:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.rate_limit:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                metrics.inc('log.rateLimited')
+                return False
+        if suppressed:
+            record.msg = f"{record.msg}（上一时间窗口省略了 {suppressed} 条同类日志）"
+        return True
+    
+    def reset(self):
+        """清空采样比例缓存和限流窗口（修改配置后调用）"""
+        with self._lock:
+            self._rates.clear()
+            self._windows.clear()
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """入队不格式化、不阻塞；队列已满时丢弃"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一进程内传递，不需要像默认实现那样先格式化成字符串；
+        # 只有参数可能在之后被修改（列表、字典、对象）时才在当前线程格式化
+        if record.args and not (isinstance(record.args, tuple)
+                                and all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('log.dropped')
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行JSON（extra 字段原样输出）"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json_codec.dumps(entry)
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[_NonBlockingQueueHandler] = None
+_filter: Optional[SamplingFilter] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(verbose: Optional[bool] = None):
+    """配置根 logger（重复调用无副作用）；verbose 为 None 时使用 Config.LOG_VERBOSE"""
+    global _listener, _handler, _filter
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if Config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+        
+        _filter = SamplingFilter(Config.LOG_SAMPLE_RATES, Config.LOG_RATE_LIMIT, Config.LOG_RATE_WINDOW)
+        _handler = _NonBlockingQueueHandler(queue.Queue(Config.LOG_QUEUE_SIZE))
+        _handler.addFilter(_filter)
+        
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_handler)
+        
+        _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    set_verbose(Config.LOG_VERBOSE if verbose is None else verbose)
+
+
+def set_verbose(enabled: bool):
+    """打开或关闭诊断模式（运行中可随时切换）"""
+    logging.getLogger().setLevel(logging.DEBUG if enabled else Config.LOG_LEVEL)
+    if _filter is not None:
+        _filter.verbose = enabled
+        _filter.reset()
+
+
+def is_verbose() -> bool:
+    return _filter is not None and _filter.verbose
+
+
+def logging_status() -> Dict[str, Any]:
+    """当前日志配置（/api/logging）"""
+    return {
+        'verbose': is_verbose(),
+        'level': logging.getLevelName(logging.getLogger().level),
+        'format': Config.LOG_FORMAT,
+        'sampleRates': dict(_filter.sample_rates) if _filter else {},
+        'rateLimit': {'count': Config.LOG_RATE_LIMIT, 'windowSeconds': Config.LOG_RATE_WINDOW},
+        'queued': _handler.queue.qsize() if _handler else 0,
+        'dropped': metrics.get('log.dropped'),
+        'sampledOut': metrics.get('log.sampledOut'),
+        'rateLimited': metrics.get('log.rateLimited'),
+    }
+
+
+def shutdown_logging():
+    """输出队列中剩余的日志并停止后台线程（进程退出时自动调用）"""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        # 之后的日志（如其他 atexit 回调）直接同步输出，再把队列中剩余的日志写完
+        root = logging.getLogger()
+        if _handler in root.handlers:
+            for handler in listener.handlers:
+                handler.addFilter(_filter)
+                root.addHandler(handler)
+            root.removeHandler(_handler)
+        listener.stop()
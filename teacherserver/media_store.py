@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的媒体文件存储
+Android 端每次重试或重新提交都会再上传一遍同一张照片，同一文件在多个阶段、多个团队中也各存一份。
+上传的文件先按 SHA-256 保存为 Config.MEDIA_BLOB_DIR/<前两位>/<sha256>（同一内容只存一份），
+团队的文件 MEDIA_DIR/<student_id>/<文件名> 是指向它的硬链接，原有的读取、导出和重建逻辑都不需要改变；
+（团队, 文件名）到内容哈希的对应关系记录在数据库 media_refs 表中。
+客户端上传前先 HEAD /api/media/blob/<sha256>，服务器已有该内容时只需要登记引用，不再上传。
+
+文件系统不支持硬链接时改为复制（团队文件仍然完整，只是不再节省空间）。
+内容文件只是去重用的索引，删除它不影响团队文件；没有团队文件链接的内容文件由 collect_garbage 清理。
+团队文件只能通过 os.replace 整体替换，不能原地写入（会同时修改其他团队链接的同一内容）。
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import logging
+from typing import Any, BinaryIO, Dict, Iterable, List, NamedTuple, Optional
+
+from config import Config
+from metrics import metrics
+from file_writer import FSYNC_NONE
+
+logger = logging.getLogger(__name__)
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_READ_SIZE = 64 * 1024
+
+
+class FileTooLarge(Exception):
+    """上传的文件超过 Config.MAX_FILE_SIZE"""
+
+
+class ChecksumMismatch(Exception):
+    """上传的文件与客户端提供的 SHA-256 不一致"""
+
+
+class StoredMedia(NamedTuple):
+    """保存到团队媒体目录的文件"""
+    path: str  # 团队文件路径
+    sha256: str
+    size: int
+    deduplicated: bool  # 内容已存在，没有新占用磁盘空间
+
+
+def is_sha256(value: str) -> bool:
+    return bool(value) and _SHA256_RE.match(value) is not None
+
+
+class MediaStore:
+    """内容文件（blob）目录 + 团队媒体目录中的硬链接"""
+    
+    def __init__(self, blob_dir: str, media_dir: str):
+        self.blob_dir = blob_dir
+        self.media_dir = media_dir
+    
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+    
+    def blob_size(self, sha256: str) -> Optional[int]:
+        """内容文件的大小（不存在时返回 None）"""
+        if not is_sha256(sha256):
+            return None
+        try:
+            return os.path.getsize(self.blob_path(sha256))
+        except OSError:
+            return None
+    
+    # ==================== 写入 ====================
+    
+    def save_stream(self, stream: BinaryIO, student_id: str, filename: str,
+                    max_size: Optional[int] = None, expected_sha256: Optional[str] = None) -> StoredMedia:
+        """
+        边读边计算 SHA-256 保存上传的文件
+        超过 max_size 抛出 FileTooLarge；与 expected_sha256 不一致时抛出 ChecksumMismatch（不替换团队文件）
+        """
+        max_size = Config.MAX_FILE_SIZE if max_size is None else max_size
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_dir, prefix='.upload.', suffix='.tmp')
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    block = stream.read(_READ_SIZE)
+                    if not block:
+                        break
+                    size += len(block)
+                    if size > max_size:
+                        raise FileTooLarge(f'文件超过 {max_size // (1024 * 1024)}MB 上限')
+                    hasher.update(block)
+                    f.write(block)
+                if Config.FILE_WRITER_FSYNC != FSYNC_NONE:
+                    f.flush()
+                    os.fsync(f.fileno())
+            sha256 = hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise ChecksumMismatch('文件校验失败（SHA-256 不一致），请重新上传')
+            return self.store_file(temp_path, sha256, student_id, filename)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def store_file(self, source_path: str, sha256: str, student_id: str, filename: str) -> StoredMedia:
+        """
+        把已计算好哈希的文件（上传的临时文件）移入内容目录并链接到团队媒体目录
+        内容已存在时直接删除 source_path
+        """
+        blob_path = self.blob_path(sha256)
+        size = os.path.getsize(source_path)
+        deduplicated = os.path.exists(blob_path)
+        if deduplicated:
+            os.remove(source_path)
+            metrics.inc('media.dedupHits')
+            metrics.inc('media.bytesSaved', size)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.chmod(source_path, 0o644)  # mkstemp 创建的文件只有属主可读
+            try:
+                os.replace(source_path, blob_path)
+            except OSError:
+                shutil.move(source_path, blob_path)  # 上传目录与内容目录不在同一磁盘
+            metrics.inc('media.blobsStored')
+        path = self.link(sha256, student_id, filename)
+        return StoredMedia(path, sha256, size, deduplicated)
+    
+    def link(self, sha256: str, student_id: str, filename: str) -> str:
+        """
+        让团队文件指向该内容（已有同名文件时原子替换），返回团队文件路径
+        内容文件不存在时抛出 FileNotFoundError
+        """
+        blob_path = self.blob_path(sha256)
+        student_media_dir = os.path.join(self.media_dir, student_id)
+        os.makedirs(student_media_dir, exist_ok=True)
+        path = os.path.join(student_media_dir, filename)
+        try:
+            if os.path.samefile(path, blob_path):
+                return path
+        except OSError:
+            pass
+        
+        temp_path = os.path.join(student_media_dir, f'.{filename}.{os.getpid()}.{time.monotonic_ns()}.tmp')
+        try:
+            try:
+                os.link(blob_path, temp_path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                # 不支持硬链接（如 FAT 文件系统、跨磁盘）时复制
+                shutil.copyfile(blob_path, temp_path)
+                metrics.inc('media.linkFallback')
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return path
+    
+    # ==================== 清单 ====================
+    
+    def team_files(self, student_id: str) -> Dict[str, int]:
+        """团队媒体目录中的文件：{文件名: 大小}（一次目录扫描）"""
+        files = {}
+        try:
+            with os.scandir(os.path.join(self.media_dir, student_id)) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue  # 正在替换的临时链接
+                    try:
+                        if entry.is_file():
+                            files[entry.name] = entry.stat().st_size
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return files
+    
+    def check_manifest(self, student_id: str, items: Iterable[Dict[str, Any]],
+                       refs: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+        """
+        对比客户端的媒体文件清单和服务器已有的文件
+        items: [{path, size?, sha256?}]；refs: 数据库中该团队的 {文件名: {sha256, fileSize}}
+        返回 {'missing': [...], 'stale': [...], 'present': [...]}（均为客户端的 path）；
+        stale 为服务器上有同名文件，但大小或 SHA-256 与客户端不一致
+        """
+        files = self.team_files(student_id)
+        result: Dict[str, List[str]] = {'missing': [], 'stale': [], 'present': []}
+        for item in items:
+            path = item['path']
+            filename = item['filename']
+            size = files.get(filename)
+            if size is None:
+                result['missing'].append(path)
+                continue
+            ref = refs.get(filename)
+            expected_size = item.get('size')
+            expected_sha256 = item.get('sha256')
+            if expected_size is not None and expected_size != size:
+                result['stale'].append(path)
+            elif expected_sha256 and ref is not None and ref['sha256'] != expected_sha256:
+                # 没有哈希记录的文件（按内容存储之前上传的）只比较大小
+                result['stale'].append(path)
+            else:
+                result['present'].append(path)
+        return result
+    
+    # ==================== 清理 ====================
+    
+    def collect_garbage(self, grace_seconds: Optional[float] = None) -> int:
+        """
+        删除没有团队文件链接的内容文件（硬链接数为 1），返回删除的数量
+        刚写入的内容文件（grace_seconds 内）可能正在被链接，暂不删除
+        """
+        if not os.path.isdir(self.blob_dir):
+            return 0
+        grace_seconds = Config.MEDIA_BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        deadline = time.time() - grace_seconds
+        removed = 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                if prefix.startswith('.upload.'):
+                    # 进程中断留下的临时文件
+                    try:
+                        if os.path.getmtime(prefix_dir) < deadline:
+                            os.remove(prefix_dir)
+                    except OSError:
+                        pass
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    stat = os.stat(path)
+                    # 链接数变化会更新 ctime
+                    if stat.st_nlink <= 1 and stat.st_ctime < deadline:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            metrics.inc('media.blobsCollected', removed)
+            logger.info("🧹 已删除 %s 个未被引用的媒体内容文件", removed)
+        return removed
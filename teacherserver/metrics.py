@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标统计
+进程内的计数器和即时值（线程安全），通过 /api/metrics 查看
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+
+class Metrics:
+    """计数器 + 即时值（gauge）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._started_at = time.time()
+    
+    def inc(self, name: str, value: int = 1):
+        """计数器加 value"""
+        with self._lock:
+            self._counters[name] += value
+    
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+    
+    def register_gauge(self, name: str, func: Callable[[], Any]):
+        """注册即时值，读取指标时调用 func 获取当前值"""
+        self._gauges[name] = func
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """当前所有指标"""
+        with self._lock:
+            counters = dict(self._counters)
+        gauges = {}
+        for name, func in list(self._gauges.items()):
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                gauges[name] = f'error: {str(e)}'
+        return {
+            'uptimeSeconds': int(time.time() - self._started_at),
+            'counters': counters,
+            'gauges': gauges,
+        }
+
+
+def ratio(numerator: int, denominator: int) -> float:
+    """比例（分母为 0 时返回 0）"""
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+
+# 全局指标实例
+metrics = Metrics()
+
+# 提交去重率：内容未变化而跳过写入的提交 / 全部通过校验的提交
+metrics.register_gauge(
+    'submitDedupeRatio',
+    lambda: ratio(metrics.get('submit.unchanged'), metrics.get('submit.accepted'))
+)
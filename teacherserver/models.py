@@ -6,9 +6,12 @@
 支持与Android端数据结构兼容
 """
 
-import json
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+import hashlib
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Any, Sequence, Tuple
+
+import json_codec
+from serializers import FieldSpec, ModelSerializer
 
 
 # ==================== 阶段名称常量 ====================
@@ -33,39 +36,186 @@ STAGE_DISPLAY_NAMES = {
 }
 
 
+def now_ms() -> int:
+    """当前时间戳（毫秒）"""
+    return int(time.time() * 1000)
+
+
+# ==================== 字段编解码器 ====================
+def _decode_json_list(value: Any) -> List[Any]:
+    """解析数据库中以JSON字符串存储的列表字段"""
+    if isinstance(value, str):
+        try:
+            return json_codec.loads(value)
+        except:
+            return []
+    return value or []
+
+
+def _decode_json_dict(value: Any) -> Dict[str, Any]:
+    """解析数据库中以JSON字符串存储的字典字段"""
+    if isinstance(value, str):
+        try:
+            return json_codec.loads(value)
+        except:
+            return {}
+    return value or {}
+
+
+def _encode_json(value: Any) -> str:
+    """列表/字典编码为JSON字符串（写库）"""
+    return json_codec.dumps(value)
+
+
+def _encode_json_list(value: Optional[List[Any]]) -> str:
+    """列表编码为JSON字符串（写库），空值存为 '[]'"""
+    return json_codec.dumps(value) if value else '[]'
+
+
+def _encode_bool(value: Any) -> int:
+    """布尔值编码为 0/1（写库）"""
+    return 1 if value else 0
+
+
+def _decode_media_type(value: Any) -> str:
+    """媒体类型：可能是字符串 "PHOTO" 或 "VIDEO"，统一为大写"""
+    return value.upper() if isinstance(value, str) else 'PHOTO'
+
+
+def _positive_or_now(value: Any) -> int:
+    """时间戳可能为 0，使用当前时间作为默认值"""
+    return value if value and value > 0 else now_ms()
+
+
+def _positive_or_zero(value: Any) -> int:
+    """Android 端的时间戳可能为 0：保留为 0，保存时再决定默认值（沿用已有记录的时间或使用创建时间）"""
+    return value if value and value > 0 else 0
+
+
+def _none_or_now(value: Any) -> int:
+    """时间戳缺省时使用当前时间"""
+    return now_ms() if value is None else value
+
+
+def _none_if_empty(value: Any) -> Optional[str]:
+    return value or None
+
+
+def _empty_if_none(value: Any) -> str:
+    return value or ''
+
+
+F = FieldSpec
+
+# 公共列：id 在最前，时间戳与扩展字段在最后（与建表语句的列顺序一致）
+_ID = F('id')
+_CREATED_AT = F('created_at')
+_UPDATED_AT = F('updated_at')
+_SCHEMA_TAIL = (F('schema_version', default=1), F('extra_data'))
+
+
 # ==================== 数据库模型基类 ====================
 class BaseModel:
-    """数据库模型基类"""
+    """数据库模型基类
+    
+    所有模型使用 __slots__，不再为每个对象分配 __dict__。
+    FIELDS 为字段映射表（数据库列、Android端键名、编解码器），
+    导入时由 __init_subclass__ 生成：
+      - COLUMNS / COLUMN_SQL：数据库列顺序，查询时按该顺序 SELECT
+      - serializer：预编译的 to_dict / to_android / insert_params / 字典加载 / 数据库行加载函数
+    from_row() 按 FIELDS 的列顺序直接映射到属性，不生成时间戳、不走 from_dict 分支。
+    """
+    
+    __slots__ = ('id', 'created_at', 'updated_at', 'schema_version', 'extra_data')
+    
+    # 表名与字段映射表（子类覆盖）
+    TABLE: str = ''
+    FIELDS: Tuple[FieldSpec, ...] = ()
+    # 以下由 __init_subclass__ 自动生成
+    COLUMNS: Tuple[str, ...] = ()
+    COLUMN_SQL: str = ''
+    serializer: Optional[ModelSerializer] = None
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.serializer = ModelSerializer(cls.__name__, cls.TABLE, cls.FIELDS)
+        cls.COLUMNS = cls.serializer.columns
+        cls.COLUMN_SQL = ', '.join(cls.COLUMNS)
     
     def __init__(self):
+        now = now_ms()
         self.id: Optional[int] = None
-        self.created_at: int = int(datetime.now().timestamp() * 1000)
-        self.updated_at: int = int(datetime.now().timestamp() * 1000)
+        self.created_at: int = now
+        self.updated_at: int = now
         self.schema_version: int = 1
         self.extra_data: Optional[str] = None
     
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> 'BaseModel':
+        """从数据库行创建（按 COLUMNS 顺序映射）"""
+        obj = cls.__new__(cls)
+        cls.serializer.load_row(obj, row)
+        return obj
+    
+    def _load_base_fields(self, data: Dict[str, Any]):
+        """加载公共数据库字段（仅当字典中存在时才覆盖）"""
+        if 'id' in data:
+            self.id = data['id']
+        if 'created_at' in data:
+            self.created_at = data['created_at']
+        if 'updated_at' in data:
+            self.updated_at = data['updated_at']
+        if 'schema_version' in data:
+            self.schema_version = data['schema_version']
+        if 'extra_data' in data:
+            self.extra_data = data['extra_data']
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（数据库格式）"""
+        return self.serializer.to_dict(self)
+    
+    def to_android_dict(self) -> Dict[str, Any]:
+        """转换为Android端格式"""
+        return self.serializer.to_android(self)
+    
     def get_extra_data(self) -> Dict[str, Any]:
         """解析extra_data JSON"""
         if self.extra_data:
             try:
-                return json.loads(self.extra_data)
+                return json_codec.loads(self.extra_data)
             except:
                 return {}
         return {}
     
     def set_extra_data(self, data: Dict[str, Any]):
         """设置extra_data JSON"""
-        self.extra_data = json.dumps(data, ensure_ascii=False) if data else None
+        self.extra_data = json_codec.dumps(data) if data else None
     
     def update_timestamp(self):
         """更新updated_at时间戳"""
-        self.updated_at = int(datetime.now().timestamp() * 1000)
+        self.updated_at = now_ms()
 
 
 # ==================== 1. teams - 团队信息表 ====================
 class Team(BaseModel):
     """团队信息表"""
     
+    __slots__ = ('team_id', 'school', 'grade', 'class_name', 'stove_number',
+                 'member_count', 'member_names')
+    
+    TABLE = 'teams'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('school', 'school', ''),
+        F('grade', 'grade', ''),
+        F('class_name', 'className', ''),
+        F('stove_number', 'stoveNumber', ''),
+        F('member_count', 'memberCount', 0),
+        F('member_names', 'memberNames', ''),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -82,72 +232,19 @@ class Team(BaseModel):
     
     def from_dict(self, data: Dict[str, Any]):
         """从字典创建（兼容Android端格式）"""
-        # 确保team_id属性已初始化（防御性检查）
-        if not hasattr(self, 'team_id'):
-            self.team_id = ''
-        
         # 兼容Android端的TeamInfo格式
         if 'teamInfo' in data:
-            team_info = data['teamInfo']
-            self.school = team_info.get('school', '')
-            self.grade = team_info.get('grade', '')
-            self.class_name = team_info.get('className', '')
-            self.stove_number = team_info.get('stoveNumber', '')
-            self.member_count = team_info.get('memberCount', 0)
-            self.member_names = team_info.get('memberNames', '')
+            self.serializer.load_android(self, data['teamInfo'])
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.school = data.get('school', '')
-            self.grade = data.get('grade', '')
-            self.class_name = data.get('class_name', '')
-            self.stove_number = data.get('stove_number', '')
-            self.member_count = data.get('member_count', 0)
-            self.member_names = data.get('member_names', '')
+            self.serializer.load_db(self, data)
         
         # 生成team_id
         if not self.team_id:
             self.team_id = f"{self.school}_{self.grade}_{self.class_name}_{self.stove_number}"
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'school': self.school,
-            'grade': self.grade,
-            'class_name': self.class_name,
-            'stove_number': self.stove_number,
-            'member_count': self.member_count,
-            'member_names': self.member_names,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
-    
-    def to_android_dict(self) -> Dict[str, Any]:
-        """转换为Android端格式"""
-        return {
-            'school': self.school,
-            'grade': self.grade,
-            'className': self.class_name,
-            'stoveNumber': self.stove_number,
-            'memberCount': self.member_count,
-            'memberNames': self.member_names
-        }
+        self._load_base_fields(data)
     
     def get_display_name(self) -> str:
         """获取显示名称"""
@@ -158,6 +255,21 @@ class Team(BaseModel):
 class TeamDivision(BaseModel):
     """团队分工表"""
     
+    __slots__ = ('team_id', 'group_leader', 'group_cooking', 'group_soup_rice',
+                 'group_fire', 'group_health')
+    
+    TABLE = 'team_divisions'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('group_leader', 'groupLeader', ''),
+        F('group_cooking', 'groupCooking', ''),
+        F('group_soup_rice', 'groupSoupRice', ''),
+        F('group_fire', 'groupFire', ''),
+        F('group_health', 'groupHealth', ''),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -173,68 +285,15 @@ class TeamDivision(BaseModel):
     
     def from_dict(self, data: Dict[str, Any]):
         """从字典创建（兼容Android端格式）"""
-        # 初始化 team_id（如果不存在）
-        if not hasattr(self, 'team_id'):
-            self.team_id = ''
-        
         # 兼容Android端的TeamDivision格式
         if 'teamDivision' in data:
-            division_data = data['teamDivision']
-            self.group_leader = division_data.get('groupLeader', '')
-            self.group_cooking = division_data.get('groupCooking', '')
-            self.group_soup_rice = division_data.get('groupSoupRice', '')
-            self.group_fire = division_data.get('groupFire', '')
-            self.group_health = division_data.get('groupHealth', '')
+            self.serializer.load_android(self, data['teamDivision'])
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.group_leader = data.get('group_leader', '')
-            self.group_cooking = data.get('group_cooking', '')
-            self.group_soup_rice = data.get('group_soup_rice', '')
-            self.group_fire = data.get('group_fire', '')
-            self.group_health = data.get('group_health', '')
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        # 确保 team_id 存在
-        if not hasattr(self, 'team_id'):
-            self.team_id = ''
-        
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'group_leader': self.group_leader,
-            'group_cooking': self.group_cooking,
-            'group_soup_rice': self.group_soup_rice,
-            'group_fire': self.group_fire,
-            'group_health': self.group_health,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
-    
-    def to_android_dict(self) -> Dict[str, Any]:
-        """转换为Android端格式"""
-        return {
-            'groupLeader': self.group_leader,
-            'groupCooking': self.group_cooking,
-            'groupSoupRice': self.group_soup_rice,
-            'groupFire': self.group_fire,
-            'groupHealth': self.group_health
-        }
+        self._load_base_fields(data)
     
     def is_empty(self) -> bool:
         """检查是否为空"""
@@ -251,6 +310,19 @@ class TeamDivision(BaseModel):
 class ProcessRecord(BaseModel):
     """过程记录表"""
     
+    __slots__ = ('team_id', 'start_time', 'end_time', 'current_stage', 'overall_notes')
+    
+    TABLE = 'process_records'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('start_time', 'startTime', 0),
+        F('end_time', 'endTime', None, kind=int),
+        F('current_stage', 'currentStage', 'PREPARATION'),
+        F('overall_notes', 'overallNotes', ''),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -267,70 +339,46 @@ class ProcessRecord(BaseModel):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的ProcessRecord格式
         if 'processRecord' in data:
-            process_data = data['processRecord']
-            self.start_time = process_data.get('startTime', 0)
-            self.end_time = process_data.get('endTime')
-            self.current_stage = process_data.get('currentStage', 'PREPARATION')
-            self.overall_notes = process_data.get('overallNotes', '')
+            self.serializer.load_android(self, data['processRecord'])
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.start_time = data.get('start_time', 0)
-            self.end_time = data.get('end_time')
-            self.current_stage = data.get('current_stage', 'PREPARATION')
-            self.overall_notes = data.get('overall_notes', '')
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'current_stage': self.current_stage,
-            'overall_notes': self.overall_notes,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
+        self._load_base_fields(data)
     
     def to_android_dict(self) -> Dict[str, Any]:
         """转换为Android端格式（需要配合StageRecord）"""
-        # 防御性检查，确保属性已初始化
-        if not hasattr(self, 'start_time'):
-            self.start_time = 0
-        if not hasattr(self, 'end_time'):
-            self.end_time = None
-        if not hasattr(self, 'current_stage'):
-            self.current_stage = 'PREPARATION'
-        if not hasattr(self, 'overall_notes'):
-            self.overall_notes = ''
-        
-        return {
-            'startTime': self.start_time,
-            'endTime': self.end_time,
-            'currentStage': self.current_stage,
-            'overallNotes': self.overall_notes
-        }
+        return self.serializer.to_android(self)
 
 
 # ==================== 4. stage_records - 阶段记录表 ====================
 class StageRecord(BaseModel):
     """阶段记录表"""
     
+    # media_items 不是数据库列，读取时由 db_manager 按 LoadSpec 附加（用于前端显示）：
+    # 列表 或 LazyMediaItems（迭代时才查询）
+    __slots__ = ('process_record_id', 'stage_name', 'start_time', 'end_time', 'self_rating',
+                 'notes', 'problem_notes', 'is_completed', 'selected_tags', 'media_items')
+    
+    TABLE = 'stage_records'
+    FIELDS = (
+        _ID,
+        F('process_record_id'),
+        F('stage_name', 'stage', ''),
+        F('start_time', 'startTime', 0),
+        F('end_time', 'endTime', None, kind=int),
+        F('self_rating', 'selfRating', 0),
+        F('notes', 'notes', ''),
+        F('problem_notes', 'problemNotes', ''),
+        # is_completed 在数据库中存储为 0/1
+        F('is_completed', 'isCompleted', False, db_encoder=_encode_bool, db_decoder=bool, row_decoder=bool),
+        # selected_tags 在数据库中存储为JSON字符串
+        F('selected_tags', 'selectedTags', [], db_encoder=_encode_json_list, db_decoder=_decode_json_list,
+          row_decoder=_decode_json_list),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -343,109 +391,37 @@ class StageRecord(BaseModel):
         self.problem_notes = ''
         self.is_completed = False
         self.selected_tags = []
+        self.media_items = []
         
         if data:
             self.from_dict(data)
     
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> 'StageRecord':
+        """从数据库行创建（媒体文件按加载范围另外查询）"""
+        obj = super().from_row(row)
+        obj.media_items = []
+        return obj
+    
     def from_dict(self, data: Dict[str, Any]):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的StageRecord格式
         if 'stage' in data:
-            self.stage_name = data.get('stage', '')
-            self.start_time = data.get('startTime', 0)
-            self.end_time = data.get('endTime')
-            self.self_rating = data.get('selfRating', 0)
-            self.notes = data.get('notes', '')
-            self.problem_notes = data.get('problemNotes', '')
-            self.is_completed = data.get('isCompleted', False)
-            self.selected_tags = data.get('selectedTags', [])
+            self.serializer.load_android(self, data)
         else:
             # 数据库格式
-            self.process_record_id = data.get('process_record_id')
-            self.stage_name = data.get('stage_name', '')
-            self.start_time = data.get('start_time', 0)
-            self.end_time = data.get('end_time')
-            self.self_rating = data.get('self_rating', 0)
-            self.notes = data.get('notes', '')
-            self.problem_notes = data.get('problem_notes', '')
-            self.is_completed = bool(data.get('is_completed', 0))
-            # selected_tags在数据库中存储为JSON字符串
-            tags_str = data.get('selected_tags', '[]')
-            if isinstance(tags_str, str):
-                try:
-                    self.selected_tags = json.loads(tags_str)
-                except:
-                    self.selected_tags = []
-            else:
-                self.selected_tags = tags_str or []
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'process_record_id': self.process_record_id,
-            'stage_name': self.stage_name,
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'self_rating': self.self_rating,
-            'notes': self.notes,
-            'problem_notes': self.problem_notes,
-            'is_completed': 1 if self.is_completed else 0,
-            'selected_tags': json.dumps(self.selected_tags, ensure_ascii=False),
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
+        self._load_base_fields(data)
     
     def to_android_dict(self) -> Dict[str, Any]:
         """转换为Android端格式"""
-        # 防御性检查，确保属性已初始化
-        if not hasattr(self, 'stage_name'):
-            self.stage_name = ''
-        if not hasattr(self, 'start_time'):
-            self.start_time = 0
-        if not hasattr(self, 'end_time'):
-            self.end_time = None
-        if not hasattr(self, 'self_rating'):
-            self.self_rating = 0
-        if not hasattr(self, 'notes'):
-            self.notes = ''
-        if not hasattr(self, 'problem_notes'):
-            self.problem_notes = ''
-        if not hasattr(self, 'is_completed'):
-            self.is_completed = False
-        if not hasattr(self, 'selected_tags'):
-            self.selected_tags = []
-        if not hasattr(self, 'media_items'):
-            self.media_items = []
-        
-        result = {
-            'stage': self.stage_name,
-            'startTime': self.start_time,
-            'endTime': self.end_time,
-            'selfRating': self.self_rating,
-            'notes': self.notes,
-            'problemNotes': self.problem_notes,
-            'isCompleted': self.is_completed,
-            'selectedTags': self.selected_tags
-        }
+        result = self.serializer.to_android(self)
         
-        # 添加媒体文件（如果存在）
-        if hasattr(self, 'media_items') and self.media_items:
-            result['mediaItems'] = self.media_items
+        # 添加媒体文件（如果存在；惰性集合在这里才真正查询）
+        if self.media_items:
+            result['mediaItems'] = list(self.media_items)
         
         return result
     
@@ -460,10 +436,91 @@ class StageRecord(BaseModel):
         return STAGE_ORDER.get(self.stage_name, 999)
 
 
+class LazyMediaItems:
+    """
+    阶段的媒体文件集合（惰性加载）
+    只有在迭代/索引时才调用 loader 查询数据库，结果缓存；
+    已知数量（LoadSpec.MEDIA_COUNTS）时 len() / bool() 不会触发查询
+    """
+    
+    __slots__ = ('_loader', '_count', '_items')
+    
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]], count: Optional[int] = None):
+        self._loader = loader
+        self._count = count
+        self._items: Optional[List[Dict[str, Any]]] = None
+    
+    @property
+    def loaded(self) -> bool:
+        return self._items is not None
+    
+    def _load(self) -> List[Dict[str, Any]]:
+        if self._items is None:
+            self._items = self._loader()
+            self._count = len(self._items)
+        return self._items
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._load())
+    
+    def __getitem__(self, index):
+        return self._load()[index]
+    
+    def __len__(self) -> int:
+        if self._count is None:
+            self._load()
+        return self._count
+    
+    def __bool__(self) -> bool:
+        return len(self) > 0
+    
+    def __repr__(self) -> str:
+        if self._items is None:
+            return f"<LazyMediaItems 未加载 count={self._count}>"
+        return f"<LazyMediaItems {self._items!r}>"
+
+
 # ==================== 5. media_items - 媒体文件表 ====================
+def media_key(file_path: Optional[str]) -> str:
+    """媒体文件匹配键：文件名（手机端路径和上传后的服务器路径文件名相同）"""
+    return (file_path or '').replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def media_id_for(team_id: str, stage_name: str, file_path: Optional[str]) -> str:
+    """
+    媒体文件的服务器ID：由团队、阶段和文件名决定，重复提交、重建数据库后保持不变，
+    客户端按该ID上传文件（/api/media/<media_id>/upload）
+    
+    ID 是确定的，知道团队ID和文件名的客户端自己也能算出来，只用于定位记录，不是访问凭证
+    （按团队和文件名读取文件的旧接口仍然可用）。
+    同一阶段中文件名相同的文件（即使手机端目录不同）是同一个ID、同一条记录：
+    服务器按团队和文件名保存文件，这些文件在服务器上本来就是同一个文件。
+    """
+    key = f"{team_id}\0{stage_name}\0{media_key(file_path)}".encode('utf-8')
+    return hashlib.sha256(key).hexdigest()[:24]
+
+
 class MediaItem(BaseModel):
     """媒体文件表"""
     
+    __slots__ = ('stage_record_id', 'summary_question', 'file_path', 'file_type',
+                 'file_size', 'timestamp', 'media_id', 'stored_path')
+    
+    # media_items 表没有 updated_at 列
+    TABLE = 'media_items'
+    FIELDS = (
+        _ID,
+        F('stage_record_id'),
+        F('summary_question'),
+        F('file_path', 'path', ''),
+        F('file_type', 'type', 'PHOTO', android_decoder=_decode_media_type),  # PHOTO 或 VIDEO
+        F('file_size'),
+        F('timestamp', 'timestamp', 0, db_decoder=_positive_or_now, android_decoder=_positive_or_zero),
+        F('media_id'),  # 服务器ID（media_id_for）
+        F('stored_path'),  # 已上传文件相对 MEDIA_DIR 的路径（<student_id>/<文件名>），未上传为 None
+        _CREATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -473,72 +530,51 @@ class MediaItem(BaseModel):
         self.file_type = 'PHOTO'  # PHOTO 或 VIDEO
         self.file_size = None
         self.timestamp = 0
+        self.media_id = None
+        self.stored_path = None
         
         if data:
             self.from_dict(data)
     
+    def to_android_dict(self) -> Dict[str, Any]:
+        """转换为Android端格式（附带服务器ID、上传地址和访问地址）"""
+        data = self.serializer.to_android(self)
+        if self.media_id:
+            data['mediaId'] = self.media_id
+            data['uploadUrl'] = f"/api/media/{self.media_id}/upload"
+            data['url'] = f"/api/media/{self.media_id}"
+            data['uploaded'] = self.stored_path is not None
+        return data
+    
     def from_dict(self, data: Dict[str, Any]):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的MediaItem格式
         if 'path' in data:
-            self.file_path = data.get('path', '')
-            # 处理 type 字段：可能是字符串 "PHOTO" 或 "VIDEO"
-            type_value = data.get('type', 'PHOTO')
-            if isinstance(type_value, str):
-                self.file_type = type_value.upper()  # 确保大写
-            else:
-                self.file_type = 'PHOTO'
-            # timestamp 可能为 0，使用当前时间作为默认值
-            timestamp_value = data.get('timestamp', 0)
-            self.timestamp = timestamp_value if timestamp_value > 0 else int(datetime.now().timestamp() * 1000)
+            self.serializer.load_android(self, data)
         else:
             # 数据库格式
-            self.stage_record_id = data.get('stage_record_id')
-            self.summary_question = data.get('summary_question')
-            self.file_path = data.get('file_path', '')
-            self.file_type = data.get('file_type', 'PHOTO')
-            self.file_size = data.get('file_size')
-            timestamp_value = data.get('timestamp', 0)
-            self.timestamp = timestamp_value if timestamp_value > 0 else int(datetime.now().timestamp() * 1000)
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'stage_record_id': self.stage_record_id,
-            'summary_question': self.summary_question,
-            'file_path': self.file_path,
-            'file_type': self.file_type,
-            'file_size': self.file_size,
-            'timestamp': self.timestamp,
-            'created_at': self.created_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
-    
-    def to_android_dict(self) -> Dict[str, Any]:
-        """转换为Android端格式"""
-        return {
-            'path': self.file_path,
-            'type': self.file_type,
-            'timestamp': self.timestamp
-        }
+        self._load_base_fields(data)
 
 
 # ==================== 6. summary_data - 课后总结表 ====================
 class SummaryData(BaseModel):
     """课后总结表"""
     
+    __slots__ = ('team_id', 'answer1', 'answer2', 'answer3')
+    
+    TABLE = 'summary_data'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('answer1', 'answer1', ''),
+        F('answer2', 'answer2', ''),
+        F('answer3', 'answer3', ''),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -554,56 +590,39 @@ class SummaryData(BaseModel):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的SummaryData格式
         if 'summaryData' in data:
-            summary_data = data['summaryData']
-            self.answer1 = summary_data.get('answer1', '')
-            self.answer2 = summary_data.get('answer2', '')
-            self.answer3 = summary_data.get('answer3', '')
+            self.serializer.load_android(self, data['summaryData'])
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.answer1 = data.get('answer1', '')
-            self.answer2 = data.get('answer2', '')
-            self.answer3 = data.get('answer3', '')
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'answer1': self.answer1,
-            'answer2': self.answer2,
-            'answer3': self.answer3,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
+        self._load_base_fields(data)
     
     def to_android_dict(self) -> Dict[str, Any]:
         """转换为Android端格式（照片通过media_items表关联）"""
-        return {
-            'answer1': self.answer1,
-            'answer2': self.answer2,
-            'answer3': self.answer3
-        }
+        return self.serializer.to_android(self)
 
 
 # ==================== 7. teacher_evaluations - 教师评价表 ====================
 class TeacherEvaluation(BaseModel):
     """教师评价表"""
     
+    __slots__ = ('team_id', 'stage_name', 'rating', 'comment', 'strengths',
+                 'improvements', 'timestamp')
+    
+    TABLE = 'teacher_evaluations'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('stage_name', 'stage', None, android_encoder=_empty_if_none, android_decoder=_none_if_empty),
+        F('rating', 'rating', 0),
+        F('comment', 'comment', ''),
+        F('strengths', 'strengths', ''),
+        F('improvements', 'improvements', ''),
+        F('timestamp', 'timestamp', None, db_decoder=_none_or_now, android_decoder=_none_or_now),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -613,7 +632,7 @@ class TeacherEvaluation(BaseModel):
         self.comment = ''
         self.strengths = ''
         self.improvements = ''
-        self.timestamp = int(datetime.now().timestamp() * 1000)
+        self.timestamp = self.created_at
         
         if data:
             self.from_dict(data)
@@ -622,120 +641,48 @@ class TeacherEvaluation(BaseModel):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的TeacherEvaluation格式
         if 'stage' in data:
-            self.stage_name = data.get('stage') or None
-            self.rating = data.get('rating', 0)
-            self.comment = data.get('comment', '')
-            self.strengths = data.get('strengths', '')
-            self.improvements = data.get('improvements', '')
-            self.timestamp = data.get('timestamp', int(datetime.now().timestamp() * 1000))
+            self.serializer.load_android(self, data)
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.stage_name = data.get('stage_name')
-            self.rating = data.get('rating', 0)
-            self.comment = data.get('comment', '')
-            self.strengths = data.get('strengths', '')
-            self.improvements = data.get('improvements', '')
-            self.timestamp = data.get('timestamp', int(datetime.now().timestamp() * 1000))
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'stage_name': self.stage_name,
-            'rating': self.rating,
-            'comment': self.comment,
-            'strengths': self.strengths,
-            'improvements': self.improvements,
-            'timestamp': self.timestamp,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
-    
-    def to_android_dict(self) -> Dict[str, Any]:
-        """转换为Android端格式"""
-        return {
-            'stage': self.stage_name or '',
-            'rating': self.rating,
-            'comment': self.comment,
-            'strengths': self.strengths,
-            'improvements': self.improvements,
-            'timestamp': self.timestamp
-        }
+        self._load_base_fields(data)
 
 
 # ==================== 8. teacher_evaluations_v2 - 新版本教师评价表 ====================
 class TeacherEvaluationV2(BaseModel):
     """新版本教师评价表（JSON格式存储）"""
     
+    __slots__ = ('team_id', 'evaluation_data', 'json_file_path')
+    
+    # teacher_evaluations_v2 表没有 schema_version / extra_data 列
+    TABLE = 'teacher_evaluations_v2'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        # evaluation_data 在数据库中存储为JSON字符串
+        F('evaluation_data', default={}, db_encoder=_encode_json, db_decoder=_decode_json_dict,
+          row_decoder=_decode_json_dict),
+        F('json_file_path'),
+        _CREATED_AT, _UPDATED_AT,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         self.team_id = ''
         self.evaluation_data: Dict[str, Any] = {}  # JSON数据
         self.json_file_path: Optional[str] = None
-        self.created_at = int(datetime.now().timestamp() * 1000)
-        self.updated_at = int(datetime.now().timestamp() * 1000)
         
         if data:
             self.from_dict(data)
     
     def from_dict(self, data: Dict[str, Any]):
-        """从字典创建"""
-        self.team_id = data.get('team_id', '')
-        
-        # 处理evaluation_data（可能是字符串或字典）
-        eval_data = data.get('evaluation_data', {})
-        if isinstance(eval_data, str):
-            try:
-                import json
-                self.evaluation_data = json.loads(eval_data)
-            except:
-                self.evaluation_data = {}
-        else:
-            self.evaluation_data = eval_data or {}
-        
-        self.json_file_path = data.get('json_file_path')
+        """从字典创建（evaluation_data 可能是字符串或字典）"""
+        self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        import json
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'evaluation_data': json.dumps(self.evaluation_data, ensure_ascii=False),
-            'json_file_path': self.json_file_path,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
+        self._load_base_fields(data)
     
     def to_json_dict(self) -> Dict[str, Any]:
         """转换为JSON格式（用于导出）"""
@@ -745,16 +692,24 @@ class TeacherEvaluationV2(BaseModel):
             'timestamp': self.evaluation_data.get('timestamp', self.updated_at),
             'stages': self.evaluation_data.get('stages', {})
         }
-    
-    def update_timestamp(self):
-        """更新时间戳"""
-        self.updated_at = int(datetime.now().timestamp() * 1000)
 
 
 # ==================== 9. menus - 菜单表 ====================
 class Menu(BaseModel):
     """菜单表"""
     
+    __slots__ = ('team_id', 'soup', 'dishes')
+    
+    TABLE = 'menus'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('soup', 'soup', ''),
+        # dishes 在数据库中存储为JSON字符串
+        F('dishes', 'dishes', [], db_encoder=_encode_json, db_decoder=_decode_json_list, row_decoder=_decode_json_list),
+        _CREATED_AT, _UPDATED_AT, *_SCHEMA_TAIL,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         # 先初始化所有属性
@@ -769,98 +724,51 @@ class Menu(BaseModel):
         """从字典创建（兼容Android端格式）"""
         # 兼容Android端的Menu格式
         if 'menuData' in data:
-            menu_data = data['menuData']
-            self.soup = menu_data.get('soup', '')
-            self.dishes = menu_data.get('dishes', [])
+            self.serializer.load_android(self, data['menuData'])
         else:
             # 数据库格式
-            self.team_id = data.get('team_id', '')
-            self.soup = data.get('soup', '')
-            # dishes在数据库中存储为JSON字符串
-            dishes_str = data.get('dishes', '[]')
-            if isinstance(dishes_str, str):
-                try:
-                    self.dishes = json.loads(dishes_str)
-                except:
-                    self.dishes = []
-            else:
-                self.dishes = dishes_str or []
+            self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-        if 'schema_version' in data:
-            self.schema_version = data['schema_version']
-        if 'extra_data' in data:
-            self.extra_data = data['extra_data']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典（数据库格式）"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'soup': self.soup,
-            'dishes': json.dumps(self.dishes, ensure_ascii=False),
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'schema_version': self.schema_version,
-            'extra_data': self.extra_data
-        }
-    
-    def to_android_dict(self) -> Dict[str, Any]:
-        """转换为Android端格式"""
-        return {
-            'soup': self.soup,
-            'dishes': self.dishes
-        }
+        self._load_base_fields(data)
 
 
 # ==================== 10. teacher_evaluation_teams - 教师评价团队表 ====================
 class TeacherEvaluationTeam(BaseModel):
     """教师评价团队表"""
     
+    __slots__ = ('team_id', 'team_name')
+    
+    TABLE = 'teacher_evaluation_teams'
+    FIELDS = (
+        _ID,
+        F('team_id', default=''),
+        F('team_name', default=''),
+        _CREATED_AT, _UPDATED_AT,
+    )
+    
     def __init__(self, data: Optional[Dict[str, Any]] = None):
         super().__init__()
         self.team_id = ''
         self.team_name = ''
-        self.created_at = int(datetime.now().timestamp() * 1000)
-        self.updated_at = int(datetime.now().timestamp() * 1000)
         
         if data:
             self.from_dict(data)
     
     def from_dict(self, data: Dict[str, Any]):
         """从字典创建"""
-        self.team_id = data.get('team_id', '')
-        self.team_name = data.get('team_name', '')
+        self.serializer.load_db(self, data)
         
         # 数据库字段
-        if 'id' in data:
-            self.id = data['id']
-        if 'created_at' in data:
-            self.created_at = data['created_at']
-        if 'updated_at' in data:
-            self.updated_at = data['updated_at']
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            'id': self.id,
-            'team_id': self.team_id,
-            'team_name': self.team_name,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
-        }
+        self._load_base_fields(data)
 
 
 # ==================== 兼容性类（保持向后兼容） ====================
 class TeamInfo:
     """团队信息（兼容旧代码）"""
     
+    __slots__ = ('school', 'grade', 'className', 'stoveNumber', 'memberCount', 'memberNames')
+    
     def __init__(self, data: Dict[str, Any]):
         self.school: str = data.get('school', '')
         self.grade: str = data.get('grade', '')
@@ -887,6 +795,8 @@ class TeamInfo:
 class StudentDataPackage:
     """学生数据包（兼容旧代码）"""
     
+    __slots__ = ('teamInfo', 'teamDivision', 'processRecord', 'summaryData', 'exportTime', '_raw_data')
+    
     @staticmethod
     def from_dict(data: Dict[str, Any]) -> 'StudentDataPackage':
         """从字典创建数据包"""
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MessagePack 编解码模块
+/api/submit 的可选二进制提交格式（Content-Type: application/msgpack），
+比JSON更紧凑（整数时间戳、短字符串的长度前缀只占1个字节）。
+内置纯Python实现，不依赖外部服务或第三方库；已安装 msgpack（C扩展）时优先使用。
+
+只支持与JSON对应的类型：nil / bool / int / float / str / bin / array / map（键为字符串），
+扩展类型按格式错误处理（时间戳请直接用毫秒整数）。
+
+适用范围只是减小请求体体积（约为JSON的 80%），不减少解码CPU：
+解码结果是普通的字典和列表，之后与JSON提交一样经过 validate_submission 生成模型对象，
+不直接解码为校验后的行结构（校验器只有一份，两种格式的结果和错误信息完全一致）。
+内置的纯Python解码器比 orjson 慢（benchmark.py msgpack 的“解码+校验”一行），
+服务器CPU比带宽紧张时应继续使用JSON（安装 msgpack C扩展后解码改用C实现）。
+Android 端仍然提交 gzip 压缩的JSON（线上体积更小），MessagePack 供中继设备等其他客户端选用。
+"""
+
+import struct
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import Config
+
+try:
+    import msgpack as _msgpack
+except ImportError:  # 可选依赖
+    _msgpack = None
+
+CONTENT_TYPES = frozenset({'application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack'})
+
+# 嵌套层数上限（防止恶意数据导致递归过深）
+MAX_DEPTH = 64
+
+BACKEND = 'msgpack' if _msgpack is not None and Config.MSGPACK_BACKEND != 'python' else 'python'
+
+
+class MsgpackError(ValueError):
+    """数据不是有效的 MessagePack（与JSON解析失败一样是 ValueError）"""
+
+
+def is_msgpack(content_type: str) -> bool:
+    """Content-Type 是否为 MessagePack（忽略 charset 等参数）"""
+    return (content_type or '').split(';', 1)[0].strip().lower() in CONTENT_TYPES
+
+
+# ==================== 解码 ====================
+
+_U16 = struct.Struct('>H').unpack_from
+_U32 = struct.Struct('>I').unpack_from
+_U64 = struct.Struct('>Q').unpack_from
+_I8 = struct.Struct('>b').unpack_from
+_I16 = struct.Struct('>h').unpack_from
+_I32 = struct.Struct('>i').unpack_from
+_I64 = struct.Struct('>q').unpack_from
+_F32 = struct.Struct('>f').unpack_from
+_F64 = struct.Struct('>d').unpack_from
+
+# 定长格式：类型字节 -> (解包函数, 字节数)
+_FIXED: Dict[int, Tuple[Callable, int]] = {
+    0xcc: (lambda data, pos: (data[pos],), 1),
+    0xcd: (_U16, 2), 0xce: (_U32, 4), 0xcf: (_U64, 8),
+    0xd0: (_I8, 1), 0xd1: (_I16, 2), 0xd2: (_I32, 4), 0xd3: (_I64, 8),
+    0xca: (_F32, 4), 0xcb: (_F64, 8),
+}
+
+# 变长格式的长度前缀：类型字节 -> (长度解包函数, 字节数)
+_LENGTH: Dict[int, Tuple[Callable, int]] = {
+    0xd9: (lambda data, pos: (data[pos],), 1), 0xda: (_U16, 2), 0xdb: (_U32, 4),  # str
+    0xc4: (lambda data, pos: (data[pos],), 1), 0xc5: (_U16, 2), 0xc6: (_U32, 4),  # bin
+    0xdc: (_U16, 2), 0xdd: (_U32, 4),  # array
+    0xde: (_U16, 2), 0xdf: (_U32, 4),  # map
+}
+
+
+def _unpack(data: bytes, pos: int, depth: int) -> Tuple[Any, int]:
+    """解码 pos 处的一个对象，返回 (对象, 下一个位置)"""
+    code = data[pos]
+    pos += 1
+    # 按提交数据中出现的频率排列：短字符串、小整数、map、array
+    if 0xa0 <= code <= 0xbf:
+        end = pos + (code & 0x1f)
+        if end > len(data):
+            raise MsgpackError("数据不完整")
+        return data[pos:end].decode('utf-8'), end
+    if code <= 0x7f:
+        return code, pos
+    if 0x80 <= code <= 0x8f:
+        return _unpack_map(data, pos, code & 0x0f, depth)
+    if 0x90 <= code <= 0x9f:
+        return _unpack_array(data, pos, code & 0x0f, depth)
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code == 0xc0:
+        return None, pos
+    if code == 0xc2:
+        return False, pos
+    if code == 0xc3:
+        return True, pos
+    
+    fixed = _FIXED.get(code)
+    if fixed is not None:
+        unpack, size = fixed
+        if pos + size > len(data):
+            raise MsgpackError("数据不完整")
+        return unpack(data, pos)[0], pos + size
+    
+    prefix = _LENGTH.get(code)
+    if prefix is None:
+        if 0xc7 <= code <= 0xc9 or 0xd4 <= code <= 0xd8:
+            raise MsgpackError("不支持扩展类型")
+        raise MsgpackError(f"无效的类型字节: 0x{code:02x}")
+    unpack, size = prefix
+    if pos + size > len(data):
+        raise MsgpackError("数据不完整")
+    length = unpack(data, pos)[0]
+    pos += size
+    
+    if code in (0xdc, 0xdd):
+        return _unpack_array(data, pos, length, depth)
+    if code in (0xde, 0xdf):
+        return _unpack_map(data, pos, length, depth)
+    end = pos + length
+    if end > len(data):
+        raise MsgpackError("数据不完整")
+    if code in (0xd9, 0xda, 0xdb):
+        return data[pos:end].decode('utf-8'), end
+    return bytes(data[pos:end]), end
+
+
+def _unpack_array(data: bytes, pos: int, length: int, depth: int) -> Tuple[List[Any], int]:
+    if depth >= MAX_DEPTH:
+        raise MsgpackError(f"嵌套超过 {MAX_DEPTH} 层")
+    depth += 1
+    items = []
+    append = items.append
+    for _ in range(length):
+        item, pos = _unpack(data, pos, depth)
+        append(item)
+    return items, pos
+
+
+def _unpack_map(data: bytes, pos: int, length: int, depth: int) -> Tuple[Dict[Any, Any], int]:
+    if depth >= MAX_DEPTH:
+        raise MsgpackError(f"嵌套超过 {MAX_DEPTH} 层")
+    depth += 1
+    result = {}
+    for _ in range(length):
+        code = data[pos]
+        if 0xa0 <= code <= 0xbf:
+            # 键几乎都是短字符串，直接解码
+            end = pos + 1 + (code & 0x1f)
+            if end > len(data):
+                raise MsgpackError("数据不完整")
+            key = data[pos + 1:end].decode('utf-8')
+            pos = end
+        else:
+            key, pos = _unpack(data, pos, depth)
+            if not isinstance(key, str):
+                raise MsgpackError("map 的键必须是字符串")
+        result[key], pos = _unpack(data, pos, depth)
+    return result, pos
+
+
+def _python_unpackb(data: bytes) -> Any:
+    try:
+        obj, pos = _unpack(data, 0, 0)
+    except MsgpackError:
+        raise
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise MsgpackError(f"MessagePack 格式错误: {str(e) or '数据不完整'}")
+    if pos != len(data):
+        raise MsgpackError(f"MessagePack 数据末尾有多余的 {len(data) - pos} 个字节")
+    return obj
+
+
+# ==================== 编码 ====================
+
+def _pack(obj: Any, out: bytearray):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj <= 0x7f:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif obj >= 0:
+            if obj <= 0xff:
+                out += struct.pack('>BB', 0xcc, obj)
+            elif obj <= 0xffff:
+                out += struct.pack('>BH', 0xcd, obj)
+            elif obj <= 0xffffffff:
+                out += struct.pack('>BI', 0xce, obj)
+            else:
+                out += struct.pack('>BQ', 0xcf, obj)
+        elif obj >= -0x80:
+            out += struct.pack('>Bb', 0xd0, obj)
+        elif obj >= -0x8000:
+            out += struct.pack('>Bh', 0xd1, obj)
+        elif obj >= -0x80000000:
+            out += struct.pack('>Bi', 0xd2, obj)
+        else:
+            out += struct.pack('>Bq', 0xd3, obj)
+    elif isinstance(obj, float):
+        out += struct.pack('>Bd', 0xcb, obj)
+    elif isinstance(obj, str):
+        raw = obj.encode('utf-8')
+        size = len(raw)
+        if size <= 0x1f:
+            out.append(0xa0 | size)
+        elif size <= 0xff:
+            out += struct.pack('>BB', 0xd9, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xda, size)
+        else:
+            out += struct.pack('>BI', 0xdb, size)
+        out += raw
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size <= 0xff:
+            out += struct.pack('>BB', 0xc4, size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xc5, size)
+        else:
+            out += struct.pack('>BI', 0xc6, size)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        size = len(obj)
+        if size <= 0x0f:
+            out.append(0x90 | size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xdc, size)
+        else:
+            out += struct.pack('>BI', 0xdd, size)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size <= 0x0f:
+            out.append(0x80 | size)
+        elif size <= 0xffff:
+            out += struct.pack('>BH', 0xde, size)
+        else:
+            out += struct.pack('>BI', 0xdf, size)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+def _python_packb(obj: Any) -> bytes:
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def _reject_ext(code: int, payload: bytes):
+    raise MsgpackError("不支持扩展类型")
+
+
+if BACKEND == 'msgpack':
+    def packb(obj: Any) -> bytes:
+        """编码为 MessagePack"""
+        return _msgpack.packb(obj, use_bin_type=True)
+    
+    def unpackb(data: bytes) -> Any:
+        """解码 MessagePack（格式错误抛出 MsgpackError）"""
+        try:
+            return _msgpack.unpackb(data, raw=False, ext_hook=_reject_ext)
+        except MsgpackError:
+            raise
+        except Exception as e:
+            raise MsgpackError(f"MessagePack 格式错误: {str(e)}")
+else:
+    def packb(obj: Any) -> bytes:
+        """编码为 MessagePack"""
+        return _python_packb(obj)
+    
+    def unpackb(data: bytes) -> Any:
+        """解码 MessagePack（格式错误抛出 MsgpackError）"""
+        return _python_unpackb(data)
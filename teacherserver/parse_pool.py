@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大提交的进程池解析
+长时间的课程会产生几MB的提交数据，JSON解码和 validate_submission 在请求线程中一直持有 GIL，
+这期间其他请求（包括教师端看板和媒体下载）都停住。
+超过 Config.PARSE_POOL_MIN_BYTES 的请求体交给子进程解码和校验，
+子进程只返回校验后的模型对象、内容哈希和顶层键（ParsedSubmission），不回传原始字典，也不回传请求体：
+JSON请求体由父进程保留用于归档，MessagePack 请求体的归档JSON在子进程中压缩后返回。
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import threading
+import zlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, List, NamedTuple, Optional
+
+from config import Config
+from metrics import metrics
+from validation import ValidatedSubmission, validate_submission, submission_hash
+import json_codec
+import msgpack_codec
+
+logger = logging.getLogger(__name__)
+
+
+class ParseTimeout(Exception):
+    """子进程在 Config.PARSE_POOL_TIMEOUT 内没有解析完请求体"""
+
+
+class ParsedSubmission(NamedTuple):
+    """解码并校验后的提交（进程间传递，不含原始字典）"""
+    submission: Optional[ValidatedSubmission]  # 数据为空或缺少 teamInfo 时为 None
+    content_hash: Optional[str]  # 校验通过时的内容哈希（忽略 exportTime）
+    raw_json: bytes  # 归档用的原始JSON
+    keys: List[str]  # 顶层键（日志用）
+    error: str  # submission 为 None 时的错误信息
+    archive_payload: Optional[bytes] = None  # 已压缩的归档数据（流式解析或子进程解析 MessagePack 时，此时 raw_json 为空）
+
+
+def parse_data(data: Any, raw_json: Optional[bytes] = None) -> ParsedSubmission:
+    """校验已解码的提交数据"""
+    if not data:
+        return ParsedSubmission(None, None, b'', [], '未收到数据')
+    if not isinstance(data, dict) or 'teamInfo' not in data:
+        return ParsedSubmission(None, None, b'', [], '缺少团队信息')
+    # 校验并规范化（单次遍历，直接产出各表的模型对象和字段级错误）
+    submission = validate_submission(data)
+    content_hash = submission_hash(data) if not submission.errors else None
+    if raw_json is None:
+        raw_json = json_codec.dumps_bytes(data)
+    return ParsedSubmission(submission, content_hash, raw_json, list(data.keys()), '')
+
+
+def decode_payload(payload: bytes, payload_format: str = 'json') -> Any:
+    """解码请求体（格式错误抛出 ValueError）"""
+    return msgpack_codec.unpackb(payload) if payload_format == 'msgpack' else json_codec.loads(payload)
+
+
+def parse_payload(payload: bytes, payload_format: str = 'json') -> ParsedSubmission:
+    """解码并校验请求体（在子进程中执行；JSON请求体直接作为归档内容，不重新编码）"""
+    data = decode_payload(payload, payload_format)
+    return parse_data(data, payload if payload_format == 'json' else None)
+
+
+def _parse_in_worker(payload: bytes, payload_format: str) -> ParsedSubmission:
+    """在子进程中执行 parse_payload，结果中不带请求体（JSON请求体由 decode_submission 在父进程补上）"""
+    parsed = parse_payload(payload, payload_format)
+    if payload_format != 'json' and parsed.raw_json:
+        # MessagePack 请求体的归档JSON是子进程重新编码的，压缩后再返回
+        archive_payload = zlib.compress(parsed.raw_json, Config.ARCHIVE_COMPRESS_LEVEL)
+        return parsed._replace(raw_json=b'', archive_payload=archive_payload)
+    return parsed._replace(raw_json=b'')
+
+
+def _report_pid(pids):
+    """子进程初始化：上报自己的 pid，超时回收进程池时父进程据此结束子进程"""
+    pids.put(os.getpid())
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pids = None  # 当前进程池子进程上报的 pid（multiprocessing.SimpleQueue）
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pids
+    with _pool_lock:
+        if _pool is None:
+            workers = Config.PARSE_POOL_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+            _pool_pids = multiprocessing.SimpleQueue()
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_report_pid, initargs=(_pool_pids,))
+            logger.info("✅ 大提交解析进程池已启动: %s 个进程", workers)
+        return _pool
+
+
+def shutdown():
+    """关闭进程池"""
+    global _pool, _pool_pids
+    with _pool_lock:
+        pool, _pool, _pool_pids = _pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def _recycle():
+    """结束当前进程池的子进程（超时的解析仍在占用进程），下次使用时重建"""
+    global _pool, _pool_pids
+    with _pool_lock:
+        pool, pids, _pool, _pool_pids = _pool, _pool_pids, None, None
+    if pool is None:
+        return
+    # 正在运行的任务无法取消，只能结束子进程（子进程启动时都已上报 pid）
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except OSError:
+            pass  # 子进程已经退出
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def use_pool(size: int) -> bool:
+    """该大小的请求体是否交给进程池解析"""
+    return Config.PARSE_POOL_ENABLED and size >= Config.PARSE_POOL_MIN_BYTES
+
+
+def decode_submission(payload: bytes, payload_format: str = 'json') -> Any:
+    """
+    解码请求体：小请求体直接在当前线程解码，返回字典；
+    大请求体在子进程解码并校验，返回 ParsedSubmission（process_submission 两种都接受）。
+    格式错误抛出 ValueError；子进程解析超时抛出 ParseTimeout
+    """
+    if not use_pool(len(payload)):
+        return decode_payload(payload, payload_format)
+    
+    try:
+        future = _get_pool().submit(_parse_in_worker, payload, payload_format)
+        try:
+            parsed = future.result(timeout=Config.PARSE_POOL_TIMEOUT)
+        except FutureTimeoutError:
+            metrics.inc('parsePool.timeouts')
+            if not future.cancel():
+                _recycle()
+            logger.warning("⚠️ 解析进程池超时（%d 字节，%s 秒），已放弃该请求体", len(payload),
+                           Config.PARSE_POOL_TIMEOUT)
+            raise ParseTimeout(f'提交数据解析超时（{Config.PARSE_POOL_TIMEOUT} 秒）')
+        metrics.inc('parsePool.parsed')
+        metrics.inc('parsePool.bytes', len(payload))
+        # JSON请求体本身就是归档内容，父进程一直持有，不经过进程间传递
+        return parsed._replace(raw_json=payload) if payload_format == 'json' else parsed
+    except BrokenProcessPool as e:
+        # 子进程异常退出（如内存不足）：重建进程池，这一次在当前线程解析
+        logger.warning("⚠️ 解析进程池不可用，改为在当前线程解析: %s", e)
+        metrics.inc('parsePool.fallback')
+        shutdown()
+        return decode_payload(payload, payload_format)
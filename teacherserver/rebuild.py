@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+从原始提交归档重建数据库
+数据库损坏或表结构变更后使用：读取每个团队最新的原始提交（归档或尚未迁移的旧格式文件），
+在进程池中并行解析、校验（与 /api/submit 相同的 validate_submission），
+再按批次在大事务中批量写入一个新数据库，最后替换原数据库（原数据库改名保留为备份）。
+
+教师评价、菜单等不来自学生提交的数据从原数据库复制（原数据库无法读取时跳过）；
+最后一次完整提交之后通过 PATCH 接口做的修改不在归档中，重建后会丢失。
+
+用法（请先停止服务器）:
+    python rebuild.py                 # 使用全部CPU核心
+    python rebuild.py --workers 4
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from archive import list_submissions
+from db_init import init_database
+from db_manager import DatabaseManager
+from models import media_key
+from validation import ValidatedSubmission, validate_submission, submission_hash
+
+logger = logging.getLogger(__name__)
+
+# 不来自学生提交、需要从原数据库复制的表
+PRESERVED_TABLES = ('teacher_evaluations', 'teacher_evaluation_teams', 'teacher_evaluations_v2', 'menus')
+
+# 团队数少于该值时不启动进程池（启动进程的开销比解析还大）
+_MIN_PARALLEL_TEAMS = 32
+
+# (团队目录, 提交数据, 内容哈希, 错误信息)
+ParsedTeam = Tuple[str, Optional[ValidatedSubmission], Optional[str], str]
+
+
+def _parse_team(student_dir: str, media_dir: str) -> ParsedTeam:
+    """读取并校验一个团队最新的原始提交（在子进程中执行）"""
+    try:
+        submissions = list_submissions(student_dir)
+        if not submissions:
+            return student_dir, None, None, '没有原始提交数据'
+        data = submissions[0][1]()
+        submission = validate_submission(data)
+        if submission.errors:
+            return student_dir, None, None, f'数据格式错误: {submission.errors[0]}'
+        
+        # 已上传到服务器的媒体文件：与上传接口一样记录已上传文件的位置
+        team_media_dir = os.path.join(media_dir, submission.student_id)
+        uploaded = set(os.listdir(team_media_dir)) if os.path.isdir(team_media_dir) else set()
+        if uploaded:
+            for media_items in submission.stages_media.values():
+                for media_item in media_items:
+                    filename = media_key(media_item.file_path)
+                    if filename in uploaded:
+                        media_item.stored_path = f"{submission.student_id}/{filename}"
+        
+        return student_dir, submission, submission_hash(data), ''
+    except Exception as e:
+        return student_dir, None, None, str(e)
+
+
+def _parse_all(student_dirs: List[str], media_dir: str, workers: int) -> Iterator[ParsedTeam]:
+    """按目录顺序返回解析结果（团队较多时使用进程池）"""
+    if workers <= 1 or len(student_dirs) < _MIN_PARALLEL_TEAMS:
+        for student_dir in student_dirs:
+            yield _parse_team(student_dir, media_dir)
+        return
+    chunksize = max(1, len(student_dirs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_parse_team, student_dirs, [media_dir] * len(student_dirs), chunksize=chunksize)
+
+
+def _copy_preserved_tables(new_db_path: str, old_db_path: str) -> Dict[str, int]:
+    """从原数据库复制教师评价、菜单等（按两边都有的列复制，兼容表结构变更）"""
+    copied: Dict[str, int] = {}
+    if not os.path.exists(old_db_path):
+        return copied
+    conn = sqlite3.connect(new_db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS old", (old_db_path,))
+        for table in PRESERVED_TABLES:
+            try:
+                new_columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+                old_columns = {row[1] for row in conn.execute(f"PRAGMA old.table_info({table})")}
+                columns = ', '.join(c for c in new_columns if c in old_columns)
+                if not columns:
+                    continue
+                # 只保留重建后仍然存在的团队的数据
+                where = " WHERE team_id IN (SELECT team_id FROM main.teams)" if 'team_id' in old_columns else ''
+                cursor = conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM old.{table}{where}")
+                copied[table] = cursor.rowcount
+            except sqlite3.DatabaseError as e:
+                logger.warning("⚠️ 无法从原数据库复制 %s: %s", table, e)
+        conn.commit()
+    except sqlite3.DatabaseError as e:
+        logger.warning("⚠️ 原数据库无法读取，教师评价和菜单不会保留: %s", e)
+    finally:
+        conn.close()
+    return copied
+
+
+def _replace_database(new_db_path: str, db_path: str) -> Optional[str]:
+    """用新数据库替换原数据库，原数据库（含 -wal / -shm）改名为备份，返回备份路径"""
+    backup_path = None
+    if os.path.exists(db_path):
+        backup_path = f"{db_path}.bak_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.replace(db_path + suffix, backup_path + suffix)
+    os.replace(new_db_path, db_path)
+    return backup_path
+
+
+def rebuild_database(db_path: Optional[str] = None, data_dir: Optional[str] = None,
+                     media_dir: Optional[str] = None, workers: Optional[int] = None,
+                     batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """从原始提交归档重建数据库，返回统计信息"""
+    db_path = db_path or Config.DATABASE_PATH
+    data_dir = data_dir or Config.DATA_DIR
+    media_dir = media_dir or Config.MEDIA_DIR
+    workers = workers or Config.REBUILD_WORKERS or os.cpu_count() or 1
+    batch_size = batch_size or Config.REBUILD_BATCH_SIZE
+    start = time.perf_counter()
+    
+    student_dirs = sorted(
+        os.path.join(data_dir, name) for name in os.listdir(data_dir)
+        if os.path.isdir(os.path.join(data_dir, name))
+    ) if os.path.isdir(data_dir) else []
+    logger.info("📥 开始重建数据库: %s 个团队目录, %s 个解析进程", len(student_dirs), workers)
+    
+    new_db_path = db_path + '.rebuild'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(new_db_path + suffix):
+            os.remove(new_db_path + suffix)
+    if not init_database(new_db_path):
+        raise RuntimeError(f"无法创建新数据库: {new_db_path}")
+    
+    db = DatabaseManager(new_db_path)
+    # 新数据库写入失败时直接丢弃，不需要每次提交都落盘
+    db._get_connection().execute("PRAGMA synchronous = OFF")
+    totals = {'teams': 0, 'stages': 0, 'media': 0}
+    failed: List[Dict[str, str]] = []
+    seen = set()
+    batch: List[Tuple[ValidatedSubmission, Optional[str]]] = []
+    
+    def flush():
+        counts = db.bulk_insert_submissions(batch)
+        for key in totals:
+            totals[key] += counts[key]
+        batch.clear()
+    
+    try:
+        for student_dir, submission, content_hash, error in _parse_all(student_dirs, media_dir, workers):
+            if submission is None:
+                failed.append({'dir': os.path.basename(student_dir), 'error': error})
+                logger.warning("⚠️ 跳过 %s: %s", os.path.basename(student_dir), error)
+                continue
+            if submission.student_id in seen:
+                logger.warning("⚠️ 跳过 %s: 团队 %s 已从其他目录导入", os.path.basename(student_dir), submission.student_id)
+                continue
+            seen.add(submission.student_id)
+            batch.append((submission, content_hash))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        db._get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        db.close()
+    
+    copied = _copy_preserved_tables(new_db_path, db_path)
+    backup_path = _replace_database(new_db_path, db_path)
+    
+    elapsed = time.perf_counter() - start
+    logger.info("✅ 数据库重建完成: %s 个团队, %s 个阶段, %s 个媒体文件, 失败 %s 个, 耗时 %.2f 秒",
+                totals['teams'], totals['stages'], totals['media'], len(failed), elapsed)
+    if backup_path:
+        logger.info("   原数据库已备份为: %s", backup_path)
+    return {**totals, 'failed': failed, 'copied': copied, 'backup': backup_path, 'seconds': round(elapsed, 3)}
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    args = sys.argv[1:]
+    workers = None
+    if '--workers' in args:
+        workers = int(args[args.index('--workers') + 1])
+    
+    result = rebuild_database(workers=workers)
+    for item in result['failed']:
+        print(f"  [失败] {item['dir']}: {item['error']}")
+    for table, count in result['copied'].items():
+        print(f"  从原数据库复制 {table}: {count} 条")
+
+
+if __name__ == '__main__':
+    main()
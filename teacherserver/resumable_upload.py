@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可续传的媒体文件上传
+一次 multipart POST 上传 90MB 的视频时，学校 Wi-Fi 在 80% 处断开就要从头再传。这里把上传拆成：
+- 创建：POST /api/student/<id>/media/uploads，声明文件大小，返回 uploadId 和已接收的字节数；
+  uploadId 由团队、原始路径、大小和时间戳决定，客户端重启后再次创建会得到同一个上传，从断点继续；
+- 追加：PATCH .../uploads/<uploadId>，请求头 Upload-Offset 必须等于服务器已接收的字节数，请求体追加到 .part 文件；
+- 查询：HEAD .../uploads/<uploadId>，响应头 Upload-Offset 为已接收的字节数（连接断开后用来确定从哪里继续）；
+- 完成：POST .../uploads/<uploadId>/complete，校验大小和 SHA-256 后移入按内容寻址的媒体存储（media_store.py）。
+
+SHA-256 随写入增量计算（服务器重启后第一次追加时从 .part 文件重新计算一次）。
+同一个上传同时只有最新的一个 PATCH 能写入：新的 PATCH 开始后，仍在读取旧连接的请求在下一次写入前放弃。
+"""
+
+import hashlib
+import os
+import threading
+import time
+import logging
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from config import Config
+from metrics import metrics
+from file_writer import atomic_write, FSYNC_NONE
+from media_store import MediaStore
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+_READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无法处理（status 为 HTTP 状态码，offset 为服务器已接收的字节数）"""
+    
+    def __init__(self, message: str, status: int, offset: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+def safe_media_filename(original_path: str, filename: str) -> str:
+    """服务器端保存的文件名：优先使用 Android 原始路径中的文件名，去掉路径分隔符"""
+    name = os.path.basename(original_path) if original_path else filename
+    return name.replace('..', '').replace('/', '').replace('\\', '')
+
+
+class _Session:
+    """一个进行中的上传（元数据保存在 <uploadId>.json，已接收的数据在 <uploadId>.part）"""
+    
+    def __init__(self, info: Dict[str, Any], part_path: str):
+        self.info = info
+        self.part_path = part_path
+        self.lock = threading.Lock()
+        self.generation = 0  # 每个新的 PATCH 加一，旧请求发现后放弃写入
+        self.hasher: Optional[Any] = None  # 与 .part 文件内容一致的 SHA-256；None 表示需要从文件重新计算
+        self.hashed_size = 0
+    
+    @property
+    def size(self) -> int:
+        return self.info['size']
+    
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+    
+    def ensure_hasher(self):
+        """调用方持有 lock"""
+        if self.hasher is not None:
+            return
+        hasher = hashlib.sha256()
+        size = 0
+        if os.path.exists(self.part_path):
+            with open(self.part_path, 'rb') as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    hasher.update(block)
+                    size += len(block)
+        self.hasher, self.hashed_size = hasher, size
+
+
+class ResumableUploads:
+    """可续传上传的会话管理（进程内缓存 + 上传目录中的文件）"""
+    
+    def __init__(self, upload_dir: str, media_store: MediaStore):
+        self.upload_dir = upload_dir
+        self.media_store = media_store
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def upload_id(student_id: str, original_path: str, size: int, timestamp: int) -> str:
+        key = f"{student_id}\0{original_path}\0{size}\0{timestamp}".encode('utf-8')
+        return hashlib.sha256(key).hexdigest()[:32]
+    
+    def _paths(self, upload_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.upload_dir, upload_id)
+        return base + '.json', base + '.part'
+    
+    def _load(self, student_id: str, upload_id: str) -> _Session:
+        """取得上传会话（不存在或不属于该团队时抛出 404）"""
+        if not upload_id.isalnum():
+            raise UploadError('上传不存在', 404)
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                meta_path, part_path = self._paths(upload_id)
+                try:
+                    info = json_codec.load_file(meta_path)
+                except (OSError, ValueError):
+                    raise UploadError('上传不存在或已过期', 404)
+                session = self._sessions[upload_id] = _Session(info, part_path)
+        if session.info['studentId'] != student_id:
+            raise UploadError('上传不存在', 404)
+        return session
+    
+    # ==================== 创建 / 查询 ====================
+    
+    def create(self, student_id: str, original_path: str, filename: str, file_type: str,
+               timestamp: int, size: int, media_id: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """创建上传；相同文件的上传已存在时返回已有的上传。返回 (状态, 是否新建)"""
+        if size < 0:
+            raise UploadError('文件大小无效', 400)
+        if size > Config.MAX_FILE_SIZE:
+            raise UploadError(f'文件超过 {Config.MAX_FILE_SIZE // (1024 * 1024)}MB 上限', 413)
+        safe_filename = safe_media_filename(original_path, filename)
+        if not safe_filename:
+            raise UploadError('文件名为空', 400)
+        
+        upload_id = self.upload_id(student_id, original_path, size, timestamp)
+        try:
+            session = self._load(student_id, upload_id)
+            offset = session.offset()
+            if offset:
+                metrics.inc('upload.resumed')
+                logger.info("⏯️ 继续上传: %s/%s (已接收 %d/%d 字节)", student_id, safe_filename, offset, size)
+            return self._status(session), False
+        except UploadError:
+            pass
+        
+        self.cleanup_expired()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        now = int(time.time() * 1000)
+        info = {
+            'uploadId': upload_id,
+            'studentId': student_id,
+            'originalPath': original_path,
+            'filename': safe_filename,
+            'type': file_type,
+            'timestamp': timestamp,
+            'size': size,
+            'mediaId': media_id,
+            'createdAt': now,
+        }
+        meta_path, part_path = self._paths(upload_id)
+        open(part_path, 'ab').close()
+        atomic_write(meta_path, json_codec.dumps_bytes(info), FSYNC_NONE)
+        session = _Session(info, part_path)
+        with self._lock:
+            session = self._sessions.setdefault(upload_id, session)
+        metrics.inc('upload.created')
+        return self._status(session), True
+    
+    def status(self, student_id: str, upload_id: str) -> Dict[str, Any]:
+        """上传的当前状态（offset 为已接收的字节数）"""
+        return self._status(self._load(student_id, upload_id))
+    
+    @staticmethod
+    def _status(session: _Session) -> Dict[str, Any]:
+        return {
+            'uploadId': session.info['uploadId'],
+            'filename': session.info['filename'],
+            'size': session.size,
+            'offset': session.offset(),
+            'chunkSize': Config.RESUMABLE_UPLOAD_CHUNK_SIZE,
+        }
+    
+    # ==================== 追加 ====================
+    
+    def append(self, student_id: str, upload_id: str, offset: int, stream: BinaryIO,
+               length: Optional[int]) -> int:
+        """把请求体追加到 offset 处（必须等于已接收的字节数），返回新的已接收字节数"""
+        session = self._load(student_id, upload_id)
+        with session.lock:
+            current = session.offset()
+            if offset != current:
+                metrics.inc('upload.offsetConflicts')
+                raise UploadError(f'Upload-Offset 应为 {current}', 409, current)
+            if length is not None and current + length > session.size:
+                raise UploadError('数据超过声明的文件大小', 413, current)
+            session.generation += 1
+            generation = session.generation
+            session.ensure_hasher()
+        
+        received = 0
+        try:
+            with open(session.part_path, 'ab') as f:
+                while True:
+                    block = stream.read(_READ_SIZE)
+                    if not block:
+                        break
+                    with session.lock:
+                        if session.generation != generation:
+                            # 客户端已经从新的连接继续上传，这个（断开的）请求不再写入
+                            metrics.inc('upload.superseded')
+                            raise UploadError('该上传已由新的请求继续', 409, session.offset())
+                        if session.hashed_size + len(block) > session.size:
+                            raise UploadError('数据超过声明的文件大小', 413, session.hashed_size)
+                        try:
+                            f.write(block)
+                            f.flush()
+                        except Exception:
+                            session.hasher = None  # 写入了多少不确定，下次从文件重新计算
+                            raise
+                        session.hasher.update(block)
+                        session.hashed_size += len(block)
+                    received += len(block)
+        finally:
+            # 包括断线前已写入的部分（这些数据续传时不需要重新发送）
+            metrics.inc('upload.bytes', received)
+        return session.offset()
+    
+    # ==================== 完成 ====================
+    
+    def finalize(self, student_id: str, upload_id: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """校验后把 .part 文件移入媒体存储，返回最终文件信息"""
+        session = self._load(student_id, upload_id)
+        with session.lock:
+            offset = session.offset()
+            if offset != session.size:
+                raise UploadError(f'文件尚未上传完整（{offset}/{session.size} 字节）', 409, offset)
+            session.ensure_hasher()
+            digest = session.hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                # 内容与客户端不一致，只能重新上传
+                self._discard(session)
+                metrics.inc('upload.checksumFailed')
+                raise UploadError('文件校验失败（SHA-256 不一致），请重新上传', 422, 0)
+            
+            if Config.FILE_WRITER_FSYNC != FSYNC_NONE:
+                with open(session.part_path, 'rb') as f:
+                    os.fsync(f.fileno())
+            stored = self.media_store.store_file(session.part_path, digest, student_id, session.info['filename'])
+            self._discard(session)
+        metrics.inc('upload.completed')
+        return {**session.info, 'path': stored.path, 'sha256': digest, 'deduplicated': stored.deduplicated}
+    
+    def _discard(self, session: _Session):
+        """删除上传会话的文件（调用方持有 session.lock）"""
+        upload_id = session.info['uploadId']
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        session.generation += 1
+        session.hasher = None
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+    
+    def cleanup_expired(self):
+        """删除超过 Config.RESUMABLE_UPLOAD_EXPIRE_HOURS 没有写入的上传"""
+        if not os.path.isdir(self.upload_dir):
+            return
+        deadline = time.time() - Config.RESUMABLE_UPLOAD_EXPIRE_HOURS * 3600
+        last_modified: Dict[str, float] = {}  # uploadId -> 元数据和数据文件中较新的修改时间
+        for name in os.listdir(self.upload_dir):
+            try:
+                mtime = os.path.getmtime(os.path.join(self.upload_dir, name))
+            except FileNotFoundError:
+                continue
+            upload_id = name.split('.', 1)[0]
+            last_modified[upload_id] = max(mtime, last_modified.get(upload_id, 0))
+        
+        for upload_id, mtime in last_modified.items():
+            if mtime >= deadline:
+                continue
+            with self._lock:
+                session = self._sessions.get(upload_id)
+                if session is not None and session.lock.locked():
+                    continue
+                self._sessions.pop(upload_id, None)
+            for path in self._paths(upload_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            metrics.inc('upload.expired')
+            logger.info("🧹 已删除过期的上传: %s", upload_id)
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'active': len(self._sessions)}
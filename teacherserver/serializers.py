@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型序列化器生成模块
+根据字段映射表（数据库列名、Android端键名、编解码器）在导入时一次性生成
+to_dict / to_android_dict / 插入参数 / 字典加载函数 / 数据库行加载函数，
+避免在每次调用时做 hasattr 检查和逐字段的分支判断
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# 由 from_dict 末尾统一处理的公共列（仅当字典中存在时才覆盖）
+BASE_COLUMNS = frozenset({'id', 'created_at', 'updated_at', 'schema_version', 'extra_data'})
+
+
+class FieldSpec(NamedTuple):
+    """字段映射：一行描述一个数据库列"""
+    column: str                                        # 数据库列名（snake_case），同时也是属性名
+    android_key: Optional[str] = None                  # Android端键名（camelCase），None 表示不出现在Android格式中
+    default: Any = None                                # 从字典加载时的缺省值（仅支持字面量）
+    db_encoder: Optional[Callable[[Any], Any]] = None       # 写入数据库前的编码（如 列表 -> JSON字符串）
+    db_decoder: Optional[Callable[[Any], Any]] = None       # 从数据库格式字典加载时的解码
+    android_encoder: Optional[Callable[[Any], Any]] = None  # 输出Android格式时的编码
+    android_decoder: Optional[Callable[[Any], Any]] = None  # 从Android格式字典加载时的解码
+    kind: Optional[type] = None                        # Android端取值类型（用于提交校验），None 表示按 default 的类型推断
+    row_decoder: Optional[Callable[[Any], Any]] = None      # 从数据库行（SELECT 的原始值）加载时的解码，None 表示原样使用
+
+
+class ModelSerializer:
+    """单个模型的预编译序列化器"""
+    
+    def __init__(self, model_name: str, table: str, fields: Tuple[FieldSpec, ...]):
+        self.model_name = model_name
+        self.table = table
+        self.fields = fields
+        self.columns: Tuple[str, ...] = tuple(f.column for f in fields)
+        self.android_keys: Tuple[str, ...] = tuple(f.android_key for f in fields if f.android_key)
+        
+        # INSERT 语句（不含自增 id 列）
+        self.insert_columns: Tuple[str, ...] = tuple(c for c in self.columns if c != 'id')
+        self.insert_sql = (
+            f"INSERT INTO {table} ({', '.join(self.insert_columns)}) "
+            f"VALUES ({', '.join('?' * len(self.insert_columns))})"
+        ) if table else ''
+        # 预先分配 id 的批量插入（参数为 (id, *insert_params)）
+        self.insert_with_id_sql = (
+            f"INSERT INTO {table} (id, {', '.join(self.insert_columns)}) "
+            f"VALUES (?, {', '.join('?' * len(self.insert_columns))})"
+        ) if table else ''
+        
+        self._db_encoders: Dict[str, Callable[[Any], Any]] = {f.column: f.db_encoder for f in fields if f.db_encoder}
+        
+        namespace: Dict[str, Any] = {}
+        self.to_dict: Callable[[Any], Dict[str, Any]] = self._compile_to_dict(namespace)
+        self.to_android: Callable[[Any], Dict[str, Any]] = self._compile_to_android(namespace)
+        self.insert_params: Callable[[Any], tuple] = self._compile_insert_params(namespace)
+        self.load_android: Callable[[Any, Dict[str, Any]], None] = self._compile_load_android(namespace)
+        self.load_db: Callable[[Any, Dict[str, Any]], None] = self._compile_load_db(namespace)
+        self.load_row: Callable[[Any, Sequence[Any]], None] = self._compile_load_row(namespace)
+    
+    def encode_db(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """把部分列的值编码为数据库格式（列名 -> 值），用于只更新部分列的 UPDATE"""
+        encoders = self._db_encoders
+        return {column: encoders[column](value) if column in encoders else value
+                for column, value in values.items()}
+    
+    # ==================== 代码生成 ====================
+    
+    @staticmethod
+    def _register(namespace: Dict[str, Any], func: Optional[Callable]) -> Optional[str]:
+        """把编解码函数放入生成代码的命名空间，返回其引用名"""
+        if func is None:
+            return None
+        name = f"_f{len(namespace)}"
+        namespace[name] = func
+        return name
+    
+    def _wrap(self, namespace: Dict[str, Any], func: Optional[Callable], expr: str) -> str:
+        name = self._register(namespace, func)
+        return f"{name}({expr})" if name else expr
+    
+    def _build(self, name: str, lines: List[str], namespace: Dict[str, Any]) -> Callable:
+        source = '\n'.join(lines)
+        code = compile(source, f"<serializer {self.model_name}.{name}>", 'exec')
+        exec(code, namespace)
+        return namespace.pop(name)
+    
+    def _compile_to_dict(self, namespace: Dict[str, Any]) -> Callable:
+        items = [
+            f"{f.column!r}: {self._wrap(namespace, f.db_encoder, 'o.' + f.column)}"
+            for f in self.fields
+        ]
+        return self._build('to_dict', [
+            "def to_dict(o):",
+            f"    return {{{', '.join(items)}}}",
+        ], namespace)
+    
+    def _compile_to_android(self, namespace: Dict[str, Any]) -> Callable:
+        items = [
+            f"{f.android_key!r}: {self._wrap(namespace, f.android_encoder, 'o.' + f.column)}"
+            for f in self.fields if f.android_key
+        ]
+        return self._build('to_android', [
+            "def to_android(o):",
+            f"    return {{{', '.join(items)}}}",
+        ], namespace)
+    
+    def _compile_insert_params(self, namespace: Dict[str, Any]) -> Callable:
+        items = [
+            self._wrap(namespace, f.db_encoder, 'o.' + f.column)
+            for f in self.fields if f.column != 'id'
+        ]
+        return self._build('insert_params', [
+            "def insert_params(o):",
+            f"    return ({', '.join(items)},)",
+        ], namespace)
+    
+    def _compile_load_android(self, namespace: Dict[str, Any]) -> Callable:
+        lines = ["def load_android(o, d):"]
+        for f in self.fields:
+            if not f.android_key:
+                continue
+            value = self._wrap(namespace, f.android_decoder, f"d.get({f.android_key!r}, {f.default!r})")
+            lines.append(f"    o.{f.column} = {value}")
+        if len(lines) == 1:
+            lines.append("    pass")
+        return self._build('load_android', lines, namespace)
+    
+    def _compile_load_db(self, namespace: Dict[str, Any]) -> Callable:
+        lines = ["def load_db(o, d):"]
+        for f in self.fields:
+            if f.column in BASE_COLUMNS:
+                continue
+            value = self._wrap(namespace, f.db_decoder, f"d.get({f.column!r}, {f.default!r})")
+            lines.append(f"    o.{f.column} = {value}")
+        if len(lines) == 1:
+            lines.append("    pass")
+        return self._build('load_db', lines, namespace)
+    
+    def _compile_load_row(self, namespace: Dict[str, Any]) -> Callable:
+        """按 columns 顺序解包数据库行（列数不一致时抛出 ValueError，不会错位）"""
+        targets = []
+        decode_lines = []
+        for i, f in enumerate(self.fields):
+            if f.row_decoder:
+                targets.append(f"_v{i}")
+                decode_lines.append(f"    o.{f.column} = {self._wrap(namespace, f.row_decoder, f'_v{i}')}")
+            else:
+                targets.append(f"o.{f.column}")
+        lines = ["def load_row(o, row):", f"    ({', '.join(targets)},) = row", *decode_lines]
+        # 没有对应列的公共属性（如 media_items 表没有 updated_at）
+        if 'updated_at' not in self.columns:
+            lines.append("    o.updated_at = o.created_at")
+        if 'schema_version' not in self.columns:
+            lines.append("    o.schema_version = 1")
+        if 'extra_data' not in self.columns:
+            lines.append("    o.extra_data = None")
+        return self._build('load_row', lines, namespace)
@@ -6,17 +6,21 @@
 """
 
 import os
-import json
 import shutil
 import zipfile
 import re
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Tuple, Any
 import logging
 
-from models import StudentDataPackage, TeacherEvaluation, TeacherEvaluationV2, TeacherEvaluationTeam, TeamInfo, Team, TeamDivision, ProcessRecord, StageRecord, SummaryData
+from models import StudentDataPackage, Menu, TeacherEvaluation, TeacherEvaluationV2, TeacherEvaluationTeam, TeamInfo, Team, TeamDivision, ProcessRecord, StageRecord, SummaryData, MediaItem
 from config import Config
-from db_manager import DatabaseManager
+import json_codec
+from db_manager import DatabaseManager, LoadSpec
+from validation import ValidatedSubmission, validate_submission
+from archive import SubmissionArchive
+from team_locks import team_locks
+from file_writer import file_writer, atomic_write, FSYNC_NONE
 
 logger = logging.getLogger(__name__)
 
@@ -38,112 +42,112 @@ class DataStorage:
         os.makedirs(self.export_dir, exist_ok=True)
     
     def save_student_data(self, data_package: StudentDataPackage) -> str:
-        """保存学生数据到数据库"""
-        try:
-            # 生成学生ID（team_id）
-            student_id = data_package.teamInfo.get_student_id()
-            
-            # ⭐ 关键调试：检查原始数据
-            logger.info(f"🔍 开始保存学生数据到数据库: {student_id}")
-            if hasattr(data_package, '_raw_data') and data_package._raw_data:
-                process_record_raw = data_package._raw_data.get('processRecord')
-                if process_record_raw:
-                    has_stages = 'stages' in process_record_raw
-                    logger.info(f"   原始数据检查:")
-                    logger.info(f"     processRecord 存在: {process_record_raw is not None}")
-                    logger.info(f"     包含 stages 字段: {has_stages}")
-                    if has_stages:
-                        stages_dict = process_record_raw.get('stages', {})
-                        stages_count = len(stages_dict)
-                        logger.info(f"     stages 数量: {stages_count}")
-                        # 统计媒体文件
-                        total_media = 0
-                        for stage_name, stage_data in stages_dict.items():
-                            media_items = stage_data.get('mediaItems', [])
-                            if not media_items:
-                                media_items = stage_data.get('media_items', [])
-                            media_count = len(media_items) if media_items else 0
-                            total_media += media_count
-                        logger.info(f"     总计媒体文件: {total_media}")
-                    else:
-                        logger.warning(f"     ⚠️ processRecord 中没有 stages 字段！")
-                        logger.warning(f"     processRecord 的键: {list(process_record_raw.keys())}")
-                else:
-                    logger.warning(f"   ⚠️ _raw_data 中没有 processRecord")
-            else:
-                logger.warning(f"⚠️ data_package 没有 _raw_data 或为空")
-            
-            # 1. 保存团队信息
-            team = Team({'teamInfo': data_package.teamInfo.to_dict()})
-            self.db_manager.save_team(team)
-            
-            # 2. 保存团队分工（如果有）
-            if data_package.teamDivision and not data_package.teamDivision.is_empty():
-                # 确保team_id已设置
-                data_package.teamDivision.team_id = student_id
-                self.db_manager.save_team_division(student_id, data_package.teamDivision)
-            
-            # 3. 保存过程记录和阶段记录（如果有）
-            if data_package.processRecord:
-                # 提取阶段记录和媒体文件
-                stages = []
-                stages_media = {}  # 存储每个阶段的媒体文件
-                # 从原始数据中提取stages（如果存在）
-                if hasattr(data_package, '_raw_data') and data_package._raw_data:
-                    process_data = data_package._raw_data.get('processRecord')
-                    logger.info(f"处理过程记录数据: process_data存在={process_data is not None}")
-                    
-                    if process_data:
-                        if 'stages' in process_data:
-                            stages_dict = process_data.get('stages', {})
-                            logger.info(f"找到stages数据: {len(stages_dict)} 个阶段")
-                            
-                            for stage_name, stage_data in stages_dict.items():
-                                try:
-                                    stage = StageRecord(stage_data)
-                                    stages.append(stage)
-                                    
-                                    # 提取媒体文件
-                                    media_items = []
-                                    if 'mediaItems' in stage_data:
-                                        media_items = stage_data['mediaItems']
-                                    elif 'media_items' in stage_data:
-                                        media_items = stage_data['media_items']
-                                    
-                                    if media_items:
-                                        stages_media[stage_name] = media_items
-                                        logger.info(f"  阶段 {stage_name}: {len(media_items)} 个媒体文件")
-                                        # 记录每个媒体文件的详细信息
-                                        for idx, media_item in enumerate(media_items):
-                                            logger.info(f"    媒体文件 {idx+1}: path={media_item.get('path', 'N/A')}, type={media_item.get('type', 'N/A')}")
-                                    else:
-                                        logger.info(f"  阶段 {stage_name}: 没有媒体文件")
-                                        
-                                except Exception as e:
-                                    logger.error(f"处理阶段 {stage_name} 失败: {str(e)}", exc_info=True)
-                        else:
-                            logger.warning(f"processRecord 中没有 'stages' 字段")
-                            logger.debug(f"processRecord 的键: {list(process_data.keys()) if process_data else []}")
-                    else:
-                        logger.warning(f"process_data 为 None")
-                else:
-                    logger.warning(f"data_package 没有 _raw_data 属性或 _raw_data 为空")
+        """保存学生数据到数据库（兼容旧接口，内部转为 save_submission）"""
+        raw_data = data_package._raw_data if data_package._raw_data else data_package.to_dict()
+        submission = validate_submission(raw_data)
+        if submission.errors:
+            raise ValueError(f"数据格式错误: {submission.errors[0]}")
+        return self.save_submission(submission)
+    
+    def is_unchanged_submission(self, student_id: str, content_hash: str) -> bool:
+        """提交内容与该团队上次成功保存的内容相同"""
+        return self.db_manager.get_submission_hash(student_id) == content_hash
+    
+    def save_submission(self, submission: ValidatedSubmission, content_hash: Optional[str] = None) -> str:
+        """
+        保存校验后的提交数据到数据库，content_hash 用于之后识别重复提交
+        各表在一个事务中写入，任一失败时整体回滚（不会留下只更新了一半的团队数据和对应的哈希）
+        """
+        with team_locks.lock(submission.student_id), self.db_manager.transaction():
+            try:
+                # 学生ID（team_id）
+                student_id = submission.student_id
+                logger.debug("🔍 开始保存学生数据到数据库: %s", student_id)
                 
-                # 保存过程记录和阶段记录（包括媒体文件）
-                logger.info(f"准备保存: {len(stages)} 个阶段记录, {len(stages_media)} 个阶段有媒体文件")
-                self.db_manager.save_process_record(student_id, data_package.processRecord, stages, stages_media)
-            
-            # 4. 保存课后总结（如果有）
-            if data_package.summaryData:
-                self.db_manager.save_summary_data(student_id, data_package.summaryData)
-            
-            logger.info(f"保存学生数据到数据库: {student_id}")
-            
-            return student_id
+                # 1. 保存团队信息
+                self.db_manager.save_team(submission.team)
+                
+                # 2. 保存团队分工（如果有）
+                if submission.division and not submission.division.is_empty():
+                    self.db_manager.save_team_division(student_id, submission.division)
+                
+                # 3. 保存过程记录和阶段记录（如果有）
+                if submission.process:
+                    if not submission.stages:
+                        logger.warning("⚠️ processRecord 中没有 stages 数据: %s", student_id)
+                    # 保存过程记录和阶段记录（包括媒体文件）
+                    logger.debug("准备保存: %d 个阶段记录, %d 个阶段有媒体文件（共 %d 个）", len(submission.stages),
+                                 len(submission.stages_media), submission.media_count)
+                    self.db_manager.save_process_record(student_id, submission.process, submission.stages, submission.stages_media)
+                
+                # 4. 保存课后总结（如果有）
+                if submission.summary:
+                    self.db_manager.save_summary_data(student_id, submission.summary)
+                
+                # 5. 记录内容哈希（全部写入成功后才记录）
+                if content_hash:
+                    self.db_manager.save_submission_hash(student_id, content_hash)
+                
+                logger.debug("保存学生数据到数据库: %s", student_id)
+                
+                return student_id
             
-        except Exception as e:
-            logger.error(f"保存学生数据失败: {str(e)}", exc_info=True)
-            raise
+            except Exception as e:
+                logger.error("保存学生数据失败: %s", e, exc_info=True)
+                raise
+    
+    def save_submissions(self, submissions: List[Tuple[ValidatedSubmission, Optional[str]]]) -> List[str]:
+        """在一个事务中保存多个团队的提交数据 [(提交数据, 内容哈希)]，任一失败时全部回滚"""
+        # 先取得所有团队锁再开启事务（与单个提交的加锁顺序一致）
+        with team_locks.lock_many(submission.student_id for submission, _ in submissions), \
+                self.db_manager.transaction():
+            return [self.save_submission(submission, content_hash) for submission, content_hash in submissions]
+    
+    def get_archive(self, student_id: str) -> SubmissionArchive:
+        """团队的原始提交归档"""
+        return SubmissionArchive(os.path.join(self.data_dir, student_id))
+    
+    def archive_submission(self, student_id: str, raw_json: bytes) -> int:
+        """把原始提交数据追加到归档，返回版本号"""
+        return self.get_archive(student_id).append(raw_json)
+    
+    def archive_compressed_submission(self, student_id: str, payload: bytes) -> int:
+        """把已压缩的原始提交数据追加到归档，返回版本号"""
+        return self.get_archive(student_id).append_compressed(payload)
+    
+    def get_submission_versions(self, student_id: str) -> List[Dict[str, Any]]:
+        """原始提交的所有版本（从旧到新）"""
+        return [entry.to_dict() for entry in self.get_archive(student_id).entries()]
+    
+    def get_raw_submission(self, student_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """读取某个版本的原始提交（version 为 None 时读取最新版本）"""
+        archive = self.get_archive(student_id)
+        entry = archive.entry(version)
+        if entry is None:
+            return None
+        return {**entry.to_dict(), 'data': archive.load(entry.version)}
+    
+    def update_stage(self, student_id: str, stage_name: str, fields: Dict[str, Any],
+                     media_items: Optional[List[MediaItem]] = None) -> Optional[Dict[str, Any]]:
+        """更新单个阶段（部分字段），返回更新后的阶段数据（Android格式）；学生不存在时返回 None"""
+        with team_locks.lock(student_id):
+            stage = self.db_manager.patch_stage(student_id, stage_name, fields, media_items)
+        if stage is None:
+            return None
+        return stage.to_android_dict()
+    
+    def update_summary(self, student_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新课后总结（部分字段），返回更新后的课后总结（Android格式）；学生不存在时返回 None"""
+        with team_locks.lock(student_id):
+            summary = self.db_manager.patch_summary_data(student_id, fields)
+        if summary is None:
+            return None
+        return summary.to_android_dict()
+    
+    def save_menu(self, menu: Menu) -> int:
+        """保存或覆盖团队菜单（与提交数据共用团队锁，先查后写在一个事务中完成）"""
+        with team_locks.lock(menu.team_id), self.db_manager.transaction():
+            return self.db_manager.save_menu(menu)
     
     def get_all_students(self) -> List[Dict[str, Any]]:
         """获取所有学生列表（从数据库读取）"""
@@ -163,8 +167,8 @@ class DataStorage:
                     if team_division:
                         group_leader = team_division.group_leader
                     
-                    # 获取过程记录和阶段记录
-                    process_result = self.db_manager.get_process_record(student_id)
+                    # 获取过程记录和阶段记录（列表只需要评分和完成状态，不加载媒体文件）
+                    process_result = self.db_manager.get_process_record(student_id, LoadSpec.STAGES)
                     completed_stages = 0
                     total_stages = 0
                     has_process_record = False
@@ -174,7 +178,7 @@ class DataStorage:
                         has_process_record = True
                         total_stages = len(stages)
                         completed_stages = sum(1 for s in stages if s.is_completed)
-                        logger.info(f"🔍 学生 {student_id}: 找到 {len(stages)} 个阶段记录")
+                        logger.debug("🔍 学生 %s: 找到 %d 个阶段记录", student_id, len(stages))
                         # 提取每个阶段的评分
                         for stage in stages:
                             # 确保正确读取评分值（处理 None、0 等情况）
@@ -192,8 +196,8 @@ class DataStorage:
                                 'selfRating': self_rating,
                                 'isCompleted': stage.is_completed
                             }
-                            # 使用 INFO 级别，确保能看到日志
-                            logger.info(f"✅ 阶段 {stage.stage_name} 评分: {self_rating} (原始值: {stage.self_rating}, 类型: {type(stage.self_rating)})")
+                            logger.debug("✅ 阶段 %s 评分: %d (原始值: %r)", stage.stage_name, self_rating,
+                                         stage.self_rating)
                     
                     # 检查是否有课后总结
                     summary_data = self.db_manager.get_summary_data(student_id)
@@ -239,22 +243,21 @@ class DataStorage:
                         'menu': menu_data  # 菜单数据
                     })
                     
-                    # 记录评分数据摘要
-                    if stage_ratings:
-                        logger.info(f"📊 学生 {student_id} 的评分摘要: {len(stage_ratings)} 个阶段有数据")
-                        for stage_name, rating_data in stage_ratings.items():
-                            logger.info(f"   {stage_name}: {rating_data['selfRating']} 星")
-                    
+                    # 记录评分数据摘要（看板每 30 秒刷新一次，只在诊断模式下输出）
+                    if stage_ratings and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("📊 学生 %s 的评分摘要: %s", student_id,
+                                     ', '.join(f"{name} {data['selfRating']} 星" for name, data in stage_ratings.items()))
+                
                 except Exception as e:
-                    logger.error(f"读取学生数据失败 {student_id}: {str(e)}")
+                    logger.error("读取学生数据失败 %s: %s", student_id, e)
                     continue
             
             # 按照炉号数字排序（1-20），从小到大
             # 如果炉号相同，则按提交时间排序（后提交的排在后面）
             students.sort(key=lambda x: (x['stoveNumberInt'], x.get('submitTime', 0)))
-            
+        
         except Exception as e:
-            logger.error(f"获取学生列表失败: {str(e)}", exc_info=True)
+            logger.error("获取学生列表失败: %s", e, exc_info=True)
         
         return students
     
@@ -292,7 +295,7 @@ class DataStorage:
                             try:
                                 stages_dict[stage.stage_name] = stage.to_android_dict()
                             except Exception as e:
-                                logger.error(f"转换阶段记录失败 {stage.stage_name}: {str(e)}", exc_info=True)
+                                logger.error("转换阶段记录失败 %s: %s", stage.stage_name, e, exc_info=True)
                                 # 使用默认值
                                 stages_dict[stage.stage_name] = {
                                     'stage': stage.stage_name if hasattr(stage, 'stage_name') else '',
@@ -307,7 +310,7 @@ class DataStorage:
                         process_dict['stages'] = stages_dict
                         data['processRecord'] = process_dict
                     except Exception as e:
-                        logger.error(f"转换过程记录失败: {str(e)}", exc_info=True)
+                        logger.error("转换过程记录失败: %s", e, exc_info=True)
                         # 使用默认值
                         data['processRecord'] = {
                             'startTime': getattr(process_record, 'start_time', 0),
@@ -319,7 +322,7 @@ class DataStorage:
                 else:
                     data['processRecord'] = None
             except Exception as e:
-                logger.error(f"获取过程记录失败: {str(e)}", exc_info=True)
+                logger.error("获取过程记录失败: %s", e, exc_info=True)
                 data['processRecord'] = None
             
             # 获取课后总结
@@ -338,9 +341,9 @@ class DataStorage:
             data['exportTime'] = team.updated_at
             
             return data
-            
+        
         except Exception as e:
-            logger.error(f"获取学生数据失败 {student_id}: {str(e)}", exc_info=True)
+            logger.error("获取学生数据失败 %s: %s", student_id, e, exc_info=True)
             return None
     
     def student_exists(self, student_id: str) -> bool:
@@ -354,7 +357,7 @@ class DataStorage:
             teams = self.db_manager.get_all_teams()
             return len(teams)
         except Exception as e:
-            logger.error(f"获取学生数量失败: {str(e)}")
+            logger.error("获取学生数量失败: %s", e)
             return 0
     
     def save_student_evaluation(self, student_id: str, evaluation: TeacherEvaluation):
@@ -365,12 +368,13 @@ class DataStorage:
                 raise ValueError(f"学生 {student_id} 不存在")
             
             # 保存到数据库
-            self.db_manager.save_teacher_evaluation(student_id, evaluation)
-            
-            logger.info(f"保存评价到数据库: {student_id} - {evaluation.stage_name}")
+            with team_locks.lock(student_id):
+                self.db_manager.save_teacher_evaluation(student_id, evaluation)
             
+            logger.info("保存评价到数据库: %s - %s", student_id, evaluation.stage_name)
+        
         except Exception as e:
-            logger.error(f"保存评价失败: {str(e)}", exc_info=True)
+            logger.error("保存评价失败: %s", e, exc_info=True)
             raise
     
     def get_student_evaluation(self, student_id: str, stage_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
@@ -380,9 +384,9 @@ class DataStorage:
             if evaluation:
                 return evaluation.to_android_dict()
             return None
-                
+        
         except Exception as e:
-            logger.error(f"获取评价失败: {str(e)}")
+            logger.error("获取评价失败: %s", e)
             return None
     
     def get_all_student_evaluations(self, student_id: str) -> Dict[str, Dict[str, Any]]:
@@ -394,82 +398,18 @@ class DataStorage:
                 result[stage_name] = evaluation.to_android_dict()
             return result
         except Exception as e:
-            logger.error(f"获取所有评价失败: {str(e)}", exc_info=True)
+            logger.error("获取所有评价失败: %s", e, exc_info=True)
             return {}
-            logger.error(f"获取评价失败: {str(e)}")
+            logger.error("获取评价失败: %s", e)
             return None
     
-    def get_media_file_path(self, student_id: str, filename: str) -> Optional[str]:
-        """获取媒体文件路径"""
-        try:
-            logger.debug(f"查找媒体文件: student_id={student_id}, filename={filename}")
-            
-            # 处理不同的路径格式
-            # 1. 如果filename是完整路径（Android路径），提取文件名
-            original_filename = filename
-            if os.path.sep in filename or '/' in filename:
-                # 提取文件名（处理Android路径格式）
-                filename = os.path.basename(filename)
-                logger.debug(f"从完整路径提取文件名: {original_filename} -> {filename}")
-            
-            # 2. 尝试在媒体目录中查找（优先级最高）
-            file_path = os.path.join(self.media_dir, student_id, filename)
-            if os.path.exists(file_path):
-                logger.info(f"✅ 找到媒体文件（媒体目录）: {file_path}")
-                return file_path
-            
-            # 3. 尝试在媒体目录根目录查找
-            file_path = os.path.join(self.media_dir, filename)
-            if os.path.exists(file_path):
-                logger.info(f"✅ 找到媒体文件（媒体根目录）: {file_path}")
-                return file_path
-            
-            # 4. 尝试在学生数据目录中查找
-            student_dir = os.path.join(self.data_dir, student_id)
-            file_path = os.path.join(student_dir, filename)
-            if os.path.exists(file_path):
-                logger.info(f"✅ 找到媒体文件（数据目录）: {file_path}")
-                return file_path
-            
-            # 5. 如果filename是完整路径且文件存在（本地测试用）
-            if os.path.exists(original_filename):
-                logger.info(f"✅ 找到媒体文件（完整路径）: {original_filename}")
-                return original_filename
-            
-            # 6. 尝试从数据库查找对应的文件路径
-            try:
-                from db_manager import DatabaseManager
-                db_manager = DatabaseManager()
-                # 查询包含该文件名的记录
-                rows = db_manager._fetch_all(
-                    "SELECT file_path FROM media_items WHERE file_path LIKE ? OR file_path LIKE ? LIMIT 5",
-                    (f'%{filename}', f'%{os.path.basename(filename)}')
-                )
-                
-                if rows:
-                    logger.info(f"在数据库中找到 {len(rows)} 条相关记录")
-                    for row in rows:
-                        db_path = row['file_path']
-                        # 提取文件名
-                        db_filename = os.path.basename(db_path)
-                        # 再次尝试查找
-                        test_path = os.path.join(self.media_dir, student_id, db_filename)
-                        if os.path.exists(test_path):
-                            logger.info(f"✅ 通过数据库路径找到文件: {test_path}")
-                            return test_path
-            except Exception as e:
-                logger.debug(f"从数据库查找失败: {str(e)}")
-            
-            logger.warning(f"❌ 媒体文件未找到: student_id={student_id}, filename={filename}")
-            logger.warning(f"   尝试过的路径:")
-            logger.warning(f"     1. {os.path.join(self.media_dir, student_id, filename)}")
-            logger.warning(f"     2. {os.path.join(self.media_dir, filename)}")
-            logger.warning(f"     3. {os.path.join(self.data_dir, student_id, filename)}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"获取媒体文件路径失败: {str(e)}", exc_info=True)
+    def get_media_file_path(self, media_id: str) -> Optional[str]:
+        """按服务器ID获取已上传的媒体文件路径（记录不存在或文件未上传时返回 None）"""
+        found = self.db_manager.get_media_item(media_id)
+        if not found or not found[0].stored_path:
             return None
+        file_path = os.path.join(self.media_dir, found[0].stored_path)
+        return file_path if os.path.isfile(file_path) else None
     
     def export_all_data(self) -> Optional[str]:
         """导出所有数据为ZIP文件（包含数据库、媒体文件、学生数据、评价数据等）"""
@@ -480,16 +420,16 @@ class DataStorage:
             zip_filename = f'campcooking_export_{timestamp}.zip'
             zip_path = os.path.join(self.export_dir, zip_filename)
             
-            logger.info(f"开始导出所有数据到: {zip_path}")
+            logger.info("开始导出所有数据到: %s", zip_path)
             
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 # 1. 添加数据库文件
                 db_path = Config.DATABASE_PATH
                 if os.path.exists(db_path):
                     zipf.write(db_path, 'campcooking.db')
-                    logger.info(f"✅ 已添加数据库文件: {db_path}")
+                    logger.info("✅ 已添加数据库文件: %s", db_path)
                 else:
-                    logger.warning(f"⚠️ 数据库文件不存在: {db_path}")
+                    logger.warning("⚠️ 数据库文件不存在: %s", db_path)
                 
                 # 2. 添加学生数据目录
                 if os.path.exists(self.data_dir):
@@ -500,7 +440,7 @@ class DataStorage:
                             arcname = os.path.join('students', os.path.relpath(file_path, self.data_dir))
                             zipf.write(file_path, arcname)
                             student_count += 1
-                    logger.info(f"✅ 已添加 {student_count} 个学生数据文件")
+                    logger.info("✅ 已添加 %s 个学生数据文件", student_count)
                 
                 # 3. 添加评价数据
                 if os.path.exists(self.evaluation_dir):
@@ -511,7 +451,7 @@ class DataStorage:
                             arcname = os.path.join('evaluations', file)
                             zipf.write(file_path, arcname)
                             eval_count += 1
-                    logger.info(f"✅ 已添加 {eval_count} 个评价文件")
+                    logger.info("✅ 已添加 %s 个评价文件", eval_count)
                 
                 # 4. 添加媒体文件（照片和视频）
                 if os.path.exists(self.media_dir):
@@ -524,7 +464,7 @@ class DataStorage:
                             zipf.write(file_path, arcname)
                             media_count += 1
                             total_size += os.path.getsize(file_path)
-                    logger.info(f"✅ 已添加 {media_count} 个媒体文件 (总大小: {total_size / 1024 / 1024:.2f} MB)")
+                    logger.info("✅ 已添加 %s 个媒体文件 (总大小: %.2f MB)", media_count, total_size / 1024 / 1024)
                 
                 # 5. 添加元数据文件（导出信息）
                 metadata = {
@@ -536,16 +476,15 @@ class DataStorage:
                     'media_dir': 'media',
                     'description': '野炊教学数据管理系统 - 完整数据导出'
                 }
-                metadata_json = json.dumps(metadata, ensure_ascii=False, indent=2)
-                zipf.writestr('metadata.json', metadata_json.encode('utf-8'))
+                zipf.writestr('metadata.json', json_codec.dumps_bytes(metadata, json_codec.is_pretty('metadata')))
                 logger.info("✅ 已添加元数据文件")
             
             file_size = os.path.getsize(zip_path)
-            logger.info(f"✅ 导出完成: {zip_path} (大小: {file_size / 1024 / 1024:.2f} MB)")
+            logger.info("✅ 导出完成: %s (大小: %.2f MB)", zip_path, file_size / 1024 / 1024)
             return zip_path
-            
+        
         except Exception as e:
-            logger.error(f"导出数据失败: {str(e)}", exc_info=True)
+            logger.error("导出数据失败: %s", e, exc_info=True)
             return None
     
     def import_all_data(self, zip_path: str, merge_mode: bool = False) -> Dict[str, Any]:
@@ -578,18 +517,17 @@ class DataStorage:
                 result['message'] = f'ZIP文件不存在: {zip_path}'
                 return result
             
-            logger.info(f"开始导入数据从: {zip_path}")
+            logger.info("开始导入数据从: %s", zip_path)
             
             with zipfile.ZipFile(zip_path, 'r') as zipf:
                 # 读取元数据
                 metadata = None
                 if 'metadata.json' in zipf.namelist():
                     try:
-                        metadata_json = zipf.read('metadata.json').decode('utf-8')
-                        metadata = json.loads(metadata_json)
-                        logger.info(f"读取元数据: {metadata.get('export_time', '未知时间')}")
+                        metadata = json_codec.loads(zipf.read('metadata.json'))
+                        logger.info("读取元数据: %s", metadata.get('export_time', '未知时间'))
                     except Exception as e:
-                        logger.warning(f"读取元数据失败: {str(e)}")
+                        logger.warning("读取元数据失败: %s", e)
                 
                 # 1. 导入数据库
                 if 'campcooking.db' in zipf.namelist():
@@ -599,7 +537,7 @@ class DataStorage:
                             if os.path.exists(Config.DATABASE_PATH):
                                 backup_path = Config.DATABASE_PATH + f'.backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
                                 shutil.copy2(Config.DATABASE_PATH, backup_path)
-                                logger.info(f"已备份现有数据库到: {backup_path}")
+                                logger.info("已备份现有数据库到: %s", backup_path)
                             
                             # 提取数据库文件
                             os.makedirs(os.path.dirname(Config.DATABASE_PATH), exist_ok=True)
@@ -636,7 +574,7 @@ class DataStorage:
                             
                             result['imported_items']['students'] += 1
                         
-                        logger.info(f"✅ 已导入 {result['imported_items']['students']} 个学生数据文件")
+                        logger.info("✅ 已导入 %s 个学生数据文件", result['imported_items']['students'])
                     except Exception as e:
                         error_msg = f"学生数据导入失败: {str(e)}"
                         logger.error(error_msg, exc_info=True)
@@ -660,7 +598,7 @@ class DataStorage:
                             
                             result['imported_items']['evaluations'] += 1
                         
-                        logger.info(f"✅ 已导入 {result['imported_items']['evaluations']} 个评价文件")
+                        logger.info("✅ 已导入 %s 个评价文件", result['imported_items']['evaluations'])
                     except Exception as e:
                         error_msg = f"评价数据导入失败: {str(e)}"
                         logger.error(error_msg, exc_info=True)
@@ -682,14 +620,13 @@ class DataStorage:
                             # 创建目录
                             os.makedirs(os.path.dirname(target_path), exist_ok=True)
                             
-                            # 提取文件
+                            # 提取文件（整体替换而不是原地写入：已有文件可能是与其他团队共享内容的硬链接）
                             with zipf.open(file_info) as src_file:
-                                with open(target_path, 'wb') as dst_file:
-                                    dst_file.write(src_file.read())
+                                atomic_write(target_path, src_file.read(), FSYNC_NONE)
                             
                             result['imported_items']['media'] += 1
                         
-                        logger.info(f"✅ 已导入 {result['imported_items']['media']} 个媒体文件")
+                        logger.info("✅ 已导入 %s 个媒体文件", result['imported_items']['media'])
                     except Exception as e:
                         error_msg = f"媒体文件导入失败: {str(e)}"
                         logger.error(error_msg, exc_info=True)
@@ -698,12 +635,12 @@ class DataStorage:
             result['success'] = len(result['errors']) == 0
             result['message'] = f"导入完成: 数据库={result['imported_items']['database']}, 学生数据={result['imported_items']['students']}, 评价={result['imported_items']['evaluations']}, 媒体={result['imported_items']['media']}"
             
-            logger.info(f"✅ 导入完成: {result['message']}")
+            logger.info("✅ 导入完成: %s", result['message'])
             if result['errors']:
-                logger.warning(f"⚠️ 导入过程中有 {len(result['errors'])} 个错误")
+                logger.warning("⚠️ 导入过程中有 %s 个错误", len(result['errors']))
             
             return result
-            
+        
         except Exception as e:
             error_msg = f"导入数据失败: {str(e)}"
             logger.error(error_msg, exc_info=True)
@@ -719,7 +656,7 @@ class DataStorage:
         try:
             return self.db_manager.get_statistics()
         except Exception as e:
-            logger.error(f"获取统计失败: {str(e)}", exc_info=True)
+            logger.error("获取统计失败: %s", e, exc_info=True)
             return {
                 'totalStudents': 0,
                 'studentsWithProcess': 0,
@@ -751,31 +688,30 @@ class DataStorage:
             json_filename = f"evaluation_{safe_team_id}_{timestamp}.json"
             json_file_path = os.path.join(Config.EVALUATION_DIR, json_filename)
             
-            # 保存带时间戳的文件
-            with open(json_file_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=2)
+            # 保存带时间戳的文件（后台线程原子写入，不阻塞请求）
+            file_writer.write_json(json_data, json_file_path, 'evaluation')
             
             # 保存最新版本（覆盖）
             latest_filename = f"evaluation_{safe_team_id}_latest.json"
             latest_file_path = os.path.join(Config.EVALUATION_DIR, latest_filename)
-            with open(latest_file_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=2)
+            file_writer.write_json(json_data, latest_file_path, 'evaluation')
             
             # 保存到数据库
-            self.db_manager.save_teacher_evaluation_v2(
-                team_id=team_id,
-                evaluation_data=json_data,
-                json_file_path=json_file_path
-            )
-            
-            # 确保团队在teacher_evaluation_teams表中
-            self.db_manager.save_teacher_evaluation_team(team_id, team_name)
+            with team_locks.lock(team_id):
+                self.db_manager.save_teacher_evaluation_v2(
+                    team_id=team_id,
+                    evaluation_data=json_data,
+                    json_file_path=json_file_path
+                )
+                
+                # 确保团队在teacher_evaluation_teams表中
+                self.db_manager.save_teacher_evaluation_team(team_id, team_name)
             
-            logger.info(f"✅ 保存教师评价V2成功: {team_id}, JSON文件: {json_file_path}")
+            logger.info("✅ 保存教师评价V2成功: %s, JSON文件: %s", team_id, json_file_path)
             return True
-            
+        
         except Exception as e:
-            logger.error(f"保存教师评价V2失败: {str(e)}", exc_info=True)
+            logger.error("保存教师评价V2失败: %s", e, exc_info=True)
             return False
     
     def get_teacher_evaluation_v2(self, team_id: str) -> Optional[Dict[str, Any]]:
@@ -786,45 +722,45 @@ class DataStorage:
                 return evaluation.to_json_dict()
             return None
         except Exception as e:
-            logger.error(f"获取教师评价V2失败: {str(e)}", exc_info=True)
+            logger.error("获取教师评价V2失败: %s", e, exc_info=True)
             return None
     
     def get_all_evaluation_teams(self, page: int = 1, page_size: int = 5) -> Dict[str, Any]:
         """
         获取所有可评价的团队列表（从teams表读取所有已提交数据的团队）
-
+        
         Args:
             page: 页码（从1开始）
             page_size: 每页数量（默认5个）
-
+        
         Returns:
             包含团队列表和分页信息的字典
         """
         try:
             import re
-
+            
             # 从 teams 表读取所有团队
             teams = self.db_manager.get_all_teams()
-
+            
             # 提取炉号数字并排序
             def extract_stove_number(team):
                 """从炉号中提取数字，如 '1号炉' -> 1"""
                 match = re.search(r'(\d+)', team.stove_number)
                 return int(match.group(1)) if match else 999
-
+            
             # 按炉号数字排序
             teams.sort(key=extract_stove_number)
-
+            
             # 构建完整团队信息
             all_teams = []
             for team in teams:
                 # 获取团队分工信息
                 division = self.db_manager.get_team_division(team.team_id)
                 group_leader = division.group_leader if division else ""
-
+                
                 # 构建显示名称（学校 + 年级 + 班级 + 炉号）
                 display_name = f"{team.school} {team.grade}{team.class_name} {team.stove_number}"
-
+                
                 all_teams.append({
                     'id': team.team_id,
                     'teamId': team.team_id,
@@ -845,16 +781,16 @@ class DataStorage:
                         'groupHealth': division.group_health if division else ""
                     } if division else None
                 })
-
+            
             # 分页处理
             total_count = len(all_teams)
             total_pages = (total_count + page_size - 1) // page_size  # 向上取整
             page = max(1, min(page, total_pages)) if total_pages > 0 else 1  # 确保页码有效
-
+            
             start_idx = (page - 1) * page_size
             end_idx = min(start_idx + page_size, total_count)
             page_teams = all_teams[start_idx:end_idx]
-
+            
             return {
                 'teams': page_teams,
                 'pagination': {
@@ -867,7 +803,7 @@ class DataStorage:
                 }
             }
         except Exception as e:
-            logger.error(f"获取评价团队列表失败: {str(e)}", exc_info=True)
+            logger.error("获取评价团队列表失败: %s", e, exc_info=True)
             return {
                 'teams': [],
                 'pagination': {
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/submit 的流式解析
+request.get_json() 先缓存整个请求体再构造完整的对象树，一份提交的内存峰值是请求体大小的好几倍，
+全班同时提交时还要再乘以并发数。这里按块读取 request.stream：
+- 顶层的 teamInfo / teamDivision / summaryData 等小段，以及 processRecord.stages 中的每个阶段，
+  读完一段就解码这一段并交给 SubmissionValidator 对应的方法，然后丢弃；
+- 读到的原始字节边读边压缩（与归档格式相同），归档时直接写入，不再保留原始请求体；
+- 内容哈希（与 submission_hash 结果相同）由各段的规范化JSON拼接计算，阶段的规范化JSON压缩暂存。
+
+内存峰值取决于读取块大小和最大的单个阶段，而不是整个请求体。
+校验后的模型对象仍然在请求结束时一次写入数据库（读网络数据期间不占用数据库写锁）。
+
+顶层、processRecord 或 stages 中出现重复的键时（已经逐段校验过的内容无法撤回），
+读完剩余数据后按完整请求体重新解析，与 json_codec.loads 一样以最后一个值为准，
+同一份请求体不会因为大小或 STREAM_PARSE 配置不同而得到不同的结果。
+"""
+
+import hashlib
+import re
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from parse_pool import ParsedSubmission, parse_data
+from validation import SubmissionValidator
+import json_codec
+
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+_STRING_TAIL = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)  # 从开头的引号之后到结尾的引号
+# 跳过字符串和普通字符，停在下一个括号（或未读完的字符串开头）处
+_SKIP_TO_BRACKET = re.compile(rb'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*', re.S)
+_SCALAR = re.compile(rb'[^,:}\]\s]+')
+
+_COMMA, _COLON = ord(','), ord(':')
+_OPEN_OBJECT, _CLOSE_OBJECT = ord('{'), ord('}')
+_OPEN_ARRAY, _CLOSE_ARRAY = ord('['), ord(']')
+_QUOTE = ord('"')
+
+
+class StreamParseError(ValueError):
+    """请求体不是有效的JSON（与JSON解析失败一样是 ValueError）"""
+
+
+class PayloadTooLarge(Exception):
+    """请求体超过大小上限"""
+
+
+class _DuplicateKey(Exception):
+    """对象中出现重复的键，需要按完整请求体重新解析"""
+
+
+class _Reader:
+    """按块读取的JSON词法读取器（只负责找出一个值的字节范围，值本身交给 json_codec 解码）"""
+    
+    def __init__(self, stream, max_size: int, chunk_size: int, sink: Callable[[bytes], None]):
+        self.stream = stream
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.sink = sink  # 每块原始字节都交给 sink（压缩归档）
+        self.buf = bytearray()
+        self.pos = 0
+        self.total = 0
+        self.eof = False
+    
+    def _fill(self) -> bool:
+        """再读一块，没有更多数据时返回 False"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.total += len(chunk)
+        if self.total > self.max_size:
+            raise PayloadTooLarge()
+        self.sink(chunk)
+        self.buf += chunk
+        return True
+    
+    def _compact(self):
+        """丢弃已经处理过的数据（只在两个值之间调用，扫描中的位置不会失效）"""
+        if self.pos > self.chunk_size:
+            del self.buf[:self.pos]
+            self.pos = 0
+    
+    def error(self, message: str) -> StreamParseError:
+        return StreamParseError(f"{message}（第 {self.total - len(self.buf) + self.pos + 1} 个字节附近）")
+    
+    def peek(self) -> int:
+        """跳过空白，返回下一个字符（不消耗）；数据提前结束时抛出 StreamParseError"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._compact()
+            if not self._fill():
+                raise self.error("数据不完整")
+    
+    def at_end(self) -> bool:
+        """后面只剩空白（读到流结束）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return False
+            self._compact()
+            if not self._fill():
+                return True
+    
+    def expect(self, char: int):
+        if self.peek() != char:
+            raise self.error(f"应为 '{chr(char)}'")
+        self.pos += 1
+    
+    def skip(self):
+        self.pos += 1
+    
+    def read_value(self) -> bytes:
+        """读取下一个完整的JSON值，返回它的原始字节"""
+        self._compact()
+        first = self.peek()
+        start = self.pos
+        if first == _QUOTE:
+            end = self._string_end(start + 1)
+        elif first in (_OPEN_OBJECT, _OPEN_ARRAY):
+            end = self._container_end(start)
+        else:
+            while True:
+                match = _SCALAR.match(self.buf, start)
+                if match is None:
+                    raise self.error("无效的值")
+                if match.end() < len(self.buf) or not self._fill():
+                    end = match.end()
+                    break
+        self.pos = end
+        return bytes(self.buf[start:end])
+    
+    def _string_end(self, index: int) -> int:
+        """index 为开头引号之后的位置，返回结尾引号之后的位置"""
+        while True:
+            match = _STRING_TAIL.match(self.buf, index)
+            if match is not None:
+                return match.end()
+            if not self._fill():
+                raise self.error("字符串不完整")
+    
+    def _container_end(self, start: int) -> int:
+        depth = 0
+        index = start
+        buf = self.buf
+        skip = _SKIP_TO_BRACKET.match
+        while True:
+            index = skip(buf, index).end()
+            char = buf[index] if index < len(buf) else _QUOTE
+            if char == _QUOTE:
+                # 读到缓冲区末尾，或字符串还没有读完
+                if not self._fill():
+                    raise self.error("数据不完整")
+                continue
+            index += 1
+            if char == _OPEN_OBJECT or char == _OPEN_ARRAY:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return index
+    
+    def read_key(self) -> str:
+        if self.peek() != _QUOTE:
+            raise self.error("应为字符串键")
+        key = json_codec.loads(self.read_value())
+        self.expect(_COLON)
+        return key
+    
+    def next_member(self, close: int) -> bool:
+        """对象或数组中一个成员之后：还有下一个成员返回 True，结束返回 False"""
+        char = self.peek()
+        self.skip()
+        if char == _COMMA:
+            return True
+        if char == close:
+            return False
+        raise self.error(f"应为 ',' 或 '{chr(close)}'")
+
+
+def _decode(raw: bytes) -> Any:
+    try:
+        return json_codec.loads(raw)
+    except ValueError as e:
+        raise StreamParseError(str(e))
+
+
+class _CanonicalHash:
+    """
+    按段计算 submission_hash：规范化JSON（键排序、无空白）可以由各段的规范化JSON拼接得到，
+    阶段数量多、内容大，规范化后压缩暂存，最后按键排序解压拼接
+    """
+    
+    def __init__(self):
+        self.sections: Dict[str, bytes] = {}  # 顶层键 -> 规范化JSON（processRecord 除外）
+        self.process_fields: Dict[str, bytes] = {}  # processRecord 中除 stages 之外的字段
+        self.stages: List[Tuple[str, bytes]] = []  # [(阶段键, 压缩的规范化JSON)]
+        self.stages_is_list = False
+        self.streamed_process = False
+    
+    @staticmethod
+    def _pack(value: Any) -> bytes:
+        return zlib.compress(json_codec.canonical_bytes(value), 1)
+    
+    def add_stage(self, key: str, value: Any):
+        self.stages.append((key, self._pack(value)))
+    
+    def _write_object(self, update: Callable[[bytes], None], items: Dict[str, Callable[[], None]]):
+        update(b'{')
+        for index, key in enumerate(sorted(items)):
+            if index:
+                update(b',')
+            update(json_codec.canonical_bytes(key) + b':')
+            items[key]()
+        update(b'}')
+    
+    def hexdigest(self) -> str:
+        digest = hashlib.sha256()
+        update = digest.update
+        
+        def write_stages():
+            if self.stages_is_list:
+                update(b'[')
+                update(b','.join(zlib.decompress(packed) for _, packed in self.stages))
+                update(b']')
+            else:
+                stages = dict(self.stages)
+                self._write_object(update, {key: (lambda key=key: update(zlib.decompress(stages[key])))
+                                            for key in stages})
+        
+        def write_process():
+            items = {key: (lambda value=value: update(value)) for key, value in self.process_fields.items()}
+            items['stages'] = write_stages
+            self._write_object(update, items)
+        
+        items = {key: (lambda value=value: update(value)) for key, value in self.sections.items()}
+        if self.streamed_process:
+            items['processRecord'] = write_process
+        self._write_object(update, items)
+        return digest.hexdigest()
+
+
+def parse_submission_stream(stream, max_size: Optional[int] = None,
+                            chunk_size: Optional[int] = None) -> ParsedSubmission:
+    """
+    流式解析并校验一份提交，返回 ParsedSubmission（archive_payload 为已压缩的归档数据）
+    JSON格式错误抛出 StreamParseError，超过大小上限抛出 PayloadTooLarge
+    """
+    compressor = zlib.compressobj(Config.ARCHIVE_COMPRESS_LEVEL)
+    compressed: List[bytes] = []
+    reader = _Reader(stream, max_size or Config.MAX_FILE_SIZE, chunk_size or Config.STREAM_PARSE_CHUNK_SIZE,
+                     lambda chunk: compressed.append(compressor.compress(chunk)))
+    
+    if reader.at_end():
+        return ParsedSubmission(None, None, b'', [], '未收到数据')
+    if reader.peek() != _OPEN_OBJECT:
+        _decode(reader.read_value())  # 不是对象：格式错误照常报错，否则按缺少团队信息处理
+        return ParsedSubmission(None, None, b'', [], '缺少团队信息')
+    reader.skip()
+    
+    try:
+        return _parse_members(reader, compressor, compressed)
+    except _DuplicateKey:
+        # 读完剩余数据，按完整请求体解析（重复的键以最后一个值为准）
+        while reader._fill():
+            pass
+        compressed.append(compressor.flush())
+        raw_json = zlib.decompress(b''.join(compressed))
+        return parse_data(_decode(raw_json), raw_json)
+
+
+def _parse_members(reader: _Reader, compressor, compressed: List[bytes]) -> ParsedSubmission:
+    """逐个读取顶层成员并校验（调用方已读过开头的 '{'）"""
+    validator = SubmissionValidator()
+    canonical = _CanonicalHash()
+    keys: List[str] = []
+    if reader.peek() == _CLOSE_OBJECT:
+        reader.skip()
+    else:
+        while True:
+            key = reader.read_key()
+            if key in keys:
+                raise _DuplicateKey(key)
+            keys.append(key)
+            if key == 'processRecord' and reader.peek() == _OPEN_OBJECT:
+                _parse_process_record(reader, validator, canonical)
+            else:
+                value = _decode(reader.read_value())
+                if key == 'teamInfo':
+                    validator.team_info(value)
+                elif key == 'teamDivision':
+                    validator.team_division(value)
+                elif key == 'processRecord':
+                    validator.process_record(value)
+                elif key == 'summaryData':
+                    validator.summary_data(value)
+                elif key == 'exportTime':
+                    validator.export_time(value)
+                if key != 'exportTime':
+                    canonical.sections[key] = json_codec.canonical_bytes(value)
+            if not reader.next_member(_CLOSE_OBJECT):
+                break
+    if not reader.at_end():
+        raise reader.error("JSON之后有多余的数据")
+    
+    if not keys:
+        return ParsedSubmission(None, None, b'', [], '未收到数据')
+    if 'teamInfo' not in keys:
+        return ParsedSubmission(None, None, b'', [], '缺少团队信息')
+    submission = validator.finish()
+    content_hash = canonical.hexdigest() if not submission.errors else None
+    compressed.append(compressor.flush())
+    return ParsedSubmission(submission, content_hash, b'', keys, '', b''.join(compressed))
+
+
+def _parse_process_record(reader: _Reader, validator: SubmissionValidator, canonical: _CanonicalHash):
+    """processRecord：普通字段先收集，stages 中的阶段逐个校验"""
+    reader.skip()
+    fields: Dict[str, Any] = {}
+    has_stages = False
+    if reader.peek() == _CLOSE_OBJECT:
+        reader.skip()
+    else:
+        has_stages = _parse_process_fields(reader, validator, canonical, fields)
+    
+    canonical.streamed_process = has_stages
+    if has_stages:
+        # 阶段已经逐个校验过，这里只校验过程记录本身（stages 键保留，与完整解析时判断一致）
+        validator.process_record({**fields, 'stages': None}, with_stages=False)
+    else:
+        validator.process_record(fields)
+        canonical.sections['processRecord'] = json_codec.canonical_bytes(fields)
+
+
+def _parse_process_fields(reader: _Reader, validator: SubmissionValidator, canonical: _CanonicalHash,
+                          fields: Dict[str, Any]) -> bool:
+    """读取 processRecord 的各个成员，返回是否逐个解析了 stages"""
+    has_stages = False
+    while True:
+        key = reader.read_key()
+        if key in fields or (key == 'stages' and has_stages):
+            raise _DuplicateKey(f"processRecord.{key}")
+        char = reader.peek()
+        if key == 'stages' and char in (_OPEN_OBJECT, _OPEN_ARRAY):
+            has_stages = True
+            canonical.stages_is_list = char == _OPEN_ARRAY
+            _parse_stages(reader, validator, canonical, char)
+        else:
+            fields[key] = _decode(reader.read_value())
+            canonical.process_fields[key] = json_codec.canonical_bytes(fields[key])
+        if not reader.next_member(_CLOSE_OBJECT):
+            break
+    return has_stages
+
+
+def _parse_stages(reader: _Reader, validator: SubmissionValidator, canonical: _CanonicalHash, open_char: int):
+    reader.skip()
+    close = _CLOSE_OBJECT if open_char == _OPEN_OBJECT else _CLOSE_ARRAY
+    if reader.peek() == close:
+        reader.skip()
+        return
+    seen = set()
+    index = 0
+    while True:
+        if close == _CLOSE_OBJECT:
+            key = reader.read_key()
+            if key in seen:
+                raise _DuplicateKey(f"processRecord.stages.{key}")
+            seen.add(key)
+        else:
+            key = str(index)
+            index += 1
+        stage_data = _decode(reader.read_value())
+        validator.stage(key, stage_data)
+        canonical.add_stage(key, stage_data)
+        if not reader.next_member(close):
+            break
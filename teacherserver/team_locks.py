@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按团队分段加锁（进程内）
+同一团队的提交、媒体上传、阶段修改、教师评价在这里排队，不再同时去抢数据库写锁、
+在 _execute 的重试循环里互相等待；不同团队大多落在不同的锁上，仍然并行。
+
+锁按 team_id 的哈希分成固定数量的段（Config.TEAM_LOCK_STRIPES），内存占用与团队数量无关。
+加锁顺序：先团队锁，再数据库事务（事务内不能再获取团队锁）。
+"""
+
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List
+
+from config import Config
+from metrics import metrics, ratio
+
+
+class TeamLocks:
+    """team_id -> 分段可重入锁"""
+    
+    def __init__(self, stripes: int):
+        self._locks = [threading.RLock() for _ in range(max(1, stripes))]
+    
+    def _index(self, team_id: str) -> int:
+        # crc32 不受 PYTHONHASHSEED 影响，同一团队在每个进程中都落在同一段
+        return zlib.crc32(team_id.encode('utf-8')) % len(self._locks)
+    
+    def _acquire(self, index: int):
+        lock = self._locks[index]
+        metrics.inc('teamLock.acquired')
+        if lock.acquire(blocking=False):
+            return
+        start = time.perf_counter()
+        lock.acquire()
+        metrics.inc('teamLock.contended')
+        metrics.inc('teamLock.waitMs', int((time.perf_counter() - start) * 1000))
+    
+    @contextmanager
+    def lock(self, team_id: str) -> Iterator[None]:
+        """独占一个团队的写操作（可重入）"""
+        index = self._index(team_id)
+        self._acquire(index)
+        try:
+            yield
+        finally:
+            self._locks[index].release()
+    
+    @contextmanager
+    def lock_many(self, team_ids: Iterable[str]) -> Iterator[None]:
+        """同时独占多个团队（批量提交用），按分段编号顺序加锁，避免互相等待成环"""
+        indexes = sorted({self._index(team_id) for team_id in team_ids})
+        acquired: List[int] = []
+        try:
+            for index in indexes:
+                self._acquire(index)
+                acquired.append(index)
+            yield
+        finally:
+            for index in reversed(acquired):
+                self._locks[index].release()
+
+
+# 全局实例（所有写路径共用）
+team_locks = TeamLocks(Config.TEAM_LOCK_STRIPES)
+
+# 团队锁争用率：需要等待的加锁次数 / 全部加锁次数
+metrics.register_gauge(
+    'teamLockContention',
+    lambda: ratio(metrics.get('teamLock.contended'), metrics.get('teamLock.acquired'))
+)
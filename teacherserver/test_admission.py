@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试写请求准入控制（admission.AdmissionMiddleware）
+并发名额和等待队列都已满时返回 503 和 Retry-After，只读请求和豁免路径不受限制
+
+用法:
+    python -m pytest -q test_admission.py
+"""
+
+import sys
+import threading
+import time
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from admission import AdmissionController, AdmissionMiddleware
+from config import Config
+
+
+class _BlockingApp:
+    """POST 请求在 release 之前一直占用处理名额"""
+    
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+    
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'POST' and environ['PATH_INFO'] == '/api/submit':
+            self.entered.set()
+            self.release.wait(5)
+        return Response('ok')(environ, start_response)
+
+
+def _client(app, controller):
+    """请求都用 buffered=True：读完响应体后中间件才归还名额"""
+    middleware = AdmissionMiddleware(app, controller, ['/api/'], exempt_suffixes=['/status'])
+    return Client(middleware)
+
+
+def _occupy(client):
+    """在后台线程发出一个会阻塞的写请求，返回线程和结果列表"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(client.post('/api/submit', buffered=True)))
+    thread.start()
+    return thread, results
+
+
+def test_rejects_with_retry_after_when_full():
+    app = _BlockingApp()
+    controller = AdmissionController(max_active=1, max_queue=0, queue_timeout=1)
+    client = _client(app, controller)
+    thread, results = _occupy(client)
+    assert app.entered.wait(5)
+    
+    try:
+        response = client.post('/api/submit', buffered=True)
+        assert response.status_code == 503
+        retry_after = int(response.headers['Retry-After'])
+        assert 1 <= retry_after <= Config.ADMISSION_RETRY_AFTER_MAX
+        assert response.get_json() == {'status': 'error', 'message': '服务器繁忙，请稍后重试',
+                                       'retryAfter': retry_after}
+    finally:
+        app.release.set()
+        thread.join(5)
+    assert results[0].status_code == 200
+    
+    # 名额归还后可以再次写入
+    assert client.post('/api/submit', buffered=True).status_code == 200
+    assert controller.stats()['active'] == 0
+
+
+def test_reads_and_exempt_paths_bypass_limit():
+    app = _BlockingApp()
+    controller = AdmissionController(max_active=1, max_queue=0, queue_timeout=1)
+    client = _client(app, controller)
+    thread, _ = _occupy(client)
+    assert app.entered.wait(5)
+    
+    try:
+        assert client.get('/api/submit', buffered=True).status_code == 200
+        assert client.post('/api/jobs/status', buffered=True).status_code == 200
+        assert client.post('/other', buffered=True).status_code == 200
+    finally:
+        app.release.set()
+        thread.join(5)
+
+
+def test_queued_request_is_admitted_after_release():
+    """排队的请求在名额归还后被处理"""
+    app = _BlockingApp()
+    controller = AdmissionController(max_active=1, max_queue=1, queue_timeout=5)
+    client = _client(app, controller)
+    first, first_results = _occupy(client)
+    assert app.entered.wait(5)
+    
+    second_results = []
+    second = threading.Thread(target=lambda: second_results.append(client.post('/api/other', buffered=True)))
+    second.start()
+    for _ in range(500):
+        if controller.stats()['queued']:
+            break
+        time.sleep(0.01)
+    assert controller.stats()['queued'] == 1
+    
+    app.release.set()
+    first.join(5)
+    second.join(5)
+    assert first_results[0].status_code == 200
+    assert second_results[0].status_code == 200
+
+
+def test_queue_timeout():
+    controller = AdmissionController(max_active=1, max_queue=1, queue_timeout=0.05)
+    assert controller.acquire()
+    assert not controller.acquire()
+    controller.release(0.1)
+    assert controller.acquire()
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_RETRY_AFTER_MAX', 3)
+    controller = AdmissionController(max_active=1, max_queue=0, queue_timeout=0)
+    assert controller.acquire()
+    controller.release(60)
+    assert controller.retry_after() == 3
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
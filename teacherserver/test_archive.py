@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试提交归档的崩溃恢复（archive._recover）
+进程在写归档文件和写索引之间被结束时，下次写入要补齐或重建索引并截断不完整的记录
+
+用法:
+    python -m pytest -q test_archive.py
+"""
+
+import os
+import sys
+
+import pytest
+
+from archive import SubmissionArchive, _INDEX_ENTRY, _RECORD_HEADER
+
+
+def _raw(n):
+    return ('{"version":%d}' % n).encode()
+
+
+def test_append_and_read_versions(tmp_path):
+    """连续追加的版本号从1开始递增，可按版本读取"""
+    archive = SubmissionArchive(str(tmp_path))
+    assert archive.append(_raw(1)) == 1
+    assert archive.append(_raw(2)) == 2
+    
+    assert archive.read(1) == _raw(1)
+    assert archive.read() == _raw(2)
+    assert [entry.version for entry in archive.entries()] == [1, 2]
+
+
+def test_torn_record_is_truncated(tmp_path):
+    """归档末尾只写了一半的记录被截断，下一个版本号接着最后一条完整记录"""
+    archive = SubmissionArchive(str(tmp_path))
+    archive.append(_raw(1))
+    archive.append(_raw(2))
+    good_size = os.path.getsize(archive.log_path)
+    
+    with open(archive.log_path, 'ab') as f:
+        f.write(b'CSA1\x03\x00\x00\x00')
+    
+    assert archive.append(_raw(3)) == 3
+    assert [entry.version for entry in archive.entries()] == [1, 2, 3]
+    assert archive.entry(3).offset == good_size
+    assert archive.read(3) == _raw(3)
+
+
+def test_unindexed_record_is_recovered(tmp_path):
+    """记录已完整写入但索引未追加时补齐索引，该版本不会丢失"""
+    archive = SubmissionArchive(str(tmp_path))
+    archive.append(_raw(1))
+    archive.append(_raw(2))
+    with open(archive.index_path, 'r+b') as f:
+        f.truncate(_INDEX_ENTRY.size)
+    
+    assert archive.append(_raw(3)) == 3
+    assert [entry.version for entry in archive.entries()] == [1, 2, 3]
+    assert archive.read(2) == _raw(2)
+
+
+def test_half_written_index_entry(tmp_path):
+    """索引最后一条只写了一半时先截断再补齐"""
+    archive = SubmissionArchive(str(tmp_path))
+    archive.append(_raw(1))
+    archive.append(_raw(2))
+    with open(archive.index_path, 'r+b') as f:
+        f.truncate(_INDEX_ENTRY.size + _INDEX_ENTRY.size // 2)
+    
+    assert archive.append(_raw(3)) == 3
+    assert os.path.getsize(archive.index_path) == 3 * _INDEX_ENTRY.size
+    assert [archive.read(v) for v in (1, 2, 3)] == [_raw(1), _raw(2), _raw(3)]
+
+
+def test_index_ahead_of_log_is_rebuilt(tmp_path):
+    """索引指向不存在的数据（归档文件被截断）时从头重建索引"""
+    archive = SubmissionArchive(str(tmp_path))
+    archive.append(_raw(1))
+    archive.append(_raw(2))
+    first_end = archive.entry(2).offset
+    with open(archive.log_path, 'r+b') as f:
+        f.truncate(first_end + _RECORD_HEADER.size - 1)
+    
+    assert archive.append(_raw(2)) == 2
+    assert [entry.version for entry in archive.entries()] == [1, 2]
+    assert archive.read(1) == _raw(1)
+    assert archive.read(2) == _raw(2)
+
+
+def test_corrupt_record_raises(tmp_path):
+    """数据被改动时 crc 校验失败"""
+    archive = SubmissionArchive(str(tmp_path))
+    archive.append(_raw(1))
+    with open(archive.log_path, 'r+b') as f:
+        f.seek(_RECORD_HEADER.size)
+        byte = f.read(1)
+        f.seek(_RECORD_HEADER.size)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    
+    with pytest.raises(ValueError):
+        archive.read(1)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
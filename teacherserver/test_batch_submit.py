@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量提交接口 POST /api/submit/batch
+全部成功 200，部分成功 207，全部失败 422；一组团队的事务写入失败时整组回滚后逐个写入，只有出错的那一项失败
+
+用法:
+    python -m pytest -q test_batch_submit.py
+"""
+
+import sys
+
+import pytest
+
+import json_codec
+import msgpack_codec
+from config import Config
+
+URL = '/api/submit/batch'
+
+
+def _data(stove, rating=4):
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': stove,
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'processRecord': {'startTime': 1700000000000, 'currentStage': 'PREPARATION', 'stages': {
+            'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': rating,
+                            'mediaItems': [{'path': f'/storage/emulated/0/DCIM/{stove}.jpg', 'type': 'PHOTO',
+                                            'timestamp': 1700000000001}]},
+        }},
+        'summaryData': {'answer1': stove},
+        'exportTime': 1700000900000,
+    }
+
+
+def _team_id(stove):
+    return f'实验学校_7_3班_{stove}'
+
+
+def _invalid(stove):
+    data = _data(stove)
+    data['processRecord']['stages']['PREPARATION']['selfRating'] = 'good'
+    return data
+
+
+def _statuses(response):
+    return [item['httpStatus'] for item in response.get_json()['results']]
+
+
+def test_all_accepted_200(server, client):
+    stoves = [f'{i}号炉' for i in range(1, 6)]
+    response = client.post(URL, json=[_data(stove) for stove in stoves])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['status'], body['total'], body['accepted'], body['failed']) == ('success', 5, 5, 0)
+    assert [item['index'] for item in body['results']] == list(range(5))
+    assert [item['studentId'] for item in body['results']] == [_team_id(stove) for stove in stoves]
+    assert body['results'][0]['media'][0]['path'] == '/storage/emulated/0/DCIM/1号炉.jpg'
+    db = server.storage.db_manager
+    for stove in stoves:
+        assert db.get_summary_data(_team_id(stove)).answer1 == stove
+        assert db.get_submission_hash(_team_id(stove))
+
+
+def test_partial_207(server, client):
+    response = client.post(URL, json=[_data('1号炉'), _invalid('2号炉'), 'not an object', _data('3号炉')])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body['status'], body['accepted'], body['failed']) == ('partial', 2, 2)
+    assert _statuses(response) == [200, 400, 400, 200]
+    assert body['results'][1]['errors'][0]['field'] == 'processRecord.stages.PREPARATION.selfRating'
+    db = server.storage.db_manager
+    assert db.get_team(_team_id('1号炉')) and db.get_team(_team_id('3号炉'))
+    assert db.get_team(_team_id('2号炉')) is None
+
+
+def test_all_failed_422(server, client):
+    response = client.post(URL, json=[_invalid('1号炉'), _invalid('2号炉')])
+    assert response.status_code == 422
+    assert response.get_json()['status'] == 'error'
+    assert _statuses(response) == [400, 400]
+
+
+def test_unchanged_items_count_as_accepted(client):
+    assert client.post(URL, json=[_data('1号炉')]).status_code == 200
+    response = client.post(URL, json=[_data('1号炉'), _data('2号炉')])
+    assert response.status_code == 200
+    assert response.get_json()['results'][0]['unchanged'] is True
+
+
+def test_failed_group_falls_back_to_single_writes(server, client, monkeypatch):
+    """同一事务中的一个团队写入失败：整组回滚，再逐个写入，只有该团队返回 500"""
+    monkeypatch.setattr(Config, 'BATCH_SUBMIT_GROUP_SIZE', 3)
+    db = server.storage.db_manager
+    save_summary_data = db.save_summary_data
+    group_writes = []
+    
+    def failing_save_summary_data(team_id, summary):
+        if team_id == _team_id('2号炉'):
+            raise RuntimeError('磁盘错误')
+        return save_summary_data(team_id, summary)
+    
+    save_submissions = server.storage.save_submissions
+    
+    def recording_save_submissions(submissions):
+        group_writes.append([submission.student_id for submission, _ in submissions])
+        return save_submissions(submissions)
+    
+    monkeypatch.setattr(db, 'save_summary_data', failing_save_summary_data)
+    monkeypatch.setattr(server.storage, 'save_submissions', recording_save_submissions)
+    stoves = [f'{i}号炉' for i in range(1, 6)]
+    response = client.post(URL, json=[_data(stove) for stove in stoves])
+    
+    assert response.status_code == 207
+    assert _statuses(response) == [200, 500, 200, 200, 200]
+    assert response.get_json()['results'][1]['studentId'] == _team_id('2号炉')
+    assert group_writes == [[_team_id(stove) for stove in stoves[:3]], [_team_id(stove) for stove in stoves[3:]]]
+    for stove in ('1号炉', '3号炉', '4号炉', '5号炉'):
+        assert db.get_summary_data(_team_id(stove)).answer1 == stove
+    # 失败的团队整体回滚：没有只写了一半的数据，也没有记录内容哈希
+    assert db.get_team(_team_id('2号炉')) is None
+    assert db.get_submission_hash(_team_id('2号炉')) is None
+
+
+def test_ndjson_and_msgpack_bodies(client):
+    lines = [json_codec.dumps_bytes(_data('1号炉')), b'', b'{"teamInfo": ', json_codec.dumps_bytes(_data('2号炉'))]
+    response = client.post(URL, data=b'\n'.join(lines), content_type='application/x-ndjson')
+    assert response.status_code == 207
+    assert _statuses(response) == [200, 400, 200]
+    
+    response = client.post(URL, data=msgpack_codec.packb([_data('3号炉')]), content_type='application/msgpack')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('body', [b'{"teamInfo": {}}', b'[', b'[]'], ids=['object', 'invalid', 'empty'])
+def test_malformed_batch_400(client, body):
+    assert client.post(URL, data=body, content_type='application/json').status_code == 400
+
+
+def test_too_many_items_413(client, monkeypatch):
+    monkeypatch.setattr(Config, 'BATCH_SUBMIT_MAX_ITEMS', 2)
+    response = client.post(URL, json=[_data(f'{i}号炉') for i in range(3)])
+    assert response.status_code == 413
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试请求体解压（compression.RequestDecompressionMiddleware）
+gzip / deflate 请求体在进入应用前解压；不支持的编码返回 415，解压后超过上限返回 413（压缩炸弹只解压到上限为止），
+数据损坏或不完整返回 400
+
+用法:
+    python -m pytest -q test_compression.py
+"""
+
+import gzip
+import sys
+import zlib
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Request, Response
+
+import compression
+from compression import RequestDecompressionMiddleware
+from metrics import metrics
+
+BODY = '{"teamInfo": {"school": "实验学校"}}'.encode('utf-8') * 50
+MAX_SIZE = 64 * 1024
+
+
+def _echo(environ, start_response):
+    """返回收到的请求体和相关请求头"""
+    request = Request(environ)
+    response = Response(request.get_data())
+    response.headers['X-Content-Length'] = str(request.content_length)
+    response.headers['X-Content-Encoding'] = request.headers.get('Content-Encoding', '')
+    return response(environ, start_response)
+
+
+@pytest.fixture
+def client():
+    return Client(RequestDecompressionMiddleware(_echo, ['/api/submit'], max_size=MAX_SIZE))
+
+
+def _post(client, data, encoding, path='/api/submit'):
+    return client.post(path, data=data, headers={'Content-Encoding': encoding})
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('x-gzip', gzip.compress),
+    ('GZIP', gzip.compress),
+    ('deflate', zlib.compress),
+])
+def test_decompresses_body(client, encoding, compress):
+    before = metrics.get('requestCompression.requests')
+    response = _post(client, compress(BODY), encoding)
+    assert response.status_code == 200
+    assert response.data == BODY
+    assert response.headers['X-Content-Length'] == str(len(BODY))
+    assert response.headers['X-Content-Encoding'] == ''
+    assert metrics.get('requestCompression.requests') == before + 1
+
+
+def test_uncompressed_and_other_paths_pass_through(client):
+    assert _post(client, BODY, 'identity').data == BODY
+    assert client.post('/api/submit', data=BODY).data == BODY
+    # 不在解压路径内的请求原样转发（包括 Content-Encoding）
+    response = _post(client, b'raw', 'gzip', path='/api/other')
+    assert response.data == b'raw'
+    assert response.headers['X-Content-Encoding'] == 'gzip'
+
+
+def test_unsupported_encoding_415(client):
+    response = _post(client, BODY, 'br')
+    assert response.status_code == 415
+    assert response.json['status'] == 'error'
+    assert 'br' in response.json['message']
+
+
+@pytest.mark.parametrize('data', [b'not gzip data', gzip.compress(BODY)[:-20]], ids=['corrupt', 'truncated'])
+def test_invalid_data_400(client, data):
+    response = _post(client, data, 'gzip')
+    assert response.status_code == 400
+    assert response.json['status'] == 'error'
+
+
+def test_body_at_limit_is_accepted(client):
+    body = b'x' * MAX_SIZE
+    response = _post(client, gzip.compress(body), 'gzip')
+    assert response.status_code == 200
+    assert response.data == body
+
+
+@pytest.mark.parametrize('encoding, compress', [('gzip', gzip.compress), ('deflate', zlib.compress)])
+def test_decompression_bomb_413(client, monkeypatch, encoding, compress):
+    """1MB 的 0 压缩后只有约 1KB：解压超过上限时立即停止，最多只比上限多解压 1 字节"""
+    produced = []
+    decompressobj = zlib.decompressobj
+    
+    class _Recording:
+        def __init__(self, wbits):
+            self._decompressor = decompressobj(wbits)
+        
+        def __getattr__(self, name):
+            return getattr(self._decompressor, name)
+        
+        def decompress(self, data, max_length=0):
+            output = self._decompressor.decompress(data, max_length)
+            produced.append(len(output))
+            return output
+    
+    monkeypatch.setattr(compression.zlib, 'decompressobj', _Recording)
+    before = metrics.get('requestCompression.rejected')
+    bomb = compress(b'\0' * (16 * MAX_SIZE))
+    assert len(bomb) < MAX_SIZE // 16
+    
+    response = _post(client, bomb, encoding)
+    assert response.status_code == 413
+    assert response.json['status'] == 'error'
+    assert MAX_SIZE < sum(produced) <= MAX_SIZE + 1
+    assert metrics.get('requestCompression.rejected') == before + 1
+
+
+def test_submit_accepts_gzip_body(server):
+    body = ('{"teamInfo": {"school": "实验学校", "grade": "7", "className": "3班", "stoveNumber": "5号炉"}, '
+            '"exportTime": 1700000000000}').encode('utf-8')
+    response = server.app.test_client().post('/api/submit', data=gzip.compress(body),
+                                              content_type='application/json',
+                                              headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert server.storage.db_manager.get_team('实验学校_7_3班_5号炉') is not None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
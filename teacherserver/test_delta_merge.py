@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试过程记录的差异合并（DatabaseManager.save_process_record）
+重复提交时只对有变化的阶段和媒体文件执行 UPDATE / INSERT / DELETE，未变化的行不写入
+
+用法:
+    python -m pytest -q test_delta_merge.py
+"""
+
+import sys
+from collections import Counter
+
+import pytest
+
+from config import Config
+from db_init import init_database
+from db_manager import DatabaseManager
+from models import ProcessRecord, StageRecord, Team
+
+TEAM_INFO = {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+             'memberCount': 5, 'memberNames': '张三,李四'}
+STAGE_NAMES = ('PREPARATION', 'FIRE_MAKING', 'COOKING_RICE')
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'MEDIA_DIR', str(tmp_path / 'media'))
+    db_path = str(tmp_path / 'campcooking.db')
+    assert init_database(db_path)
+    manager = DatabaseManager(db_path)
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def team_id(db):
+    team = Team({'teamInfo': TEAM_INFO})
+    db.save_team(team)
+    return team.team_id
+
+
+class _WriteCounter:
+    """统计 _execute 执行的写语句：(语句类型, 表名) -> 次数"""
+    
+    def __init__(self, db, monkeypatch):
+        self.counts = Counter()
+        execute = db._execute
+        
+        def counting_execute(sql, params=()):
+            words = sql.split()
+            verb = words[0].upper()
+            if verb in ('INSERT', 'UPDATE', 'DELETE'):
+                table = words[{'INSERT': 2, 'UPDATE': 1, 'DELETE': 2}[verb]]
+                self.counts[verb, table] += 1
+            return execute(sql, params)
+        
+        monkeypatch.setattr(db, '_execute', counting_execute)
+
+
+def _submission(ratings=None, stage_names=STAGE_NAMES, media_count=2):
+    """构造一次提交的过程记录、阶段记录和媒体文件（Android格式）"""
+    ratings = ratings or {}
+    process = ProcessRecord({'processRecord': {'startTime': 1700000000000, 'currentStage': 'COOKING_RICE',
+                                               'overallNotes': '顺利'}})
+    stages = []
+    stages_media = {}
+    for i, name in enumerate(stage_names):
+        stages.append(StageRecord({
+            'stage': name, 'startTime': 1700000000000 + i, 'endTime': 1700000600000 + i,
+            'selfRating': ratings.get(name, 4), 'notes': '好', 'isCompleted': True,
+            'selectedTags': ['火候'],
+        }))
+        stages_media[name] = [{'path': f'/storage/emulated/0/DCIM/{name}_{j}.jpg', 'type': 'PHOTO',
+                               'timestamp': 1700000000000 + j} for j in range(media_count)]
+    return process, stages, stages_media
+
+
+def _stage_rows(db, team_id):
+    rows = db._fetch_rows("""
+        SELECT sr.stage_name, sr.id, sr.self_rating, sr.updated_at FROM stage_records sr
+        JOIN process_records pr ON sr.process_record_id = pr.id WHERE pr.team_id = ?
+    """, (team_id,))
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _media_ids(db):
+    return {row[0] for row in db._fetch_rows("SELECT id FROM media_items")}
+
+
+def test_first_save_inserts_everything(db, team_id, monkeypatch):
+    writes = _WriteCounter(db, monkeypatch)
+    db.save_process_record(team_id, *_submission())
+    
+    assert writes.counts['INSERT', 'process_records'] == 1
+    assert writes.counts['INSERT', 'stage_records'] == 3
+    assert writes.counts['INSERT', 'media_items'] == 6
+    assert not any(verb in ('UPDATE', 'DELETE') for verb, _ in writes.counts)
+
+
+def test_identical_resubmit_writes_nothing(db, team_id, monkeypatch):
+    """内容未变化的重复提交不执行任何写语句，行ID保持不变"""
+    db.save_process_record(team_id, *_submission())
+    before_stages = _stage_rows(db, team_id)
+    before_media = _media_ids(db)
+    
+    writes = _WriteCounter(db, monkeypatch)
+    db.save_process_record(team_id, *_submission())
+    
+    assert sum(writes.counts.values()) == 0
+    assert _stage_rows(db, team_id) == before_stages
+    assert _media_ids(db) == before_media
+
+
+def test_changed_stage_is_updated_in_place(db, team_id, monkeypatch):
+    """只有评分变化的阶段执行一次 UPDATE，媒体文件不动"""
+    db.save_process_record(team_id, *_submission())
+    before = _stage_rows(db, team_id)
+    before_media = _media_ids(db)
+    
+    writes = _WriteCounter(db, monkeypatch)
+    db.save_process_record(team_id, *_submission(ratings={'FIRE_MAKING': 2}))
+    
+    assert writes.counts == Counter({('UPDATE', 'stage_records'): 1})
+    after = _stage_rows(db, team_id)
+    assert after['FIRE_MAKING'][0] == before['FIRE_MAKING'][0]
+    assert after['FIRE_MAKING'][1] == 2
+    assert after['PREPARATION'] == before['PREPARATION']
+    assert after['COOKING_RICE'] == before['COOKING_RICE']
+    assert _media_ids(db) == before_media
+
+
+def test_added_and_removed_stages(db, team_id, monkeypatch):
+    """新出现的阶段插入，提交中已不存在的阶段删除（媒体文件随之级联删除）"""
+    db.save_process_record(team_id, *_submission())
+    
+    writes = _WriteCounter(db, monkeypatch)
+    db.save_process_record(team_id, *_submission(stage_names=('PREPARATION', 'FIRE_MAKING', 'COOKING_DISHES')))
+    
+    assert writes.counts['INSERT', 'stage_records'] == 1
+    assert writes.counts['DELETE', 'stage_records'] == 1
+    assert writes.counts['INSERT', 'media_items'] == 2
+    assert ('UPDATE', 'stage_records') not in writes.counts
+    assert set(_stage_rows(db, team_id)) == {'PREPARATION', 'FIRE_MAKING', 'COOKING_DISHES'}
+    assert len(_media_ids(db)) == 6
+
+
+def test_removed_media_is_deleted(db, team_id):
+    """阶段中少了的媒体文件被删除，保留的媒体记录ID不变"""
+    db.save_process_record(team_id, *_submission(media_count=2))
+    before_media = _media_ids(db)
+    
+    db.save_process_record(team_id, *_submission(media_count=1))
+    after_media = _media_ids(db)
+    
+    assert len(after_media) == 3
+    assert after_media < before_media
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试原子写入和后台文件写入（file_writer.atomic_write / FileWriter）
+临时文件 + os.replace：失败时保留原文件、不留临时文件；fsync 按策略调用；
+同一路径按提交顺序写入，队列满时调用方等待，停止后改为同步写入
+
+用法:
+    python -m pytest -q test_file_writer.py
+"""
+
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+import file_writer as file_writer_module
+from file_writer import FileWriter, atomic_write, FSYNC_ALWAYS, FSYNC_FILE, FSYNC_NONE
+import json_codec
+from metrics import metrics
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """记录 fsync 的对象：'file' 或 'dir'"""
+    calls = []
+    fsync = os.fsync
+    
+    def recording(fd):
+        calls.append('dir' if stat.S_ISDIR(os.fstat(fd).st_mode) else 'file')
+        return fsync(fd)
+    
+    monkeypatch.setattr(file_writer_module.os, 'fsync', recording)
+    return calls
+
+
+@pytest.fixture
+def writer():
+    writer = FileWriter(workers=2, max_queue=4, fsync=FSYNC_NONE)
+    yield writer
+    writer.shutdown()
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = str(tmp_path / 'evaluation.json')
+    atomic_write(path, b'old', FSYNC_NONE)
+    atomic_write(path, b'new', FSYNC_NONE)
+    with open(path, 'rb') as f:
+        assert f.read() == b'new'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ['evaluation.json']
+
+
+def test_atomic_write_failure_keeps_old_content(tmp_path, monkeypatch):
+    path = str(tmp_path / 'evaluation.json')
+    atomic_write(path, b'old', FSYNC_NONE)
+    
+    def fail(src, dst):
+        raise OSError('磁盘已满')
+    
+    monkeypatch.setattr(file_writer_module.os, 'replace', fail)
+    with pytest.raises(OSError):
+        atomic_write(path, b'new', FSYNC_NONE)
+    with open(path, 'rb') as f:
+        assert f.read() == b'old'
+    # 临时文件已删除
+    assert os.listdir(tmp_path) == ['evaluation.json']
+
+
+@pytest.mark.parametrize('policy, expected', [
+    (FSYNC_ALWAYS, ['file', 'dir'] if os.name == 'posix' else ['file']),
+    (FSYNC_FILE, ['file']),
+    (FSYNC_NONE, []),
+])
+def test_fsync_policy(tmp_path, fsyncs, policy, expected):
+    atomic_write(str(tmp_path / 'a.json'), b'{}', policy)
+    assert fsyncs == expected
+
+
+def test_fsync_default_from_config(tmp_path, fsyncs, monkeypatch):
+    monkeypatch.setattr(file_writer_module.Config, 'FILE_WRITER_FSYNC', FSYNC_FILE)
+    atomic_write(str(tmp_path / 'a.json'), b'{}')
+    assert fsyncs == ['file']
+
+
+def test_writer_uses_its_fsync_policy(tmp_path, fsyncs):
+    writer = FileWriter(workers=1, fsync=FSYNC_ALWAYS)
+    try:
+        writer.write(str(tmp_path / 'a.json'), b'{}')
+        writer.flush()
+    finally:
+        writer.shutdown()
+    assert fsyncs == (['file', 'dir'] if os.name == 'posix' else ['file'])
+
+
+def test_same_path_written_in_order(tmp_path, writer):
+    paths = [str(tmp_path / f'{i}.json') for i in range(3)]
+    for version in range(50):
+        for path in paths:
+            writer.write(path, str(version).encode())
+    writer.flush()
+    for path in paths:
+        with open(path, 'rb') as f:
+            assert f.read() == b'49'
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_write_json_serializes_immediately(tmp_path, writer, monkeypatch):
+    monkeypatch.setitem(file_writer_module.Config.JSON_PRETTY, 'evaluation', True)
+    data = {'teamId': '实验学校_7_3班_5号炉', 'rating': 5}
+    path = str(tmp_path / 'evaluation.json')
+    writer.write_json(data, path, 'evaluation')
+    data['rating'] = 1
+    writer.flush()
+    with open(path, 'rb') as f:
+        assert f.read() == json_codec.dumps_bytes({'teamId': '实验学校_7_3班_5号炉', 'rating': 5}, True)
+
+
+def test_full_queue_blocks_caller(tmp_path, monkeypatch):
+    """队列满时调用方等待，不丢数据，也不在调用线程直接写入"""
+    started = threading.Event()
+    release = threading.Event()
+    write = file_writer_module.atomic_write
+    
+    def slow_write(path, data, fsync=None):
+        started.set()
+        release.wait(5)
+        write(path, data, fsync)
+    
+    monkeypatch.setattr(file_writer_module, 'atomic_write', slow_write)
+    writer = FileWriter(workers=1, max_queue=1, fsync=FSYNC_NONE)
+    path = str(tmp_path / 'a.json')
+    blocked = metrics.get('fileWriter.blocked')
+    try:
+        writer.write(path, b'1')  # 线程取走后阻塞在写入中
+        assert started.wait(5)
+        writer.write(path, b'2')  # 占满队列
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (writer.write(path, b'3'), done.set()), daemon=True)
+        thread.start()
+        assert not done.wait(0.2)
+        release.set()
+        assert done.wait(5)
+        writer.flush()
+    finally:
+        release.set()
+        writer.shutdown()
+    assert metrics.get('fileWriter.blocked') == blocked + 1
+    with open(path, 'rb') as f:
+        assert f.read() == b'3'
+
+
+def test_failed_write_is_counted(tmp_path, writer):
+    failed = metrics.get('fileWriter.failed')
+    writer.write(str(tmp_path / 'missing' / 'a.json'), b'{}')
+    writer.flush()
+    assert metrics.get('fileWriter.failed') == failed + 1
+
+
+def test_shutdown_flushes_then_writes_synchronously(tmp_path, writer):
+    path = str(tmp_path / 'a.json')
+    for version in range(20):
+        writer.write(path, str(version).encode())
+    writer.shutdown()
+    assert writer.stats() == {'queued': 0, 'workers': 0}
+    with open(path, 'rb') as f:
+        assert f.read() == b'19'
+    
+    writer.write(path, b'after')
+    with open(path, 'rb') as f:
+        assert f.read() == b'after'
+    writer.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试异步提交队列（ingest.IngestQueue）
+服务器重启时重放日志：未完成的任务按原顺序重新处理，已完成任务的状态可继续查询
+
+用法:
+    python -m pytest -q test_ingest.py
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+import json_codec
+from ingest import IngestQueue, JOURNAL_FILENAME, JOB_DONE, JOB_FAILED
+
+
+class _Recorder:
+    """记录 handler 收到的数据；数据中 valid 为 false 时返回校验失败"""
+    
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, data):
+        with self._lock:
+            self.calls.append(data)
+        if data.get('valid') is False:
+            return {'status': 'error', 'message': '数据验证失败'}, 400
+        return {'status': 'success', 'studentId': data['studentId'], 'seq': data.get('seq')}, 200
+
+
+def _write_journal(ingest_dir, records, tail=b''):
+    os.makedirs(ingest_dir, exist_ok=True)
+    with open(os.path.join(ingest_dir, JOURNAL_FILENAME), 'wb') as f:
+        for kind, job_id, body in records:
+            f.write(IngestQueue._frame(kind, job_id, body))
+        f.write(tail)
+
+
+def test_replay_requeues_unfinished_jobs(tmp_path):
+    """没有最终状态的任务重启后按原顺序处理，已完成的不再处理，末尾不完整的记录被忽略"""
+    ingest_dir = str(tmp_path)
+    done_status = {'jobId': 'job0', 'status': JOB_DONE, 'httpStatus': 200, 'createdAt': 0, 'updatedAt': 0}
+    _write_journal(ingest_dir, [
+        (b'J', 'job0', json_codec.dumps_bytes({'studentId': 'team0'})),
+        (b'J', 'job1', json_codec.dumps_bytes({'studentId': 'team1'})),
+        (b'S', 'job0', json_codec.dumps_bytes(done_status)),
+        (b'J', 'job2', json_codec.dumps_bytes({'studentId': 'team2'})),
+    ], tail=b'J job3 100\n{"studentId":')
+    
+    handler = _Recorder()
+    ingest = IngestQueue(ingest_dir, handler, workers=1, fsync=False)
+    ingest.start()
+    assert ingest.wait_idle(5)
+    
+    assert [data['studentId'] for data in handler.calls] == ['team1', 'team2']
+    assert ingest.get_job('job0')['status'] == JOB_DONE
+    assert ingest.get_job('job1')['status'] == JOB_DONE
+    assert ingest.get_job('job2')['result']['studentId'] == 'team2'
+    assert ingest.get_job('job3') is None
+
+
+def test_replay_after_restart_skips_finished(tmp_path):
+    """处理完的任务写入了最终状态，再次启动时不会重复处理"""
+    ingest_dir = str(tmp_path)
+    handler = _Recorder()
+    ingest = IngestQueue(ingest_dir, handler, workers=1, fsync=False)
+    job_id = ingest.submit(json_codec.dumps_bytes({'studentId': 'team1'}))
+    assert ingest.wait_idle(5)
+    
+    restarted_handler = _Recorder()
+    restarted = IngestQueue(ingest_dir, restarted_handler, workers=1, fsync=False)
+    restarted.start()
+    assert restarted.wait_idle(5)
+    
+    assert restarted_handler.calls == []
+    assert restarted.get_job(job_id)['status'] == JOB_DONE
+
+
+def test_decoder_error_finishes_job(tmp_path):
+    """数据无法解析时任务以 400 失败结束，不会一直停在 processing"""
+    handler = _Recorder()
+    ingest = IngestQueue(str(tmp_path), handler, workers=1, fsync=False)
+    job_id = ingest.submit(b'{"studentId": ')
+    assert ingest.wait_idle(5)
+    
+    job = ingest.get_job(job_id)
+    assert job['status'] == JOB_FAILED
+    assert job['httpStatus'] == 400
+    assert handler.calls == []
+
+
+def test_unexpected_decoder_exception_finishes_job(tmp_path):
+    """解析器抛出 ValueError 以外的异常时任务以 500 失败结束"""
+    def decoder(payload, payload_format):
+        raise RuntimeError('进程池已关闭')
+    
+    ingest = IngestQueue(str(tmp_path), _Recorder(), workers=1, fsync=False, decoder=decoder)
+    job_id = ingest.submit(b'{}')
+    assert ingest.wait_idle(5)
+    
+    job = ingest.get_job(job_id)
+    assert job['status'] == JOB_FAILED
+    assert job['httpStatus'] == 500
+
+
+def _coalescing_queue(tmp_path, handler):
+    return IngestQueue(str(tmp_path), handler, workers=1, fsync=False,
+                       key_func=lambda data: data['studentId'], coalesce_ms=200)
+
+
+def test_coalesce_writes_only_latest(tmp_path):
+    """合并窗口内同一团队的多次提交只写入最新的一份，其余任务以该结果完成"""
+    handler = _Recorder()
+    ingest = _coalescing_queue(tmp_path, handler)
+    job_ids = [ingest.submit(json_codec.dumps_bytes({'studentId': 'team1', 'seq': seq})) for seq in (1, 2, 3)]
+    assert ingest.wait_idle(5)
+    
+    assert [data['seq'] for data in handler.calls] == [3]
+    jobs = [ingest.get_job(job_id) for job_id in job_ids]
+    assert all(job['status'] == JOB_DONE for job in jobs)
+    assert [job['result']['seq'] for job in jobs] == [3, 3, 3]
+    assert [job['result'].get('coalesced', False) for job in jobs] == [True, True, False]
+
+
+def test_coalesce_falls_back_to_earlier_submission(tmp_path):
+    """最新的一份校验失败时依次尝试较早的提交，写入最近的有效数据"""
+    handler = _Recorder()
+    ingest = _coalescing_queue(tmp_path, handler)
+    payloads = [
+        {'studentId': 'team1', 'seq': 1},
+        {'studentId': 'team1', 'seq': 2},
+        {'studentId': 'team1', 'seq': 3, 'valid': False},
+    ]
+    job_ids = [ingest.submit(json_codec.dumps_bytes(payload)) for payload in payloads]
+    assert ingest.wait_idle(5)
+    
+    assert [data['seq'] for data in handler.calls] == [3, 2]
+    first, second, latest = (ingest.get_job(job_id) for job_id in job_ids)
+    assert latest['status'] == JOB_FAILED
+    assert second['status'] == JOB_DONE and second['result']['seq'] == 2
+    assert first['result']['seq'] == 2 and first['result']['coalesced'] is True
+
+
+def test_coalesce_keeps_teams_apart(tmp_path):
+    """不同团队的提交不会互相合并"""
+    handler = _Recorder()
+    ingest = _coalescing_queue(tmp_path, handler)
+    for student_id in ('team1', 'team2', 'team1'):
+        ingest.submit(json_codec.dumps_bytes({'studentId': student_id}))
+    assert ingest.wait_idle(5)
+    
+    assert sorted(data['studentId'] for data in handler.calls) == ['team1', 'team2']
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试JSON编解码模块（json_codec）
+orjson 与标准库两个后端输出相同的字节（归档内容和内容哈希与安装了哪个后端无关），
+按文件类型决定是否缩进，Flask 的 jsonify / get_json 经过同一套编解码
+
+用法:
+    python -m pytest -q test_json_codec.py
+"""
+
+import decimal
+import importlib
+import json
+import sys
+
+import pytest
+from flask import Flask, jsonify, request
+
+import json_codec
+from config import Config
+
+DATA = {
+    'teamInfo': {'school': '实验学校', 'stoveNumber': '5号炉', 'memberCount': 5},
+    'stages': [{'stage': 'PREPARATION', 'selfRating': 4, 'ratio': 0.5, 'endTime': None, 'isCompleted': True}],
+    'emoji': '🔥',
+}
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def codec(request):
+    """按指定后端重新加载 json_codec，结束后恢复原来的后端"""
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    original = Config.JSON_BACKEND
+    Config.JSON_BACKEND = request.param
+    try:
+        yield importlib.reload(json_codec)
+    finally:
+        Config.JSON_BACKEND = original
+        importlib.reload(json_codec)
+
+
+def test_backend_selection(codec):
+    assert codec.BACKEND == Config.JSON_BACKEND
+
+
+def test_compact_output_is_identical_across_backends(codec):
+    expected = json.dumps(DATA, ensure_ascii=False, separators=(',', ':'))
+    assert codec.dumps(DATA) == expected
+    assert codec.dumps_bytes(DATA) == expected.encode('utf-8')
+    assert codec.loads(codec.dumps_bytes(DATA)) == DATA
+    assert codec.loads(expected) == DATA
+
+
+def test_canonical_bytes_and_content_hash(codec):
+    reordered = {'emoji': DATA['emoji'], 'stages': DATA['stages'], 'teamInfo': dict(reversed(DATA['teamInfo'].items()))}
+    expected = json.dumps(DATA, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    assert codec.canonical_bytes(reordered) == expected
+    assert codec.content_hash(reordered) == codec.content_hash(DATA)
+
+
+def test_pretty_output(codec):
+    pretty = codec.dumps(DATA, pretty=True)
+    assert '\n  "teamInfo"' in pretty
+    assert '实验学校' in pretty
+    assert codec.loads(pretty) == DATA
+
+
+def test_default_types(codec):
+    class WithToDict:
+        def to_dict(self):
+            return {'a': 1}
+    
+    value = {'set': {1}, 'decimal': decimal.Decimal('1.5'), 'model': WithToDict()}
+    assert codec.loads(codec.dumps(value)) == {'set': [1], 'decimal': '1.5', 'model': {'a': 1}}
+    with pytest.raises(TypeError):
+        codec.dumps({'bad': object()})
+
+
+def test_invalid_json_raises_value_error(codec):
+    with pytest.raises(ValueError):
+        codec.loads(b'{"teamInfo": ')
+
+
+def test_pretty_by_file_kind(monkeypatch, tmp_path):
+    monkeypatch.setitem(Config.JSON_PRETTY, 'evaluation', True)
+    monkeypatch.setitem(Config.JSON_PRETTY, 'response', False)
+    assert json_codec.is_pretty('evaluation')
+    assert not json_codec.is_pretty('response')
+    assert not json_codec.is_pretty('unknown')
+    assert not json_codec.is_pretty(None)
+    
+    path = str(tmp_path / 'evaluation.json')
+    json_codec.dump_file(DATA, path, 'evaluation')
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == json_codec.dumps(DATA, pretty=True)
+    assert json_codec.load_file(path) == DATA
+
+
+def test_flask_provider(monkeypatch):
+    monkeypatch.setitem(Config.JSON_PRETTY, 'response', False)
+    app = Flask(__name__)
+    app.json = json_codec.CodecJSONProvider(app)
+    
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify(request.get_json())
+    
+    response = app.test_client().post('/echo', data=json_codec.dumps_bytes(DATA), content_type='application/json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    # 不转义中文、不缩进
+    assert response.data == json_codec.dumps_bytes(DATA)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
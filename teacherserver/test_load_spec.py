@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试过程记录的加载范围（db_manager.LoadSpec）和惰性媒体集合（models.LazyMediaItems）
+列表类读取不查询 media_items；媒体文件只在迭代时才查询，并且只查询一次
+
+用法:
+    python -m pytest -q test_load_spec.py
+"""
+
+import sys
+
+import pytest
+
+from config import Config
+from db_init import init_database
+from db_manager import LoadSpec
+from models import LazyMediaItems
+from storage import DataStorage
+from validation import validate_submission
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+MEDIA_COUNTS = {'PREPARATION': 3, 'FIRE_MAKING': 0, 'COOKING_RICE': 1}
+
+
+def _data():
+    stages = {}
+    for i, (name, count) in enumerate(MEDIA_COUNTS.items()):
+        stages[name] = {
+            'stage': name, 'startTime': 1700000000000 + i, 'selfRating': i + 3, 'isCompleted': True,
+            'mediaItems': [{'path': f'/storage/emulated/0/DCIM/{name}_{j}.jpg', 'type': 'PHOTO',
+                            'timestamp': 1700000000000 + j} for j in range(count)],
+        }
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'processRecord': {'startTime': 1700000000000, 'currentStage': 'COOKING_RICE', 'stages': stages},
+    }
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE_PATH', str(tmp_path / 'campcooking.db'))
+    monkeypatch.setattr(Config, 'MEDIA_DIR', str(tmp_path / 'media'))
+    monkeypatch.setattr(Config, 'EVALUATION_DIR', str(tmp_path / 'evaluations'))
+    monkeypatch.setattr(Config, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    assert init_database(Config.DATABASE_PATH)
+    storage = DataStorage(str(tmp_path / 'students'), Config.MEDIA_DIR)
+    submission = validate_submission(_data())
+    assert not submission.errors
+    storage.save_submission(submission)
+    yield storage
+    storage.db_manager.close()
+
+
+@pytest.fixture
+def db(storage):
+    return storage.db_manager
+
+
+@pytest.fixture
+def media_queries(db, monkeypatch):
+    """记录查询 media_items 表的语句"""
+    queries = []
+    for name in ('_fetch_rows', '_fetch_row', '_fetch_one'):
+        fetch = getattr(db, name)
+        
+        def recording(sql, params=(), fetch=fetch):
+            if 'media_items' in sql:
+                queries.append(sql)
+            return fetch(sql, params)
+        
+        monkeypatch.setattr(db, name, recording)
+    return queries
+
+
+def test_stages_spec_never_touches_media(db, media_queries):
+    _, stages = db.get_process_record(TEAM_ID, LoadSpec.STAGES)
+    assert [stage.stage_name for stage in stages] == list(MEDIA_COUNTS)
+    for stage in stages:
+        assert stage.media_items == []
+        assert 'mediaItems' not in stage.to_android_dict()
+    assert media_queries == []
+
+
+def test_media_counts_spec_uses_one_aggregate_query(db, media_queries):
+    _, stages = db.get_process_record(TEAM_ID, LoadSpec.MEDIA_COUNTS)
+    assert len(media_queries) == 1
+    assert {stage.stage_name: len(stage.media_items) for stage in stages} == MEDIA_COUNTS
+    assert [bool(stage.media_items) for stage in stages] == [True, False, True]
+    assert not any(stage.media_items.loaded for stage in stages)
+    assert len(media_queries) == 1
+    
+    # 迭代时才查询该阶段的媒体文件
+    preparation = stages[0]
+    assert [item['path'] for item in preparation.media_items] == \
+        [f'/storage/emulated/0/DCIM/PREPARATION_{j}.jpg' for j in range(3)]
+    assert len(media_queries) == 2
+
+
+def test_full_spec_is_lazy_and_cached(db, media_queries):
+    _, stages = db.get_process_record(TEAM_ID, LoadSpec.FULL)
+    assert media_queries == []
+    
+    rice = stages[2]
+    assert rice.to_android_dict()['mediaItems'][0]['path'] == '/storage/emulated/0/DCIM/COOKING_RICE_0.jpg'
+    assert rice.media_items.loaded
+    queries = len(media_queries)
+    assert len(rice.media_items) == 1
+    assert rice.media_items[0]['type'] == 'PHOTO'
+    assert list(rice.media_items) == rice.to_android_dict()['mediaItems']
+    assert len(media_queries) == queries
+    # 其他阶段仍未加载
+    assert not stages[0].media_items.loaded
+
+
+def test_default_spec_is_full(db):
+    _, stages = db.get_process_record(TEAM_ID)
+    assert isinstance(stages[0].media_items, LazyMediaItems)
+    assert len(stages[0].media_items) == 3
+
+
+def test_student_list_never_touches_media(storage, media_queries):
+    students = storage.get_all_students()
+    assert [student['id'] for student in students] == [TEAM_ID]
+    assert media_queries == []
+
+
+def test_lazy_media_items_without_count():
+    calls = []
+    
+    def loader():
+        calls.append(1)
+        return [{'path': 'a.jpg'}]
+    
+    items = LazyMediaItems(loader)
+    assert 'count=None' in repr(items)
+    assert calls == []
+    assert len(items) == 1
+    assert items
+    assert items[0] == {'path': 'a.jpg'}
+    assert calls == [1]
+
+
+def test_lazy_media_items_with_zero_count():
+    items = LazyMediaItems(lambda: pytest.fail('数量为 0 时不应查询'), 0)
+    assert not items
+    assert len(items) == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试服务器日志配置（log_config）
+按 logger 采样、按日志位置限流、非阻塞入队（不格式化、队列满时丢弃）、JSON格式，
+以及运行中通过 /api/logging 切换诊断模式
+
+用法:
+    python -m pytest -q test_log_config.py
+"""
+
+import logging
+import queue
+import sys
+
+import pytest
+
+import json_codec
+import log_config
+from config import Config
+from log_config import JsonFormatter, SamplingFilter, _NonBlockingQueueHandler
+from metrics import metrics
+
+
+def _record(name='app', level=logging.INFO, msg='消息 %s', args=(1,), lineno=10, created=1000.0, **extra):
+    record = logging.LogRecord(name, level, 'app.py', lineno, msg, args, None)
+    record.created = created
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+@pytest.fixture
+def sampling():
+    return SamplingFilter({'werkzeug': 0.0, 'werkzeug.serving': 1.0}, rate_limit=0, rate_window=10)
+
+
+def test_sampling_by_longest_prefix(sampling):
+    before = metrics.get('log.sampledOut')
+    assert not sampling.filter(_record('werkzeug'))
+    assert not sampling.filter(_record('werkzeug.routing'))
+    assert sampling.filter(_record('werkzeug.serving'))
+    assert sampling.filter(_record('werkzeugx'))
+    assert sampling.filter(_record('app'))
+    assert metrics.get('log.sampledOut') == before + 2
+
+
+def test_sampling_skips_warnings_and_verbose_mode(sampling):
+    assert sampling.filter(_record('werkzeug', logging.WARNING))
+    assert sampling.filter(_record('werkzeug', logging.ERROR))
+    sampling.verbose = True
+    assert sampling.filter(_record('werkzeug', logging.DEBUG))
+
+
+def test_rate_limit_per_call_site():
+    log_filter = SamplingFilter({}, rate_limit=2, rate_window=10)
+    before = metrics.get('log.rateLimited')
+    assert [log_filter.filter(_record(created=1000 + i)) for i in range(5)] == [True, True, False, False, False]
+    # 其他位置的日志和 ERROR 不受影响
+    assert log_filter.filter(_record(lineno=11, created=1001))
+    assert log_filter.filter(_record(level=logging.ERROR, created=1001))
+    assert metrics.get('log.rateLimited') == before + 3
+    
+    # 下一个时间窗口的第一条附上省略的条数
+    record = _record(created=1010)
+    assert log_filter.filter(record)
+    assert record.getMessage() == '消息 1（上一时间窗口省略了 3 条同类日志）'
+    record = _record(created=1011)
+    assert log_filter.filter(record)
+    assert record.getMessage() == '消息 1'
+
+
+def test_rate_limit_disabled():
+    log_filter = SamplingFilter({}, rate_limit=0, rate_window=10)
+    assert all(log_filter.filter(_record()) for _ in range(100))
+
+
+def test_queue_handler_defers_formatting():
+    handler = _NonBlockingQueueHandler(queue.Queue())
+    record = _record(args=('团队', 3))
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    # 参数都是不可变类型：原样入队，由后台线程格式化
+    assert queued.msg == '消息 %s' and queued.args == ('团队', 3)
+    
+    # 可变参数在当前线程格式化，之后修改不影响日志内容
+    stages = ['PREPARATION']
+    handler.handle(_record(args=(stages,)))
+    stages.append('FIRE_MAKING')
+    queued = handler.queue.get_nowait()
+    assert queued.args is None
+    assert queued.getMessage() == "消息 ['PREPARATION']"
+
+
+def test_queue_handler_drops_when_full():
+    handler = _NonBlockingQueueHandler(queue.Queue(1))
+    before = metrics.get('log.dropped')
+    handler.handle(_record())
+    handler.handle(_record())
+    assert handler.queue.qsize() == 1
+    assert metrics.get('log.dropped') == before + 1
+
+
+def test_debug_arguments_not_formatted_by_default(server):
+    """非诊断模式下 DEBUG 日志的参数不会被格式化（日志调用使用 % 参数而不是 f-string）"""
+    class Expensive:
+        def __str__(self):
+            raise AssertionError('级别不够时不应格式化参数')
+    
+    logger = logging.getLogger('app')
+    assert not logger.isEnabledFor(logging.DEBUG)
+    logger.debug("阶段详情: %s", Expensive())
+
+
+def test_json_formatter_includes_extra_fields():
+    record = _record(studentId='实验学校_7_3班_5号炉', mediaCount=3)
+    entry = json_codec.loads(JsonFormatter().format(record))
+    assert entry['message'] == '消息 1'
+    assert entry['level'] == 'INFO'
+    assert entry['logger'] == 'app'
+    assert (entry['studentId'], entry['mediaCount']) == ('实验学校_7_3班_5号炉', 3)
+    assert 'pathname' not in entry
+
+
+@pytest.fixture
+def verbose_off():
+    yield
+    log_config.set_verbose(False)
+
+
+def test_set_verbose(server, verbose_off):
+    # 导入 app 时已调用 setup_logging
+    log_config.set_verbose(True)
+    assert log_config.is_verbose()
+    assert logging.getLogger().level == logging.DEBUG
+    log_config.set_verbose(False)
+    assert not log_config.is_verbose()
+    assert logging.getLevelName(logging.getLogger().level) == Config.LOG_LEVEL
+
+
+def test_logging_endpoint(client, verbose_off):
+    response = client.get('/api/logging')
+    assert response.status_code == 200
+    assert response.get_json()['logging']['verbose'] is False
+    
+    response = client.put('/api/logging', json={'verbose': True})
+    assert response.status_code == 200
+    status = response.get_json()['logging']
+    assert status['verbose'] is True
+    assert status['level'] == 'DEBUG'
+    assert logging.getLogger('app').isEnabledFor(logging.DEBUG)
+    
+    assert client.put('/api/logging', json={'verbose': False}).get_json()['logging']['level'] == Config.LOG_LEVEL
+
+
+@pytest.mark.parametrize('body', [{}, {'verbose': 'yes'}, [True]], ids=['missing', 'string', 'list'])
+def test_logging_endpoint_400(client, body):
+    response = client.put('/api/logging', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
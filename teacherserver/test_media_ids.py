@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试媒体文件的服务器ID（models.media_id_for、db_init.migrate_media_ids 和 /api/media/<media_id>）
+旧数据库升级时补全 media_id / stored_path 并合并同一阶段中文件名重复的记录；
+客户端按 /api/submit 返回的ID上传文件，再通过 /api/media/<media_id> 读取
+
+用法:
+    python -m pytest -q test_media_ids.py
+"""
+
+import io
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from config import Config
+from db_init import init_database
+from db_manager import DatabaseManager
+from metrics import metrics
+from models import media_id_for
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+OTHER_TEAM_ID = '实验学校_7_3班_6号炉'
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'FIRE_MAKING', 'stages': {
+        'PREPARATION': {'stage': 'PREPARATION', 'selfRating': 4, 'mediaItems': [
+            {'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'PHOTO', 'timestamp': 1700000000001},
+            {'path': '/storage/emulated/0/DCIM/b.mp4', 'type': 'VIDEO', 'timestamp': 1700000000002},
+        ]},
+        'FIRE_MAKING': {'stage': 'FIRE_MAKING', 'selfRating': 3, 'mediaItems': [
+            {'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'PHOTO', 'timestamp': 1700000000003},
+        ]},
+    }},
+}
+
+
+def test_media_id_is_stable_and_scoped():
+    media_id = media_id_for(TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/a.jpg')
+    assert len(media_id) == 24
+    assert media_id == media_id_for(TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/a.jpg')
+    # 同一阶段中文件名相同即为同一个文件
+    assert media_id == media_id_for(TEAM_ID, 'PREPARATION', '/sdcard/Pictures/a.jpg')
+    assert media_id != media_id_for(TEAM_ID, 'FIRE_MAKING', '/storage/emulated/0/DCIM/a.jpg')
+    assert media_id != media_id_for(OTHER_TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/a.jpg')
+
+
+# ==================== 旧数据库升级 ====================
+def _legacy_database(db_path, media_rows):
+    """没有 media_id / stored_path 列的旧数据库；media_rows: [(团队ID, 阶段名, 手机端路径)]"""
+    assert init_database(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP INDEX idx_media_items_media_id")
+    conn.execute("ALTER TABLE media_items DROP COLUMN media_id")
+    conn.execute("ALTER TABLE media_items DROP COLUMN stored_path")
+    stage_ids = {}
+    for team_id, stage_name, file_path in media_rows:
+        if (team_id, stage_name) not in stage_ids:
+            conn.execute("INSERT OR IGNORE INTO teams (team_id, school, grade, class_name, stove_number, member_names, "
+                         "created_at, updated_at) VALUES (?, '实验学校', '7', '3班', '', '', 0, 0)", (team_id,))
+            row = conn.execute("SELECT id FROM process_records WHERE team_id = ?", (team_id,)).fetchone()
+            process_id = row[0] if row else conn.execute(
+                "INSERT INTO process_records (team_id, start_time, created_at, updated_at) VALUES (?, 0, 0, 0)",
+                (team_id,)).lastrowid
+            stage_ids[team_id, stage_name] = conn.execute(
+                "INSERT INTO stage_records (process_record_id, stage_name, start_time, created_at, updated_at) "
+                "VALUES (?, ?, 0, 0, 0)", (process_id, stage_name)).lastrowid
+        conn.execute("INSERT INTO media_items (stage_record_id, file_path, file_type, timestamp, created_at) "
+                     "VALUES (?, ?, 'PHOTO', 0, 0)", (stage_ids[team_id, stage_name], file_path))
+    conn.commit()
+    conn.close()
+
+
+def _media_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT file_path, media_id, stored_path FROM media_items ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_migrate_media_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'MEDIA_DIR', str(tmp_path / 'media'))
+    db_path = str(tmp_path / 'campcooking.db')
+    _legacy_database(db_path, [
+        (TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/a.jpg'),
+        (TEAM_ID, 'PREPARATION', '/sdcard/Pictures/a.jpg'),  # 同一阶段、同名：合并
+        (TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/b.jpg'),
+        (TEAM_ID, 'FIRE_MAKING', '/storage/emulated/0/DCIM/a.jpg'),  # 其他阶段：保留
+        (OTHER_TEAM_ID, 'PREPARATION', '/storage/emulated/0/DCIM/a.jpg'),
+    ])
+    # 5号炉的 a.jpg 已经上传过
+    os.makedirs(os.path.join(Config.MEDIA_DIR, TEAM_ID))
+    with open(os.path.join(Config.MEDIA_DIR, TEAM_ID, 'a.jpg'), 'wb') as f:
+        f.write(b'jpeg')
+    
+    # 升级过程中创建 media_id 唯一索引，重复记录没有合并时会失败
+    assert init_database(db_path)
+    assert _media_rows(db_path) == [
+        ('/storage/emulated/0/DCIM/a.jpg', media_id_for(TEAM_ID, 'PREPARATION', 'a.jpg'), f'{TEAM_ID}/a.jpg'),
+        ('/storage/emulated/0/DCIM/b.jpg', media_id_for(TEAM_ID, 'PREPARATION', 'b.jpg'), None),
+        ('/storage/emulated/0/DCIM/a.jpg', media_id_for(TEAM_ID, 'FIRE_MAKING', 'a.jpg'), f'{TEAM_ID}/a.jpg'),
+        ('/storage/emulated/0/DCIM/a.jpg', media_id_for(OTHER_TEAM_ID, 'PREPARATION', 'a.jpg'), None),
+    ]
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        versions = conn.execute("SELECT schema_version, migration_script FROM data_versions "
+                                "WHERE table_name = 'media_items'").fetchall()
+    finally:
+        conn.close()
+    assert versions == [(2, 'db_init.migrate_media_ids')]
+    
+    # 再次初始化不重复迁移
+    assert init_database(db_path)
+    assert len(_media_rows(db_path)) == 4
+    
+    db = DatabaseManager(db_path)
+    try:
+        media_item, team_id = db.get_media_item(media_id_for(TEAM_ID, 'PREPARATION', 'a.jpg'))
+    finally:
+        db.close()
+    assert team_id == TEAM_ID
+    assert media_item.stored_path == f'{TEAM_ID}/a.jpg'
+
+
+# ==================== /api/media/<media_id> ====================
+@pytest.fixture
+def media(client):
+    """提交数据，返回 手机端路径 -> 服务器ID（PREPARATION 阶段）"""
+    response = client.post('/api/submit', json=DATA)
+    assert response.status_code == 200
+    return {item['path']: item['mediaId'] for item in response.get_json()['media'] if item['stage'] == 'PREPARATION'}
+
+
+def _upload(client, media_id, content=b'jpeg', filename='a.jpg'):
+    return client.post(f'/api/media/{media_id}/upload', data={'file': (io.BytesIO(content), filename)})
+
+
+def test_submit_returns_media_ids(client, media):
+    response = client.post('/api/submit', json={**DATA, 'exportTime': 1})
+    items = response.get_json()['media']
+    assert [(item['stage'], item['path']) for item in items] == [
+        ('PREPARATION', '/storage/emulated/0/DCIM/a.jpg'),
+        ('PREPARATION', '/storage/emulated/0/DCIM/b.mp4'),
+        ('FIRE_MAKING', '/storage/emulated/0/DCIM/a.jpg'),
+    ]
+    for item in items:
+        assert item['mediaId'] == media_id_for(TEAM_ID, item['stage'], item['path'])
+        assert item['uploadUrl'] == f"/api/media/{item['mediaId']}/upload"
+    assert {item['path']: item['mediaId'] for item in items[:2]} == media
+
+
+def test_upload_and_get_by_media_id(server, client, media):
+    media_id = media['/storage/emulated/0/DCIM/a.jpg']
+    assert client.get(f'/api/media/{media_id}').status_code == 404
+    
+    response = _upload(client, media_id)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['mediaId'] == media_id
+    assert body['url'] == f'/api/media/{media_id}'
+    
+    response = client.get(f'/api/media/{media_id}')
+    assert response.status_code == 200
+    assert response.data == b'jpeg'
+    # 支持条件请求
+    assert client.get(f'/api/media/{media_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    
+    # 其他文件仍未上传
+    assert client.get(f"/api/media/{media['/storage/emulated/0/DCIM/b.mp4']}").status_code == 404
+
+
+def test_unknown_media_id_404(client, media):
+    assert client.get('/api/media/0123456789abcdef01234567').status_code == 404
+    assert _upload(client, '0123456789abcdef01234567').status_code == 404
+
+
+def test_media_id_survives_resubmission(client, media):
+    media_id = media['/storage/emulated/0/DCIM/a.jpg']
+    assert _upload(client, media_id).status_code == 200
+    data = {**DATA, 'processRecord': {**DATA['processRecord'], 'overallNotes': '改了'}}
+    response = client.post('/api/submit', json=data)
+    assert response.status_code == 200
+    assert media_id in [item['mediaId'] for item in response.get_json()['media']]
+    assert client.get(f'/api/media/{media_id}').data == b'jpeg'
+
+
+def test_legacy_route_reads_same_file(client, media):
+    assert _upload(client, media['/storage/emulated/0/DCIM/a.jpg']).status_code == 200
+    before = metrics.get('media.legacyReads')
+    response = client.get(f'/api/student/{TEAM_ID}/media/a.jpg')
+    assert response.status_code == 200
+    assert response.data == b'jpeg'
+    assert metrics.get('media.legacyReads') == before + 1
+    assert client.get(f'/api/student/{TEAM_ID}/media/missing.jpg').status_code == 404
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按内容寻址的媒体文件存储（media_store.MediaStore）
+同一内容只保存一份，团队文件是指向内容文件的硬链接；没有团队链接的内容文件被清理；
+媒体文件清单只把服务器没有或不一致的文件列为需要上传
+
+用法:
+    python -m pytest -q test_media_store.py
+"""
+
+import hashlib
+import io
+import os
+import sys
+
+import pytest
+
+from media_store import ChecksumMismatch, FileTooLarge, MediaStore
+
+TEAM_A = '实验学校_7_3班_5号炉'
+TEAM_B = '实验学校_7_3班_6号炉'
+PHOTO = b'\xff\xd8\xff' + os.urandom(4096)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path / 'blobs'), str(tmp_path / 'media'))
+
+
+def _blob_count(store):
+    count = 0
+    for _, _, files in os.walk(store.blob_dir):
+        count += sum(1 for name in files if not name.startswith('.'))
+    return count
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_same_content_is_stored_once(store):
+    """不同团队、不同文件名上传相同内容时只保存一份"""
+    first = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    second = store.save_stream(io.BytesIO(PHOTO), TEAM_B, 'b.jpg')
+    again = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    
+    assert first.sha256 == second.sha256 == hashlib.sha256(PHOTO).hexdigest()
+    assert (first.deduplicated, second.deduplicated, again.deduplicated) == (False, True, True)
+    assert _blob_count(store) == 1
+    assert os.path.samefile(first.path, store.blob_path(first.sha256))
+    assert os.path.samefile(second.path, store.blob_path(first.sha256))
+    assert _read(second.path) == PHOTO
+    assert store.blob_size(first.sha256) == len(PHOTO)
+
+
+def test_replacing_team_file_keeps_other_links(store):
+    """团队文件替换为新内容时，链接同一旧内容的其他团队文件不受影响"""
+    old = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    store.save_stream(io.BytesIO(PHOTO), TEAM_B, 'a.jpg')
+    store.save_stream(io.BytesIO(b'new content'), TEAM_A, 'a.jpg')
+    
+    assert _read(os.path.join(store.media_dir, TEAM_A, 'a.jpg')) == b'new content'
+    assert _read(os.path.join(store.media_dir, TEAM_B, 'a.jpg')) == PHOTO
+    assert _read(store.blob_path(old.sha256)) == PHOTO
+
+
+def test_link_existing_blob(store):
+    """服务器已有该内容时只登记引用，不再上传"""
+    stored = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    path = store.link(stored.sha256, TEAM_B, 'copy.jpg')
+    
+    assert _read(path) == PHOTO
+    assert store.link(stored.sha256, TEAM_B, 'copy.jpg') == path
+    with pytest.raises(FileNotFoundError):
+        store.link('0' * 64, TEAM_B, 'missing.jpg')
+
+
+def test_checksum_mismatch_keeps_team_file(store):
+    store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    with pytest.raises(ChecksumMismatch):
+        store.save_stream(io.BytesIO(b'corrupted'), TEAM_A, 'a.jpg', expected_sha256='0' * 64)
+    
+    assert _read(os.path.join(store.media_dir, TEAM_A, 'a.jpg')) == PHOTO
+    assert _blob_count(store) == 1
+
+
+def test_file_too_large(store):
+    with pytest.raises(FileTooLarge):
+        store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg', max_size=100)
+    assert _blob_count(store) == 0
+    assert not os.path.exists(os.path.join(store.media_dir, TEAM_A, 'a.jpg'))
+
+
+def test_collect_garbage_removes_unreferenced_blobs(store):
+    kept = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    dropped = store.save_stream(io.BytesIO(b'old photo'), TEAM_A, 'b.jpg')
+    os.remove(dropped.path)
+    
+    assert store.collect_garbage(grace_seconds=60) == 0  # 刚写入的内容文件暂不删除
+    assert store.collect_garbage(grace_seconds=-1) == 1
+    assert store.blob_size(dropped.sha256) is None
+    assert store.blob_size(kept.sha256) == len(PHOTO)
+
+
+def _item(path, size=None, sha256=None):
+    return {'path': path, 'filename': os.path.basename(path), 'size': size, 'sha256': sha256}
+
+
+def test_manifest_lists_missing_stale_and_present(store):
+    stored = store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    store.save_stream(io.BytesIO(b'other'), TEAM_A, 'b.jpg')
+    refs = {'a.jpg': {'sha256': stored.sha256, 'fileSize': stored.size}}
+    items = [
+        _item('/sdcard/DCIM/a.jpg', len(PHOTO), stored.sha256),  # 完全一致
+        _item('/sdcard/DCIM/b.jpg'),  # 只有路径：同名文件存在即可
+        _item('/sdcard/DCIM/c.jpg', 10),  # 服务器没有
+        _item('/sdcard/DCIM/b.jpg', 999),  # 大小不一致
+        _item('/sdcard/DCIM/a.jpg', len(PHOTO), '0' * 64),  # 内容不一致
+    ]
+    
+    result = store.check_manifest(TEAM_A, items, refs)
+    assert result == {
+        'missing': ['/sdcard/DCIM/c.jpg'],
+        'stale': ['/sdcard/DCIM/b.jpg', '/sdcard/DCIM/a.jpg'],
+        'present': ['/sdcard/DCIM/a.jpg', '/sdcard/DCIM/b.jpg'],
+    }
+
+
+def test_manifest_without_hash_record_compares_size(store):
+    """没有哈希记录的文件（按内容存储之前上传的）只比较大小"""
+    store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'legacy.jpg')
+    result = store.check_manifest(TEAM_A, [_item('/sdcard/legacy.jpg', len(PHOTO), '0' * 64)], refs={})
+    assert result['present'] == ['/sdcard/legacy.jpg']
+
+
+def test_manifest_is_per_team(store):
+    store.save_stream(io.BytesIO(PHOTO), TEAM_A, 'a.jpg')
+    result = store.check_manifest(TEAM_B, [_item('/sdcard/a.jpg', len(PHOTO))], refs={})
+    assert result['missing'] == ['/sdcard/a.jpg']
+    assert store.team_files(TEAM_A) == {'a.jpg': len(PHOTO)}
+    assert store.team_files(TEAM_B) == {}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试模型类的 __slots__ 和按列位置加载（BaseModel.from_row）
+from_row 读出的对象重新编码后与数据库中的行完全一致，加载时不生成时间戳
+
+用法:
+    python -m pytest -q test_models.py
+"""
+
+import sys
+
+import pytest
+
+import models
+from config import Config
+from db_init import init_database
+from db_manager import DatabaseManager
+from models import BaseModel, Menu, MediaItem, ProcessRecord, StageRecord, SummaryData, Team, TeamDivision
+from validation import validate_submission
+
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'teamDivision': {'groupLeader': '张三', 'groupCooking': '李四'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'FIRE_MAKING', 'overallNotes': '顺利', 'stages': {
+        'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'endTime': 1700000600000,
+                        'selfRating': 4, 'notes': '好', 'isCompleted': True, 'selectedTags': ['火候', '分工'],
+                        'mediaItems': [{'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'photo',
+                                        'timestamp': 1700000000001}]},
+        'FIRE_MAKING': {'stage': 'FIRE_MAKING', 'startTime': 1700000600000, 'selfRating': 3,
+                        'isCompleted': False},
+    }},
+    'summaryData': {'answer1': '一', 'answer2': '二', 'answer3': '三'},
+}
+ROW_MODELS = (Team, TeamDivision, ProcessRecord, StageRecord, MediaItem, SummaryData, Menu)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'MEDIA_DIR', str(tmp_path / 'media'))
+    db_path = str(tmp_path / 'campcooking.db')
+    assert init_database(db_path)
+    manager = DatabaseManager(db_path)
+    submission = validate_submission(DATA)
+    assert not submission.errors
+    team_id = submission.student_id
+    manager.save_team(submission.team)
+    manager.save_team_division(team_id, submission.division)
+    manager.save_process_record(team_id, submission.process, submission.stages, submission.stages_media)
+    manager.save_summary_data(team_id, submission.summary)
+    menu = Menu({'menuData': {'soup': '番茄蛋汤', 'dishes': ['炒青菜', '土豆丝']}})
+    menu.team_id = team_id
+    manager.save_menu(menu)
+    yield manager
+    manager.close()
+
+
+def _rows(db, model):
+    return [tuple(row) for row in db._fetch_rows(f"SELECT {model.COLUMN_SQL} FROM {model.TABLE}")]
+
+
+@pytest.mark.parametrize('model', BaseModel.__subclasses__(), ids=lambda model: model.__name__)
+def test_models_have_no_instance_dict(model):
+    obj = model()
+    assert not hasattr(obj, '__dict__')
+    with pytest.raises(AttributeError):
+        obj.not_a_column = 1
+
+
+@pytest.mark.parametrize('model', ROW_MODELS, ids=lambda model: model.__name__)
+def test_from_row_reencodes_to_same_row(db, model):
+    rows = _rows(db, model)
+    assert rows
+    for row in rows:
+        obj = model.from_row(row)
+        assert obj.id == row[0]
+        # 按 FIELDS 顺序映射，重新编码后与库中的值逐列相同（没有错位、没有丢失）
+        assert model.serializer.insert_params(obj) == row[1:]
+
+
+def test_from_row_decodes_row_values(db):
+    stages = {stage.stage_name: stage for stage in map(StageRecord.from_row, _rows(db, StageRecord))}
+    assert stages['PREPARATION'].is_completed is True
+    assert stages['FIRE_MAKING'].is_completed is False
+    assert stages['PREPARATION'].selected_tags == ['火候', '分工']
+    assert stages['FIRE_MAKING'].selected_tags == []
+    assert Menu.from_row(_rows(db, Menu)[0]).dishes == ['炒青菜', '土豆丝']
+    
+    media = MediaItem.from_row(_rows(db, MediaItem)[0])
+    assert media.to_android_dict()['type'] == 'PHOTO'
+    assert media.to_android_dict()['timestamp'] == 1700000000001
+
+
+def test_from_row_does_not_generate_timestamps(db, monkeypatch):
+    rows = {model: _rows(db, model) for model in ROW_MODELS}
+    
+    def fail():
+        raise AssertionError('from_row 不应生成时间戳')
+    
+    monkeypatch.setattr(models, 'now_ms', fail)
+    for model, model_rows in rows.items():
+        for row in model_rows:
+            model.from_row(row)
+    # media_items 表没有 updated_at 列：沿用 created_at
+    media = MediaItem.from_row(rows[MediaItem][0])
+    assert media.updated_at == media.created_at
+    assert media.schema_version == 1
+
+
+def test_from_row_rejects_wrong_column_count():
+    with pytest.raises(ValueError):
+        Team.from_row((1, 'team'))
+
+
+def test_reads_match_submitted_data(db):
+    team_id = Team({'teamInfo': DATA['teamInfo']}).team_id
+    team = db.get_team(team_id)
+    assert team.to_android_dict() == {key: DATA['teamInfo'][key] for key in Team.serializer.android_keys}
+    
+    _, stages = db.get_process_record(team_id)
+    preparation = next(stage for stage in stages if stage.stage_name == 'PREPARATION')
+    android = preparation.to_android_dict()
+    for key in ('selfRating', 'notes', 'isCompleted', 'selectedTags', 'startTime', 'endTime'):
+        assert android[key] == DATA['processRecord']['stages']['PREPARATION'][key]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 MessagePack 编解码（msgpack_codec）
+内置纯Python实现与 msgpack（C扩展，已安装时）的编码互通，MessagePack 提交与JSON提交校验结果一致
+
+用法:
+    python -m pytest -q test_msgpack_codec.py
+"""
+
+import json
+import sys
+
+import pytest
+
+import msgpack_codec
+from msgpack_codec import MsgpackError, _python_packb, _python_unpackb
+from parse_pool import parse_payload
+
+# 覆盖各种长度前缀的边界值
+VALUES = [
+    None, True, False,
+    0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 63,
+    -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31, -2 ** 31 - 1, -2 ** 63,
+    0.5, -1.25e300,
+    '', 'a' * 31, 'a' * 32, 'b' * 255, 'c' * 256, 'd' * 65536, '中文"\\\n',
+    b'', b'\x00' * 256, b'\xff' * 65536,
+    [], list(range(15)), list(range(16)), list(range(65536)),
+    {}, {f'k{i}': i for i in range(15)}, {f'k{i}': i for i in range(16)},
+    {'nested': [{'a': [1, {'b': None}]}]},
+]
+
+
+def _submission():
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'processRecord': {'startTime': 1700000000000, 'currentStage': 'FIRE_MAKING', 'stages': {
+            'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': 4,
+                            'isCompleted': True, 'selectedTags': ['火候'],
+                            'mediaItems': [{'path': '/sdcard/a.jpg', 'type': 'PHOTO', 'timestamp': 1700000000001}]},
+        }},
+        'summaryData': {'answer1': '1', 'answer2': '', 'answer3': ''},
+        'exportTime': 1700000000000,
+    }
+
+
+@pytest.mark.parametrize('value', VALUES, ids=lambda value: type(value).__name__)
+def test_python_round_trip(value):
+    assert _python_unpackb(_python_packb(value)) == value
+
+
+def test_tuple_packs_as_array():
+    assert _python_unpackb(_python_packb((1, 2))) == [1, 2]
+
+
+def test_interop_with_msgpack_extension():
+    """纯Python实现与 msgpack（C扩展）的编码可以互相解码"""
+    msgpack = pytest.importorskip('msgpack')
+    for value in VALUES:
+        assert _python_unpackb(msgpack.packb(value, use_bin_type=True)) == value
+        assert msgpack.unpackb(_python_packb(value), raw=False) == value
+
+
+def test_submission_matches_json():
+    """MessagePack 提交的校验结果和内容哈希与JSON提交一致"""
+    data = _submission()
+    from_msgpack = parse_payload(msgpack_codec.packb(data), 'msgpack')
+    from_json = parse_payload(json.dumps(data).encode(), 'json')
+    
+    assert from_msgpack.content_hash == from_json.content_hash
+    assert from_msgpack.submission.student_id == from_json.submission.student_id
+    assert not from_msgpack.submission.errors
+    assert json.loads(from_msgpack.raw_json) == data
+
+
+@pytest.mark.parametrize('data', [
+    b'',  # 空数据
+    b'\x92\x01',  # 数组缺少元素
+    b'\xa5abc',  # 字符串不完整
+    b'\x81\x01\x02',  # 键不是字符串
+    b'\xd4\x01\x00',  # 扩展类型
+    b'\xc1',  # 未使用的类型字节
+    b'\x01\x02',  # 末尾有多余的字节
+    b'\xa2\xff\xfe',  # 不是有效的UTF-8
+])
+def test_malformed_raises_msgpack_error(data):
+    with pytest.raises(MsgpackError):
+        msgpack_codec.unpackb(data)
+
+
+def test_depth_limit():
+    data = b'\x91' * (msgpack_codec.MAX_DEPTH + 1) + b'\xc0'
+    with pytest.raises(MsgpackError):
+        _python_unpackb(data)
+
+
+def test_is_msgpack():
+    assert msgpack_codec.is_msgpack('application/msgpack')
+    assert msgpack_codec.is_msgpack('Application/X-Msgpack; charset=binary')
+    assert not msgpack_codec.is_msgpack('application/json')
+    assert not msgpack_codec.is_msgpack(None)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
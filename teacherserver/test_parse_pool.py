@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试大提交的进程池解析（parse_pool.decode_submission）
+子进程只返回校验结果，不回传请求体；解析超时时结束子进程并返回 503 + Retry-After，进程池异常退出时在当前线程解析
+
+用法:
+    python -m pytest -q test_parse_pool.py
+"""
+
+import os
+import sys
+import time
+import zlib
+
+import pytest
+
+import json_codec
+import msgpack_codec
+import parse_pool
+from config import Config
+from metrics import metrics
+from parse_pool import ParsedSubmission, ParseTimeout
+from validation import submission_hash
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'PREPARATION', 'overallNotes': '长' * 2000,
+                      'stages': {'PREPARATION': {'stage': 'PREPARATION', 'selfRating': 4}}},
+    'exportTime': 1700000900000,
+}
+MIN_BYTES = 1024
+
+
+def _slow_parse(payload, payload_format):
+    """代替 _parse_in_worker：一直占用子进程"""
+    time.sleep(30)
+
+
+def _crash(payload, payload_format):
+    """代替 _parse_in_worker：子进程异常退出"""
+    os._exit(1)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(Config, 'PARSE_POOL_ENABLED', True)
+    monkeypatch.setattr(Config, 'PARSE_POOL_MIN_BYTES', MIN_BYTES)
+    monkeypatch.setattr(Config, 'PARSE_POOL_WORKERS', 1)
+    monkeypatch.setattr(Config, 'PARSE_POOL_TIMEOUT', 30)
+    parse_pool.shutdown()
+    yield
+    parse_pool.shutdown()
+
+
+def test_small_payload_decoded_inline():
+    payload = json_codec.dumps_bytes({'teamInfo': {'school': '实验学校'}})
+    assert len(payload) < MIN_BYTES
+    assert parse_pool.decode_submission(payload) == {'teamInfo': {'school': '实验学校'}}
+    assert parse_pool._pool is None
+
+
+def test_worker_result_has_no_body():
+    payload = json_codec.dumps_bytes(DATA)
+    parsed = parse_pool._parse_in_worker(payload, 'json')
+    assert parsed.raw_json == b''
+    assert parsed.archive_payload is None
+    assert parsed.submission.student_id == TEAM_ID
+    
+    parsed = parse_pool._parse_in_worker(msgpack_codec.packb(DATA), 'msgpack')
+    assert parsed.raw_json == b''
+    assert json_codec.loads(zlib.decompress(parsed.archive_payload)) == DATA
+
+
+def test_large_json_parsed_in_pool():
+    payload = json_codec.dumps_bytes(DATA)
+    assert len(payload) >= MIN_BYTES
+    parsed_count = metrics.get('parsePool.parsed')
+    parsed = parse_pool.decode_submission(payload)
+    assert isinstance(parsed, ParsedSubmission)
+    assert parsed.submission.is_valid
+    assert parsed.submission.process.overall_notes == DATA['processRecord']['overallNotes']
+    assert parsed.content_hash == submission_hash(DATA)
+    assert parsed.keys == list(DATA)
+    # 归档内容是父进程持有的请求体本身
+    assert parsed.raw_json is payload
+    assert parsed.archive_payload is None
+    assert metrics.get('parsePool.parsed') == parsed_count + 1
+
+
+def test_large_msgpack_parsed_in_pool():
+    parsed = parse_pool.decode_submission(msgpack_codec.packb(DATA), 'msgpack')
+    assert parsed.raw_json == b''
+    assert json_codec.loads(zlib.decompress(parsed.archive_payload)) == DATA
+
+
+def test_invalid_payload_raises_value_error():
+    with pytest.raises(ValueError):
+        parse_pool.decode_submission(b'{"teamInfo": ' + b' ' * MIN_BYTES)
+
+
+def test_timeout_kills_worker_and_recycles_pool(monkeypatch):
+    parse_in_worker = parse_pool._parse_in_worker
+    monkeypatch.setattr(parse_pool, '_parse_in_worker', _slow_parse)
+    monkeypatch.setattr(Config, 'PARSE_POOL_TIMEOUT', 0.5)
+    # 只有一个子进程：先取得它的 pid
+    worker_pid = parse_pool._get_pool().submit(os.getpid).result(timeout=10)
+    timeouts = metrics.get('parsePool.timeouts')
+    with pytest.raises(ParseTimeout):
+        parse_pool.decode_submission(json_codec.dumps_bytes(DATA))
+    assert metrics.get('parsePool.timeouts') == timeouts + 1
+    assert parse_pool._pool is None
+    
+    # 正在解析的子进程被结束，不会一直占用CPU
+    deadline = time.monotonic() + 10
+    while _alive(worker_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(worker_pid)
+    
+    # 下次使用时重建进程池
+    monkeypatch.setattr(parse_pool, '_parse_in_worker', parse_in_worker)
+    parsed = parse_pool.decode_submission(json_codec.dumps_bytes(DATA))
+    assert parsed.submission.student_id == TEAM_ID
+    assert parse_pool._pool is not None
+
+
+def test_broken_pool_falls_back_to_inline_parse(monkeypatch):
+    monkeypatch.setattr(parse_pool, '_parse_in_worker', _crash)
+    fallback = metrics.get('parsePool.fallback')
+    assert parse_pool.decode_submission(json_codec.dumps_bytes(DATA)) == DATA
+    assert metrics.get('parsePool.fallback') == fallback + 1
+    assert parse_pool._pool is None
+
+
+def test_submit_timeout_returns_503(server, client, monkeypatch):
+    monkeypatch.setattr(Config, 'STREAM_PARSE_ENABLED', False)
+    monkeypatch.setattr(parse_pool, '_parse_in_worker', _slow_parse)
+    monkeypatch.setattr(Config, 'PARSE_POOL_TIMEOUT', 0.5)
+    response = client.post('/api/submit', data=json_codec.dumps_bytes(DATA), content_type='application/json')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(Config.ADMISSION_RETRY_AFTER_MAX)
+    assert response.get_json()['status'] == 'error'
+    assert server.storage.db_manager.get_team(TEAM_ID) is None
+
+
+@pytest.mark.parametrize('payload_format', ['json', 'msgpack'])
+def test_submit_through_pool_archives_request(server, client, monkeypatch, payload_format):
+    monkeypatch.setattr(Config, 'STREAM_PARSE_ENABLED', False)
+    if payload_format == 'json':
+        body, content_type = json_codec.dumps_bytes(DATA), 'application/json'
+    else:
+        body, content_type = msgpack_codec.packb(DATA), 'application/msgpack'
+    parsed_count = metrics.get('parsePool.parsed')
+    response = client.post('/api/submit', data=body, content_type=content_type)
+    assert response.status_code == 200
+    assert metrics.get('parsePool.parsed') == parsed_count + 1
+    assert server.storage.get_raw_submission(TEAM_ID)['data'] == DATA
+    assert server.storage.db_manager.get_submission_hash(TEAM_ID) == submission_hash(DATA)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
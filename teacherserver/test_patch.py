@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试部分更新接口 PATCH /api/student/<id>/stage/<stage> 和 PATCH /api/student/<id>/summary
+只写修改的字段；请求格式错误返回 400，团队不存在返回 404；更新后清除内容哈希，重发旧的完整数据不会被当作重复提交跳过
+
+用法:
+    python -m pytest -q test_patch.py
+"""
+
+import sys
+
+import pytest
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'FIRE_MAKING', 'stages': {
+        'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': 4, 'notes': '准备',
+                        'isCompleted': True,
+                        'mediaItems': [{'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'PHOTO',
+                                        'timestamp': 1700000000001}]},
+        'FIRE_MAKING': {'stage': 'FIRE_MAKING', 'startTime': 1700000600000, 'selfRating': 3, 'notes': '生火'},
+    }},
+    'summaryData': {'answer1': '一', 'answer2': '二', 'answer3': '三'},
+}
+STAGE_URL = f'/api/student/{TEAM_ID}/stage'
+SUMMARY_URL = f'/api/student/{TEAM_ID}/summary'
+
+
+@pytest.fixture
+def db(server, client):
+    assert client.post('/api/submit', json=DATA).status_code == 200
+    db = server.storage.db_manager
+    assert db.get_submission_hash(TEAM_ID)
+    return db
+
+
+def _stages(db):
+    _, stages = db.get_process_record(TEAM_ID)
+    return {stage.stage_name: stage.to_android_dict() for stage in stages}
+
+
+def test_patch_stage_updates_only_given_fields(client, db):
+    before = _stages(db)
+    response = client.patch(f'{STAGE_URL}/FIRE_MAKING', json={'notes': '火很旺', 'isCompleted': True})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['studentId'] == TEAM_ID
+    assert body['stage']['notes'] == '火很旺'
+    assert body['stage']['selfRating'] == 3
+    
+    after = _stages(db)
+    assert after['FIRE_MAKING'] == {**before['FIRE_MAKING'], 'notes': '火很旺', 'isCompleted': True}
+    assert after['PREPARATION'] == before['PREPARATION']
+
+
+def test_patch_stage_creates_missing_stage(client, db):
+    response = client.patch(f'{STAGE_URL}/COOKING_RICE', json={'selfRating': 5})
+    assert response.status_code == 200
+    assert _stages(db)['COOKING_RICE']['selfRating'] == 5
+
+
+def test_patch_stage_media_items(client, db):
+    media = [{'path': '/storage/emulated/0/DCIM/b.jpg', 'type': 'VIDEO', 'timestamp': 1700000000002}]
+    response = client.patch(f'{STAGE_URL}/PREPARATION', json={'mediaItems': media})
+    assert response.status_code == 200
+    assert [item['path'] for item in response.get_json()['stage']['mediaItems']] == \
+        ['/storage/emulated/0/DCIM/b.jpg']
+    assert _stages(db)['PREPARATION']['notes'] == '准备'
+    # 不带 mediaItems 的更新不改动媒体文件
+    assert client.patch(f'{STAGE_URL}/PREPARATION', json={'notes': '改'}).status_code == 200
+    assert len(_stages(db)['PREPARATION']['mediaItems']) == 1
+
+
+@pytest.mark.parametrize('body, field', [
+    ({}, '$'),
+    ([], '$'),
+    ({'unknown': 1}, 'unknown'),
+    ({'selfRating': 'good'}, 'selfRating'),
+    ({'stage': 'COOKING_RICE', 'notes': 'x'}, 'stage'),
+    ({'mediaItems': [{'type': 'PHOTO'}]}, 'mediaItems[0].path'),
+], ids=['empty', 'list', 'unknown', 'type', 'stage', 'media'])
+def test_patch_stage_400(client, db, body, field):
+    before = _stages(db)
+    response = client.patch(f'{STAGE_URL}/FIRE_MAKING', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+    assert field in [error['field'] for error in response.get_json()['errors']]
+    assert _stages(db) == before
+    assert db.get_submission_hash(TEAM_ID)
+
+
+def test_patch_stage_invalid_json_400(client, db):
+    response = client.patch(f'{STAGE_URL}/FIRE_MAKING', data=b'{notes', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_patch_summary(client, db):
+    response = client.patch(SUMMARY_URL, json={'answer2': '新的回答'})
+    assert response.status_code == 200
+    summary = response.get_json()['summaryData']
+    assert (summary['answer1'], summary['answer2'], summary['answer3']) == ('一', '新的回答', '三')
+    assert db.get_summary_data(TEAM_ID).answer2 == '新的回答'
+
+
+@pytest.mark.parametrize('body', [{}, {'answer4': 'x'}, {'answer1': ['x']}], ids=['empty', 'unknown', 'type'])
+def test_patch_summary_400(client, db, body):
+    assert client.patch(SUMMARY_URL, json=body).status_code == 400
+    assert db.get_summary_data(TEAM_ID).answer1 == '一'
+
+
+def test_patch_unknown_team_404(server, client):
+    assert client.patch('/api/student/没有的团队/stage/PREPARATION', json={'notes': 'x'}).status_code == 404
+    assert client.patch('/api/student/没有的团队/summary', json={'answer1': 'x'}).status_code == 404
+    assert server.storage.db_manager.get_team('没有的团队') is None
+
+
+@pytest.mark.parametrize('url, body', [
+    (f'{STAGE_URL}/FIRE_MAKING', {'notes': '火很旺'}),
+    (SUMMARY_URL, {'answer2': '新的回答'}),
+], ids=['stage', 'summary'])
+def test_patch_resets_submission_hash(client, db, url, body):
+    assert client.patch(url, json=body).status_code == 200
+    assert db.get_submission_hash(TEAM_ID) is None
+    
+    # 重发旧的完整数据：不被跳过，覆盖部分更新
+    response = client.post('/api/submit', json=DATA)
+    assert response.status_code == 200
+    assert 'unchanged' not in response.get_json()
+    assert _stages(db)['FIRE_MAKING']['notes'] == '生火'
+    assert db.get_summary_data(TEAM_ID).answer2 == '二'
+    assert db.get_submission_hash(TEAM_ID)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试从原始提交归档重建数据库（rebuild.rebuild_database）
+通过 /api/submit 等接口写入的数据库与从归档重建的数据库内容相同（串行和进程池两种方式），
+教师评价和菜单从原数据库复制，原数据库保留为备份
+
+用法:
+    python -m pytest -q test_rebuild.py
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+import rebuild
+from config import Config
+from db_manager import DatabaseManager
+from storage import DataStorage
+
+STAGES = ('PREPARATION', 'FIRE_MAKING', 'COOKING_RICE')
+
+
+def _data(stove, rating=4):
+    stages = {}
+    for i, name in enumerate(STAGES):
+        stages[name] = {
+            'stage': name, 'startTime': 1700000000000 + i, 'endTime': 1700000600000 + i, 'selfRating': rating,
+            'notes': f'{stove}{name}', 'isCompleted': i < 2, 'selectedTags': ['火候'] if i else [],
+            'mediaItems': [{'path': f'/storage/emulated/0/DCIM/{name}_{j}.jpg', 'type': 'PHOTO',
+                            'timestamp': 1700000000000 + j} for j in range(i)],
+        }
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': stove,
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'teamDivision': {'groupLeader': '张三', 'groupFire': '王五'},
+        'processRecord': {'startTime': 1700000000000, 'currentStage': 'COOKING_RICE', 'overallNotes': stove,
+                          'stages': stages},
+        'summaryData': {'answer1': '一', 'answer2': stove},
+        'exportTime': 1700000900000,
+    }
+
+
+def _team_id(stove):
+    return f'实验学校_7_3班_{stove}'
+
+
+def _snapshot(db_path):
+    """数据库中与行 id、写入时间无关的全部内容"""
+    db = DatabaseManager(db_path)
+    storage = DataStorage(Config.DATA_DIR, Config.MEDIA_DIR)
+    storage.db_manager = db
+    try:
+        teams = {}
+        for team in db.get_all_teams():
+            data = storage.get_student_data(team.team_id)
+            data.pop('exportTime')
+            teams[team.team_id] = data
+        tables = {
+            'media': "SELECT t.team_id, s.stage_name, m.file_path, m.file_type, m.timestamp, m.media_id, m.stored_path "
+                     "FROM media_items m JOIN stage_records s ON m.stage_record_id = s.id "
+                     "JOIN process_records t ON s.process_record_id = t.id",
+            'hashes': "SELECT team_id, content_hash FROM submission_hashes",
+            'menus': "SELECT team_id, soup, dishes FROM menus",
+            'evaluations': "SELECT team_id, evaluation_data FROM teacher_evaluations_v2",
+        }
+        return teams, {name: sorted(map(tuple, db._fetch_rows(sql))) for name, sql in tables.items()}
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def live(server, client):
+    """通过接口写入数据的数据库：多个团队、重复提交、上传的媒体文件、菜单和教师评价"""
+    for stove in ('1号炉', '2号炉', '3号炉'):
+        assert client.post('/api/submit', json=_data(stove, rating=3)).status_code == 200
+    # 重复提交：以最后一次为准
+    assert client.post('/api/submit', json=_data('2号炉', rating=5)).status_code == 200
+    
+    response = client.post(f"/api/student/{_team_id('1号炉')}/media/upload", data={
+        'file': (io.BytesIO(b'jpeg'), 'COOKING_RICE_1.jpg'),
+        'original_path': '/storage/emulated/0/DCIM/COOKING_RICE_1.jpg',
+        'type': 'PHOTO',
+    })
+    assert response.status_code == 200
+    assert client.post('/api/submit_menu', json={
+        'teamInfo': _data('1号炉')['teamInfo'], 'menuData': {'soup': '番茄蛋汤', 'dishes': ['炒青菜']},
+    }).status_code == 200
+    assert client.post('/api/evaluation', json={
+        'teamId': _team_id('3号炉'), 'evaluations': {'PREPARATION': {'rating': 5}},
+    }).status_code == 200
+    
+    server.storage.db_manager.close()
+    return _snapshot(Config.DATABASE_PATH)
+
+
+@pytest.mark.parametrize('workers', [1, 2], ids=['serial', 'pool'])
+def test_rebuild_matches_live_database(live, monkeypatch, workers):
+    teams, tables = live
+    assert len(teams) == 3
+    assert any(stored_path for *_, stored_path in tables['media'])
+    assert tables['menus'] and tables['evaluations']
+    
+    monkeypatch.setattr(rebuild, '_MIN_PARALLEL_TEAMS', 1)
+    result = rebuild.rebuild_database(workers=workers)
+    assert result['failed'] == []
+    assert (result['teams'], result['stages']) == (3, 9)
+    assert result['media'] == len(tables['media'])
+    assert result['copied']['teacher_evaluations_v2'] == 1
+    assert result['copied']['menus'] == 1
+    assert os.path.exists(result['backup'])
+    assert not os.path.exists(Config.DATABASE_PATH + '.rebuild')
+    
+    assert _snapshot(Config.DATABASE_PATH) == live
+    assert _snapshot(result['backup']) == live
+
+
+def test_rebuild_reports_unreadable_archives(live):
+    broken_dir = os.path.join(Config.DATA_DIR, 'broken')
+    os.makedirs(broken_dir)
+    os.makedirs(os.path.join(Config.DATA_DIR, 'empty'))
+    with open(os.path.join(broken_dir, 'latest.json'), 'w', encoding='utf-8') as f:
+        f.write('{"teamInfo": ')
+    
+    result = rebuild.rebuild_database(workers=1)
+    assert sorted(item['dir'] for item in result['failed']) == ['broken', 'empty']
+    assert result['teams'] == 3
+    assert _snapshot(Config.DATABASE_PATH) == live
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试可续传的媒体文件上传（resumable_upload.ResumableUploads）
+Upload-Offset 与服务器已接收的字节数不一致时返回 409 和正确的 offset，客户端据此从断点继续
+
+用法:
+    python -m pytest -q test_resumable_upload.py
+"""
+
+import hashlib
+import io
+import os
+import sys
+
+import pytest
+
+from media_store import MediaStore
+from resumable_upload import ResumableUploads, UploadError
+
+STUDENT_ID = '实验学校_7_3班_5号炉'
+DATA = bytes(range(256)) * 40  # 10240 字节
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path / 'blobs'), str(tmp_path / 'media'))
+
+
+@pytest.fixture
+def uploads(tmp_path, store):
+    return ResumableUploads(str(tmp_path / 'uploads'), store)
+
+
+def _create(uploads, size=len(DATA), timestamp=1700000000000):
+    status, _ = uploads.create(STUDENT_ID, '/storage/emulated/0/DCIM/video.mp4', 'video.mp4', 'VIDEO',
+                               timestamp, size)
+    return status['uploadId']
+
+
+def _append(uploads, upload_id, offset, data):
+    return uploads.append(STUDENT_ID, upload_id, offset, io.BytesIO(data), len(data))
+
+
+def test_chunked_upload_and_finalize(uploads, store):
+    upload_id = _create(uploads)
+    assert _append(uploads, upload_id, 0, DATA[:4000]) == 4000
+    assert _append(uploads, upload_id, 4000, DATA[4000:]) == len(DATA)
+    
+    result = uploads.finalize(STUDENT_ID, upload_id, hashlib.sha256(DATA).hexdigest())
+    assert result['sha256'] == hashlib.sha256(DATA).hexdigest()
+    with open(result['path'], 'rb') as f:
+        assert f.read() == DATA
+    assert result['path'] == os.path.join(store.media_dir, STUDENT_ID, 'video.mp4')
+    # 上传完成后会话被删除
+    with pytest.raises(UploadError) as excinfo:
+        uploads.status(STUDENT_ID, upload_id)
+    assert excinfo.value.status == 404
+
+
+def test_offset_mismatch_returns_409_with_current_offset(uploads):
+    """重复发送或跳过数据时拒绝写入，并告诉客户端应从哪里继续"""
+    upload_id = _create(uploads)
+    _append(uploads, upload_id, 0, DATA[:1000])
+    
+    for wrong_offset in (0, 500, 2000):
+        with pytest.raises(UploadError) as excinfo:
+            _append(uploads, upload_id, wrong_offset, DATA[wrong_offset:wrong_offset + 100])
+        assert excinfo.value.status == 409
+        assert excinfo.value.offset == 1000
+    assert uploads.status(STUDENT_ID, upload_id)['offset'] == 1000
+
+
+def test_resume_after_restart(tmp_path, uploads, store):
+    """服务器重启后再次创建同一个文件的上传，得到同一个 uploadId 和已接收的字节数"""
+    upload_id = _create(uploads)
+    _append(uploads, upload_id, 0, DATA[:3000])
+    
+    restarted = ResumableUploads(str(tmp_path / 'uploads'), store)
+    status, created = restarted.create(STUDENT_ID, '/storage/emulated/0/DCIM/video.mp4', 'video.mp4', 'VIDEO',
+                                       1700000000000, len(DATA))
+    assert not created
+    assert status['uploadId'] == upload_id
+    assert status['offset'] == 3000
+    
+    _append(restarted, upload_id, 3000, DATA[3000:])
+    result = restarted.finalize(STUDENT_ID, upload_id, hashlib.sha256(DATA).hexdigest())
+    assert result['size'] == len(DATA)
+
+
+def test_finalize_incomplete_upload(uploads):
+    upload_id = _create(uploads)
+    _append(uploads, upload_id, 0, DATA[:100])
+    
+    with pytest.raises(UploadError) as excinfo:
+        uploads.finalize(STUDENT_ID, upload_id)
+    assert excinfo.value.status == 409
+    assert excinfo.value.offset == 100
+
+
+def test_checksum_mismatch_discards_upload(uploads):
+    upload_id = _create(uploads)
+    _append(uploads, upload_id, 0, DATA)
+    
+    with pytest.raises(UploadError) as excinfo:
+        uploads.finalize(STUDENT_ID, upload_id, '0' * 64)
+    assert excinfo.value.status == 422
+    assert excinfo.value.offset == 0
+    # 重新创建后从头上传
+    assert _create(uploads) == upload_id
+    assert uploads.status(STUDENT_ID, upload_id)['offset'] == 0
+
+
+def test_data_beyond_declared_size(uploads):
+    upload_id = _create(uploads, size=100)
+    with pytest.raises(UploadError) as excinfo:
+        _append(uploads, upload_id, 0, DATA[:200])
+    assert excinfo.value.status == 413
+    with pytest.raises(UploadError) as excinfo:
+        uploads.append(STUDENT_ID, upload_id, 0, io.BytesIO(DATA[:200]), None)
+    assert excinfo.value.status == 413
+
+
+def test_other_team_cannot_access_upload(uploads):
+    upload_id = _create(uploads)
+    with pytest.raises(UploadError) as excinfo:
+        uploads.append('其他学校_7_1班_1号炉', upload_id, 0, io.BytesIO(DATA), len(DATA))
+    assert excinfo.value.status == 404
+    with pytest.raises(UploadError) as excinfo:
+        uploads.status(STUDENT_ID, '../' + upload_id)
+    assert excinfo.value.status == 404
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
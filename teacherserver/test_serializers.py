@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按字段映射表生成的序列化器（serializers.ModelSerializer）
+to_dict / to_android / insert_params / 字典加载 / 数据库行加载都由同一张表生成，编解码器只在对应方向生效
+
+用法:
+    python -m pytest -q test_serializers.py
+"""
+
+import sys
+
+import pytest
+
+import json_codec
+from models import StageRecord, Menu, TeamDivision
+from serializers import FieldSpec as F, ModelSerializer
+
+FIELDS = (
+    F('id'),
+    F('name', 'name', ''),
+    F('tags', 'tags', [], db_encoder=json_codec.dumps, db_decoder=json_codec.loads, row_decoder=json_codec.loads),
+    F('rating', 'rating', 0, android_encoder=lambda value: value * 2, android_decoder=lambda value: value // 2),
+    F('secret'),  # 不出现在Android格式中
+    F('created_at'),
+)
+
+
+class _Record:
+    __slots__ = ('id', 'name', 'tags', 'rating', 'secret', 'created_at', 'updated_at', 'schema_version',
+                 'extra_data')
+
+
+@pytest.fixture
+def serializer():
+    return ModelSerializer('_Record', 'records', FIELDS)
+
+
+def _record(**values):
+    record = _Record()
+    for column, value in {'id': 7, 'name': '甲', 'tags': ['a', 'b'], 'rating': 3, 'secret': 's',
+                          'created_at': 1700000000000, **values}.items():
+        setattr(record, column, value)
+    return record
+
+
+def test_columns_and_sql(serializer):
+    assert serializer.columns == ('id', 'name', 'tags', 'rating', 'secret', 'created_at')
+    assert serializer.android_keys == ('name', 'tags', 'rating')
+    assert serializer.insert_sql == \
+        "INSERT INTO records (name, tags, rating, secret, created_at) VALUES (?, ?, ?, ?, ?)"
+    assert serializer.insert_with_id_sql.startswith("INSERT INTO records (id, name,")
+
+
+def test_outputs_apply_encoders_per_direction(serializer):
+    record = _record()
+    assert serializer.to_dict(record) == {'id': 7, 'name': '甲', 'tags': '["a","b"]', 'rating': 3,
+                                          'secret': 's', 'created_at': 1700000000000}
+    assert serializer.to_android(record) == {'name': '甲', 'tags': ['a', 'b'], 'rating': 6}
+    assert serializer.insert_params(record) == ('甲', '["a","b"]', 3, 's', 1700000000000)
+
+
+def test_load_android_uses_defaults_and_decoders(serializer):
+    record = _record()
+    serializer.load_android(record, {'rating': 8})
+    assert (record.name, record.tags, record.rating) == ('', [], 4)
+    # 不在Android格式中的列不受影响
+    assert record.secret == 's'
+
+
+def test_load_db_skips_base_columns(serializer):
+    record = _record()
+    serializer.load_db(record, {'id': 99, 'name': '乙', 'tags': '["x"]', 'created_at': 1})
+    assert (record.name, record.tags, record.rating, record.secret) == ('乙', ['x'], 0, None)
+    assert record.id == 7 and record.created_at == 1700000000000
+
+
+def test_load_row(serializer):
+    record = _Record()
+    serializer.load_row(record, (1, '丙', '["y"]', 5, None, 1700000000000))
+    assert (record.id, record.name, record.tags, record.rating) == (1, '丙', ['y'], 5)
+    # 表中没有的公共列
+    assert record.updated_at == 1700000000000
+    assert record.schema_version == 1
+    assert record.extra_data is None
+    with pytest.raises(ValueError):
+        serializer.load_row(record, (1, '丙'))
+
+
+def test_encode_db(serializer):
+    assert serializer.encode_db({'tags': ['z'], 'rating': 2}) == {'tags': '["z"]', 'rating': 2}
+
+
+def test_stage_record_round_trip():
+    android = {'stage': 'COOKING_RICE', 'startTime': 1700000000000, 'endTime': None, 'selfRating': 5,
+               'notes': '香', 'problemNotes': '', 'isCompleted': True, 'selectedTags': ['火候']}
+    stage = StageRecord(android)
+    assert stage.to_android_dict() == android
+    row = stage.to_dict()
+    assert row['is_completed'] == 1
+    assert row['selected_tags'] == '["火候"]'
+    # 数据库格式的字典走 load_db
+    assert StageRecord(row).to_android_dict() == android
+
+
+def test_empty_lists_are_stored_as_json():
+    assert StageRecord({'stage': 'PREPARATION'}).to_dict()['selected_tags'] == '[]'
+    menu = Menu({'menuData': {'soup': '汤', 'dishes': ['菜']}})
+    assert menu.to_dict()['dishes'] == '["菜"]'
+    assert Menu(menu.to_dict()).dishes == ['菜']
+
+
+def test_team_division_android_keys():
+    division = TeamDivision({'teamDivision': {'groupLeader': '张三', 'groupFire': '王五'}})
+    android = division.to_android_dict()
+    assert android['groupLeader'] == '张三'
+    assert android['groupFire'] == '王五'
+    assert android['groupCooking'] == ''
+    # 数据库格式
+    assert TeamDivision(division.to_dict()).to_android_dict() == android
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 /api/submit 的流式解析（stream_parser.parse_submission_stream）
+流式解析的内容哈希、校验错误和归档数据必须与一次性解析（parse_pool.parse_payload）完全一致，
+否则同一份提交会因为请求体大小或 STREAM_PARSE 配置不同而被当成不同的内容
+
+用法:
+    python -m pytest -q test_stream_parser.py
+"""
+
+import io
+import json
+import sys
+import zlib
+
+import pytest
+
+from parse_pool import parse_payload
+from stream_parser import PayloadTooLarge, StreamParseError, parse_submission_stream
+from validation import submission_hash
+
+
+def _payload(notes='顺利', rating=4):
+    stages = {}
+    for i, name in enumerate(('PREPARATION', 'FIRE_MAKING', 'COOKING_RICE')):
+        stages[name] = {
+            'stage': name, 'startTime': 1700000000000 + i, 'endTime': 1700000600000 + i,
+            'selfRating': rating, 'notes': notes, 'problemNotes': '', 'isCompleted': True,
+            'selectedTags': ['火候', '"引号"\\'],
+            'mediaItems': [{'path': f'/storage/emulated/0/DCIM/{name}_{j}.jpg', 'type': 'PHOTO',
+                            'timestamp': 1700000000000 + j} for j in range(2)],
+        }
+    return {
+        'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'teamDivision': {'groupLeader': '张三', 'groupCooking': '李四', 'groupSoupRice': '',
+                         'groupFire': '', 'groupHealth': ''},
+        'processRecord': {'startTime': 1700000000000, 'endTime': None, 'currentStage': 'COOKING_RICE',
+                          'overallNotes': '', 'stages': stages},
+        'summaryData': {'answer1': '1', 'answer2': '2', 'answer3': '3'},
+        'exportTime': 1700000000000,
+    }
+
+
+def _stream(raw, chunk_size=7):
+    return parse_submission_stream(io.BytesIO(raw), chunk_size=chunk_size)
+
+
+def _assert_same(raw, chunk_size=7):
+    streamed = _stream(raw, chunk_size)
+    buffered = parse_payload(raw)
+    assert streamed.error == buffered.error
+    assert streamed.content_hash == buffered.content_hash
+    assert streamed.keys == buffered.keys
+    assert sorted(map(str, streamed.submission.errors)) == sorted(map(str, buffered.submission.errors))
+    assert streamed.submission.student_id == buffered.submission.student_id
+    assert [stage.stage_name for stage in streamed.submission.stages] == \
+        [stage.stage_name for stage in buffered.submission.stages]
+    archived = zlib.decompress(streamed.archive_payload) if streamed.archive_payload else streamed.raw_json
+    assert archived == raw
+    return streamed
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64 * 1024])
+@pytest.mark.parametrize('dumps', [
+    lambda data: json.dumps(data, ensure_ascii=False, indent=1),
+    lambda data: json.dumps(data, separators=(',', ':')),
+])
+def test_hash_matches_submission_hash(chunk_size, dumps):
+    """不同的读取块大小和JSON排版得到与 submission_hash 相同的内容哈希"""
+    data = _payload()
+    raw = dumps(data).encode()
+    streamed = _assert_same(raw, chunk_size)
+    
+    assert not streamed.submission.errors
+    assert streamed.content_hash == submission_hash(json.loads(raw))
+
+
+def test_hash_ignores_export_time():
+    data = _payload()
+    first = _stream(json.dumps(data).encode())
+    data['exportTime'] += 1000
+    second = _stream(json.dumps(data).encode())
+    
+    assert first.content_hash == second.content_hash
+
+
+def test_stages_as_list_and_validation_errors():
+    """阶段以数组形式提交、字段校验失败时的结果与一次性解析一致"""
+    data = _payload()
+    data['processRecord']['stages'] = list(data['processRecord']['stages'].values())
+    _assert_same(json.dumps(data, ensure_ascii=False).encode())
+    
+    data = _payload(rating='bad')
+    streamed = _assert_same(json.dumps(data, ensure_ascii=False).encode())
+    assert streamed.submission.errors
+    assert streamed.content_hash is None
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda raw: raw.replace(b'{"teamInfo"', b'{"summaryData":{"answer1":"old"},"teamInfo"', 1),
+    lambda raw: raw.replace(b'"stages":{', b'"stages":{"FIRE_MAKING":{"stage":"FIRE_MAKING","selfRating":1},', 1),
+    lambda raw: raw.replace(b'"currentStage"', b'"currentStage":"PREPARATION","currentStage"', 1),
+])
+def test_duplicate_keys_match_buffered_parse(mutate):
+    """重复的键与一次性解析一样以最后一个值为准"""
+    raw = mutate(json.dumps(_payload(), ensure_ascii=False, separators=(',', ':')).encode())
+    streamed = _assert_same(raw)
+    
+    assert streamed.content_hash == submission_hash(json.loads(raw))
+
+
+def test_missing_team_info():
+    data = _payload()
+    del data['teamInfo']
+    assert _stream(json.dumps(data).encode()).error == parse_payload(json.dumps(data).encode()).error
+    assert _stream(b'  ').error == '未收到数据'
+
+
+@pytest.mark.parametrize('raw', [b'{"teamInfo": {', b'{"a":1,}', b'{"a" 1}', b'{"a":1} x', b'{"a":tru}',
+                                 b'{"a":[1,2}'])
+def test_malformed_json_raises(raw):
+    with pytest.raises(StreamParseError):
+        _stream(raw, chunk_size=2)
+
+
+def test_size_limit():
+    with pytest.raises(PayloadTooLarge):
+        parse_submission_stream(io.BytesIO(b'{"a":"' + b'x' * 1000 + b'"}'), max_size=500, chunk_size=64)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
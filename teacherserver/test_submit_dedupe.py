@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试重复提交检测（validation.submission_hash 和 /api/submit）
+内容（忽略 exportTime）与团队上次成功保存的相同时直接确认，不归档、不写数据库，并计入去重率
+
+用法:
+    python -m pytest -q test_submit_dedupe.py
+"""
+
+import copy
+import sys
+
+import pytest
+
+from config import Config
+from metrics import metrics
+from validation import submission_hash
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'PREPARATION', 'stages': {
+        'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': 4,
+                        'mediaItems': [{'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'PHOTO',
+                                        'timestamp': 1700000000001}]},
+    }},
+    'exportTime': 1700000900000,
+}
+
+
+def _data(export_time=1700000900000, rating=4):
+    data = copy.deepcopy(DATA)
+    data['exportTime'] = export_time
+    data['processRecord']['stages']['PREPARATION']['selfRating'] = rating
+    return data
+
+
+def _counters(*names):
+    return {name: metrics.get(name) for name in names}
+
+
+def test_hash_ignores_export_time_and_key_order():
+    reordered = {key: DATA[key] for key in reversed(list(DATA))}
+    assert submission_hash(_data(1)) == submission_hash(_data(2)) == submission_hash(reordered)
+    assert submission_hash(_data(rating=5)) != submission_hash(DATA)
+    assert submission_hash({k: v for k, v in DATA.items() if k != 'exportTime'}) == submission_hash(DATA)
+
+
+def test_unchanged_resubmission_is_skipped(server, client, monkeypatch):
+    assert client.post('/api/submit', json=_data()).status_code == 200
+    db = server.storage.db_manager
+    saved_hash = db.get_submission_hash(TEAM_ID)
+    assert saved_hash == submission_hash(DATA)
+    versions = server.storage.get_submission_versions(TEAM_ID)
+    assert len(versions) == 1
+    
+    def fail(*args, **kwargs):
+        raise AssertionError('内容未变化时不应写入')
+    
+    monkeypatch.setattr(server.storage, 'save_submission', fail)
+    monkeypatch.setattr(server.storage, 'archive_submission', fail)
+    before = _counters('submit.accepted', 'submit.unchanged', 'submit.saved')
+    response = client.post('/api/submit', json=_data(export_time=1700009999999))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['unchanged'] is True
+    assert body['studentId'] == TEAM_ID
+    # 仍返回媒体文件的上传地址（客户端重试时需要）
+    assert body['media'][0]['path'] == '/storage/emulated/0/DCIM/a.jpg'
+    
+    after = _counters('submit.accepted', 'submit.unchanged', 'submit.saved')
+    assert after['submit.accepted'] == before['submit.accepted'] + 1
+    assert after['submit.unchanged'] == before['submit.unchanged'] + 1
+    assert after['submit.saved'] == before['submit.saved']
+    assert 0 < metrics.snapshot()['gauges']['submitDedupeRatio'] <= 1
+    assert server.storage.get_submission_versions(TEAM_ID) == versions
+
+
+def test_changed_resubmission_is_saved(server, client):
+    assert client.post('/api/submit', json=_data()).status_code == 200
+    response = client.post('/api/submit', json=_data(rating=5))
+    assert response.status_code == 200
+    assert 'unchanged' not in response.get_json()
+    db = server.storage.db_manager
+    assert db.get_submission_hash(TEAM_ID) == submission_hash(_data(rating=5))
+    _, stages = db.get_process_record(TEAM_ID)
+    assert stages[0].self_rating == 5
+    assert len(server.storage.get_submission_versions(TEAM_ID)) == 2
+
+
+def test_invalid_submission_does_not_record_hash(server, client):
+    data = _data()
+    data['processRecord']['stages']['PREPARATION']['selfRating'] = 'good'
+    assert client.post('/api/submit', json=data).status_code == 400
+    assert server.storage.db_manager.get_submission_hash(TEAM_ID) is None
+
+
+def test_dedupe_can_be_disabled(server, client, monkeypatch):
+    monkeypatch.setattr(Config, 'SUBMIT_DEDUPE', False)
+    for _ in range(2):
+        response = client.post('/api/submit', json=_data())
+        assert response.status_code == 200
+        assert 'unchanged' not in response.get_json()
+    assert len(server.storage.get_submission_versions(TEAM_ID)) == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按团队分段加锁（team_locks.TeamLocks）
+不同团队并行，同一团队排队；lock_many 按分段编号加锁，和嵌套的 save_submission 一起使用时不会互相等待成环
+
+用法:
+    python -m pytest -q test_team_locks.py
+"""
+
+import sys
+import threading
+
+import pytest
+
+from config import Config
+from db_init import init_database
+from metrics import metrics
+from storage import DataStorage
+from team_locks import TeamLocks, team_locks
+from validation import validate_submission
+
+TEAM_A = '实验学校_7_3班_1号炉'
+WAIT = 5  # 等待其他线程的上限（秒），超时说明出现了死锁
+
+
+def _other_team(locks, team_id):
+    """和 team_id 落在不同分段的团队"""
+    for n in range(2, 100):
+        other = f'实验学校_7_3班_{n}号炉'
+        if locks._index(other) != locks._index(team_id):
+            return other
+    raise AssertionError('找不到不同分段的团队')
+
+
+def _hold(locks, team_id):
+    """在后台线程中持有团队锁，返回 (已加锁事件, 释放事件, 线程)"""
+    locked = threading.Event()
+    release = threading.Event()
+    
+    def run():
+        with locks.lock(team_id):
+            locked.set()
+            release.wait(WAIT)
+    
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert locked.wait(WAIT)
+    return locked, release, thread
+
+
+def _try_lock(locks, team_id):
+    """在后台线程中加锁，返回 (已加锁事件, 线程)"""
+    entered = threading.Event()
+    
+    def run():
+        with locks.lock(team_id):
+            entered.set()
+    
+    thread = threading.Thread(target=run)
+    thread.start()
+    return entered, thread
+
+
+def test_different_teams_run_in_parallel():
+    locks = TeamLocks(64)
+    team_b = _other_team(locks, TEAM_A)
+    _, release, holder = _hold(locks, TEAM_A)
+    try:
+        # A 的锁未释放时，B 也能立即加锁
+        entered, thread = _try_lock(locks, team_b)
+        assert entered.wait(WAIT)
+        thread.join(WAIT)
+    finally:
+        release.set()
+        holder.join(WAIT)
+
+
+def test_same_team_is_serialized():
+    locks = TeamLocks(64)
+    _, release, holder = _hold(locks, TEAM_A)
+    entered, thread = _try_lock(locks, TEAM_A)
+    # 持有者释放之前，同一团队的第二个写操作一直等待
+    assert not entered.wait(0.2)
+    release.set()
+    assert entered.wait(WAIT)
+    thread.join(WAIT)
+    holder.join(WAIT)
+
+
+def test_lock_is_reentrant_and_counted():
+    locks = TeamLocks(64)
+    acquired = metrics.get('teamLock.acquired')
+    contended = metrics.get('teamLock.contended')
+    with locks.lock(TEAM_A):
+        with locks.lock_many([TEAM_A, _other_team(locks, TEAM_A)]):
+            pass
+    assert metrics.get('teamLock.acquired') == acquired + 3
+    assert metrics.get('teamLock.contended') == contended
+
+
+def test_contention_updates_metrics():
+    locks = TeamLocks(64)
+    contended = metrics.get('teamLock.contended')
+    wait_ms = metrics.get('teamLock.waitMs')
+    _, release, holder = _hold(locks, TEAM_A)
+    entered, thread = _try_lock(locks, TEAM_A)
+    assert not entered.wait(0.1)
+    release.set()
+    thread.join(WAIT)
+    holder.join(WAIT)
+    assert metrics.get('teamLock.contended') == contended + 1
+    assert metrics.get('teamLock.waitMs') >= wait_ms + 50
+    assert metrics.snapshot()['gauges']['teamLockContention'] > 0
+
+
+def test_lock_many_order_does_not_depend_on_arguments(monkeypatch):
+    locks = TeamLocks(64)
+    team_b = _other_team(locks, TEAM_A)
+    order = []
+    acquire = locks._acquire
+    
+    def recording_acquire(index):
+        order.append(index)
+        acquire(index)
+    
+    monkeypatch.setattr(locks, '_acquire', recording_acquire)
+    for team_ids in ([TEAM_A, team_b], [team_b, TEAM_A], [team_b, TEAM_A, team_b]):
+        order.clear()
+        with locks.lock_many(team_ids):
+            pass
+        # 不论参数顺序如何，都按分段编号从小到大加锁，每段只加一次
+        assert order == sorted({locks._index(TEAM_A), locks._index(team_b)})
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE_PATH', str(tmp_path / 'campcooking.db'))
+    monkeypatch.setattr(Config, 'EVALUATION_DIR', str(tmp_path / 'evaluations'))
+    monkeypatch.setattr(Config, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    assert init_database(Config.DATABASE_PATH)
+    storage = DataStorage(str(tmp_path / 'students'), str(tmp_path / 'media'))
+    yield storage
+    storage.db_manager.close()
+
+
+def _submission(team_id, rating):
+    school, grade, class_name, stove = team_id.split('_')
+    return validate_submission({
+        'teamInfo': {'school': school, 'grade': grade, 'className': class_name, 'stoveNumber': stove,
+                     'memberCount': 5, 'memberNames': '张三,李四'},
+        'processRecord': {'startTime': 1700000000000, 'currentStage': 'PREPARATION', 'stages': {
+            'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': rating,
+                            'isCompleted': True},
+        }},
+        'summaryData': {'answer1': str(rating)},
+    })
+
+
+def test_batch_and_single_saves_do_not_deadlock(storage):
+    team_b = _other_team(team_locks, TEAM_A)
+    errors = []
+    
+    def run(save):
+        try:
+            for rating in range(1, 6):
+                save(rating)
+        except Exception as e:
+            errors.append(e)
+    
+    # 批量提交按不同顺序给出团队，内部嵌套调用 save_submission（再次获取同一团队锁）；
+    # 同时还有单个团队的提交
+    workers = [
+        lambda r: storage.save_submissions([(_submission(TEAM_A, r), None), (_submission(team_b, r), None)]),
+        lambda r: storage.save_submissions([(_submission(team_b, r), None), (_submission(TEAM_A, r), None)]),
+        lambda r: storage.save_submission(_submission(TEAM_A, r)),
+        lambda r: storage.save_submission(_submission(team_b, r)),
+    ]
+    threads = [threading.Thread(target=run, args=(save,), daemon=True) for save in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT)
+    assert not any(thread.is_alive() for thread in threads), '批量提交和单个提交互相等待'
+    assert not errors
+    
+    for team_id in (TEAM_A, team_b):
+        _, stages = storage.db_manager.get_process_record(team_id)
+        assert [stage.self_rating for stage in stages] == [5]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
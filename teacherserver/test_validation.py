@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试提交数据校验（validation.validate_submission）和 /api/submit 的 400 响应
+类型明确可转换的值（数字字符串、整数值的浮点数）自动规范化，其余类型错误带字段路径返回 400
+
+用法:
+    python -m pytest -q test_validation.py
+"""
+
+import copy
+import sys
+
+import pytest
+
+from validation import validate_submission
+
+TEAM_ID = '实验学校_7_3班_5号炉'
+DATA = {
+    'teamInfo': {'school': '实验学校', 'grade': '7', 'className': '3班', 'stoveNumber': '5号炉',
+                 'memberCount': 5, 'memberNames': '张三,李四'},
+    'teamDivision': {'groupLeader': '张三'},
+    'processRecord': {'startTime': 1700000000000, 'currentStage': 'FIRE_MAKING', 'stages': {
+        'PREPARATION': {'stage': 'PREPARATION', 'startTime': 1700000000000, 'selfRating': 4, 'isCompleted': True,
+                        'mediaItems': [{'path': '/storage/emulated/0/DCIM/a.jpg', 'type': 'PHOTO',
+                                        'timestamp': 1700000000001}]},
+        'FIRE_MAKING': {'stage': 'FIRE_MAKING', 'startTime': 1700000600000, 'selfRating': 3},
+    }},
+    'summaryData': {'answer1': '一'},
+    'exportTime': 1700000900000,
+}
+MEDIA_PATH = 'processRecord.stages.PREPARATION.mediaItems[0]'
+
+
+def _with_media(**values):
+    data = copy.deepcopy(DATA)
+    data['processRecord']['stages']['PREPARATION']['mediaItems'][0].update(values)
+    return data
+
+
+def _error_fields(data):
+    return [e.path for e in validate_submission(data).errors]
+
+
+def test_valid_submission_in_one_pass():
+    submission = validate_submission(DATA)
+    assert submission.is_valid
+    assert submission.student_id == TEAM_ID
+    assert submission.team.member_count == 5
+    assert submission.division.group_leader == '张三'
+    assert [stage.stage_name for stage in submission.stages] == ['PREPARATION', 'FIRE_MAKING']
+    assert submission.media_count == 1
+    assert submission.stages_media['PREPARATION'][0].file_path == '/storage/emulated/0/DCIM/a.jpg'
+    assert submission.summary.answer1 == '一'
+    assert submission.export_time == 1700000900000
+
+
+def test_unambiguous_values_are_coerced():
+    data = copy.deepcopy(DATA)
+    data['teamInfo']['memberCount'] = ' 6 '
+    data['processRecord']['stages']['FIRE_MAKING']['selfRating'] = 4.0
+    data['exportTime'] = '1700000900000'
+    submission = validate_submission(data)
+    assert submission.is_valid
+    assert submission.team.member_count == 6
+    assert submission.stages[1].self_rating == 4
+    assert submission.export_time == 1700000900000
+    
+    media = validate_submission(_with_media(timestamp=1700000000001.0)).stages_media['PREPARATION'][0]
+    assert media.to_android_dict()['timestamp'] == 1700000000001
+
+
+@pytest.mark.parametrize('value', [['PHOTO'], {'kind': 'PHOTO'}], ids=['list', 'dict'])
+def test_non_string_media_type_is_rejected(value):
+    assert _error_fields(_with_media(type=value)) == [f'{MEDIA_PATH}.type']
+
+
+@pytest.mark.parametrize('value', [1700000000001.5, 'yesterday', [1]], ids=['float', 'str', 'list'])
+def test_non_integer_timestamp_is_rejected(value):
+    assert _error_fields(_with_media(timestamp=value)) == [f'{MEDIA_PATH}.timestamp']
+
+
+def test_field_paths_and_structure_errors():
+    data = copy.deepcopy(DATA)
+    data['teamInfo']['memberCount'] = 'five'
+    data['processRecord']['stages']['FIRE_MAKING']['isCompleted'] = 'maybe'
+    data['processRecord']['stages']['PREPARATION']['mediaItems'].append({'type': 'PHOTO'})
+    data['exportTime'] = 1.5
+    assert _error_fields(data) == [
+        'teamInfo.memberCount',
+        'processRecord.stages.PREPARATION.mediaItems[1].path',
+        'processRecord.stages.FIRE_MAKING.isCompleted',
+        'exportTime',
+    ]
+    assert _error_fields([]) == ['$']
+    assert _error_fields({'processRecord': DATA['processRecord']}) == ['teamInfo']
+    assert _error_fields({'teamInfo': 'x'}) == ['teamInfo']
+    assert _error_fields({**DATA, 'processRecord': {'stages': 'x'}}) == ['processRecord.stages']
+
+
+@pytest.mark.parametrize('data, field', [
+    (_with_media(type=['PHOTO']), f'{MEDIA_PATH}.type'),
+    (_with_media(timestamp=1700000000001.5), f'{MEDIA_PATH}.timestamp'),
+])
+def test_submit_returns_400_with_field_errors(server, client, data, field):
+    response = client.post('/api/submit', json=data)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['status'] == 'error'
+    assert body['errors'] == [{'field': field, 'message': body['errors'][0]['message']}]
+    assert field in body['message']
+    # 校验失败不写数据库，但原始数据已归档
+    assert server.storage.db_manager.get_team(TEAM_ID) is None
+    assert server.storage.get_submission_versions(TEAM_ID)
+
+
+def test_submit_accepts_valid_data(server, client):
+    response = client.post('/api/submit', json=DATA)
+    assert response.status_code == 200
+    assert response.get_json()['studentId'] == TEAM_ID
+    assert server.storage.db_manager.get_team(TEAM_ID).member_count == 5
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
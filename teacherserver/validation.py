@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学生提交数据校验模块
+根据模型的字段映射表（FIELDS）在导入时生成校验/规范化函数，
+对提交的数据包只遍历一次，直接产出可入库的模型对象（团队、分工、过程、阶段、媒体、总结）
+以及精确到字段路径的错误列表
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from models import (
+    Team, TeamDivision, ProcessRecord, StageRecord, MediaItem, SummaryData, now_ms
+)
+import json_codec
+
+
+class FieldError(NamedTuple):
+    """字段级错误"""
+    path: str  # 字段路径，例如 processRecord.stages.FIRE_MAKING.selfRating
+    message: str
+    
+    def to_dict(self) -> Dict[str, str]:
+        return {'field': self.path, 'message': self.message}
+    
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}"
+
+
+# ==================== 类型转换（类型不符时才调用） ====================
+def _to_int(value: Any, path: str, errors: List[FieldError], default: Any) -> Any:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    errors.append(FieldError(path, f"应为整数，实际为 {value!r}"))
+    return default
+
+
+def _to_str(value: Any, path: str, errors: List[FieldError], default: Any) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    errors.append(FieldError(path, f"应为字符串，实际为 {type(value).__name__}"))
+    return default
+
+
+def _to_bool(value: Any, path: str, errors: List[FieldError], default: Any) -> Any:
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    errors.append(FieldError(path, f"应为布尔值，实际为 {value!r}"))
+    return default
+
+
+def _to_list(value: Any, path: str, errors: List[FieldError], default: Any) -> Any:
+    errors.append(FieldError(path, f"应为列表，实际为 {type(value).__name__}"))
+    return default
+
+
+_CONVERTERS: Dict[type, Callable] = {
+    int: _to_int,
+    str: _to_str,
+    bool: _to_bool,
+    list: _to_list,
+}
+
+
+class ModelValidator:
+    """单个模型的预编译校验器：Android格式字典 -> 模型对象（或部分字段）"""
+    
+    def __init__(self, model_cls: type):
+        self.model_cls = model_cls
+        self.android_keys = frozenset(model_cls.serializer.android_keys)
+        namespace: Dict[str, Any] = {'_new': object.__new__, '_cls': model_cls}
+        
+        # 完整校验：所有列都赋值（缺省值、当前时间）
+        lines = ["def validate(d, path, errors, now):", "    o = _new(_cls)"]
+        # 部分校验：只返回请求中出现的字段（列名 -> 值），用于 PATCH
+        partial = ["def validate_partial(d, path, errors):", "    r = {}"]
+        for i, f in enumerate(model_cls.FIELDS):
+            if f.column in ('created_at', 'updated_at'):
+                lines.append(f"    o.{f.column} = now")
+                continue
+            if not f.android_key:
+                lines.append(f"    o.{f.column} = {f.default!r}")
+                continue
+            lines.append(f"    v = d.get({f.android_key!r})")
+            lines.extend(self._convert_lines(namespace, i, f, f"o.{f.column}", '    '))
+            partial.append(f"    if {f.android_key!r} in d:")
+            partial.append(f"        v = d[{f.android_key!r}]")
+            partial.extend(self._convert_lines(namespace, i, f, f"r[{f.column!r}]", '        '))
+        # 没有对应列的公共属性（如 media_items 表没有 updated_at）
+        if 'updated_at' not in model_cls.COLUMNS:
+            lines.append("    o.updated_at = now")
+        if 'media_items' in model_cls.__slots__:
+            lines.append("    o.media_items = []")
+        lines.append("    return o")
+        partial.append("    return r")
+        
+        code = compile('\n'.join(lines + [''] + partial), f"<validator {model_cls.__name__}>", 'exec')
+        exec(code, namespace)
+        self.validate: Callable[[Dict[str, Any], str, List[FieldError], int], Any] = namespace['validate']
+        self.validate_partial: Callable[[Dict[str, Any], str, List[FieldError]], Dict[str, Any]] = namespace['validate_partial']
+    
+    @staticmethod
+    def _convert_lines(namespace: Dict[str, Any], i: int, f, target: str, indent: str) -> List[str]:
+        """生成把变量 v 转换为字段类型并赋值给 target 的代码"""
+        kind = f.kind or (type(f.default) if f.default is not None else None)
+        lines = [f"{indent}if v is None:", f"{indent}    v = {f.default!r}"]
+        if kind in _CONVERTERS:
+            namespace[f"_c{i}"] = _CONVERTERS[kind]
+            namespace[f"_t{i}"] = kind
+            lines.append(f"{indent}elif type(v) is not _t{i}:")
+            lines.append(f"{indent}    v = _c{i}(v, path + {'.' + f.android_key!r}, errors, {f.default!r})")
+        if f.android_decoder:
+            namespace[f"_d{i}"] = f.android_decoder
+            lines.append(f"{indent}{target} = _d{i}(v)")
+        else:
+            lines.append(f"{indent}{target} = v")
+        return lines
+    
+    def unknown_keys(self, data: Dict[str, Any], allowed: frozenset = frozenset()) -> List[str]:
+        """请求中不属于该模型的键"""
+        return [key for key in data if key not in self.android_keys and key not in allowed]
+
+
+_TEAM = ModelValidator(Team)
+_DIVISION = ModelValidator(TeamDivision)
+_PROCESS = ModelValidator(ProcessRecord)
+_STAGE = ModelValidator(StageRecord)
+_MEDIA = ModelValidator(MediaItem)
+_SUMMARY = ModelValidator(SummaryData)
+
+
+class ValidatedSubmission:
+    """校验后的提交数据（可直接入库的模型对象）"""
+    
+    __slots__ = ('student_id', 'team', 'division', 'process', 'stages', 'stages_media',
+                 'summary', 'export_time', 'media_count', 'errors')
+    
+    def __init__(self):
+        self.student_id: str = ''
+        self.team: Optional[Team] = None
+        self.division: Optional[TeamDivision] = None
+        self.process: Optional[ProcessRecord] = None
+        self.stages: List[StageRecord] = []
+        self.stages_media: Dict[str, List[MediaItem]] = {}  # 阶段名 -> 媒体文件
+        self.summary: Optional[SummaryData] = None
+        self.export_time: int = 0
+        self.media_count: int = 0
+        self.errors: List[FieldError] = []
+    
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+
+class SubmissionValidator:
+    """
+    提交数据校验器（逐段调用；完整数据包用 validate_submission）
+    各段方法互相独立，流式解析时可以在读到某一段后立即调用
+    """
+    
+    def __init__(self):
+        self.result = ValidatedSubmission()
+        self.now = now_ms()
+    
+    def _expect_dict(self, value: Any, path: str) -> bool:
+        if isinstance(value, dict):
+            return True
+        self.result.errors.append(FieldError(path, f"应为对象，实际为 {type(value).__name__}"))
+        return False
+    
+    def team_info(self, data: Any):
+        if not self._expect_dict(data, 'teamInfo'):
+            return
+        team = _TEAM.validate(data, 'teamInfo', self.result.errors, self.now)
+        team.team_id = f"{team.school}_{team.grade}_{team.class_name}_{team.stove_number}"
+        self.result.team = team
+        self.result.student_id = team.team_id
+    
+    def team_division(self, data: Any):
+        if not data or not self._expect_dict(data, 'teamDivision'):
+            return
+        self.result.division = _DIVISION.validate(data, 'teamDivision', self.result.errors, self.now)
+    
+    def process_record(self, data: Any, with_stages: bool = True):
+        """过程记录；with_stages=False 时阶段由调用方逐个传给 stage()"""
+        if not data or not self._expect_dict(data, 'processRecord'):
+            return
+        self.result.process = _PROCESS.validate(data, 'processRecord', self.result.errors, self.now)
+        stages = data.get('stages') if with_stages else None
+        if isinstance(stages, dict):
+            for key, stage_data in stages.items():
+                self.stage(key, stage_data)
+        elif isinstance(stages, list):
+            for index, stage_data in enumerate(stages):
+                self.stage(str(index), stage_data)
+        elif stages is not None:
+            self.result.errors.append(FieldError('processRecord.stages', f"应为对象，实际为 {type(stages).__name__}"))
+    
+    def stage(self, key: str, data: Any):
+        """单个阶段记录及其媒体文件"""
+        path = f"processRecord.stages.{key}"
+        if not self._expect_dict(data, path):
+            return
+        errors = self.result.errors
+        stage = _STAGE.validate(data, path, errors, self.now)
+        if not stage.stage_name:
+            # 缺少 stage 字段时使用字典的键作为阶段名
+            stage.stage_name = key
+        self.result.stages.append(stage)
+        
+        media_list = data.get('mediaItems') or data.get('media_items')
+        if not media_list:
+            return
+        if not isinstance(media_list, list):
+            errors.append(FieldError(f"{path}.mediaItems", f"应为列表，实际为 {type(media_list).__name__}"))
+            return
+        media_items = []
+        validate_media = _MEDIA.validate
+        now = self.now
+        for index, media_data in enumerate(media_list):
+            # 字段路径只在出错时才拼接（媒体文件数量可能很多）
+            if type(media_data) is not dict:
+                self._expect_dict(media_data, f"{path}.mediaItems[{index}]")
+                continue
+            error_count = len(errors)
+            media_item = validate_media(media_data, '', errors, now)
+            if len(errors) > error_count:
+                errors[error_count:] = [FieldError(f"{path}.mediaItems[{index}]{e.path}", e.message)
+                                        for e in errors[error_count:]]
+            if not media_item.file_path:
+                errors.append(FieldError(f"{path}.mediaItems[{index}].path", "不能为空"))
+                continue
+            media_items.append(media_item)
+        if media_items:
+            self.result.stages_media[stage.stage_name] = media_items
+            self.result.media_count += len(media_items)
+    
+    def summary_data(self, data: Any):
+        if not data or not self._expect_dict(data, 'summaryData'):
+            return
+        self.result.summary = _SUMMARY.validate(data, 'summaryData', self.result.errors, self.now)
+    
+    def export_time(self, value: Any):
+        if value is None:
+            return
+        if type(value) is not int:
+            value = _to_int(value, 'exportTime', self.result.errors, 0)
+        self.result.export_time = value
+    
+    def finish(self) -> ValidatedSubmission:
+        if self.result.team is None and not any(e.path == 'teamInfo' for e in self.result.errors):
+            self.result.errors.append(FieldError('teamInfo', "缺少团队信息"))
+        return self.result
+
+
+def validate_submission(data: Any) -> ValidatedSubmission:
+    """校验并规范化一份完整的提交数据（单次遍历）"""
+    validator = SubmissionValidator()
+    if not isinstance(data, dict):
+        validator.result.errors.append(FieldError('$', f"应为JSON对象，实际为 {type(data).__name__}"))
+        return validator.result
+    if 'teamInfo' in data:
+        validator.team_info(data['teamInfo'])
+    validator.team_division(data.get('teamDivision'))
+    validator.process_record(data.get('processRecord'))
+    validator.summary_data(data.get('summaryData'))
+    validator.export_time(data.get('exportTime'))
+    return validator.finish()
+
+
+def submission_hash(data: Dict[str, Any]) -> str:
+    """提交内容哈希（忽略 exportTime），用于识别重复提交"""
+    return json_codec.content_hash({k: v for k, v in data.items() if k != 'exportTime'})
+
+
+def submission_team_id(data: Any) -> str:
+    """只校验 teamInfo 得到团队ID（合并同一团队的连续提交用）；teamInfo 无效时返回空字符串"""
+    if not isinstance(data, dict):
+        return ''
+    validator = SubmissionValidator()
+    validator.team_info(data.get('teamInfo'))
+    return '' if validator.result.errors else validator.result.student_id
+
+
+# ==================== 部分更新（PATCH） ====================
+def validate_stage_patch(stage_name: str, data: Any) -> Tuple[Dict[str, Any], Optional[List[MediaItem]], List[FieldError]]:
+    """
+    校验单个阶段的部分更新
+    返回 (要更新的列 -> 值, 媒体文件列表（请求中没有 mediaItems 时为 None，表示不改动）, 错误列表)
+    """
+    errors: List[FieldError] = []
+    if not isinstance(data, dict) or not data:
+        errors.append(FieldError('$', "应为非空JSON对象"))
+        return {}, None, errors
+    
+    for key in _STAGE.unknown_keys(data, frozenset({'mediaItems', 'media_items'})):
+        errors.append(FieldError(key, "未知字段"))
+    fields = _STAGE.validate_partial(data, '', errors)
+    errors = [FieldError(e.path.lstrip('.'), e.message) for e in errors]
+    if fields.get('stage_name', stage_name) != stage_name:
+        errors.append(FieldError('stage', f"与URL中的阶段名 {stage_name} 不一致"))
+    fields.pop('stage_name', None)
+    
+    media_items = None
+    media_list = data.get('mediaItems', data.get('media_items'))
+    if media_list is not None:
+        # 复用提交校验的媒体文件处理（错误路径改为相对本次请求）
+        validator = SubmissionValidator()
+        validator.stage(stage_name, {'stage': stage_name, 'mediaItems': media_list})
+        prefix = f"processRecord.stages.{stage_name}."
+        errors.extend(FieldError(e.path[len(prefix):] if e.path.startswith(prefix) else e.path, e.message)
+                      for e in validator.result.errors)
+        media_items = validator.result.stages_media.get(stage_name, [])
+    
+    if not fields and media_items is None and not errors:
+        errors.append(FieldError('$', "没有可更新的字段"))
+    return fields, media_items, errors
+
+
+def validate_summary_patch(data: Any) -> Tuple[Dict[str, Any], List[FieldError]]:
+    """校验课后总结的部分更新，返回 (要更新的列 -> 值, 错误列表)"""
+    errors: List[FieldError] = []
+    if not isinstance(data, dict) or not data:
+        errors.append(FieldError('$', "应为非空JSON对象"))
+        return {}, errors
+    
+    for key in _SUMMARY.unknown_keys(data):
+        errors.append(FieldError(key, "未知字段"))
+    fields = _SUMMARY.validate_partial(data, '', errors)
+    errors = [FieldError(e.path.lstrip('.'), e.message) for e in errors]
+    if not fields and not errors:
+        errors.append(FieldError('$', "没有可更新的字段"))
+    return fields, errors